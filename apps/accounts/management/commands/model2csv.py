@@ -6,62 +6,48 @@ Created: 1/26/18 12:39 AM
 
 Created by: '@ekivemark'
 
-Prints CSV of all fields of a model.
+Prints CSV of all fields of a model, or of the selected columns, with
+memory bounded chunked reads (see apps.core.export).
 """
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.apps import apps
 
 import apps.logging.request_logger as bb2logging
 
-import csv
 import logging
-import sys
 
+from apps.core.export import EXPORT_CHUNK_SIZE, copy_csv, open_output, write_csv
+from apps.core.replica import read_replica
 from apps.fhir.bluebutton.utils import get_fhir_now
 
 logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
 
 
-def exportcsv(app_name, model_name, add_name, field_export):
+def exportcsv(app_name, model_name, add_name, field_export, out=None, use_copy=False,
+              chunk_size=EXPORT_CHUNK_SIZE, progress=None):
     """
 
     :param app_name:
     :param model_name:
     :param add_name:
-    :return:
+    :param field_export: columns, field names or relation paths (eg. user__username)
+    :param out: text file the CSV is written to
+    :param use_copy: write the CSV with Postgres COPY
+    :return: rows written (None with use_copy)
 
     export the CSV for a model, with header line
     """
     model = apps.get_model(app_name, model_name)
-    field_list = [f.name for f in model._meta.fields]
-    if field_export:
-        field_names = []
-        for fe in field_export:
-            if fe in field_list:
-                field_names.append(fe)
-    else:
-        field_names = field_list
 
+    extra = None
     if add_name:
-        model_field_names = field_names + [app_name + '.' + model_name,
-                                           "model2csv_time"]
-        model2csv_time = get_fhir_now()
+        extra = [(app_name + '.' + model_name, app_name + '.' + model_name),
+                 ("model2csv_time", get_fhir_now())]
 
-    else:
-        model_field_names = field_names
-
-    writer = csv.writer(sys.stdout, quoting=csv.QUOTE_ALL)
-    writer.writerow(model_field_names)
-
-    for instance in model.objects.all():
-        output = [str(getattr(instance, f)) for f in field_names]
-        if add_name:
-            output = output + [app_name + '.' + model_name,
-                               model2csv_time]
-
-        writer.writerow(output)
-
-    return True
+    if use_copy:
+        copy_csv(out, model, field_export, extra)
+        return None
+    return write_csv(out, model, field_export, extra, chunk_size=chunk_size, progress=progress)
 
 
 class Command(BaseCommand):
@@ -79,7 +65,29 @@ class Command(BaseCommand):
 
         parser.add_argument('--filter_fields', help="filter fields by column "
                                                     "name, comma separated: "
-                                                    "eg. id,name,description ")
+                                                    "eg. id,name,description "
+                                                    "or related fields eg. user__username")
+
+        parser.add_argument('--output', help="write to this file instead of stdout")
+
+        parser.add_argument('--gzip', action='store_true', default=False,
+                            help="gzip compress the output")
+
+        parser.add_argument('--chunk_size', type=int, default=EXPORT_CHUNK_SIZE,
+                            help="rows read from the database at a time")
+
+        parser.add_argument('--use_copy', action='store_true', default=False,
+                            help="export with PostgreSQL COPY (NULL as empty values, "
+                                 "relation columns as ids)")
+
+        parser.add_argument('--progress', action='store_true', default=False,
+                            help="report the exported row count on stderr")
+
+    def report_progress(self, rows, total):
+        if total:
+            self.stderr.write("model2csv: {} of ~{} rows ({:.0f}%)".format(rows, total, min(rows / total * 100, 100)))
+        else:
+            self.stderr.write("model2csv: {} rows".format(rows))
 
     def handle(self, *app_labels, **options):
 
@@ -108,13 +116,13 @@ class Command(BaseCommand):
         else:
             field_export = []
 
-        e = exportcsv(app_name, model_name, add_name, field_export)
+        progress = self.report_progress if options['progress'] else None
 
-        if e:
-            logger.info('model2csv: Content exported: %s.%s' % (app_name,
-                                                                model_name))
-            return
-        else:
-            logger.info('model2csv: Problem with export')
+        try:
+            with read_replica(), open_output(options['output'], options['gzip'], self.stdout) as out:
+                rows = exportcsv(app_name, model_name, add_name, field_export, out=out,
+                              use_copy=options['use_copy'], chunk_size=options['chunk_size'], progress=progress)
+        except (LookupError, ValueError) as e:
+            raise CommandError("model2csv: {}".format(e))
 
-        return False
+        logger.info('model2csv: Content exported: %s.%s (%s rows)' % (app_name, model_name, rows))
@@ -13,9 +13,7 @@ from django.contrib.auth.models import User
 from django.db import models
 from django.db.models import (
     CASCADE,
-    Count,
-    Min,
-    Max,
+    Q,
 )
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -24,6 +22,8 @@ from django.utils.crypto import get_random_string
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext
 
+from apps.core.aggregation import CountIf, aggregate_counts
+
 from .emails import send_activation_key_via_email
 
 ADDITION = 1
@@ -437,27 +437,34 @@ def get_developer_counts():
 
     start_time = datetime.utcnow().timestamp()
 
-    queryset = (
-        User.objects.select_related()
-        .filter(userprofile__user_type="DEV")
-        .annotate(
-            app_count=Count("dot_ext_application"),
-            first_active=Min("dot_ext_application__first_active"),
-            active_app_count=Count("dot_ext_application__first_active"),
-            last_active=Max("dot_ext_application__last_active"),
-            organization_name=Min("userprofile__organization_name"),
-        )
-        .all()
+    # One scan: distinct users, as the application join repeats a developer per app
+    queryset = User.objects.filter(userprofile__user_type="DEV")
+    developer_counts = aggregate_counts(
+        queryset,
+        {
+            "total": CountIf(field="pk", distinct=True),
+            "with_registered_app": CountIf(
+                Q(dot_ext_application__isnull=False), "pk", distinct=True
+            ),
+            "with_first_api_call": CountIf(
+                Q(dot_ext_application__first_active__isnull=False), "pk", distinct=True
+            ),
+            "organization_name": CountIf(
+                field="userprofile__organization_name", distinct=True
+            ),
+            "null_organization_name": CountIf(
+                Q(userprofile__organization_name__isnull=True), "pk", distinct=True
+            ),
+        },
     )
 
-    counts_returned["total"] = queryset.count()
-    counts_returned["with_registered_app"] = queryset.filter(app_count__gt=0).count()
-    counts_returned["with_first_api_call"] = queryset.filter(
-        active_app_count__gt=0
-    ).count()
-    counts_returned["distinct_organization_name"] = (
-        queryset.values("organization_name").distinct().count()
-    )
+    counts_returned["total"] = developer_counts["total"]
+    counts_returned["with_registered_app"] = developer_counts["with_registered_app"]
+    counts_returned["with_first_api_call"] = developer_counts["with_first_api_call"]
+    # COUNT(DISTINCT) skips NULL, which counts as one more distinct organization name
+    counts_returned["distinct_organization_name"] = developer_counts[
+        "organization_name"
+    ] + (1 if developer_counts["null_organization_name"] else 0)
     counts_returned["elapsed"] = round(datetime.utcnow().timestamp() - start_time, 3)
 
     return counts_returned
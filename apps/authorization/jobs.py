@@ -0,0 +1,98 @@
+import logging
+import threading
+
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+import apps.logging.request_logger as bb2logging
+
+from .models import update_grants
+
+
+"""
+  Background DataAccessGrant backfill job.
+
+  Runs update_grants() in keyset chunks on a worker thread so that the
+  admin request starting it returns immediately. Job status/progress is
+  kept in the cache so it can be polled from any web worker.
+
+  CALLED FROM: apps.metrics.views.CheckDataAccessGrantsView
+"""
+
+log = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
+
+GRANTS_BACKFILL_STATUS_CACHE_KEY = "authorization_grants_backfill_status"
+GRANTS_BACKFILL_LOCK_CACHE_KEY = "authorization_grants_backfill_lock"
+
+# Lock expires in case a worker dies while the job is running.
+GRANTS_BACKFILL_LOCK_TIMEOUT = 60 * 60
+
+GRANTS_BACKFILL_CHUNK_SIZE = 10000
+
+
+def get_grants_backfill_status():
+    return cache.get(GRANTS_BACKFILL_STATUS_CACHE_KEY)
+
+
+def _set_status(status):
+    cache.set(GRANTS_BACKFILL_STATUS_CACHE_KEY, status, None)
+
+
+def run_grants_backfill(chunk_size=GRANTS_BACKFILL_CHUNK_SIZE):
+    """
+    Run the grants backfill, recording progress in the job status.
+    """
+    status = {
+        "state": "running",
+        "started": str(timezone.now()),
+        "finished": None,
+        "chunk_count": 0,
+        "last_id": None,
+        "created_count": 0,
+        "error": None,
+    }
+    _set_status(status)
+
+    def progress(chunk_count, last_id, created_cnt):
+        status.update({"chunk_count": chunk_count, "last_id": last_id, "created_count": created_cnt})
+        _set_status(status)
+
+    try:
+        update_grants(chunk_size=chunk_size, progress_callback=progress)
+        status["state"] = "done"
+    except Exception as e:
+        log.exception("DataAccessGrant backfill failed")
+        status.update({"state": "failed", "error": str(e)})
+    finally:
+        status["finished"] = str(timezone.now())
+        _set_status(status)
+        cache.delete(GRANTS_BACKFILL_LOCK_CACHE_KEY)
+
+    return status
+
+
+def _run_grants_backfill_thread(chunk_size):
+    try:
+        run_grants_backfill(chunk_size)
+    finally:
+        # Worker threads get their own DB connection, release it.
+        connection.close()
+
+
+def start_grants_backfill(chunk_size=GRANTS_BACKFILL_CHUNK_SIZE):
+    """
+    Start the grants backfill on a background thread, unless one is already running.
+
+    Returns (started, status).
+    """
+    if not cache.add(GRANTS_BACKFILL_LOCK_CACHE_KEY, str(timezone.now()), GRANTS_BACKFILL_LOCK_TIMEOUT):
+        return False, get_grants_backfill_status()
+
+    status = {"state": "queued", "started": None, "finished": None,
+              "chunk_count": 0, "last_id": None, "created_count": 0, "error": None}
+    _set_status(status)
+
+    threading.Thread(target=_run_grants_backfill_thread, args=(chunk_size,), daemon=True).start()
+
+    return True, status
@@ -1,8 +1,9 @@
 import pytz
+from collections import Counter, defaultdict
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-from django.db import models
-from django.db.models import Count, Min, Q
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import Count, Min
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -10,6 +11,19 @@ from oauth2_provider.settings import oauth2_settings
 from oauth2_provider.models import get_access_token_model
 from waffle import switch_is_active
 
+from apps.core.aggregation import (
+    CountIf,
+    aggregate_counts,
+    aggregate_counts_by,
+    bene_type_case,
+    bucket_counts,
+    grouped_counts,
+    real_fhir_id_q,
+    sum_counts,
+    synthetic_fhir_id_q,
+)
+from apps.core.counters import reconcile_counters
+
 
 class DataAccessGrant(models.Model):
     beneficiary = models.ForeignKey(
@@ -87,16 +101,90 @@ class ArchivedDataAccessGrant(models.Model):
         return self.beneficiary
 
 
-def update_grants(*args, **kwargs):
+# Insert missing grants for (beneficiary, application) pairs with an unexpired token.
+UPDATE_GRANTS_SQL = (
+    "INSERT INTO {grant} (beneficiary_id, application_id, created_at)"
+    " SELECT DISTINCT t.user_id, t.application_id, %s FROM {token} t"
+    " WHERE t.expires > %s AND t.user_id IS NOT NULL AND t.application_id IS NOT NULL{id_range}"
+    " AND NOT EXISTS (SELECT 1 FROM {grant} g"
+    " WHERE g.beneficiary_id = t.user_id AND g.application_id = t.application_id)"
+)
+
+# Attempts of an update_grants() chunk. A chunk fails with an IntegrityError when a
+# concurrent authorization commits a grant of the chunk after the NOT EXISTS check,
+# its retry skips that grant. (Not ON CONFLICT DO NOTHING: the squashed initial
+# migration runs update_grants() before the unique index exists.)
+UPDATE_GRANTS_ATTEMPTS = 3
+
+
+def update_grants(*args, chunk_size=None, progress_callback=None, **kwargs):
+    """
+    Backfill DataAccessGrant records for beneficiary/application pairs
+    that have an unexpired access token, but no grant.
+
+    Runs as one set-based INSERT ... SELECT DISTINCT ... WHERE NOT EXISTS,
+    or when chunk_size is given, one INSERT per keyset chunk of access
+    token ids (for very large token tables).
+
+    progress_callback(chunk_count, last_id, created_cnt) is called after each chunk.
+
+    Returns the number of grants created.
+    """
     AccessToken = get_access_token_model()
-    # inefficient version
-    tokens = AccessToken.objects.all()
-    for token in tokens:
-        if token.is_valid():
-            DataAccessGrant.objects.get_or_create(
-                beneficiary=token.user,
-                application=token.application,
+    qn = connection.ops.quote_name
+    now = timezone.now()
+    created_at = connection.ops.adapt_datetimefield_value(now)
+    expires_after = connection.ops.adapt_datetimefield_value(now)
+
+    def insert_grants(id_range="", id_params=()):
+        for attempt in range(1, UPDATE_GRANTS_ATTEMPTS + 1):
+            sql = UPDATE_GRANTS_SQL.format(
+                grant=qn(DataAccessGrant._meta.db_table),
+                token=qn(AccessToken._meta.db_table),
+                id_range=id_range,
             )
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(sql, [created_at, expires_after, *id_params])
+                    return cursor.rowcount
+            except IntegrityError:
+                if attempt == UPDATE_GRANTS_ATTEMPTS:
+                    raise
+
+    if not chunk_size:
+        created_cnt = insert_grants()
+        if progress_callback:
+            progress_callback(1, None, created_cnt)
+        _recount_grant_counters(created_cnt)
+        return created_cnt
+
+    created_cnt = 0
+    chunk_count = 0
+    last_id = 0
+    while True:
+        ids = list(
+            AccessToken.objects.filter(id__gt=last_id, expires__gt=now)
+            .order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+        if not ids:
+            break
+
+        created_cnt += insert_grants(" AND t.id > %s AND t.id <= %s", (last_id, ids[-1]))
+        chunk_count += 1
+        last_id = ids[-1]
+
+        if progress_callback:
+            progress_callback(chunk_count, last_id, created_cnt)
+
+    _recount_grant_counters(created_cnt)
+    return created_cnt
+
+
+def _recount_grant_counters(created_cnt):
+    # The set based INSERTs bypass the per application grant counters
+    if created_cnt and settings.METRIC_COUNTERS_ENABLED:
+        reconcile_counters(["grant"])
 
 
 def check_grants():
@@ -116,6 +204,25 @@ def check_grants():
     }
 
 
+def _bene_type_counts(queryset, fhir_id_field, bene_field):
+    """
+    Real/synth bene counts, and their distinct beneficiary counts, for a grant queryset in one scan.
+    """
+    real_q = real_fhir_id_q(fhir_id_field)
+    synthetic_q = synthetic_fhir_id_q(fhir_id_field)
+
+    return aggregate_counts(
+        queryset,
+        {
+            "total": CountIf(),
+            "real": CountIf(real_q),
+            "synthetic": CountIf(synthetic_q),
+            "real_deduped": CountIf(real_q, bene_field, distinct=True),
+            "synthetic_deduped": CountIf(synthetic_q, bene_field, distinct=True),
+        },
+    )
+
+
 def get_grant_bene_counts(application=None):
     """
     Get the grant counts for real/synth benes
@@ -134,36 +241,21 @@ def get_grant_bene_counts(application=None):
     if application:
         grant_queryset = grant_queryset.filter(application=application)
 
-    # Get total table count
-    counts_returned["total"] = grant_queryset.count()
-
-    real_grant_queryset = grant_queryset.filter(
-        ~Q(beneficiary__crosswalk___fhir_id__startswith="-")
-        & ~Q(beneficiary__crosswalk___fhir_id="")
-        & Q(beneficiary__crosswalk___fhir_id__isnull=False)
-    ).values("beneficiary")
-
-    synthetic_grant_queryset = grant_queryset.filter(
-        Q(beneficiary__crosswalk___fhir_id__startswith="-")
-        & ~Q(beneficiary__crosswalk___fhir_id="")
-        & Q(beneficiary__crosswalk___fhir_id__isnull=False)
-    ).values("beneficiary")
-
-    counts_returned["real"] = real_grant_queryset.count()
-    counts_returned["synthetic"] = synthetic_grant_queryset.count()
+    # Table, real/synth and distinct real/synth counts in one scan
+    grant_counts = _bene_type_counts(
+        grant_queryset, "beneficiary__crosswalk___fhir_id", "beneficiary"
+    )
+
+    counts_returned["total"] = grant_counts["total"]
+    counts_returned["real"] = grant_counts["real"]
+    counts_returned["synthetic"] = grant_counts["synthetic"]
     counts_returned["elapsed"] = round(datetime.utcnow().timestamp() - start_time, 3)
 
     # Grant real/synth bene distinct counts (excludes granted to multiple apps)
     if application is None:
-        start_time = datetime.utcnow().timestamp()
-
-        counts_returned["real_deduped"] = real_grant_queryset.distinct().count()
-        counts_returned[
-            "synthetic_deduped"
-        ] = synthetic_grant_queryset.distinct().count()
-        counts_returned["deduped_elapsed"] = round(
-            datetime.utcnow().timestamp() - start_time, 3
-        )
+        counts_returned["real_deduped"] = grant_counts["real_deduped"]
+        counts_returned["synthetic_deduped"] = grant_counts["synthetic_deduped"]
+        counts_returned["deduped_elapsed"] = counts_returned["elapsed"]
 
     # Archived grant real/synth bene distinct counts (excludes granted to multiple apps and multiple archived records)
     start_time = datetime.utcnow().timestamp()
@@ -174,25 +266,13 @@ def get_grant_bene_counts(application=None):
     if application:
         archived_queryset = archived_queryset.filter(application=application)
 
-    # Get total table count
-    counts_returned["archived_total"] = archived_queryset.count()
-
-    real_archived_queryset = archived_queryset.filter(
-        ~Q(beneficiary__crosswalk___fhir_id__startswith="-")
-        & ~Q(beneficiary__crosswalk___fhir_id="")
-        & Q(beneficiary__crosswalk___fhir_id__isnull=False)
-    ).values("beneficiary")
-
-    synthetic_archived_queryset = archived_queryset.filter(
-        Q(beneficiary__crosswalk___fhir_id__startswith="-")
-        & ~Q(beneficiary__crosswalk___fhir_id="")
-        & Q(beneficiary__crosswalk___fhir_id__isnull=False)
-    ).values("beneficiary")
-
-    counts_returned["archived_real_deduped"] = real_archived_queryset.distinct().count()
-    counts_returned[
-        "archived_synthetic_deduped"
-    ] = synthetic_archived_queryset.distinct().count()
+    archived_counts = _bene_type_counts(
+        archived_queryset, "beneficiary__crosswalk___fhir_id", "beneficiary"
+    )
+
+    counts_returned["archived_total"] = archived_counts["total"]
+    counts_returned["archived_real_deduped"] = archived_counts["real_deduped"]
+    counts_returned["archived_synthetic_deduped"] = archived_counts["synthetic_deduped"]
     counts_returned["archived_deduped_elapsed"] = round(
         datetime.utcnow().timestamp() - start_time, 3
     )
@@ -200,31 +280,16 @@ def get_grant_bene_counts(application=None):
     # Both Grant and Archived grant (UNION) real/synth bene distinct counts
     start_time = datetime.utcnow().timestamp()
 
-    real_union_queryset = real_grant_queryset.union(real_archived_queryset)
-    synthetic_union_queryset = synthetic_grant_queryset.union(
-        synthetic_archived_queryset
+    # UNION removes the duplicate (beneficiary, bene_type) rows, then one GROUP BY bene_type
+    union_counts = grouped_counts(
+        _bene_type_values(grant_queryset, "beneficiary").union(
+            _bene_type_values(archived_queryset, "beneficiary")
+        ),
+        ["bene_type"],
     )
 
-    # Django 3.2.13 upgrade: seems need to re-write the query to work around?
-    # django.db.utils.NotSupportedError: Calling QuerySet.distinct() after union() is not supported
-    # and below is the quote from Django doc:
-    #
-    # union()
-    # union(*other_qs, all=False)
-    # Uses SQL UNION operator to combine the results of two or more QuerySets. For example:
-    #
-    # >>> qs1.union(qs2, qs3)
-    # The UNION operator selects only distinct values by default. To allow duplicate values, use the all=True argument.
-
-    # counts_returned[
-    #     "grant_and_archived_real_deduped"
-    # ] = real_union_queryset.distinct().count()
-    counts_returned[
-        "grant_and_archived_real_deduped"
-    ] = real_union_queryset.count()
-    counts_returned[
-        "grant_and_archived_synthetic_deduped"
-    ] = synthetic_union_queryset.count()
+    counts_returned["grant_and_archived_real_deduped"] = union_counts[("real",)]
+    counts_returned["grant_and_archived_synthetic_deduped"] = union_counts[("synthetic",)]
     counts_returned["grant_and_archived_deduped_elapsed"] = round(
         datetime.utcnow().timestamp() - start_time, 3
     )
@@ -232,6 +297,112 @@ def get_grant_bene_counts(application=None):
     return counts_returned
 
 
+def _bene_type_values(queryset, *fields):
+    """
+    values() of fields plus the bene_type ("real"/"synthetic"/None) of a grant queryset.
+    """
+    return (
+        queryset.annotate(bene_type=bene_type_case("beneficiary__crosswalk___fhir_id"))
+        .order_by()
+        .values(*fields, "bene_type")
+    )
+
+
+def get_grant_bene_counts_by_application(application_ids=None):
+    """
+    Get the per application get_grant_bene_counts(application) counts for
+    all applications (or application_ids), with one GROUP BY application
+    query per table and one for the grant/archived grant UNION.
+
+    Returns {application_id: counts}, zero counts for applications without grants.
+    """
+    grant_queryset = DataAccessGrant.objects.all()
+    archived_queryset = ArchivedDataAccessGrant.objects.all()
+
+    if application_ids is not None:
+        grant_queryset = grant_queryset.filter(application_id__in=application_ids)
+        archived_queryset = archived_queryset.filter(application_id__in=application_ids)
+
+    counts_returned = defaultdict(
+        lambda: dict.fromkeys(
+            [
+                "total",
+                "real",
+                "synthetic",
+                "archived_total",
+                "archived_real_deduped",
+                "archived_synthetic_deduped",
+                "grant_and_archived_real_deduped",
+                "grant_and_archived_synthetic_deduped",
+            ],
+            0,
+        )
+    )
+
+    real_q = real_fhir_id_q("beneficiary__crosswalk___fhir_id")
+    synthetic_q = synthetic_fhir_id_q("beneficiary__crosswalk___fhir_id")
+
+    grant_counts = aggregate_counts_by(
+        grant_queryset,
+        "application",
+        {
+            "total": CountIf(),
+            "real": CountIf(real_q),
+            "synthetic": CountIf(synthetic_q),
+        },
+    )
+    archived_counts = aggregate_counts_by(
+        archived_queryset,
+        "application",
+        {
+            "archived_total": CountIf(),
+            "archived_real_deduped": CountIf(real_q, "beneficiary", distinct=True),
+            "archived_synthetic_deduped": CountIf(synthetic_q, "beneficiary", distinct=True),
+        },
+    )
+
+    for grouped in [grant_counts, archived_counts]:
+        for application_id, counts in grouped.items():
+            counts_returned[application_id].update(counts)
+
+    # Both Grant and Archived grant (UNION) real/synth bene distinct counts
+    union_counts = grouped_counts(
+        _bene_type_values(grant_queryset, "application", "beneficiary").union(
+            _bene_type_values(archived_queryset, "application", "beneficiary")
+        ),
+        ["application_id", "bene_type"],
+    )
+    for (application_id, bene_type), n in union_counts.items():
+        if bene_type is not None:
+            counts_returned[application_id][
+                "grant_and_archived_{}_deduped".format(bene_type)
+            ] = n
+
+    return counts_returned
+
+
+# Beneficiary grants to applications histogram buckets: (name, low, high) inclusive
+BENE_GRANT_TO_APPS_BUCKETS = [
+    ("eq_1", 1, 1),
+    ("eq_2", 2, 2),
+    ("eq_3", 3, 3),
+    ("eq_4thru5", 4, 5),
+    ("eq_6thru8", 6, 8),
+    ("eq_9thru13", 9, 13),
+    ("gt_13", 14, None),
+]
+
+# Beneficiary grant/archived grant conditions on (grant_count, grant_archived_count)
+BENE_GRANT_CONDITIONS = {
+    "grant": lambda grant, archived: grant > 0,
+    "grant_archived": lambda grant, archived: archived > 0,
+    "grant_or_archived": lambda grant, archived: grant > 0 or archived > 0,
+    "grant_and_archived": lambda grant, archived: grant > 0 and archived > 0,
+    "grant_not_archived": lambda grant, archived: grant > 0 and not archived > 0,
+    "archived_not_grant": lambda grant, archived: not grant > 0 and archived > 0,
+}
+
+
 def get_beneficiary_counts():
     """
     Get AccessToken, DataAccessGrant
@@ -245,8 +416,7 @@ def get_beneficiary_counts():
     start_time = datetime.utcnow().timestamp()
 
     queryset = (
-        User.objects.select_related()
-        .filter(userprofile__user_type="BEN")
+        User.objects.filter(userprofile__user_type="BEN")
         .annotate(
             fhir_id=Min("crosswalk___fhir_id"),
             grant_count=Count("dataaccessgrant__application", distinct=True),
@@ -254,196 +424,53 @@ def get_beneficiary_counts():
                 "archiveddataaccessgrant__application", distinct=True
             ),
         )
-        .all()
+        .annotate(bene_type=bene_type_case("fhir_id"))
+        .values("bene_type", "grant_count", "grant_archived_count")
     )
 
-    # Count should be equal to Crosswalk
-    counts_returned["total"] = queryset.count()
+    # Number of benes per (bene_type, grant_count, grant_archived_count), in one query.
+    # All the counts below are summed from these few rows.
+    bene_counts = grouped_counts(
+        queryset, ["bene_type", "grant_count", "grant_archived_count"]
+    )
 
-    # Setup base Real queryset
-    real_queryset = queryset.filter(~Q(fhir_id__startswith="-") & ~Q(fhir_id=""))
+    def count(bene_type=None, condition=None):
+        return sum_counts(
+            bene_counts,
+            lambda key: (bene_type is None or key[0] == bene_type)
+            and (condition is None or condition(key[1], key[2])),
+        )
 
-    # Setup base synthetic queryset
-    synthetic_queryset = queryset.filter(Q(fhir_id__startswith="-") & ~Q(fhir_id=""))
+    # Count should be equal to Crosswalk
+    counts_returned["total"] = count()
 
     # Real/synth counts. This should match counts using the Crosswalk table directly.
-    counts_returned["real"] = real_queryset.count()
-    counts_returned["synthetic"] = synthetic_queryset.count()
+    counts_returned["real"] = count("real")
+    counts_returned["synthetic"] = count("synthetic")
 
     """
     Grant related count section
     """
-    # Count only if in grant
-    counts_returned["total_grant"] = queryset.filter(Q(grant_count__gt=0)).count()
-    counts_returned["real_grant"] = real_queryset.filter(Q(grant_count__gt=0)).count()
-    counts_returned["synthetic_grant"] = synthetic_queryset.filter(
-        Q(grant_count__gt=0)
-    ).count()
-
-    # Count only if in grant archived
-    counts_returned["total_grant_archived"] = queryset.filter(
-        Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["real_grant_archived"] = real_queryset.filter(
-        Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["synthetic_grant_archived"] = synthetic_queryset.filter(
-        Q(grant_archived_count__gt=0)
-    ).count()
-
-    # Count only if in grant OR archived
-    counts_returned["total_grant_or_archived"] = queryset.filter(
-        Q(grant_count__gt=0) | Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["real_grant_or_archived"] = real_queryset.filter(
-        Q(grant_count__gt=0) | Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["synthetic_grant_or_archived"] = synthetic_queryset.filter(
-        Q(grant_count__gt=0) | Q(grant_archived_count__gt=0)
-    ).count()
-
-    # Count only if in grant AND archived
-    counts_returned["total_grant_and_archived"] = queryset.filter(
-        Q(grant_count__gt=0) & Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["real_grant_and_archived"] = real_queryset.filter(
-        Q(grant_count__gt=0) & Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["synthetic_grant_and_archived"] = synthetic_queryset.filter(
-        Q(grant_count__gt=0) & Q(grant_archived_count__gt=0)
-    ).count()
-
-    # Count only if in grant NOT archived
-    counts_returned["total_grant_not_archived"] = queryset.filter(
-        Q(grant_count__gt=0) & ~Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["real_grant_not_archived"] = real_queryset.filter(
-        Q(grant_count__gt=0) & ~Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["synthetic_grant_not_archived"] = synthetic_queryset.filter(
-        Q(grant_count__gt=0) & ~Q(grant_archived_count__gt=0)
-    ).count()
-
-    # Count only if in archived NOT grant
-    counts_returned["total_archived_not_grant"] = queryset.filter(
-        ~Q(grant_count__gt=0) & Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["real_archived_not_grant"] = real_queryset.filter(
-        ~Q(grant_count__gt=0) & Q(grant_archived_count__gt=0)
-    ).count()
-    counts_returned["synthetic_archived_not_grant"] = synthetic_queryset.filter(
-        ~Q(grant_count__gt=0) & Q(grant_archived_count__gt=0)
-    ).count()
+    for name, condition in BENE_GRANT_CONDITIONS.items():
+        counts_returned["total_" + name] = count(condition=condition)
+        counts_returned["real_" + name] = count("real", condition)
+        counts_returned["synthetic_" + name] = count("synthetic", condition)
 
     """
-    Bene grants to applications break down count section
+    Bene grants and archived grants to applications break down count section
     """
-    counts_returned["real_grant_to_apps_eq_1"] = real_queryset.filter(
-        Q(grant_count=1)
-    ).count()
-    counts_returned["synthetic_grant_to_apps_eq_1"] = synthetic_queryset.filter(
-        Q(grant_count=1)
-    ).count()
-
-    counts_returned["real_grant_to_apps_eq_2"] = real_queryset.filter(
-        Q(grant_count=2)
-    ).count()
-    counts_returned["synthetic_grant_to_apps_eq_2"] = synthetic_queryset.filter(
-        Q(grant_count=2)
-    ).count()
-
-    counts_returned["real_grant_to_apps_eq_3"] = real_queryset.filter(
-        Q(grant_count=3)
-    ).count()
-    counts_returned["synthetic_grant_to_apps_eq_3"] = synthetic_queryset.filter(
-        Q(grant_count=3)
-    ).count()
-
-    counts_returned["real_grant_to_apps_eq_4thru5"] = real_queryset.filter(
-        Q(grant_count__gte=4) & Q(grant_count__lte=5)
-    ).count()
-    counts_returned["synthetic_grant_to_apps_eq_4thru5"] = synthetic_queryset.filter(
-        Q(grant_count__gte=4) & Q(grant_count__lte=5)
-    ).count()
-
-    counts_returned["real_grant_to_apps_eq_6thru8"] = real_queryset.filter(
-        Q(grant_count__gte=6) & Q(grant_count__lte=8)
-    ).count()
-    counts_returned["synthetic_grant_to_apps_eq_6thru8"] = synthetic_queryset.filter(
-        Q(grant_count__gte=6) & Q(grant_count__lte=8)
-    ).count()
-
-    counts_returned["real_grant_to_apps_eq_9thru13"] = real_queryset.filter(
-        Q(grant_count__gte=9) & Q(grant_count__lte=13)
-    ).count()
-    counts_returned["synthetic_grant_to_apps_eq_9thru13"] = synthetic_queryset.filter(
-        Q(grant_count__gte=9) & Q(grant_count__lte=13)
-    ).count()
-
-    counts_returned["real_grant_to_apps_gt_13"] = real_queryset.filter(
-        Q(grant_count__gt=13)
-    ).count()
-    counts_returned["synthetic_grant_to_apps_gt_13"] = synthetic_queryset.filter(
-        Q(grant_count__gt=13)
-    ).count()
-
-    """
-    Bene archived grants to applications break down count section
-    """
-    counts_returned["real_grant_archived_to_apps_eq_1"] = real_queryset.filter(
-        Q(grant_archived_count=1)
-    ).count()
-    counts_returned[
-        "synthetic_grant_archived_to_apps_eq_1"
-    ] = synthetic_queryset.filter(Q(grant_archived_count=1)).count()
-
-    counts_returned["real_grant_archived_to_apps_eq_2"] = real_queryset.filter(
-        Q(grant_archived_count=2)
-    ).count()
-    counts_returned[
-        "synthetic_grant_archived_to_apps_eq_2"
-    ] = synthetic_queryset.filter(Q(grant_archived_count=2)).count()
-
-    counts_returned["real_grant_archived_to_apps_eq_3"] = real_queryset.filter(
-        Q(grant_archived_count=3)
-    ).count()
-    counts_returned[
-        "synthetic_grant_archived_to_apps_eq_3"
-    ] = synthetic_queryset.filter(Q(grant_archived_count=3)).count()
-
-    counts_returned["real_grant_archived_to_apps_eq_4thru5"] = real_queryset.filter(
-        Q(grant_archived_count__gte=4) & Q(grant_archived_count__lte=5)
-    ).count()
-    counts_returned[
-        "synthetic_grant_archived_to_apps_eq_4thru5"
-    ] = synthetic_queryset.filter(
-        Q(grant_archived_count__gte=4) & Q(grant_archived_count__lte=5)
-    ).count()
-
-    counts_returned["real_grant_archived_to_apps_eq_6thru8"] = real_queryset.filter(
-        Q(grant_archived_count__gte=6) & Q(grant_archived_count__lte=8)
-    ).count()
-    counts_returned[
-        "synthetic_grant_archived_to_apps_eq_6thru8"
-    ] = synthetic_queryset.filter(
-        Q(grant_archived_count__gte=6) & Q(grant_archived_count__lte=8)
-    ).count()
-
-    counts_returned["real_grant_archived_to_apps_eq_9thru13"] = real_queryset.filter(
-        Q(grant_archived_count__gte=9) & Q(grant_archived_count__lte=13)
-    ).count()
-    counts_returned[
-        "synthetic_grant_archived_to_apps_eq_9thru13"
-    ] = synthetic_queryset.filter(
-        Q(grant_archived_count__gte=9) & Q(grant_archived_count__lte=13)
-    ).count()
-
-    counts_returned["real_grant_archived_to_apps_gt_13"] = real_queryset.filter(
-        Q(grant_archived_count__gt=13)
-    ).count()
-    counts_returned[
-        "synthetic_grant_archived_to_apps_gt_13"
-    ] = synthetic_queryset.filter(Q(grant_archived_count__gt=13)).count()
+    for bene_type in ["real", "synthetic"]:
+        grant_histogram = Counter()
+        grant_archived_histogram = Counter()
+        for (key_bene_type, grant, archived), n in bene_counts.items():
+            if key_bene_type == bene_type:
+                grant_histogram[grant] += n
+                grant_archived_histogram[archived] += n
+
+        for name, n in bucket_counts(grant_histogram, BENE_GRANT_TO_APPS_BUCKETS).items():
+            counts_returned["{}_grant_to_apps_{}".format(bene_type, name)] = n
+        for name, n in bucket_counts(grant_archived_histogram, BENE_GRANT_TO_APPS_BUCKETS).items():
+            counts_returned["{}_grant_archived_to_apps_{}".format(bene_type, name)] = n
 
     counts_returned["elapsed"] = round(datetime.utcnow().timestamp() - start_time, 3)
 
@@ -462,73 +489,48 @@ def get_beneficiary_grant_app_pair_counts():
     # Grant real/synth bene counts (includes granted to multiple apps)
     start_time = datetime.utcnow().timestamp()
 
-    # Setup base queryset
-    grant_queryset = DataAccessGrant.objects.values("beneficiary", "application")
-
-    real_grant_queryset = grant_queryset.filter(
-        ~Q(beneficiary__crosswalk___fhir_id__startswith="-")
-        & ~Q(beneficiary__crosswalk___fhir_id="")
-        & Q(beneficiary__crosswalk___fhir_id__isnull=False)
-    ).values("beneficiary", "application")
-
-    synthetic_grant_queryset = grant_queryset.filter(
-        Q(beneficiary__crosswalk___fhir_id__startswith="-")
-        & ~Q(beneficiary__crosswalk___fhir_id="")
-        & Q(beneficiary__crosswalk___fhir_id__isnull=False)
-    ).values("beneficiary", "application")
-
-    counts_returned["grant_total"] = grant_queryset.count()
-    counts_returned["real_grant"] = real_grant_queryset.count()
-    counts_returned["synthetic_grant"] = synthetic_grant_queryset.count()
-
-    # Setup base queryset
-    grant_archived_queryset = ArchivedDataAccessGrant.objects.values(
-        "beneficiary", "application"
+    grant_counts = _bene_type_counts(
+        DataAccessGrant.objects, "beneficiary__crosswalk___fhir_id", "beneficiary"
     )
 
-    real_grant_archived_queryset = grant_archived_queryset.filter(
-        ~Q(beneficiary__crosswalk___fhir_id__startswith="-")
-        & ~Q(beneficiary__crosswalk___fhir_id="")
-        & Q(beneficiary__crosswalk___fhir_id__isnull=False)
-    ).values("beneficiary", "application")
+    counts_returned["grant_total"] = grant_counts["total"]
+    counts_returned["real_grant"] = grant_counts["real"]
+    counts_returned["synthetic_grant"] = grant_counts["synthetic"]
 
-    synthetic_grant_archived_queryset = grant_archived_queryset.filter(
-        Q(beneficiary__crosswalk___fhir_id__startswith="-")
-        & ~Q(beneficiary__crosswalk___fhir_id="")
-        & Q(beneficiary__crosswalk___fhir_id__isnull=False)
-    ).values("beneficiary", "application")
+    grant_archived_counts = _bene_type_counts(
+        ArchivedDataAccessGrant.objects, "beneficiary__crosswalk___fhir_id", "beneficiary"
+    )
 
     # Get total table count
-    counts_returned["grant_archived_total"] = grant_archived_queryset.count()
-    counts_returned["real_grant_archived"] = real_grant_archived_queryset.count()
-    counts_returned[
-        "synthetic_grant_archived"
-    ] = synthetic_grant_archived_queryset.count()
+    counts_returned["grant_archived_total"] = grant_archived_counts["total"]
+    counts_returned["real_grant_archived"] = grant_archived_counts["real"]
+    counts_returned["synthetic_grant_archived"] = grant_archived_counts["synthetic"]
 
     """
     Bene<->App pair differences
     """
-    # Pairs in Grant but not in ArchivedGrant.
-    counts_returned["grant_vs_archived_difference_total"] = grant_queryset.difference(
-        grant_archived_queryset
-    ).count()
-    counts_returned[
-        "real_grant_vs_archived_difference_total"
-    ] = real_grant_queryset.difference(real_grant_archived_queryset).count()
-    counts_returned[
-        "synthetic_grant_vs_archived_difference_total"
-    ] = synthetic_grant_queryset.difference(synthetic_grant_archived_queryset).count()
-
-    # Pairs in ArchivedGrant but not in Grant.
-    counts_returned[
-        "archived_vs_grant_difference_total"
-    ] = grant_archived_queryset.difference(grant_queryset).count()
-    counts_returned[
-        "real_archived_vs_grant_difference_total"
-    ] = real_grant_archived_queryset.difference(real_grant_queryset).count()
-    counts_returned[
-        "synthetic_archived_vs_grant_difference_total"
-    ] = synthetic_grant_archived_queryset.difference(synthetic_grant_queryset).count()
+    grant_queryset = _bene_type_values(
+        DataAccessGrant.objects, "beneficiary", "application"
+    )
+    grant_archived_queryset = _bene_type_values(
+        ArchivedDataAccessGrant.objects, "beneficiary", "application"
+    )
+
+    # Pairs in Grant but not in ArchivedGrant, by bene_type.
+    difference_counts = grouped_counts(
+        grant_queryset.difference(grant_archived_queryset), ["bene_type"]
+    )
+    counts_returned["grant_vs_archived_difference_total"] = sum_counts(difference_counts)
+    counts_returned["real_grant_vs_archived_difference_total"] = difference_counts[("real",)]
+    counts_returned["synthetic_grant_vs_archived_difference_total"] = difference_counts[("synthetic",)]
+
+    # Pairs in ArchivedGrant but not in Grant, by bene_type.
+    difference_counts = grouped_counts(
+        grant_archived_queryset.difference(grant_queryset), ["bene_type"]
+    )
+    counts_returned["archived_vs_grant_difference_total"] = sum_counts(difference_counts)
+    counts_returned["real_archived_vs_grant_difference_total"] = difference_counts[("real",)]
+    counts_returned["synthetic_archived_vs_grant_difference_total"] = difference_counts[("synthetic",)]
 
     counts_returned["elapsed"] = round(datetime.utcnow().timestamp() - start_time, 3)
 
@@ -1,13 +1,10 @@
+from apps.dot_ext.revocation import bulk_revoke_tokens
 from apps.dot_ext.signals import beneficiary_authorized_application
-from oauth2_provider.models import get_access_token_model, get_refresh_token_model
 from django.db.models.signals import (
     post_delete,
 )
 from .models import DataAccessGrant, ArchivedDataAccessGrant
 
-AccessToken = get_access_token_model()
-RefreshToken = get_refresh_token_model()
-
 
 def app_authorized_record_grant(sender, request, user, application, **kwargs):
     auth_status = kwargs.get('auth_status', None)
@@ -25,15 +22,8 @@ beneficiary_authorized_application.connect(app_authorized_record_grant)
 
 
 def revoke_associated_tokens(sender, instance=None, **kwargs):
-    # Revoke access tokens
-    tokens = AccessToken.objects.filter(application=instance.application, user=instance.user).all()
-    for token in tokens:
-        token.revoke()
-
-    # Remove refresh tokens
-    tokens = RefreshToken.objects.filter(application=instance.application, user=instance.user).all()
-    for token in tokens:
-        token.revoke()
+    # Revoke access and refresh tokens as a set
+    bulk_revoke_tokens(instance.application, user=instance.user)
 
 
 def archive_removed_grant(sender, instance=None, **kwargs):
@@ -11,10 +11,19 @@ from oauth2_provider.models import (
     get_access_token_model,
 )
 from django.urls import reverse
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from apps.test import BaseApiTest
+from apps.authorization.jobs import (
+    GRANTS_BACKFILL_LOCK_CACHE_KEY,
+    GRANTS_BACKFILL_STATUS_CACHE_KEY,
+    run_grants_backfill,
+)
 from apps.authorization.models import (
     DataAccessGrant,
     ArchivedDataAccessGrant,
+    UPDATE_GRANTS_SQL,
     check_grants,
     update_grants,
 )
@@ -358,6 +367,97 @@ class TestDataAccessGrant(BaseApiTest):
             checks['grants'],
         )
 
+    def _create_backfill_tokens(self):
+        application = self._create_application('an app', redirect_uris='http://localhost')
+        users = [User.objects.create_user('bene{}'.format(i), password='123456') for i in range(5)]
+        for i, user in enumerate(users):
+            # Two unexpired tokens for the same pair create one grant
+            for n in range(2):
+                AccessToken.objects.create(
+                    token="token{}-{}".format(i, n),
+                    user=user,
+                    application=application,
+                    expires=timezone.now() + timedelta(seconds=60),
+                )
+        AccessToken.objects.create(
+            token="expiredtoken",
+            user=User.objects.create_user('expired_bene', password='123456'),
+            application=application,
+            expires=timezone.now() - timedelta(seconds=10),
+        )
+        # Pair with an existing grant is skipped
+        DataAccessGrant.objects.create(beneficiary=users[0], application=application)
+        return application, users
+
+    def test_update_grants_chunked(self):
+        application, users = self._create_backfill_tokens()
+        progress = []
+
+        created_cnt = update_grants(chunk_size=3, progress_callback=lambda *args: progress.append(args))
+
+        self.assertEqual(created_cnt, 4)
+        self.assertEqual(len(progress), 4)
+        self.assertEqual(progress[-1][2], 4)
+        self.assertEqual(
+            set(DataAccessGrant.objects.values_list('beneficiary__username', flat=True)),
+            {u.username for u in users},
+        )
+        self.assertEqual(check_grants()['unique_tokens'], check_grants()['grants'])
+
+        # Nothing left to backfill
+        self.assertEqual(update_grants(), 0)
+
+    def test_update_grants_retries_chunk_on_concurrent_grant(self):
+        self._create_backfill_tokens()
+        # First attempt without the NOT EXISTS check, like a grant committed after the check
+        racy_sql = UPDATE_GRANTS_SQL.replace(
+            " AND NOT EXISTS (SELECT 1 FROM {grant} g"
+            " WHERE g.beneficiary_id = t.user_id AND g.application_id = t.application_id)", "")
+        self.assertNotEqual(racy_sql, UPDATE_GRANTS_SQL)
+        formats = []
+
+        def format_sql(**kwargs):
+            formats.append(kwargs)
+            return (racy_sql if len(formats) == 1 else UPDATE_GRANTS_SQL).format(**kwargs)
+        sql = mock.Mock()
+        sql.format.side_effect = format_sql
+
+        with mock.patch('apps.authorization.models.UPDATE_GRANTS_SQL', sql):
+            self.assertEqual(update_grants(chunk_size=3), 4)
+        # The first chunk was retried
+        self.assertEqual(formats[0], formats[1])
+        self.assertEqual(check_grants()['unique_tokens'], check_grants()['grants'])
+
+    def test_grants_backfill_job(self):
+        self._create_backfill_tokens()
+        cache.delete(GRANTS_BACKFILL_STATUS_CACHE_KEY)
+        cache.delete(GRANTS_BACKFILL_LOCK_CACHE_KEY)
+
+        self.client.force_login(User.objects.create_user('admin', password='123456', is_staff=True))
+        url = reverse('check-grants')
+
+        # Run the background job inline
+        with mock.patch('apps.authorization.jobs.threading.Thread') as thread:
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['backfill']['state'], 'queued')
+        thread.return_value.start.assert_called_once()
+        run_grants_backfill(chunk_size=2)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        content = response.json()
+        self.assertEqual(content['unique_tokens'], content['grants'])
+        self.assertEqual(content['backfill']['state'], 'done')
+        self.assertEqual(content['backfill']['created_count'], 4)
+        self.assertEqual(content['backfill']['chunk_count'], 5)
+
+        # Lock was released, so a new backfill can start
+        with mock.patch('apps.authorization.jobs.threading.Thread'):
+            self.assertEqual(self.client.post(url).status_code, 202)
+            self.assertEqual(self.client.post(url).status_code, 409)
+        cache.delete(GRANTS_BACKFILL_LOCK_CACHE_KEY)
+
     def test_permission_deny_on_app_or_org_disabled(self):
         '''
         BB2-149 leverage application.active, user.is_active to deny permission
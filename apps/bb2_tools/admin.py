@@ -1,13 +1,19 @@
 import json
 from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
 from django.db.models import Q, Count, Min, Max, DateTimeField
 from django.db.models.functions import Trunc
+from django.utils.functional import cached_property
 from django.utils.html import format_html
 from oauth2_provider.models import AccessToken, RefreshToken
 from oauth2_provider.models import get_application_model
 
 from apps.accounts.models import UserProfile
+from apps.bb2_tools.rollups import get_application_rollup, get_daily_rollup
+from apps.core.aggregation import estimated_count
+from apps.core.replica import read_replica_view
 from apps.dot_ext.models import ArchivedToken
 from apps.bb2_tools.models import (
     BeneficiaryDashboard,
@@ -28,6 +34,11 @@ BB2_TOOLS_PATH = "/{}/admin/bb2_tools/".format(ADMIN_PREPEND) if ADMIN_PREPEND e
 
 LINK_REF_FMT = "<a  href='{0}{1}?q={2}&user__id__exact={3}'>{4}</a>"
 TOKEN_VIEWERS = {MyAccessTokenViewer, MyRefreshTokenViewer, MyArchivedTokenViewer}
+CONNECTED_APP_TOKEN_COUNTS = (
+    (MyAccessTokenViewer, "Token Count"),
+    (MyRefreshTokenViewer, "Refresh Token Count"),
+    (MyArchivedTokenViewer, "Archived Token Count"),
+)
 
 
 def extract_date_range(response):
@@ -65,7 +76,12 @@ def extract_date_range(response):
     return startdate, lower_bound_op, enddate, upper_bound_op
 
 
-def gen_ctx_grpby_datefld(request, response, uniq_fld_name, filters, date_fld_name, clazz_model, date_hierarchy):
+def gen_ctx_grpby_datefld(request, response, uniq_fld_name, filters, date_fld_name, clazz_model, date_hierarchy,
+                          rollup_name=None):
+    '''
+    chart rows of the model's counts per period, read from the daily
+    rollup rollup_name when given and refreshed (see apps.bb2_tools.rollups)
+    '''
 
     period = get_next_in_date_hierarchy(
         request,
@@ -82,22 +98,18 @@ def gen_ctx_grpby_datefld(request, response, uniq_fld_name, filters, date_fld_na
     aggregate_by_period_ctx['period'] = period
 
     total_by_date = None
+    if rollup_name is not None and (dt_range is None or (lower_bound_op == 'gte' and upper_bound_op == 'lt')):
+        total_by_date = get_daily_rollup(rollup_name, period, startdate, enddate)
+
     q_filter = filters if filters is not None else None
     if dt_range:
         if q_filter:
             q_filter = {**q_filter, **dt_range}
         else:
             q_filter = dt_range
-    if q_filter is not None:
-        total_by_date = clazz_model.objects.filter(**q_filter).annotate(
-            period=Trunc(
-                date_fld_name,
-                period,
-                output_field=DateTimeField(),
-            ),
-        ).values('period').annotate(sub_total=Count(uniq_fld_name)).order_by('period')
-    else:
-        total_by_date = clazz_model.objects.all().annotate(
+    if total_by_date is None:
+        queryset = clazz_model.objects.filter(**q_filter) if q_filter is not None else clazz_model.objects.all()
+        total_by_date = queryset.annotate(
             period=Trunc(
                 date_fld_name,
                 period,
@@ -105,13 +117,10 @@ def gen_ctx_grpby_datefld(request, response, uniq_fld_name, filters, date_fld_na
             ),
         ).values('period').annotate(sub_total=Count(uniq_fld_name)).order_by('period')
 
-    sub_totals_range = total_by_date.aggregate(
-        low=Min('sub_total'),
-        high=Max('sub_total'),
-    )
-
-    high = sub_totals_range.get('high', 0)
-    low = sub_totals_range.get('low', 0)
+    total_by_date = list(total_by_date)
+    sub_totals = [e['sub_total'] or 0 for e in total_by_date]
+    high = max(sub_totals, default=0)
+    low = min(sub_totals, default=0)
     chart_list = []
     for e in total_by_date:
         chart_list.append(
@@ -170,8 +179,24 @@ def get_my_tokens_widget(u, id):
     return widget_html
 
 
+class EstimatedCountPaginator(Paginator):
+    '''
+    paginator counting large unfiltered changelists by the table's row
+    estimate (above settings.ADMIN_ESTIMATED_COUNT_THRESHOLD), exact COUNT(*) otherwise
+    '''
+    @cached_property
+    def count(self):
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate > settings.ADMIN_ESTIMATED_COUNT_THRESHOLD:
+            return estimate
+        return super().count
+
+
 class ReadOnlyAdmin(admin.ModelAdmin):
     readonly_fields = []
+    paginator = EstimatedCountPaginator
+    # no extra unfiltered COUNT(*) of the whole table on filtered changelists
+    show_full_result_count = False
 
     def get_readonly_fields(self, request, obj=None):
         return list(self.readonly_fields) + \
@@ -189,6 +214,54 @@ class TokenCountByAppsAdmin(ReadOnlyAdmin):
     def get_model(self):
         pass
 
+    def get_rollup_name(self):
+        # per application rollup of the model's tokens, see apps.bb2_tools.rollups
+        return None
+
+    def get_rollup_token_cnts(self, with_no_demo):
+        # token counts by app name from the per application rollups, None if not refreshed yet
+        rollup_name = self.get_rollup_name()
+        if rollup_name is None:
+            return None
+        no_demo_rollup_name = rollup_name + '_no_demo'
+        rollup = get_application_rollup([rollup_name, no_demo_rollup_name])
+        if rollup is None:
+            return None
+
+        app_names = dict(get_application_model().objects.filter(
+            id__in=[app_id for app_id in rollup if app_id is not None]).values_list('id', 'name'))
+        tk_cnts = {}
+        no_demo_tk_cnts = {}
+        for app_id, counts in rollup.items():
+            app_name = app_names.get(app_id)
+            tk_cnts[app_name] = tk_cnts.get(app_name, 0) + counts.get(rollup_name, 0)
+            if with_no_demo and counts.get(no_demo_rollup_name):
+                no_demo_tk_cnts[app_name] = no_demo_tk_cnts.get(app_name, 0) + counts[no_demo_rollup_name]
+
+        token_cnts_by_app = [{'application__name': name, 'tk_cnt': tk_cnts[name]}
+                             for name in sorted(tk_cnts, key=lambda name: (name is None, name)) if tk_cnts[name]]
+        token_no_demo_cnts_by_app = [{'application__name': name, 'tk_cnt': cnt} for name, cnt in no_demo_tk_cnts.items()]
+        return token_cnts_by_app, sum(tk_cnts.values()), token_no_demo_cnts_by_app, sum(no_demo_tk_cnts.values())
+
+    def get_live_token_cnts(self, clazz_model, with_no_demo):
+        token_cnts_by_app = clazz_model.objects.all().values(
+            'application__name').annotate(
+                tk_cnt=Count('token')).order_by('application__name')
+
+        token_total = clazz_model.objects.all().count()
+
+        token_no_demo_cnts_by_app = []
+        token_no_demo_total = 0
+        if with_no_demo:
+            token_no_demo_cnts_by_app = clazz_model.objects.filter(
+                ~Q(scope__icontains="patient/Patient.read")).values(
+                'application__name').annotate(
+                    tk_cnt=Count('token')).order_by('application__name')
+            token_no_demo_total = clazz_model.objects.filter(
+                ~Q(scope__icontains="patient/Patient.read")).count()
+        return list(token_cnts_by_app), token_total, list(token_no_demo_cnts_by_app), token_no_demo_total
+
+    @read_replica_view
     def changelist_view(self, request, extra_context=None):
         response = super().changelist_view(
             request,
@@ -196,36 +269,25 @@ class TokenCountByAppsAdmin(ReadOnlyAdmin):
         )
 
         clazz_model = self.get_model()
+        # aggregations without demographic scopes for access token and archived token only
+        with_no_demo = clazz_model == AccessToken or clazz_model == ArchivedToken
 
         # common aggregations for access token, refresh token, archived token
-        token_cnts_by_app = clazz_model.objects.all().values(
-            'application__name').annotate(
-                tk_cnt=Count('token')).order_by('application__name')
-
-        token_total = clazz_model.objects.all().count()
+        token_cnts = self.get_rollup_token_cnts(with_no_demo)
+        if token_cnts is None:
+            token_cnts = self.get_live_token_cnts(clazz_model, with_no_demo)
+        token_cnts_by_app, token_total, token_no_demo_cnts_by_app, token_no_demo_total = token_cnts
 
         response.context_data["token_total"] = token_total
 
-        token_cnts_range = token_cnts_by_app.aggregate(
-            low=Min('tk_cnt'),
-            high=Max('tk_cnt'),
-        )
-
-        high = token_cnts_range.get('high', 0)
-        low = token_cnts_range.get('low', 0)
+        tk_cnts = [x['tk_cnt'] or 0 for x in token_cnts_by_app]
+        high = max(tk_cnts, default=0)
+        low = min(tk_cnts, default=0)
 
         token_no_demo_dict = {}
-        token_no_demo_total = 0
         chart_list = []
         table_list = []
-        if clazz_model == AccessToken or clazz_model == ArchivedToken:
-            # aggregations for access token and archived token only - without demographic scopes
-            token_no_demo_cnts_by_app = clazz_model.objects.filter(
-                ~Q(scope__icontains="patient/Patient.read")).values(
-                'application__name').annotate(
-                    tk_cnt=Count('token')).order_by('application__name')
-            token_no_demo_total = clazz_model.objects.filter(
-                ~Q(scope__icontains="patient/Patient.read")).count()
+        if with_no_demo:
             response.context_data['token_no_demo_total'] = token_no_demo_total
             for t in token_no_demo_cnts_by_app:
                 token_no_demo_dict[t['application__name']] = t['tk_cnt']
@@ -256,6 +318,31 @@ class TokenCountByAppsAdmin(ReadOnlyAdmin):
         return response
 
 
+def prefetch_connected_applications(crosswalks):
+    '''
+    load the token counts by app of a page of beneficiaries (crosswalks),
+    with one grouped query per token model instead of queries per row
+    '''
+    user_ids = [c.user_id for c in crosswalks]
+    connected = {user_id: [] for user_id in user_ids}
+    for clazz_model, label in CONNECTED_APP_TOKEN_COUNTS:
+        tokens = clazz_model.objects.filter(
+            user__in=user_ids).values("user", "application__name").annotate(
+                token_count=Count("token")).order_by("user", "application__name")
+        for t in tokens:
+            connected[t['user']].append((label, t['application__name'], t['token_count']))
+
+    for c in crosswalks:
+        c.connected_applications = connected[c.user_id]
+
+
+class BeneficiaryDashboardChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # evaluates the page's queryset, rendered from its result cache
+        prefetch_connected_applications(self.result_list)
+
+
 @admin.register(BeneficiaryDashboard)
 class BeneficiaryDashboardAdmin(ReadOnlyAdmin):
     change_form_template = 'admin/bb2_bene_dashboard_change_form.html'
@@ -263,11 +350,15 @@ class BeneficiaryDashboardAdmin(ReadOnlyAdmin):
     search_fields = ('user__username', '_fhir_id', '_user_id_hash', '_user_mbi_hash')
     readonly_fields = ('date_created',)
     raw_id_fields = ("user", )
+    list_select_related = ("user", )
 
     def get_queryset(self, request):
         qs = super(BeneficiaryDashboardAdmin, self).get_queryset(request)
         return qs
 
+    def get_changelist(self, request, **kwargs):
+        return BeneficiaryDashboardChangeList
+
     def get_user_username(self, obj):
         return obj.user.username
 
@@ -291,25 +382,12 @@ class BeneficiaryDashboardAdmin(ReadOnlyAdmin):
     get_identities.allow_tags = True
 
     def get_connected_applications(self, obj):
-        inlinehtml = "<div><ul>"
-        tokens = MyAccessTokenViewer.objects.filter(
-            user=obj.user_id).values("user", "application").annotate(token_count=Count("token"))
-        for t in tokens:
-            app = get_application_model().objects.get(id=t['application'])
-            inlinehtml += "<li>App:{}, Token Count:{}</li>".format(app.name, t['token_count'])
-
-        refreshtokens = MyRefreshTokenViewer.objects.filter(
-            user=obj.user_id).values("user", "application").annotate(token_count=Count("token"))
-        for t in refreshtokens:
-            app = get_application_model().objects.get(id=t['application'])
-            inlinehtml += "<li>App:{}, Refresh Token Count:{}</li>".format(app.name, t['token_count'])
-
-        archivedtokens = MyArchivedTokenViewer.objects.filter(
-            user=obj.user_id).values("user", "application").annotate(token_count=Count("token"))
-        for t in archivedtokens:
-            app = get_application_model().objects.get(id=t['application'])
-            inlinehtml += "<li>App:{}, Archived Token Count:{}</li>".format(app.name, t['token_count'])
+        if not hasattr(obj, 'connected_applications'):
+            prefetch_connected_applications([obj])
 
+        inlinehtml = "<div><ul>"
+        for label, app_name, token_count in obj.connected_applications:
+            inlinehtml += "<li>App:{}, {}:{}</li>".format(app_name, label, token_count)
         inlinehtml += "</ul></div>"
 
         return format_html(inlinehtml)
@@ -392,6 +470,7 @@ class ApplicationStatsAdmin(ReadOnlyAdmin):
 
     date_hierarchy = 'created'
 
+    @read_replica_view
     def changelist_view(self, request, extra_context=None):
         response = super().changelist_view(
             request,
@@ -409,7 +488,8 @@ class ApplicationStatsAdmin(ReadOnlyAdmin):
                                                             None,
                                                             'created',
                                                             clazz_model,
-                                                            self.date_hierarchy)
+                                                            self.date_hierarchy,
+                                                            rollup_name='application_created')
         top_panel = {
             'type': 'bar-chart',
             'title': 'Apps Count by Signup Date, Total ({})'.format(total),
@@ -466,6 +546,7 @@ class UserCountByCreateDateAdmin(ReadOnlyAdmin):
     change_list_template = 'admin/user_counts_by_date_change_list.html'
     date_hierarchy = 'user__date_joined'
 
+    @read_replica_view
     def changelist_view(self, request, extra_context=None):
         response = super().changelist_view(
             request,
@@ -484,7 +565,8 @@ class UserCountByCreateDateAdmin(ReadOnlyAdmin):
                                                                  {'user_type': 'BEN'},
                                                                  'user__date_joined',
                                                                  clazz_model,
-                                                                 self.date_hierarchy)
+                                                                 self.date_hierarchy,
+                                                                 rollup_name='bene_joined')
         top_panel = {
             'type': 'bar-chart',
             'title': ('Beneficiaries Counts by Joined Date, '
@@ -501,7 +583,8 @@ class UserCountByCreateDateAdmin(ReadOnlyAdmin):
                                                                  {'user_type': 'DEV'},
                                                                  'user__date_joined',
                                                                  clazz_model,
-                                                                 self.date_hierarchy)
+                                                                 self.date_hierarchy,
+                                                                 rollup_name='dev_joined')
         center_panel = {
             'type': 'bar-chart',
             'title': ('Developer User Counts by Joined Date:'
@@ -548,6 +631,10 @@ class ConnectedBeneficiaryCountByAppsAdmin(TokenCountByAppsAdmin):
     def get_model(self):
         return AccessToken
 
+    def get_rollup_name(self):
+        return 'access_token'
+
+    @read_replica_view
     def changelist_view(self, request, extra_context=None):
 
         response = super().changelist_view(
@@ -577,6 +664,10 @@ class RefreshTokenCountByAppsAdmin(TokenCountByAppsAdmin):
     def get_model(self):
         return RefreshToken
 
+    def get_rollup_name(self):
+        return 'refresh_token'
+
+    @read_replica_view
     def changelist_view(self, request, extra_context=None):
         response = super().changelist_view(
             request,
@@ -599,6 +690,10 @@ class ArchivedTokenStatsAdmin(TokenCountByAppsAdmin):
     def get_model(self):
         return ArchivedToken
 
+    def get_rollup_name(self):
+        return 'archived_token'
+
+    @read_replica_view
     def changelist_view(self, request, extra_context=None):
         response = super().changelist_view(
             request,
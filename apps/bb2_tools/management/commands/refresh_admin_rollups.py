@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+import apps.logging.request_logger as logging
+
+from apps.bb2_tools.rollups import refresh_rollups
+
+
+logger = logging.getLogger(logging.AUDIT_GLOBAL_STATE_METRICS_LOGGER)
+
+
+class Command(BaseCommand):
+    help = ('Refresh the pre-aggregated rollup tables of the bb2_tools admin charts '
+            '(see apps.bb2_tools.rollups). Run it on a schedule.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", default=False,
+                            help="Rebuild the daily rollups instead of recounting the recent days.")
+
+    def handle(self, *args, **options):
+        summary = refresh_rollups(full=options["full"])
+        logger.info(summary)
+
+        for name, days in summary["days"].items():
+            self.stdout.write("{}: {} days".format(name, days))
+        self.stdout.write("Refreshed admin rollups, application rows={}, elapsed={}s".format(
+            summary["application_rows"], summary["elapsed"]))
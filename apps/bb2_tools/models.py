@@ -1,3 +1,4 @@
+from django.db import models
 from oauth2_provider.models import AccessToken, RefreshToken
 
 from apps.accounts.models import UserProfile
@@ -84,3 +85,29 @@ class ApplicationStats(Application):
         app_label = "bb2_tools"
         verbose_name = "Application statistics"
         verbose_name_plural = "Application statistics"
+
+
+class DailyCountRollup(models.Model):
+    """
+    Rows of a chart's model per day, see apps.bb2_tools.rollups.
+    """
+    name = models.CharField(max_length=64)
+    day = models.DateField()
+    count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("name", "day")
+
+
+class ApplicationCountRollup(models.Model):
+    """
+    Rows of a chart's model per application, see apps.bb2_tools.rollups.
+    """
+    name = models.CharField(max_length=64)
+    application_id = models.BigIntegerField(null=True)
+    count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("name", "application_id")
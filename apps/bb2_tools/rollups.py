@@ -0,0 +1,240 @@
+import time
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.apps import apps as django_apps
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from oauth2_provider.settings import oauth2_settings
+
+from apps.core.aggregation import CountIf, aggregate_counts_by
+from apps.core.replica import read_replica
+
+
+"""
+  Pre-aggregated rollup tables of the bb2_tools admin charts.
+
+  The date charts (apps by signup date, users by joined date) and the
+  token counts by application group the whole tables on every changelist
+  view. Instead the refresh_admin_rollups management command, run on a
+  schedule, keeps the counts in two small tables:
+
+  - DailyCountRollup: rows per day of each DailyRollupSpec. Only the days
+    since the last refresh (less ROLLUP_REWIND_DAYS, for late rows and
+    deletes) are recounted, full=True rebuilds them.
+  - ApplicationCountRollup: rows per application of each metric of the
+    ApplicationRollupSpecs, one GROUP BY query per model.
+
+  The charts sum the daily rows into their month/week/day periods
+  (get_daily_rollup()) and read the per application counts with
+  get_application_rollup(). A rollup that was never refreshed, and the
+  hourly drill down, fall back to the live aggregation queries.
+"""
+
+# Recounted days before the last refreshed one
+ROLLUP_REWIND_DAYS = 2
+
+# Rollup periods, see get_next_in_date_hierarchy()
+ROLLUP_PERIODS = ("month", "week", "day")
+
+NO_DEMO_SCOPE_Q = ~Q(scope__icontains="patient/Patient.read")
+
+
+class DailyRollupSpec:
+    """
+    Rows of model (an "<app_label>.<ModelName>" label) matching q, per day
+    of the date_field (lookup path of a DateTimeField).
+    """
+
+    def __init__(self, name, model, date_field, q=None):
+        self.name = name
+        self.model_label = model
+        self.date_field = date_field
+        self.q = q
+
+    @property
+    def model(self):
+        return django_apps.get_model(self.model_label)
+
+    def get_queryset(self):
+        queryset = self.model._base_manager.all()
+        return queryset.filter(self.q) if self.q is not None else queryset
+
+
+class ApplicationRollupSpec:
+    """
+    The metrics dict of name -> CountIf over the rows of model, per application.
+    """
+
+    def __init__(self, model, metrics):
+        self.model_label = model
+        self.metrics = metrics
+
+    @property
+    def model(self):
+        return django_apps.get_model(self.model_label)
+
+
+DAILY_ROLLUPS = [
+    DailyRollupSpec("application_created", "dot_ext.Application", "created"),
+    DailyRollupSpec("bene_joined", "accounts.UserProfile", "user__date_joined", q=Q(user_type="BEN")),
+    DailyRollupSpec("dev_joined", "accounts.UserProfile", "user__date_joined", q=Q(user_type="DEV")),
+]
+
+APPLICATION_ROLLUPS = [
+    ApplicationRollupSpec(oauth2_settings.ACCESS_TOKEN_MODEL, {
+        "access_token": CountIf(),
+        "access_token_no_demo": CountIf(NO_DEMO_SCOPE_Q),
+    }),
+    ApplicationRollupSpec(oauth2_settings.REFRESH_TOKEN_MODEL, {
+        "refresh_token": CountIf(),
+    }),
+    ApplicationRollupSpec("dot_ext.ArchivedToken", {
+        "archived_token": CountIf(),
+        "archived_token_no_demo": CountIf(NO_DEMO_SCOPE_Q),
+    }),
+]
+
+
+def _get_daily_model():
+    return django_apps.get_model("bb2_tools", "DailyCountRollup")
+
+
+def _get_application_model():
+    return django_apps.get_model("bb2_tools", "ApplicationCountRollup")
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()), timezone.get_default_timezone())
+
+
+def refresh_daily_rollup(spec, full=False):
+    """
+    Recount the days of a DailyRollupSpec since its last refresh (all days
+    when full), returns the number of days written.
+    """
+    DailyCountRollup = _get_daily_model()
+
+    since = None
+    if not full:
+        last_day = DailyCountRollup.objects.filter(name=spec.name).aggregate(last_day=Max("day"))["last_day"]
+        if last_day is not None:
+            since = last_day - timedelta(days=ROLLUP_REWIND_DAYS)
+
+    queryset = spec.get_queryset()
+    if since is not None:
+        queryset = queryset.filter(**{spec.date_field + "__gte": _day_start(since)})
+
+    with read_replica():
+        rows = list(
+            queryset.order_by()
+            .annotate(rollup_day=TruncDate(spec.date_field, tzinfo=timezone.get_default_timezone()))
+            .values("rollup_day")
+            .annotate(rollup_count=Count("pk"))
+            .values_list("rollup_day", "rollup_count")
+        )
+
+    with transaction.atomic():
+        stale = DailyCountRollup.objects.filter(name=spec.name)
+        if since is not None:
+            stale = stale.filter(day__gte=since)
+        stale.delete()
+        DailyCountRollup.objects.bulk_create(
+            [DailyCountRollup(name=spec.name, day=day, count=count) for day, count in rows if day is not None]
+        )
+    return len(rows)
+
+
+def refresh_application_rollups():
+    """
+    Recount the per application rollups, returns the number of rows written.
+    """
+    ApplicationCountRollup = _get_application_model()
+
+    rollups = []
+    for spec in APPLICATION_ROLLUPS:
+        with read_replica():
+            counts = aggregate_counts_by(spec.model._base_manager.all(), "application_id", spec.metrics)
+        for application_id, row in counts.items():
+            rollups.extend(
+                ApplicationCountRollup(name=name, application_id=application_id, count=count)
+                for name, count in row.items() if count
+            )
+
+    with transaction.atomic():
+        ApplicationCountRollup.objects.all().delete()
+        ApplicationCountRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def refresh_rollups(full=False):
+    """
+    Refresh all the rollups, returns a summary dict.
+    """
+    start_time = time.time()
+    days = {spec.name: refresh_daily_rollup(spec, full=full) for spec in DAILY_ROLLUPS}
+    applications = refresh_application_rollups()
+
+    return {
+        "type": "admin_rollups_refresh",
+        "full": full,
+        "days": days,
+        "application_rows": applications,
+        "elapsed": round(time.time() - start_time, 3),
+    }
+
+
+def _period_start(day, period):
+    if period == "month":
+        day = day.replace(day=1)
+    elif period == "week":
+        day = day - timedelta(days=day.weekday())
+    return _day_start(day)
+
+
+def get_daily_rollup(name, period, start=None, end=None):
+    """
+    Return [{"period": datetime, "sub_total": count}] ordered by period,
+    summed from the daily rollup of name for the days in [start, end)
+    (aware datetimes at midnight, from the admin date hierarchy). Days are
+    in the default time zone (settings.TIME_ZONE).
+
+    Returns None when the period is finer than a day or the rollup was
+    never refreshed, the caller then aggregates the live table.
+    """
+    if period not in ROLLUP_PERIODS:
+        return None
+
+    DailyCountRollup = _get_daily_model()
+    queryset = DailyCountRollup.objects.filter(name=name)
+    if not queryset.exists():
+        return None
+
+    if start is not None:
+        queryset = queryset.filter(day__gte=timezone.localtime(start, timezone.get_default_timezone()).date())
+    if end is not None:
+        queryset = queryset.filter(day__lt=timezone.localtime(end, timezone.get_default_timezone()).date())
+
+    totals = defaultdict(int)
+    for day, count in queryset.values_list("day", "count"):
+        totals[_period_start(day, period)] += count
+    return [{"period": period_start, "sub_total": totals[period_start]} for period_start in sorted(totals)]
+
+
+def get_application_rollup(names):
+    """
+    Return {application_id: {name: count}} of the per application rollups
+    of names, or None when they were never refreshed.
+    """
+    ApplicationCountRollup = _get_application_model()
+    rows = ApplicationCountRollup.objects.filter(name__in=names).values_list("application_id", "name", "count")
+
+    counts = defaultdict(dict)
+    for application_id, name, count in rows:
+        counts[application_id][name] = count
+    if not counts and not ApplicationCountRollup.objects.exists():
+        return None
+    return dict(counts)
@@ -0,0 +1,67 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import override_settings
+from django.test.client import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from apps.fhir.bluebutton.utils import clear_patient_cache, get_patient_by_id
+from apps.test import BaseApiTest
+
+
+DASHBOARD_URL = "/admin/bb2_tools/beneficiarydashboard/"
+
+
+class TestBeneficiaryDashboardAdmin(BaseApiTest):
+    def setUp(self):
+        self._create_capability("Capability A", [])
+        self.admin_user = User.objects.create_superuser("admin", "admin@example.com", "xxx123")
+
+    def _get_changelist(self):
+        self.client.force_login(self.admin_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(DASHBOARD_URL)
+        self.assertEqual(200, response.status_code)
+        return response, len(context.captured_queries)
+
+    def test_changelist_queries_constant(self):
+        self._create_range_users_app_token_grant("-2000000000", 2, "app1", "org1")
+        response, two_row_queries = self._get_changelist()
+        self.assertContains(response, "App:app1, Token Count:1")
+
+        self._create_range_users_app_token_grant("-3000000000", 4, "app2", "org2")
+        self._create_range_users_app_token_grant("-3000000000", 4, "app1", "org1")
+        response, six_row_queries = self._get_changelist()
+
+        self.assertEqual(two_row_queries, six_row_queries)
+        self.assertContains(response, "App:app2, Token Count:1")
+
+
+@override_settings(BFD_PATIENT_CACHE_TTL=60)
+class TestPatientLookupCache(BaseApiTest):
+    def setUp(self):
+        clear_patient_cache()
+        self.request = RequestFactory().get("/")
+        self.request.user = User.objects.create_user("admin")
+
+    def tearDown(self):
+        clear_patient_cache()
+
+    @mock.patch("apps.fhir.bluebutton.utils._fetch_patient", side_effect=lambda id, headers: {"id": id})
+    def test_cached_lookup(self, fetch_patient):
+        self.assertEqual({"id": "-1"}, get_patient_by_id("-1", self.request))
+        self.assertEqual({"id": "-1"}, get_patient_by_id("-1", self.request))
+        fetch_patient.assert_called_once()
+        self.assertEqual("BB2-Tools", fetch_patient.call_args[0][1]["BlueButton-Application"])
+
+        with override_settings(BFD_PATIENT_CACHE_TTL=0):
+            get_patient_by_id("-1", self.request)
+        self.assertEqual(2, fetch_patient.call_count)
+
+    @mock.patch("apps.fhir.bluebutton.utils._fetch_patient", side_effect=Exception("BFD down"))
+    def test_errors_not_cached(self, fetch_patient):
+        for _ in range(2):
+            with self.assertRaises(Exception):
+                get_patient_by_id("-1", self.request)
+        self.assertEqual(2, fetch_patient.call_count)
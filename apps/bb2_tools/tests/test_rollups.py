@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from oauth2_provider.models import AccessToken
+
+from apps.bb2_tools.admin import EstimatedCountPaginator
+from apps.bb2_tools.models import DailyCountRollup
+from apps.bb2_tools.rollups import (
+    DAILY_ROLLUPS,
+    get_application_rollup,
+    get_daily_rollup,
+    refresh_daily_rollup,
+    refresh_rollups,
+)
+from apps.dot_ext.models import Application
+from apps.test import BaseApiTest
+
+
+APPLICATION_CREATED = DAILY_ROLLUPS[0]
+
+
+def _aware(*args):
+    return timezone.make_aware(datetime(*args), timezone.utc)
+
+
+class TestAdminRollups(BaseApiTest):
+    def setUp(self):
+        self.dev_user = User.objects.create_user("dev", password="123456")
+
+    def _create_app(self, name, created):
+        app = self._create_application(name, user=self.dev_user)
+        Application.objects.filter(pk=app.pk).update(created=created)
+        return app
+
+    def _create_token(self, app, token, scope="profile"):
+        return AccessToken.objects.create(user=self.dev_user, application=app, token=token, scope=scope,
+                                          expires=timezone.now() + timedelta(hours=1))
+
+    def test_daily_rollup_periods(self):
+        self._create_app("app1", _aware(2022, 3, 1, 10))
+        self._create_app("app2", _aware(2022, 3, 1, 23))
+        self._create_app("app3", _aware(2022, 3, 9))
+        self._create_app("app4", _aware(2022, 4, 2))
+
+        self.assertIsNone(get_daily_rollup("application_created", "month"))
+        refresh_daily_rollup(APPLICATION_CREATED)
+
+        self.assertEqual(
+            [{"period": _aware(2022, 3, 1), "sub_total": 3}, {"period": _aware(2022, 4, 1), "sub_total": 1}],
+            get_daily_rollup("application_created", "month"),
+        )
+        self.assertEqual(
+            [{"period": _aware(2022, 2, 28), "sub_total": 2}, {"period": _aware(2022, 3, 7), "sub_total": 1}],
+            get_daily_rollup("application_created", "week", _aware(2022, 3, 1), _aware(2022, 4, 1)),
+        )
+        self.assertEqual(
+            [{"period": _aware(2022, 3, 1), "sub_total": 2}, {"period": _aware(2022, 3, 9), "sub_total": 1}],
+            get_daily_rollup("application_created", "day", _aware(2022, 3, 1), _aware(2022, 4, 1)),
+        )
+        # Hourly drill down aggregates the live table
+        self.assertIsNone(get_daily_rollup("application_created", "hour"))
+
+    def test_daily_rollup_incremental_refresh(self):
+        old_app = self._create_app("app1", _aware(2022, 3, 1))
+        self._create_app("app2", _aware(2022, 3, 9))
+        refresh_daily_rollup(APPLICATION_CREATED)
+
+        self._create_app("app3", _aware(2022, 3, 8))
+        self._create_app("app4", _aware(2022, 3, 10))
+        old_app.delete()
+
+        # Only the days since the last one (less the rewind days) are recounted
+        self.assertEqual(3, refresh_daily_rollup(APPLICATION_CREATED))
+        self.assertEqual(
+            [(_aware(2022, 3, 1).date(), 1), (_aware(2022, 3, 8).date(), 1),
+             (_aware(2022, 3, 9).date(), 1), (_aware(2022, 3, 10).date(), 1)],
+            list(DailyCountRollup.objects.filter(name="application_created").order_by("day").values_list("day", "count")),
+        )
+
+        refresh_daily_rollup(APPLICATION_CREATED, full=True)
+        self.assertEqual(
+            [{"period": _aware(2022, 3, 1), "sub_total": 3}],
+            get_daily_rollup("application_created", "month"),
+        )
+
+    def test_application_rollup(self):
+        app1 = self._create_app("app1", _aware(2022, 3, 1))
+        app2 = self._create_app("app2", _aware(2022, 3, 1))
+        self._create_token(app1, "t1")
+        self._create_token(app1, "t2", scope="profile patient/Patient.read")
+        self._create_token(app2, "t3")
+
+        self.assertIsNone(get_application_rollup(["access_token"]))
+        refresh_rollups()
+
+        self.assertEqual(
+            {app1.id: {"access_token": 2, "access_token_no_demo": 1},
+             app2.id: {"access_token": 1, "access_token_no_demo": 1}},
+            get_application_rollup(["access_token", "access_token_no_demo"]),
+        )
+        self.assertEqual({}, get_application_rollup(["refresh_token"]))
+
+    def test_token_counts_admin_reads_rollup(self):
+        app1 = self._create_app("app1", _aware(2022, 3, 1))
+        self._create_token(app1, "t1")
+        self._create_token(app1, "t2", scope="profile patient/Patient.read")
+        refresh_rollups()
+        # Not in the rollup until the next refresh
+        self._create_token(app1, "t3")
+
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "xxx123"))
+        response = self.client.get("/admin/bb2_tools/accesstokenstats/")
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, response.context_data["token_total"])
+        self.assertEqual(1, response.context_data["token_no_demo_total"])
+        self.assertEqual([{"application__name": "app1", "tk_cnt": 2, "no_demo_tk_cnt": 1}],
+                         response.context_data["token_cnts_by_apps"])
+
+        response = self.client.get("/admin/bb2_tools/applicationstats/")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([{"period": _aware(2022, 3, 1), "sub_total": 1, "pct": 0}],
+                         response.context_data["panels"][0]["body"])
+
+    def test_refresh_admin_rollups_command(self):
+        self._create_app("app1", _aware(2022, 3, 1))
+        out = StringIO()
+
+        call_command("refresh_admin_rollups", "--full", stdout=out)
+
+        self.assertIn("application_created: 1 days", out.getvalue())
+        self.assertEqual(1, DailyCountRollup.objects.get(name="application_created").count)
+
+    @override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=1000)
+    def test_estimated_count_paginator(self):
+        queryset = AccessToken.objects.order_by("pk")
+
+        with mock.patch("apps.bb2_tools.admin.estimated_count", return_value=5000):
+            self.assertEqual(5000, EstimatedCountPaginator(queryset, 100).count)
+        with mock.patch("apps.bb2_tools.admin.estimated_count", return_value=500):
+            self.assertEqual(0, EstimatedCountPaginator(queryset, 100).count)
+        # No estimate on sqlite
+        self.assertEqual(0, EstimatedCountPaginator(queryset, 100).count)
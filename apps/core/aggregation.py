@@ -0,0 +1,182 @@
+from collections import Counter
+
+from django.db import connections
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+
+"""
+  Conditional aggregation for table wide counts.
+
+  Instead of one COUNT(*) query per filter, the counts over a table are
+  declared as a dict of name -> CountIf and compiled into a single
+  aggregate() query using COUNT(...) FILTER (WHERE ...) expressions
+  (CASE WHEN on databases without FILTER):
+
+    counts = aggregate_counts(DataAccessGrant.objects, {
+        "total": CountIf(),
+        "real": CountIf(REAL_Q),
+        "real_deduped": CountIf(REAL_Q, "beneficiary", distinct=True),
+    })
+
+  aggregate_counts_by() computes the same counts for every value of a
+  field (per application, etc.) with one GROUP BY query.
+
+  Counts over per row aggregates (grants per beneficiary, etc.) can't be
+  filtered in the same query, so grouped_counts() wraps the annotated
+  queryset in one outer GROUP BY over the annotations, and the histogram
+  buckets are summed from its (small) result with bucket_counts().
+
+  Beneficiaries are real or synthetic by their crosswalk fhir_id
+  (synthetic ids start with "-"), see real_fhir_id_q(), synthetic_fhir_id_q()
+  and bene_type_case().
+
+  estimated_count() reads the planner's row estimate of a table instead of
+  a full COUNT(*), for paginating very large unfiltered admin changelists.
+"""
+
+
+class CountIf:
+    """
+    COUNT of field over the rows matching q (all rows when q is None).
+    """
+
+    def __init__(self, q=None, field="pk", distinct=False):
+        self.q = q
+        self.field = field
+        self.distinct = distinct
+
+    def as_expression(self):
+        return Count(self.field, filter=self.q, distinct=self.distinct)
+
+
+def aggregate_counts(queryset, metrics):
+    """
+    Return {name: count} for the metrics dict of name -> CountIf, in one query.
+    """
+    return queryset.aggregate(
+        **{name: metric.as_expression() for name, metric in metrics.items()}
+    )
+
+
+def aggregate_counts_by(queryset, field, metrics):
+    """
+    Return {field value: {name: count}} for the metrics dict of
+    name -> CountIf, in one GROUP BY field query.
+    """
+    rows = (
+        queryset.order_by()
+        .values(field)
+        .annotate(**{name: metric.as_expression() for name, metric in metrics.items()})
+    )
+    return {row.pop(field): row for row in rows}
+
+
+def grouped_counts(queryset, fields):
+    """
+    Return a Counter of {(field values...): number of rows} for the rows of
+    queryset grouped by fields, in one query.
+
+    fields are the names of annotations (or columns) selected by the
+    queryset's values(), so per row aggregates and the rows of union() or
+    difference() querysets can be grouped on:
+
+        SELECT <fields>, COUNT(*) FROM (<queryset>) GROUP BY <fields>
+    """
+    queryset = queryset.order_by()
+    connection = connections[queryset.db]
+    sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+
+    columns = ", ".join("grouped.{}".format(connection.ops.quote_name(f)) for f in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT {columns}, COUNT(*) FROM ({sql}) grouped GROUP BY {columns}".format(
+                columns=columns, sql=sql
+            ),
+            params,
+        )
+        return Counter({tuple(row[:-1]): row[-1] for row in cursor.fetchall()})
+
+
+def sum_counts(counts, match=None):
+    """
+    Sum the grouped_counts() rows whose key tuple satisfies match(key).
+    """
+    return sum(n for key, n in counts.items() if match is None or match(key))
+
+
+def bucket_counts(values, buckets):
+    """
+    Sum a {value: count} histogram into named buckets.
+
+    buckets is a list of (name, low, high) with inclusive bounds, high None
+    for an open ended bucket. Values outside every bucket are not counted.
+    """
+    returned = {}
+    for name, low, high in buckets:
+        returned[name] = sum(
+            n for value, n in values.items()
+            if value is not None and value >= low and (high is None or value <= high)
+        )
+    return returned
+
+
+def real_fhir_id_q(field):
+    """
+    Q for a real beneficiary's fhir_id at the field lookup path
+    (for example "beneficiary__crosswalk___fhir_id").
+    """
+    return (
+        ~Q(**{field + "__startswith": "-"})
+        & ~Q(**{field: ""})
+        & Q(**{field + "__isnull": False})
+    )
+
+
+def synthetic_fhir_id_q(field):
+    """
+    Q for a synthetic beneficiary's fhir_id at the field lookup path.
+    """
+    return (
+        Q(**{field + "__startswith": "-"})
+        & ~Q(**{field: ""})
+        & Q(**{field + "__isnull": False})
+    )
+
+
+def bene_type_case(field):
+    """
+    Expression for "real" or "synthetic" (None otherwise) from the fhir_id
+    at the field lookup path, to group counts by beneficiary type.
+    """
+    return Case(
+        When(synthetic_fhir_id_q(field), then=Value("synthetic")),
+        When(real_fhir_id_q(field), then=Value("real")),
+        default=None,
+        output_field=CharField(),
+    )
+
+
+def estimated_count(queryset):
+    """
+    Return the planner's row estimate of an unfiltered queryset's table
+    (pg_class.reltuples, maintained by VACUUM/ANALYZE), None for filtered,
+    distinct or grouped querysets, other databases or tables never analyzed.
+    """
+    query = queryset.query
+    if query.has_filters() or query.distinct or query.group_by is not None or query.is_sliced:
+        return None
+
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
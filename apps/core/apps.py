@@ -5,3 +5,7 @@ class CoreConfig(AppConfig):
     name = 'apps.core'
     label = 'core'
     verbose_name = "Application Core"
+
+    def ready(self):
+        from .counters import connect_counter_signals
+        connect_counter_signals()
@@ -0,0 +1,144 @@
+import gzip
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+"""
+  Response body compression helpers and middleware.
+
+  Brotli ships in the requirements; it is skipped if the package is missing.
+"""
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Encodings in server preference order
+SUPPORTED_ENCODINGS = (["br"] if brotli is not None else []) + ["gzip"]
+
+ACCEPT_ENCODING_RE = re.compile(r"^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*$")
+
+
+def parse_accept_encoding(header):
+    """
+    Return a dict of encoding -> q value from an Accept-Encoding header value.
+    """
+    accepted = {}
+    for part in (header or "").split(","):
+        m = ACCEPT_ENCODING_RE.match(part)
+        if not m:
+            continue
+        try:
+            q = float(m.group(2)) if m.group(2) is not None else 1.0
+        except ValueError:
+            continue
+        accepted[m.group(1).lower()] = q
+    return accepted
+
+
+def choose_encoding(request, available=None):
+    """
+    Choose the content encoding for a response to request, from the
+    available encodings (default SUPPORTED_ENCODINGS, in preference order).
+
+    Returns the encoding name or None for identity.
+    """
+    accepted = parse_accept_encoding(request.META.get("HTTP_ACCEPT_ENCODING"))
+    best, best_q = None, 0
+    for encoding in (SUPPORTED_ENCODINGS if available is None else available):
+        q = accepted.get(encoding, accepted.get("*", 0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body, encoding, level=None):
+    """
+    Compress body bytes with the given encoding ("gzip" or "br").
+    """
+    if encoding == "gzip":
+        # mtime=0 keeps the output (and ETags derived from it) stable.
+        return gzip.compress(body, compresslevel=level or GZIP_LEVEL, mtime=0)
+    if encoding == "br" and brotli is not None:
+        return brotli.compress(body, quality=level or BROTLI_QUALITY)
+    raise ValueError("Unsupported content encoding: {}".format(encoding))
+
+
+def compress_stream(chunks, encoding, level=None):
+    """
+    Incrementally compress an iterable of body chunks (bytes).
+    """
+    if encoding == "gzip":
+        compressor = zlib.compressobj(level or GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+    elif encoding == "br" and brotli is not None:
+        compressor = brotli.Compressor(quality=level or BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    else:
+        raise ValueError("Unsupported content encoding: {}".format(encoding))
+
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with gzip or brotli, as negotiated with Accept-Encoding.
+
+    Only applies to paths matching settings.COMPRESSION_PATHS_REGEX (API
+    responses, not HTML pages with CSRF tokens), to responses without a
+    Content-Encoding and, unless streamed, of at least
+    settings.COMPRESSION_MIN_SIZE bytes. Levels are set with
+    settings.COMPRESSION_GZIP_LEVEL and settings.COMPRESSION_BROTLI_QUALITY.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.paths_re = re.compile(settings.COMPRESSION_PATHS_REGEX)
+        self.levels = {
+            "gzip": settings.COMPRESSION_GZIP_LEVEL,
+            "br": settings.COMPRESSION_BROTLI_QUALITY,
+        }
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if not self.paths_re.search(request.path) or response.has_header("Content-Encoding"):
+            return response
+        if not response.streaming and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        encoding = choose_encoding(request)
+        if encoding is None:
+            return response
+
+        level = self.levels[encoding]
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding, level)
+            del response["Content-Length"]
+        else:
+            compressed = compress(response.content, encoding, level)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response["Content-Length"] = str(len(compressed))
+
+        # The compressed body is not byte for byte the strong ETag's representation.
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+
+        response["Content-Encoding"] = encoding
+        return response
@@ -0,0 +1,362 @@
+import threading
+import time
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from oauth2_provider.settings import oauth2_settings
+
+from .aggregation import CountIf, aggregate_counts_by
+
+
+"""
+  Incrementally maintained metric counters.
+
+  Row counts of the large tables (globally and per application) kept in
+  the MetricCounter table, so the current figures are read in O(1)
+  instead of with full table COUNTs:
+
+    get_counter("token"), get_counter("grant", application_id=app.id)
+
+  Each counter is declared by a CounterSpec (METRIC_COUNTERS). The
+  post_save (created) and post_delete receivers of the counted models
+  record the counter changes, paths that bypass model signals
+  (bulk_create, raw SQL) call objects_created(), objects_deleted() or
+  add_counts() themselves.
+
+  The changes are written with transaction.on_commit(), after the row
+  changes commit, so the request transactions never lock the (hot)
+  global counter rows. Changes of a rolled back transaction are never
+  written; changes lost between a commit and their write (process
+  crash) are repaired by reconcile_counters().
+
+  Inside batched_counts() the deltas are summed and written once on exit,
+  so bulk paths pay a constant number of counter updates.
+
+  reconcile_counters() repairs any drift with a full recount, and is run
+  periodically by the reconcile_metric_counters management command. The
+  full table counts of log_global_state_metrics stay as the audit
+  verification of these figures.
+"""
+
+# application_id of the global counter of a name
+GLOBAL = 0
+
+# Drifted counters listed in the reconcile summary
+MAX_REPORTED_DRIFT = 100
+
+_batched_counts_state = threading.local()
+
+
+class CounterSpec:
+    """
+    Count of the rows of model (an "<app_label>.<ModelName>" label) matching q.
+
+    match(instance) is the python version of q, to tell if a created or
+    deleted instance is counted. per_application also keeps a counter per
+    the instance's application_id.
+    """
+
+    def __init__(self, name, model, q=None, match=None, per_application=False):
+        self.name = name
+        self.model_label = model
+        self.q = q
+        self.match = match
+        self.per_application = per_application
+
+    @property
+    def model(self):
+        return django_apps.get_model(self.model_label)
+
+    def get_queryset(self):
+        queryset = self.model._base_manager.all()
+        return queryset.filter(self.q) if self.q is not None else queryset
+
+    def matches(self, instance):
+        return self.match is None or self.match(instance)
+
+
+def _is_real_crosswalk(crosswalk):
+    return bool(crosswalk._fhir_id) and not crosswalk._fhir_id.startswith("-")
+
+
+def _is_synthetic_crosswalk(crosswalk):
+    return bool(crosswalk._fhir_id) and crosswalk._fhir_id.startswith("-")
+
+
+METRIC_COUNTERS = [
+    CounterSpec("crosswalk", "bluebutton.Crosswalk"),
+    # Same filters as Crosswalk.real_objects/synth_objects
+    CounterSpec("crosswalk_real", "bluebutton.Crosswalk",
+                q=~Q(_fhir_id__startswith="-") & ~Q(_fhir_id=""), match=_is_real_crosswalk),
+    CounterSpec("crosswalk_synthetic", "bluebutton.Crosswalk",
+                q=Q(_fhir_id__startswith="-"), match=_is_synthetic_crosswalk),
+    CounterSpec("archived_crosswalk", "bluebutton.ArchivedCrosswalk"),
+    CounterSpec("grant", "authorization.DataAccessGrant", per_application=True),
+    CounterSpec("archived_grant", "authorization.ArchivedDataAccessGrant", per_application=True),
+    CounterSpec("token", oauth2_settings.ACCESS_TOKEN_MODEL, per_application=True),
+    CounterSpec("archived_token", "dot_ext.ArchivedToken", per_application=True),
+]
+
+
+def get_counter_specs(names=None):
+    return [spec for spec in METRIC_COUNTERS if names is None or spec.name in names]
+
+
+def _get_model():
+    return django_apps.get_model("core", "MetricCounter")
+
+
+def _upsert_counters(name, deltas):
+    """
+    Add the {application_id: delta} deltas to the counters of name with a
+    single INSERT ... ON CONFLICT DO UPDATE, creating the missing counters.
+    """
+    rows = sorted((application_id, delta) for application_id, delta in deltas.items() if delta)
+    if not rows:
+        return
+
+    MetricCounter = _get_model()
+    connection = connections[router.db_for_write(MetricCounter)]
+    qn = connection.ops.quote_name
+    table = qn(MetricCounter._meta.db_table)
+    updated_at = MetricCounter._meta.get_field("updated_at").get_db_prep_value(
+        timezone.now(), connection)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO {table} ({name}, {application_id}, {value}, {updated_at}) VALUES {rows}"
+            " ON CONFLICT ({name}, {application_id}) DO UPDATE"
+            " SET {value} = {table}.{value} + excluded.{value}, {updated_at} = excluded.{updated_at}".format(
+                table=table,
+                name=qn("name"),
+                application_id=qn("application_id"),
+                value=qn("value"),
+                updated_at=qn("updated_at"),
+                rows=", ".join(["(%s, %s, %s, %s)"] * len(rows)),
+            ),
+            [param for application_id, delta in rows for param in (name, application_id, delta, updated_at)],
+        )
+
+
+def _write_counts(counts_by_name):
+    for name, counts_by_application in sorted(counts_by_name.items()):
+        deltas = {
+            application_id: delta for application_id, delta in counts_by_application.items()
+            if application_id is not None
+        }
+        deltas[GLOBAL] = sum(counts_by_application.values())
+        _upsert_counters(name, deltas)
+
+
+def _add_counts_on_commit(counts_by_name):
+    """
+    Write the {name: {application_id: delta}} counts, one statement per
+    name, once the current transaction commits (right away outside of one).
+    """
+    if not settings.METRIC_COUNTERS_ENABLED:
+        return
+
+    counts_by_name = {name: dict(counts) for name, counts in counts_by_name.items() if any(counts.values())}
+    if counts_by_name:
+        transaction.on_commit(lambda: _write_counts(counts_by_name),
+                              using=router.db_for_write(_get_model()))
+
+
+def add_counts(name, counts_by_application):
+    """
+    Add the {application_id: delta} counts to the per application
+    counters of name, and their sum to its global counter, in one
+    statement once the current transaction commits.
+    """
+    batched = getattr(_batched_counts_state, "deltas", None)
+    if batched is not None:
+        batched[name].update(counts_by_application)
+    else:
+        _add_counts_on_commit({name: counts_by_application})
+
+
+def get_counter(name, application_id=GLOBAL):
+    """
+    Return the value of a counter, None if it was never set.
+    """
+    return (
+        _get_model().objects.filter(name=name, application_id=application_id)
+        .values_list("value", flat=True)
+        .first()
+    )
+
+
+def get_counters(names=None):
+    """
+    Return {name: value} of the global counters.
+    """
+    counters = _get_model().objects.filter(application_id=GLOBAL)
+    if names is not None:
+        counters = counters.filter(name__in=names)
+    return dict(counters.values_list("name", "value"))
+
+
+def get_application_counters(names=None):
+    """
+    Return {application_id: {name: value}} of the per application counters.
+    """
+    counters = _get_model().objects.exclude(application_id=GLOBAL)
+    if names is not None:
+        counters = counters.filter(name__in=names)
+
+    returned = defaultdict(dict)
+    for name, application_id, value in counters.values_list("name", "application_id", "value"):
+        returned[application_id][name] = value
+    return dict(returned)
+
+
+@contextmanager
+def batched_counts():
+    """
+    Sum the counter changes of the model instances created or deleted in
+    the current thread, and write them once when the outermost block exits.
+    """
+    deltas = getattr(_batched_counts_state, "deltas", None)
+    if deltas is not None:
+        yield
+        return
+
+    _batched_counts_state.deltas = deltas = defaultdict(Counter)
+    try:
+        yield
+    finally:
+        _batched_counts_state.deltas = None
+
+    _add_counts_on_commit(deltas)
+
+
+def _add_instances(instances, sign):
+    batched = getattr(_batched_counts_state, "deltas", None)
+    deltas = defaultdict(Counter) if batched is None else batched
+    for instance in instances:
+        label = instance._meta.concrete_model._meta.label
+        for spec in METRIC_COUNTERS:
+            if spec.model_label == label and spec.matches(instance):
+                application_id = instance.application_id if spec.per_application else None
+                deltas[spec.name][application_id] += sign
+
+    if batched is None:
+        _add_counts_on_commit(deltas)
+
+
+def objects_created(instances):
+    """
+    Count instances inserted without a post_save signal (bulk_create).
+    """
+    _add_instances(instances, 1)
+
+
+def objects_deleted(instances):
+    """
+    Uncount instances deleted without a post_delete signal.
+    """
+    _add_instances(instances, -1)
+
+
+def count_created(sender, instance=None, created=False, raw=False, **kwargs):
+    if created and not raw:
+        _add_instances([instance], 1)
+
+
+def count_deleted(sender, instance=None, **kwargs):
+    _add_instances([instance], -1)
+
+
+def connect_counter_signals():
+    """
+    Connect the receivers for the counted models, and their proxy models
+    (signals are sent with the proxy as sender).
+
+    CALLED FROM: apps.core.apps.CoreConfig.ready()
+    """
+    labels = {spec.model_label for spec in METRIC_COUNTERS}
+    for model in django_apps.get_models():
+        if model._meta.concrete_model._meta.label in labels:
+            post_save.connect(count_created, sender=model, dispatch_uid="metric_counters_created")
+            post_delete.connect(count_deleted, sender=model, dispatch_uid="metric_counters_deleted")
+
+
+def _recount(spec):
+    """
+    Return {application_id: count} (GLOBAL for the total) for a counter, with full scans.
+    """
+    queryset = spec.get_queryset()
+    if not spec.per_application:
+        return {GLOBAL: queryset.count()}
+
+    counts = {
+        application_id: row["value"]
+        for application_id, row in aggregate_counts_by(queryset, "application", {"value": CountIf()}).items()
+    }
+    # Rows without an application only count globally.
+    counts[GLOBAL] = sum(counts.values())
+    counts.pop(None, None)
+    return counts
+
+
+def reconcile_counters(names=None):
+    """
+    Recount the counters (all, or the names given) and repair any drift.
+
+    Increments committed between a counter's recount and its update are
+    lost, so run it when the tables are quiet; the next run repairs it.
+
+    Returns a summary dict of the counters with drift.
+    """
+    MetricCounter = _get_model()
+    start_time = time.time()
+    drift = []
+
+    for spec in get_counter_specs(names):
+        expected = _recount(spec)
+
+        with transaction.atomic():
+            current = dict(
+                MetricCounter.objects.select_for_update()
+                .filter(name=spec.name)
+                .values_list("application_id", "value")
+            )
+            for application_id in set(current) | set(expected):
+                value = current.get(application_id)
+                expected_value = expected.get(application_id, 0)
+                if value == expected_value:
+                    continue
+
+                if value is None:
+                    MetricCounter.objects.create(name=spec.name, application_id=application_id,
+                                                 value=expected_value)
+                elif application_id != GLOBAL and not expected_value:
+                    MetricCounter.objects.filter(name=spec.name, application_id=application_id).delete()
+                else:
+                    MetricCounter.objects.filter(name=spec.name, application_id=application_id).update(
+                        value=expected_value, updated_at=timezone.now())
+
+                if value is not None or expected_value:
+                    drift.append({
+                        "name": spec.name,
+                        "application_id": application_id,
+                        "value": value,
+                        "expected": expected_value,
+                    })
+
+    summary = {
+        "type": "metric_counters_reconcile",
+        "counters": [spec.name for spec in get_counter_specs(names)],
+        "drift_count": len(drift),
+        "drift": drift[:MAX_REPORTED_DRIFT],
+        "elapsed": round(time.time() - start_time, 3),
+    }
+
+    return summary
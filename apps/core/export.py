@@ -0,0 +1,175 @@
+import csv
+import gzip
+import io
+
+from contextlib import contextmanager
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import CharField, Value
+from django.db.models.constants import LOOKUP_SEP
+
+from .aggregation import estimated_count
+
+
+"""
+  Memory bounded CSV export of a model's rows (the model2csv command).
+
+  The rows are read with QuerySet.iterator() in chunks of chunk_size (a
+  server side cursor on Postgres), so memory use doesn't grow with the
+  table size:
+
+    with open_output("users.csv.gz", compress=True) as out:
+        write_csv(out, User, ["id", "username", "userprofile__user_type"])
+
+  Columns are field names or relation paths ("user__username"). The
+  forward foreign key and one to one relations they follow are loaded
+  with select_related, instead of one query per row. A relation column
+  ("user") exports str() of the related object.
+
+  copy_csv() has Postgres write the CSV itself with COPY ... TO STDOUT:
+  faster, but in Postgres' formatting (NULL as an empty value, relation
+  columns as the related primary key).
+"""
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def get_default_columns(model):
+    return [f.name for f in model._meta.fields]
+
+
+def get_related_path(model, column):
+    """
+    Return the select_related path needed by a column, "" for a local field.
+
+    Raises ValueError for unknown columns and for columns through many
+    valued relations.
+    """
+    parts = column.split(LOOKUP_SEP)
+    related = []
+    for i, part in enumerate(parts):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            raise ValueError("Unknown column {} of {}".format(column, model._meta.label))
+
+        if field.many_to_many or field.one_to_many or not (field.concrete or field.one_to_one):
+            raise ValueError("Column {} of {} is not single valued".format(column, model._meta.label))
+
+        if field.is_relation:
+            related.append(part)
+            model = field.related_model
+        elif i < len(parts) - 1:
+            raise ValueError("Unknown column {} of {}".format(column, model._meta.label))
+    return LOOKUP_SEP.join(related)
+
+
+def get_export_queryset(model, columns):
+    paths = {get_related_path(model, column) for column in columns} - {""}
+    queryset = model._base_manager.all()
+    if paths:
+        queryset = queryset.select_related(*sorted(paths))
+    return queryset.order_by("pk")
+
+
+def get_column_value(instance, column):
+    value = instance
+    for part in column.split(LOOKUP_SEP):
+        # A missing reverse one to one object raises an AttributeError
+        value = getattr(value, part, None)
+        if value is None:
+            break
+    return str(value)
+
+
+def export_rows(queryset, columns, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yield a list of str values per row of queryset, reading chunk_size rows at a time.
+    """
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        yield [get_column_value(instance, column) for column in columns]
+
+
+def write_csv(out, model, columns=None, extra=None, chunk_size=EXPORT_CHUNK_SIZE, progress=None, limit=None):
+    """
+    Write the rows of model (the first limit ones when given) as CSV with
+    a header line to the text file out.
+
+    extra is a list of (header, value) columns appended to every row.
+    progress(rows written, estimated total or None) is called after every
+    chunk_size rows. Returns the number of rows written.
+    """
+    columns = columns or get_default_columns(model)
+    queryset = get_export_queryset(model, columns)
+    if limit is not None:
+        queryset = queryset[:limit]
+    extra = extra or []
+    extra_values = [value for header, value in extra]
+    total = estimated_count(queryset) if progress is not None else None
+
+    writer = csv.writer(out, quoting=csv.QUOTE_ALL)
+    writer.writerow(columns + [header for header, value in extra])
+
+    rows = 0
+    for row in export_rows(queryset, columns, chunk_size):
+        writer.writerow(row + extra_values)
+        rows += 1
+        if progress is not None and rows % chunk_size == 0:
+            progress(rows, total)
+
+    if progress is not None:
+        progress(rows, total)
+    return rows
+
+
+def copy_csv(out, model, columns=None, extra=None):
+    """
+    Write the rows of model as CSV with a header line to the text file out
+    with Postgres' COPY ... TO STDOUT, see write_csv().
+    """
+    columns = columns or get_default_columns(model)
+    for column in columns:
+        get_related_path(model, column)
+    extra = extra or []
+
+    queryset = model._base_manager.order_by("pk")
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        raise ValueError("COPY exports need a PostgreSQL database, not {}".format(connection.vendor))
+
+    extra_names = ["_export_extra_{}".format(i) for i in range(len(extra))]
+    queryset = queryset.annotate(**{
+        name: Value(str(value), output_field=CharField()) for name, (header, value) in zip(extra_names, extra)
+    }).values_list(*(columns + extra_names))
+
+    csv.writer(out, quoting=csv.QUOTE_ALL).writerow(columns + [header for header, value in extra])
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        query = cursor.mogrify(sql, params).decode(connection.connection.encoding)
+        cursor.copy_expert("COPY ({}) TO STDOUT WITH (FORMAT csv, FORCE_QUOTE *)".format(query), out)
+
+
+@contextmanager
+def open_output(path=None, compress=False, stdout=None):
+    """
+    Yield a text file writing to path (the stdout text stream when None),
+    gzip compressed when compress.
+    """
+    if path is None:
+        if not compress:
+            yield stdout
+            stdout.flush()
+            return
+        with gzip.GzipFile(fileobj=stdout.buffer, mode="wb") as compressed:
+            with io.TextIOWrapper(compressed, encoding="utf-8", newline="") as out:
+                yield out
+        stdout.buffer.flush()
+        return
+
+    if compress:
+        with gzip.open(path, "wt", encoding="utf-8", newline="") as out:
+            yield out
+    else:
+        with open(path, "w", encoding="utf-8", newline="") as out:
+            yield out
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from apps.core.retention import RETENTION_BATCH_SIZE, apply_retention_policies
+
+
+class Command(BaseCommand):
+    help = ('Delete rows of transient tables that are past the retention '
+            'policies in settings.RETENTION_POLICIES, in keyset ordered batches.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("-m", "--model", action="append", default=[],
+                            help="Only apply the policy for this model, as <app_label>.<ModelName> (repeatable).")
+        parser.add_argument("-b", "--batch-size", type=int, default=RETENTION_BATCH_SIZE,
+                            help="Number of rows deleted per batch.")
+        parser.add_argument("-p", "--pause", type=float, default=0,
+                            help="Seconds to pause between batches.")
+        parser.add_argument("-d", "--dry-run", action='store_true',
+                            help="Only count the rows qualifying for deletion.")
+
+    def handle(self, *args, **options):
+        for stats in apply_retention_policies(models=options["model"],
+                                              batch_size=options["batch_size"],
+                                              pause=options["pause"],
+                                              dry_run=options["dry_run"]):
+            if stats["dry_run"]:
+                self.stdout.write("{}: {} rows qualify ({})".format(
+                    stats["model"], stats["qualifying_count"], stats["policy"]))
+            else:
+                self.stdout.write("{}: deleted={}, batches={}, elapsed={}s".format(
+                    stats["model"], stats["deleted_count"], stats["batch_count"], stats["elapsed"]))
@@ -0,0 +1,92 @@
+import gzip
+import json
+import os
+import statistics
+import time
+import zlib
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.core.compression import brotli, compress
+
+
+EOB_BUNDLE_FILE = os.path.join(settings.BASE_DIR, "apps/fhir/bluebutton/tests/fhir_resources/eob_search_v2.json")
+
+
+def build_eob_bundle(entries, path=EOB_BUNDLE_FILE):
+    """
+    Build a searchset Bundle with the given number of EOB entries,
+    cycling over the entries of a sample BFD EOB search response.
+    """
+    with open(path, "r") as f:
+        bundle = json.load(f)
+    sample = bundle["entry"]
+    bundle["entry"] = [sample[i % len(sample)] for i in range(entries)]
+    bundle["total"] = entries
+    return json.dumps(bundle).encode("utf-8")
+
+
+def _median_ms(func, runs):
+    times = []
+    for i in range(runs):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(times)
+
+
+def benchmark(body, runs=5, mbps=10.0):
+    """
+    Return a result dict per encoding/level, with the compressed size and the
+    transfer time saved at the given bandwidth net of (de)compression time.
+    """
+    decompressors = {"gzip": gzip.decompress}
+    variants = [("gzip", level) for level in (1, 6, 9)]
+    if brotli is not None:
+        decompressors["br"] = brotli.decompress
+        variants += [("br", quality) for quality in (1, 5, 11)]
+
+    transfer_ms = len(body) * 8 / (mbps * 1000)
+    results = []
+    for encoding, level in variants:
+        compressed, compress_ms = _median_ms(lambda: compress(body, encoding, level), runs)
+        _, decompress_ms = _median_ms(lambda: decompressors[encoding](compressed), runs)
+        compressed_transfer_ms = len(compressed) * 8 / (mbps * 1000)
+        results.append({
+            "encoding": encoding,
+            "level": level,
+            "size": len(body),
+            "compressed_size": len(compressed),
+            "ratio": round(len(body) / len(compressed), 1),
+            "compress_ms": round(compress_ms, 2),
+            "decompress_ms": round(decompress_ms, 2),
+            "saved_ms": round(transfer_ms - compressed_transfer_ms - compress_ms - decompress_ms, 1),
+        })
+    return results
+
+
+class Command(BaseCommand):
+    help = ('Benchmark response compression of FHIR ExplanationOfBenefit search bundles: '
+            'bytes and latency saved per encoding and level.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("-e", "--entries", type=int, action="append",
+                            help="EOB entries per bundle (repeatable, default 10 and 50).")
+        parser.add_argument("-r", "--runs", type=int, default=5, help="Timing runs per measurement.")
+        parser.add_argument("-b", "--bandwidth", type=float, default=10.0,
+                            help="Client bandwidth in Mbit/s used for the transfer time.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("zlib {}, brotli {}".format(
+            zlib.ZLIB_VERSION, getattr(brotli, "__version__", "installed") if brotli else "not installed"))
+
+        for entries in options["entries"] or [10, 50]:
+            body = build_eob_bundle(entries)
+            self.stdout.write("\nEOB bundle, {} entries, {} bytes, {} Mbit/s:".format(
+                entries, len(body), options["bandwidth"]))
+            self.stdout.write("{:<6}{:>6}{:>12}{:>8}{:>13}{:>15}{:>11}".format(
+                "enc", "level", "bytes", "ratio", "compress_ms", "decompress_ms", "saved_ms"))
+            for r in benchmark(body, options["runs"], options["bandwidth"]):
+                self.stdout.write("{encoding:<6}{level:>6}{compressed_size:>12}{ratio:>8}"
+                                  "{compress_ms:>13}{decompress_ms:>15}{saved_ms:>11}".format(**r))
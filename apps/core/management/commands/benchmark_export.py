@@ -0,0 +1,104 @@
+import time
+import tracemalloc
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.export import EXPORT_CHUNK_SIZE, get_default_columns, get_export_queryset, write_csv
+
+
+# Largest allowed growth of the chunked export's peak memory across row counts
+FLAT_MEMORY_FACTOR = 1.5
+
+
+class NullOutput:
+    """
+    Text file discarding what is written, so only the export's own memory is measured.
+    """
+
+    def write(self, s):
+        return len(s)
+
+
+def _traced_peak(func):
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, peak, elapsed
+
+
+def _export_all_rows(model, columns, rows):
+    # The former model2csv loop: the queryset caches every row
+    written = 0
+    for instance in get_export_queryset(model, columns)[:rows]:
+        [str(getattr(instance, column)) for column in columns]
+        written += 1
+    return written
+
+
+def benchmark(model, row_counts, columns=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Return a result dict per row count, with the peak traced Python memory
+    of the chunked export and of iterating the whole queryset.
+    """
+    columns = columns or get_default_columns(model)
+    results = []
+    for rows in row_counts:
+        written, chunked_peak, chunked_s = _traced_peak(
+            lambda: write_csv(NullOutput(), model, columns, chunk_size=chunk_size, limit=rows))
+        _, all_rows_peak, all_rows_s = _traced_peak(lambda: _export_all_rows(model, columns, rows))
+        results.append({
+            "rows": written,
+            "chunked_peak_kb": round(chunked_peak / 1024),
+            "chunked_s": round(chunked_s, 3),
+            "all_rows_peak_kb": round(all_rows_peak / 1024),
+            "all_rows_s": round(all_rows_s, 3),
+        })
+    return results
+
+
+def is_flat(results, factor=FLAT_MEMORY_FACTOR):
+    """
+    True when the chunked export's peak memory grows by at most factor
+    from the smallest to the largest row count.
+    """
+    peaks = [r["chunked_peak_kb"] for r in sorted(results, key=lambda r: r["rows"])]
+    return peaks[-1] <= max(peaks[0], 1) * factor
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the memory use of model2csv exports (see apps.core.export) over the first '
+            'rows of a model: peak memory per row count, chunked vs. caching the whole queryset.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("--application", default="auth", help="application name")
+        parser.add_argument("--model", default="User", help="model name")
+        parser.add_argument("-n", "--rows", type=int, action="append",
+                            help="Rows exported (repeatable, default 1000, 10000 and 100000).")
+        parser.add_argument("--chunk_size", type=int, default=EXPORT_CHUNK_SIZE,
+                            help="Rows read from the database at a time.")
+        parser.add_argument("--check", action="store_true", default=False,
+                            help="Fail unless the chunked export's peak memory is flat across row counts.")
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options["application"], options["model"])
+        except LookupError as e:
+            raise CommandError(e)
+
+        results = benchmark(model, options["rows"] or [1000, 10000, 100000], chunk_size=options["chunk_size"])
+
+        self.stdout.write("{}, chunk size {}:".format(model._meta.label, options["chunk_size"]))
+        self.stdout.write("{:>10}{:>18}{:>12}{:>18}{:>12}".format(
+            "rows", "chunked_peak_kb", "chunked_s", "all_rows_peak_kb", "all_rows_s"))
+        for r in results:
+            self.stdout.write("{rows:>10}{chunked_peak_kb:>18}{chunked_s:>12}"
+                              "{all_rows_peak_kb:>18}{all_rows_s:>12}".format(**r))
+
+        if options["check"] and not is_flat(results):
+            raise CommandError("Chunked export memory grows with the row count")
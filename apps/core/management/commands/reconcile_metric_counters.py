@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+import apps.logging.request_logger as logging
+
+from apps.core.counters import get_counter_specs, reconcile_counters
+
+
+logger = logging.getLogger(logging.AUDIT_GLOBAL_STATE_METRICS_LOGGER)
+
+
+class Command(BaseCommand):
+    help = ('Recount the incrementally maintained metric counters (see apps.core.counters) '
+            'with full table scans and repair any drift.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("-c", "--counter", action="append", default=None,
+                            choices=[spec.name for spec in get_counter_specs()],
+                            help="Only reconcile this counter (repeatable).")
+
+    def handle(self, *args, **options):
+        summary = reconcile_counters(options["counter"])
+        logger.info(summary)
+
+        for drift in summary["drift"]:
+            self.stdout.write("{name}[{application_id}]: {value} -> {expected}".format(**drift))
+        self.stdout.write("Reconciled {} counters, drift={}, elapsed={}s".format(
+            len(summary["counters"]), summary["drift_count"], summary["elapsed"]))
@@ -0,0 +1,467 @@
+import bisect
+import glob
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+"""
+  Prometheus style operational metrics: counters, gauges and histograms,
+  exposed in the Prometheus text format (see apps.health.views.Metrics).
+
+      FETCHES = Counter("bb2_fetches", "FHIR fetches", ["resource_type"])
+      FETCHES.labels(resource_type="Patient").inc()
+
+  Metric values are kept per process. When settings.METRICS_MULTIPROC_DIR
+  is set (a directory shared by the gunicorn/uwsgi workers, emptied when
+  the service starts) each process writes its values to a memory mapped
+  file in that directory and the exposition adds up the files of all the
+  processes, otherwise the values are kept in memory and only the
+  current process' values are exposed.
+
+  Gauges are aggregated across processes with their multiprocess_mode:
+    - "sum": Sum of the processes' values (default).
+    - "max": Largest of the processes' values.
+    - "all": One sample per process, with a "pid" label.
+"""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+INF = float("inf")
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0, INF)
+
+METRIC_NAME_REGEX = re.compile(r"^[a-zA-Z_:][a-zA-Z0-9_:]*$")
+LABEL_NAME_REGEX = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+
+GAUGE_MODES = ["sum", "max", "all"]
+
+VALUES_FILE_FORMAT = "metrics_{}.db"
+VALUES_FILE_REGEX = re.compile(r"metrics_(\d+)\.db$")
+
+
+def _format_value(value):
+    if value == INF:
+        return "+Inf"
+    if value == -INF:
+        return "-Inf"
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value))
+
+
+def _escape_label_value(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def _sample_key(name, suffix, labels):
+    return json.dumps([name, suffix, labels])
+
+
+class MmapedDict:
+    """
+    A process' metric values in a memory mapped file.
+
+    The file starts with the number of bytes used (4 bytes, padded to 8),
+    followed by entries of: key length (4 bytes), utf-8 key padded so the
+    value is 8 byte aligned, value (8 byte double). New entries are
+    written before the used size is updated, so readers of the file never
+    see a partial entry.
+    """
+
+    INITIAL_SIZE = 1 << 16
+
+    def __init__(self, path):
+        self._f = open(path, "a+b")
+        if os.fstat(self._f.fileno()).st_size == 0:
+            self._f.truncate(self.INITIAL_SIZE)
+        self._capacity = os.fstat(self._f.fileno()).st_size
+        self._m = mmap.mmap(self._f.fileno(), self._capacity)
+        self._positions = {}
+        self._used = struct.unpack_from("i", self._m, 0)[0]
+        if self._used == 0:
+            self._used = 8
+            struct.pack_into("i", self._m, 0, self._used)
+        for key, _, pos in self._read_entries(self._m, self._used):
+            self._positions[key] = pos
+
+    @staticmethod
+    def _read_entries(data, used):
+        pos = 8
+        while pos < used:
+            length = struct.unpack_from("i", data, pos)[0]
+            key = bytes(data[pos + 4:pos + 4 + length]).decode("utf-8")
+            pos += 4 + length + (-(length + 4) % 8)
+            yield key, struct.unpack_from("d", data, pos)[0], pos
+            pos += 8
+
+    @classmethod
+    def read_all_values(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < 8:
+            return []
+        return [(key, value) for key, value, _ in cls._read_entries(data, struct.unpack_from("i", data, 0)[0])]
+
+    def _init_value(self, key):
+        encoded = key.encode("utf-8")
+        entry = (struct.pack("i", len(encoded)) + encoded + b" " * (-(len(encoded) + 4) % 8)
+                 + struct.pack("d", 0.0))
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._f.truncate(self._capacity)
+            self._m.close()
+            self._m = mmap.mmap(self._f.fileno(), self._capacity)
+        self._m[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        struct.pack_into("i", self._m, 0, self._used)
+        self._positions[key] = self._used - 8
+
+    def read_value(self, key):
+        if key not in self._positions:
+            self._init_value(key)
+        return struct.unpack_from("d", self._m, self._positions[key])[0]
+
+    def write_value(self, key, value):
+        if key not in self._positions:
+            self._init_value(key)
+        struct.pack_into("d", self._m, self._positions[key], value)
+
+    def close(self):
+        self._m.close()
+        self._f.close()
+
+
+class MemoryValues:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, key, value):
+        with self._lock:
+            self._values[key] = float(value)
+
+    def read_all(self):
+        with self._lock:
+            return [(os.getpid(), list(self._values.items()))]
+
+
+class MultiProcessValues:
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._dict = MmapedDict(os.path.join(directory, VALUES_FILE_FORMAT.format(os.getpid())))
+
+    def inc(self, key, amount):
+        with self._lock:
+            self._dict.write_value(key, self._dict.read_value(key) + amount)
+
+    def set(self, key, value):
+        with self._lock:
+            self._dict.write_value(key, float(value))
+
+    def read_all(self):
+        processes = []
+        for path in glob.glob(os.path.join(self.directory, VALUES_FILE_FORMAT.format("*"))):
+            m = VALUES_FILE_REGEX.search(path)
+            if m:
+                processes.append((int(m.group(1)), MmapedDict.read_all_values(path)))
+        return processes
+
+    def close(self):
+        self._dict.close()
+
+
+_values = None
+_values_pid = None
+_values_lock = threading.Lock()
+
+
+def get_values():
+    """
+    The current process' value store.
+    """
+    global _values, _values_pid
+    if _values is None or _values_pid != os.getpid():
+        with _values_lock:
+            if _values is None or _values_pid != os.getpid():
+                directory = settings.METRICS_MULTIPROC_DIR
+                _values = MultiProcessValues(directory) if directory else MemoryValues()
+                _values_pid = os.getpid()
+    return _values
+
+
+@receiver(setting_changed)
+def reset_values(setting=None, **kwargs):
+    global _values
+    if setting == "METRICS_MULTIPROC_DIR":
+        if isinstance(_values, MultiProcessValues) and _values_pid == os.getpid():
+            _values.close()
+        _values = None
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError("Duplicate metric name: {}".format(metric.name))
+            self._metrics[metric.name] = metric
+
+    def collect(self):
+        """
+        Returns {metric name: {(suffix, labels): value}} for the values of
+        all the processes.
+        """
+        samples = {name: {} for name in self._metrics}
+        for pid, values in get_values().read_all():
+            for key, value in values:
+                name, suffix, labels = json.loads(key)
+                metric = self._metrics.get(name)
+                if metric is None:
+                    continue
+                labels = tuple(tuple(label) for label in labels)
+                metric_samples = samples[name]
+                if metric.type == "gauge" and metric.multiprocess_mode == "all":
+                    labels += (("pid", str(pid)),)
+                sample = (suffix, labels)
+                if metric.type == "gauge" and metric.multiprocess_mode == "max":
+                    metric_samples[sample] = max(metric_samples.get(sample, value), value)
+                else:
+                    metric_samples[sample] = metric_samples.get(sample, 0.0) + value
+        return samples
+
+    def generate_text(self):
+        """
+        The metrics in the Prometheus text exposition format.
+        """
+        samples = self.collect()
+        lines = []
+        for name in sorted(self._metrics):
+            metric = self._metrics[name]
+            lines.append("# HELP {} {}".format(metric.family, metric.documentation.replace("\n", " ")))
+            lines.append("# TYPE {} {}".format(metric.family, metric.type))
+            for sample_name, labels, value in metric.samples(samples[name]):
+                if labels:
+                    lines.append("{}{{{}}} {}".format(sample_name, ",".join(
+                        '{}="{}"'.format(k, _escape_label_value(v)) for k, v in labels), _format_value(value)))
+                else:
+                    lines.append("{} {}".format(sample_name, _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        if not METRIC_NAME_REGEX.match(name):
+            raise ValueError("Invalid metric name: {}".format(name))
+        for labelname in labelnames:
+            if not LABEL_NAME_REGEX.match(labelname) or labelname in ("le", "pid"):
+                raise ValueError("Invalid metric label name: {}".format(labelname))
+        self.name = name
+        self.family = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *labelvalues, **labelkwargs):
+        if labelkwargs:
+            if labelvalues or sorted(labelkwargs) != sorted(self.labelnames):
+                raise ValueError("Incorrect label names for {}".format(self.name))
+            labelvalues = tuple(str(labelkwargs[n]) for n in self.labelnames)
+        else:
+            if len(labelvalues) != len(self.labelnames):
+                raise ValueError("Incorrect label count for {}".format(self.name))
+            labelvalues = tuple(str(v) for v in labelvalues)
+
+        child = self._children.get(labelvalues)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(
+                    labelvalues, self.child_class(self, list(zip(self.labelnames, labelvalues))))
+        return child
+
+    def _unlabelled(self):
+        if self.labelnames:
+            raise ValueError("Metric {} has labels, use labels()".format(self.name))
+        return self.labels()
+
+    def samples(self, values):
+        """
+        (sample name, labels, value) of the collected values, sorted by labels.
+        """
+        for (suffix, labels), value in sorted(values.items()):
+            yield self.family + suffix, labels, value
+
+
+class CounterChild:
+    def __init__(self, metric, labels):
+        self._key = _sample_key(metric.name, "_total", labels)
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        get_values().inc(self._key, amount)
+
+
+class Counter(Metric):
+    type = "counter"
+    child_class = CounterChild
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        super().__init__(name, documentation, labelnames, registry)
+        # Counter samples are <family>_total
+        if name.endswith("_total"):
+            self.family = name[:-len("_total")]
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+
+class GaugeChild:
+    def __init__(self, metric, labels):
+        self._key = _sample_key(metric.name, "", labels)
+
+    def inc(self, amount=1):
+        get_values().inc(self._key, amount)
+
+    def dec(self, amount=1):
+        get_values().inc(self._key, -amount)
+
+    def set(self, value):
+        get_values().set(self._key, value)
+
+    @contextmanager
+    def track_inprogress(self):
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+
+class Gauge(Metric):
+    type = "gauge"
+    child_class = GaugeChild
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, multiprocess_mode="sum"):
+        if multiprocess_mode not in GAUGE_MODES:
+            raise ValueError("Unknown gauge multiprocess mode: {}".format(multiprocess_mode))
+        self.multiprocess_mode = multiprocess_mode
+        super().__init__(name, documentation, labelnames, registry)
+
+    def inc(self, amount=1):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount=1):
+        self._unlabelled().dec(amount)
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+
+class HistogramChild:
+    def __init__(self, metric, labels):
+        self._buckets = metric.buckets
+        self._bucket_keys = [_sample_key(metric.name, "_bucket", labels + [["le", _format_value(b)]])
+                             for b in metric.buckets]
+        self._sum_key = _sample_key(metric.name, "_sum", labels)
+
+    def observe(self, value):
+        values = get_values()
+        # Bucket counts are stored per bucket, made cumulative on exposition
+        values.inc(self._bucket_keys[bisect.bisect_left(self._buckets, value)], 1)
+        values.inc(self._sum_key, value)
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(Metric):
+    type = "histogram"
+    child_class = HistogramChild
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        buckets = sorted(float(b) for b in buckets)
+        if buckets[-1] != INF:
+            buckets.append(INF)
+        self.buckets = buckets
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+    def samples(self, values):
+        by_labels = {}
+        for (suffix, labels), value in values.items():
+            if suffix == "_bucket":
+                labels, le = labels[:-1], labels[-1][1]
+                by_labels.setdefault(labels, {})[le] = value
+            else:
+                by_labels.setdefault(labels, {})[suffix] = value
+
+        for labels in sorted(by_labels):
+            observed = by_labels[labels]
+            count = 0.0
+            for bucket in self.buckets:
+                le = _format_value(bucket)
+                count += observed.get(le, 0.0)
+                yield self.family + "_bucket", labels + (("le", le),), count
+            yield self.family + "_count", labels, count
+            yield self.family + "_sum", labels, observed.get("_sum", 0.0)
+
+
+@contextmanager
+def observe_request(counter, histogram, **labels):
+    """
+    Count and time a call to an upstream service. The counter gets a
+    "status" label, set it on the yielded dict (default "ok"), it is
+    "error" when the call raises.
+
+        with observe_request(REQUESTS, REQUEST_SECONDS, endpoint="token") as call:
+            response = requests.post(...)
+            call["status"] = response.status_code
+    """
+    call = {"status": "ok"}
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call["status"] = "error"
+        raise
+    finally:
+        histogram.labels(**labels).observe(time.perf_counter() - start)
+        counter.labels(status=call["status"], **labels).inc()
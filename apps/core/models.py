@@ -1,5 +1,25 @@
+from django.db import models
 from waffle.models import AbstractUserFlag
 
 
 class Flag(AbstractUserFlag):
     """ Custom version of waffle feature Flag model goes here """
+
+
+class MetricCounter(models.Model):
+    """
+    Incrementally maintained row counts, see apps.core.counters.
+
+    application_id is 0 for the global counter of a name.
+    """
+
+    name = models.CharField(max_length=64)
+    application_id = models.BigIntegerField(default=0)
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("name", "application_id")
+
+    def __str__(self):
+        return "{}[{}]={}".format(self.name, self.application_id, self.value)
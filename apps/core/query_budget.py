@@ -0,0 +1,174 @@
+import re
+import time
+
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+import apps.logging.request_logger as bb2logging
+
+
+"""
+  SQL query accounting and per-request query budgets.
+
+  track_queries() counts the queries run on all the database connections
+  of the current thread and their total time, and fingerprints the
+  statements (SQL with literals and IN lists collapsed) so statements
+  repeated many times in a request, usually an N+1 loop, can be flagged.
+
+  QueryBudgetMiddleware tracks each request against its budget: the
+  view's query_budget attribute, else settings.QUERY_BUDGET_DEFAULT.
+  Requests over budget, or repeating a statement
+  settings.QUERY_BUDGET_REPEAT_THRESHOLD times or more, are logged as a
+  "query_budget" record on the performance logger.
+
+  Tests can enforce the budgets with QueryBudgetTestMixin.
+"""
+
+performance = bb2logging.getLogger(bb2logging.PERFORMANCE_LOGGER)
+
+FINGERPRINT_SUBS = [
+    # IN lists of any length
+    (re.compile(r"\bIN\s*\((?:\s*%s\s*,)*\s*%s\s*\)", re.IGNORECASE), "IN (...)"),
+    # Quoted strings and numbers
+    (re.compile(r"'(?:[^']|'')*'"), "?"),
+    (re.compile(r"\b\d+(?:\.\d+)?\b"), "?"),
+    (re.compile(r"%s"), "?"),
+    (re.compile(r"\s+"), " "),
+]
+
+# Statements logged per flagged fingerprint, and flagged fingerprints per record
+MAX_REPORTED_FINGERPRINTS = 5
+MAX_FINGERPRINT_LENGTH = 300
+
+
+def fingerprint(sql):
+    for regex, replacement in FINGERPRINT_SUBS:
+        sql = regex.sub(replacement, sql)
+    return sql.strip()
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # django.db connection execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self, threshold):
+        """
+        (fingerprint, count) of the statements run at least threshold times, most repeated first.
+        """
+        return [(fp, n) for fp, n in self.fingerprints.most_common() if n >= threshold]
+
+    def to_dict(self, repeat_threshold=None):
+        repeat_threshold = repeat_threshold or settings.QUERY_BUDGET_REPEAT_THRESHOLD
+        return {
+            "db_queries": self.count,
+            "db_time_ms": round(self.duration * 1000, 2),
+            "db_repeated_queries": [
+                {"fingerprint": fp[:MAX_FINGERPRINT_LENGTH], "count": n}
+                for fp, n in self.repeated(repeat_threshold)[:MAX_REPORTED_FINGERPRINTS]
+            ],
+        }
+
+
+@contextmanager
+def track_queries():
+    """
+    Count the queries run in the block, on all database connections.
+
+        with track_queries() as stats:
+            ...
+        stats.count, stats.duration, stats.repeated(5)
+    """
+    stats = QueryStats()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(stats))
+        yield stats
+
+
+class QueryBudgetMiddleware:
+    """
+    Track the queries of each request and log the requests over their
+    query budget or with repeated statements.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_BUDGET_ENABLED:
+            return self.get_response(request)
+
+        request._query_budget = settings.QUERY_BUDGET_DEFAULT
+        with track_queries() as stats:
+            response = self.get_response(request)
+        request._query_stats = stats
+
+        repeated = stats.repeated(settings.QUERY_BUDGET_REPEAT_THRESHOLD)
+        over_budget = request._query_budget is not None and stats.count > request._query_budget
+        if over_budget or repeated:
+            performance.warning({
+                "type": "query_budget",
+                "request_uuid": getattr(request, "_logging_uuid", None),
+                "path": request.path,
+                "response_code": response.status_code,
+                "db_query_budget": request._query_budget,
+                "over_budget": over_budget,
+                **stats.to_dict(),
+            })
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, "view_class", None) or getattr(view_func, "cls", None)
+        budget = getattr(view_class, "query_budget", getattr(view_func, "query_budget", None))
+        if budget is not None:
+            request._query_budget = budget
+
+
+class QueryBudgetTestMixin:
+    """
+    Test case assertions for query budgets.
+    """
+
+    def _format_query_stats(self, stats):
+        return "\n".join("  {} x {}".format(n, fp) for fp, n in stats.fingerprints.most_common())
+
+    @contextmanager
+    def assertQueryBudget(self, max_queries, max_repeats=None):
+        """
+        Fail if the block runs more than max_queries queries, or (when
+        max_repeats is set) the same statement more than max_repeats times.
+        """
+        with track_queries() as stats:
+            yield stats
+        if stats.count > max_queries:
+            self.fail("{} queries run, over the budget of {}:\n{}".format(
+                stats.count, max_queries, self._format_query_stats(stats)))
+        if max_repeats is not None and stats.repeated(max_repeats + 1):
+            self.fail("Statement repeated more than {} times:\n{}".format(
+                max_repeats, self._format_query_stats(stats)))
+
+    def assertWithinQueryBudget(self, response):
+        """
+        Fail if the test client request of response ran more queries than
+        its view's query budget (see QueryBudgetMiddleware).
+        """
+        request = response.wsgi_request
+        budget, stats = request._query_budget, request._query_stats
+        if budget is not None and stats.count > budget:
+            self.fail("{} {}: {} queries run, over the view's budget of {}:\n{}".format(
+                request.method, request.path, stats.count, budget, self._format_query_stats(stats)))
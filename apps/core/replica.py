@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+import apps.logging.request_logger as bb2logging
+
+
+"""
+  Read replica routing.
+
+  Designated read-only workloads (the metrics views, admin charts and
+  exports) read from the settings.REPLICA_DATABASE_ALIAS database, so the
+  heavy aggregations don't load the primary serving token validation and
+  FHIR request authorization:
+
+    with read_replica():
+        counts = get_beneficiary_counts()
+
+  Within read_replica() ReplicaRouter routes the reads of the current
+  thread to the replica; writes always go to the default database.
+
+  The replica is used only while its replication lag is within
+  settings.REPLICA_MAX_LAG_SECONDS, checked at most every
+  settings.REPLICA_LAG_CHECK_INTERVAL seconds. A lagging or unreachable
+  replica falls back to the default database.
+
+  Views opt in with the read_replica_view decorator (function views,
+  admin views) or ReadReplicaMixin (class based views, safe methods only).
+"""
+
+logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_read_replica_state = threading.local()
+
+# {alias: (checked at, lag seconds or None when unreachable)}
+_replica_status = {}
+
+
+def get_replica_lag(alias):
+    """
+    Return the replication lag of the database alias in seconds.
+
+    A Postgres standby replaying all the WAL it received is current (an
+    idle primary doesn't advance pg_last_xact_replay_timestamp()). Other
+    databases are reported as current.
+    """
+    connection = connections[alias]
+    if connection.vendor != "postgresql":
+        return 0.0
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE"
+            " WHEN NOT pg_is_in_recovery() THEN 0"
+            " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+            " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)"
+            " END"
+        )
+        return float(cursor.fetchone()[0])
+
+
+def _get_checked_lag(alias):
+    checked_at, lag = _replica_status.get(alias, (None, None))
+    if checked_at is not None and time.monotonic() - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return lag
+
+    try:
+        lag = get_replica_lag(alias)
+    except DatabaseError as e:
+        logger.warning("Read replica {} unreachable: {}".format(alias, e))
+        lag = None
+    _replica_status[alias] = (time.monotonic(), lag)
+    return lag
+
+
+def clear_replica_status():
+    _replica_status.clear()
+
+
+def get_read_alias(max_lag=None):
+    """
+    Return the database alias for replica reads: the replica, or the
+    default database when no replica is configured, or it lags more than
+    max_lag (default settings.REPLICA_MAX_LAG_SECONDS) or is unreachable.
+    """
+    alias = settings.REPLICA_DATABASE_ALIAS
+    if not alias or alias not in settings.DATABASES:
+        return DEFAULT_DB_ALIAS
+
+    max_lag = settings.REPLICA_MAX_LAG_SECONDS if max_lag is None else max_lag
+    lag = _get_checked_lag(alias)
+    if lag is None or lag > max_lag:
+        logger.info("Reading from {} instead of read replica {} (lag {})".format(DEFAULT_DB_ALIAS, alias, lag))
+        return DEFAULT_DB_ALIAS
+    return alias
+
+
+def get_active_read_alias():
+    """
+    Return the database alias of the enclosing read_replica(), else None.
+    """
+    return getattr(_read_replica_state, "alias", None)
+
+
+@contextmanager
+def read_replica(max_lag=None):
+    """
+    Route the reads of the current thread to the read replica (see
+    get_read_alias()) within the block. Yields the alias used.
+
+    Nested blocks keep the alias of the outermost one.
+    """
+    alias = get_active_read_alias()
+    if alias is not None:
+        yield alias
+        return
+
+    _read_replica_state.alias = alias = get_read_alias(max_lag)
+    try:
+        yield alias
+    finally:
+        _read_replica_state.alias = None
+
+
+def read_replica_view(view_func):
+    """
+    Run a view (or view method) within read_replica().
+
+    Template responses (admin changelists, DRF responses) evaluate their
+    querysets when rendered, so the outermost view renders its response
+    within the block.
+    """
+    @wraps(view_func)
+    def wrapped(*args, **kwargs):
+        outermost = get_active_read_alias() is None
+        with read_replica():
+            response = view_func(*args, **kwargs)
+            if outermost and callable(getattr(response, "render", None)) and not response.is_rendered:
+                response.render()
+        return response
+
+    return wrapped
+
+
+class ReadReplicaMixin(object):
+    """
+    Class based view mixin running the GET, HEAD and OPTIONS requests
+    within read_replica().
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+
+        if hasattr(request, "user"):
+            # Load the session user from the default database, a new
+            # session may not be on the replica yet
+            request.user.is_authenticated
+        return read_replica_view(super().dispatch)(request, *args, **kwargs)
+
+
+class ReplicaRouter:
+    """
+    Database router sending the reads within read_replica() to the replica.
+
+    Writes go to the default database, also for instances read from the
+    replica.
+    """
+
+    def db_for_read(self, model, **hints):
+        return get_active_read_alias()
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get("instance")
+        replica_alias = settings.REPLICA_DATABASE_ALIAS
+        if get_active_read_alias() is not None or (
+            replica_alias and instance is not None and instance._state.db == replica_alias
+        ):
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the default database
+        replica_alias = settings.REPLICA_DATABASE_ALIAS
+        aliases = {DEFAULT_DB_ALIAS, replica_alias}
+        if replica_alias and obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
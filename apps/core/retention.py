@@ -0,0 +1,146 @@
+import time
+
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+import apps.logging.request_logger as logging
+
+
+"""
+  Data retention for transient tables.
+
+  Policies are declared in settings.RETENTION_POLICIES, one dict per model:
+
+    model = "<app_label>.<ModelName>"
+    age_field, max_age = Rows with age_field older than max_age (timedelta) qualify.
+    filter = Optional dict of extra field lookups a qualifying row must match.
+    keep_latest = All but the latest N rows (by primary key) qualify.
+
+  Qualifying rows are deleted in primary key (keyset) ordered batches,
+  each batch its own short statement, with an optional pause between
+  batches to give replicas/vacuum time to catch up.
+
+  CALLED FROM: apps.core.management.commands.apply_retention
+"""
+
+logger = logging.getLogger(logging.AUDIT_DATA_RETENTION_LOGGER)
+
+RETENTION_BATCH_SIZE = 1000
+
+
+class RetentionPolicy:
+    def __init__(self, model, age_field=None, max_age=None, filter=None, keep_latest=None):
+        if (age_field is None) == (keep_latest is None):
+            raise ImproperlyConfigured(
+                "Retention policy for {} needs either age_field/max_age or keep_latest.".format(model))
+        if age_field is not None and max_age is None:
+            raise ImproperlyConfigured("Retention policy for {} is missing max_age.".format(model))
+
+        self.label = model
+        self.model = django_apps.get_model(model)
+        self.age_field = age_field
+        self.max_age = max_age
+        self.filter = filter or {}
+        self.keep_latest = keep_latest
+
+    def get_queryset(self, now=None):
+        """
+        Return a queryset of the rows that qualify for deletion.
+        """
+        qs = self.model._base_manager.filter(**self.filter)
+
+        if self.age_field:
+            cutoff = (now or timezone.now()) - self.max_age
+            return qs.filter(**{"{}__lt".format(self.age_field): cutoff})
+
+        # Rows older than the latest keep_latest rows.
+        boundary = list(
+            self.model._base_manager.order_by("-pk")
+            .values_list("pk", flat=True)[self.keep_latest:self.keep_latest + 1]
+        )
+        if not boundary:
+            return qs.none()
+        return qs.filter(pk__lte=boundary[0])
+
+    def describe(self):
+        if self.age_field:
+            return "{} older than {}".format(self.age_field, self.max_age)
+        return "all but latest {}".format(self.keep_latest)
+
+
+def get_retention_policies(models=None):
+    """
+    Return the configured RetentionPolicy list, optionally
+    restricted to a list of "<app_label>.<ModelName>" labels.
+    """
+    policies = [RetentionPolicy(**p) for p in settings.RETENTION_POLICIES]
+
+    if models:
+        unknown = set(models) - set(p.label for p in policies)
+        if unknown:
+            raise ImproperlyConfigured("No retention policy for: {}".format(", ".join(sorted(unknown))))
+        policies = [p for p in policies if p.label in models]
+
+    return policies
+
+
+def apply_retention_policy(policy, batch_size=RETENTION_BATCH_SIZE, pause=0, dry_run=False, now=None):
+    """
+    Delete the rows qualifying for a retention policy in keyset batches.
+
+    For a dry run only the qualifying rows are counted.
+
+    Returns a stats dict that is also written to the audit logger.
+    """
+    qs = policy.get_queryset(now)
+    start_t = time.time()
+
+    stats = {
+        "type": "data_retention",
+        "model": policy.label,
+        "policy": policy.describe(),
+        "dry_run": dry_run,
+        "batch_size": batch_size,
+        "pause": pause,
+        "batch_count": 0,
+        "deleted_count": 0,
+    }
+
+    if dry_run:
+        stats["qualifying_count"] = qs.count()
+    else:
+        last_pk = None
+        while True:
+            batch_qs = qs if last_pk is None else qs.filter(pk__gt=last_pk)
+            pks = list(batch_qs.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                break
+
+            _, deleted = policy.model._base_manager.filter(pk__in=pks).delete()
+            deleted_cnt = deleted.get(policy.model._meta.label, 0)
+            last_pk = pks[-1]
+
+            stats["batch_count"] += 1
+            stats["deleted_count"] += deleted_cnt
+
+            if pause and len(pks) == batch_size:
+                time.sleep(pause)
+
+    elapsed = time.time() - start_t
+    stats["elapsed"] = round(elapsed, 3)
+    stats["rows_per_sec"] = round(stats["deleted_count"] / elapsed, 1) if elapsed > 0 else None
+
+    logger.info(stats)
+
+    return stats
+
+
+def apply_retention_policies(models=None, batch_size=RETENTION_BATCH_SIZE, pause=0, dry_run=False):
+    """
+    Apply all (or the selected) retention policies. Returns the list of stats dicts.
+    """
+    now = timezone.now()
+    return [apply_retention_policy(p, batch_size=batch_size, pause=pause, dry_run=dry_run, now=now)
+            for p in get_retention_policies(models)]
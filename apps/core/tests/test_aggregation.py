@@ -0,0 +1,117 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Q
+from django.test import SimpleTestCase
+
+from apps.accounts.models import get_developer_counts
+from apps.authorization.models import (
+    get_beneficiary_counts,
+    get_beneficiary_grant_app_pair_counts,
+    get_grant_bene_counts,
+)
+from apps.core.aggregation import (
+    CountIf,
+    aggregate_counts,
+    bucket_counts,
+    grouped_counts,
+    sum_counts,
+)
+from apps.dot_ext.models import get_token_bene_counts
+from apps.fhir.bluebutton.models import get_crosswalk_bene_counts
+from apps.test import BaseApiTest
+
+
+User = get_user_model()
+
+
+class TestBuckets(SimpleTestCase):
+    def test_bucket_counts(self):
+        buckets = [("eq_1", 1, 1), ("eq_2thru3", 2, 3), ("gt_3", 4, None)]
+        self.assertEqual(
+            {"eq_1": 5, "eq_2thru3": 7, "gt_3": 9},
+            bucket_counts({0: 100, 1: 5, 2: 3, 3: 4, 4: 1, 20: 8, None: 1}, buckets),
+        )
+        self.assertEqual({"eq_1": 0, "eq_2thru3": 0, "gt_3": 0}, bucket_counts({}, buckets))
+
+    def test_sum_counts(self):
+        counts = {("real", 1): 2, ("real", 0): 3, ("synthetic", 1): 4}
+        self.assertEqual(9, sum_counts(counts))
+        self.assertEqual(5, sum_counts(counts, lambda key: key[0] == "real"))
+
+
+class TestConditionalAggregation(BaseApiTest):
+    def setUp(self):
+        self.read_capability = self._create_capability("Read", [])
+        self.write_capability = self._create_capability("Write", [])
+
+    def _create_grants(self):
+        # Real bene granted to 2 apps, synthetic benes granted to 1 app
+        self._create_user_app_token_grant(
+            "real", "bene", "40000000000001", "app0", "dev0", "org0")
+        self._create_user_app_token_grant(
+            "real", "bene", "40000000000001", "app1", "dev1", "org1")
+        self._create_user_app_token_grant(
+            "synth", "bene1", "-20000000000001", "app0", "dev0", "org0")
+        self._create_user_app_token_grant(
+            "synth", "bene2", "-20000000000002", "app1", "dev1", "org1")
+
+    def test_aggregate_and_grouped_counts(self):
+        for name in ["a1", "a2", "b1"]:
+            User.objects.create_user(name, is_active=name != "a2")
+
+        with self.assertNumQueries(1):
+            counts = aggregate_counts(User.objects, {
+                "total": CountIf(),
+                "active": CountIf(Q(is_active=True)),
+                "a": CountIf(Q(username__startswith="a"), "username", distinct=True),
+            })
+        self.assertEqual({"total": 3, "active": 2, "a": 2}, counts)
+
+        with self.assertNumQueries(1):
+            counts = grouped_counts(
+                User.objects.values("is_active").annotate(n=Count("pk")), ["n"])
+        self.assertEqual({(1,): 1, (2,): 1}, counts)
+
+    def test_global_state_counts_query_counts(self):
+        self._create_grants()
+
+        with self.assertNumQueries(1):
+            counts = get_beneficiary_counts()
+        self.assertEqual(3, counts["total"])
+        self.assertEqual(1, counts["real_grant"])
+        self.assertEqual(2, counts["synthetic_grant"])
+        self.assertEqual(1, counts["real_grant_to_apps_eq_2"])
+        self.assertEqual(0, counts["real_grant_to_apps_eq_1"])
+        self.assertEqual(2, counts["synthetic_grant_to_apps_eq_1"])
+        self.assertEqual(0, counts["synthetic_grant_archived_to_apps_eq_1"])
+
+        with self.assertNumQueries(3):
+            counts = get_grant_bene_counts()
+        self.assertEqual(4, counts["total"])
+        self.assertEqual(2, counts["real"])
+        self.assertEqual(1, counts["real_deduped"])
+        self.assertEqual(2, counts["synthetic_deduped"])
+        self.assertEqual(1, counts["grant_and_archived_real_deduped"])
+        self.assertEqual(2, counts["grant_and_archived_synthetic_deduped"])
+
+        with self.assertNumQueries(3):
+            counts = get_token_bene_counts()
+        self.assertEqual(1, counts["real_deduped"])
+        self.assertEqual(2, counts["real_bene_app_pair_deduped"])
+        self.assertEqual(2, counts["synthetic_bene_app_pair_deduped"])
+
+        with self.assertNumQueries(4):
+            counts = get_beneficiary_grant_app_pair_counts()
+        self.assertEqual(4, counts["grant_vs_archived_difference_total"])
+        self.assertEqual(2, counts["real_grant_vs_archived_difference_total"])
+        self.assertEqual(0, counts["archived_vs_grant_difference_total"])
+
+        with self.assertNumQueries(2):
+            counts = get_crosswalk_bene_counts()
+        self.assertEqual(1, counts["real"])
+        self.assertEqual(2, counts["synthetic"])
+
+        with self.assertNumQueries(1):
+            counts = get_developer_counts()
+        self.assertEqual(2, counts["total"])
+        self.assertEqual(2, counts["with_registered_app"])
+        self.assertEqual(2, counts["distinct_organization_name"])
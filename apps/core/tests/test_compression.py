@@ -0,0 +1,74 @@
+import brotli
+import gzip
+import json
+
+from io import StringIO
+from django.core.management import call_command
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+
+from apps.core.compression import CompressionMiddleware, choose_encoding, parse_accept_encoding
+
+
+@override_settings(COMPRESSION_PATHS_REGEX=r"^/v[12]/fhir/|admin/metrics/", COMPRESSION_MIN_SIZE=100,
+                   COMPRESSION_GZIP_LEVEL=6, COMPRESSION_BROTLI_QUALITY=5)
+class TestCompressionMiddleware(TestCase):
+    BODY = json.dumps({"resourceType": "Bundle", "entry": [{"resource": {"id": i}} for i in range(100)]}).encode()
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _get(self, path, response, **extra):
+        return CompressionMiddleware(lambda request: response)(self.factory.get(path, **extra))
+
+    def test_parse_accept_encoding(self):
+        self.assertEqual(parse_accept_encoding("gzip, deflate;q=0.5, br ; q=0, bad;q=x"),
+                         {"gzip": 1.0, "deflate": 0.5, "br": 0.0})
+        self.assertIsNone(choose_encoding(self.factory.get("/", HTTP_ACCEPT_ENCODING="identity")))
+        self.assertEqual(choose_encoding(self.factory.get("/", HTTP_ACCEPT_ENCODING="*")), choose_encoding(
+            self.factory.get("/", HTTP_ACCEPT_ENCODING="br, gzip")))
+
+    def test_gzip_response(self):
+        response = HttpResponse(self.BODY, content_type="application/json")
+        response["ETag"] = '"abc"'
+        response = self._get("/v2/fhir/ExplanationOfBenefit/", response, HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), self.BODY)
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response["ETag"], 'W/"abc"')
+
+    def test_brotli_response(self):
+        response = self._get("/v2/fhir/ExplanationOfBenefit/", HttpResponse(self.BODY, content_type="application/json"),
+                             HTTP_ACCEPT_ENCODING="gzip, br")
+
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), self.BODY)
+
+    def test_not_compressed(self):
+        # Not accepted
+        response = self._get("/v2/fhir/Patient/", HttpResponse(self.BODY), HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        # Below threshold
+        response = self._get("/v2/fhir/Patient/", HttpResponse(b"{}"), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        # Path not matched
+        response = self._get("/v2/accounts/login", HttpResponse(self.BODY), HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertFalse(response.has_header("Vary"))
+
+    def test_streaming_response(self):
+        chunks = [self.BODY[i:i + 50] for i in range(0, len(self.BODY), 50)]
+        response = self._get("/admin/metrics/raw/developers", StreamingHttpResponse(iter(chunks)),
+                             HTTP_ACCEPT_ENCODING="gzip")
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(b"".join(response.streaming_content)), self.BODY)
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command("benchmark_compression", "--entries", "2", "--runs", "1", stdout=out)
+        self.assertIn("EOB bundle, 2 entries", out.getvalue())
+        self.assertIn("gzip", out.getvalue())
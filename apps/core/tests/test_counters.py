@@ -0,0 +1,154 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import transaction
+from django.test import override_settings
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model
+
+from apps.authorization.models import DataAccessGrant
+from apps.core.counters import (
+    get_application_counters,
+    get_counter,
+    get_counters,
+    reconcile_counters,
+)
+from apps.core.models import MetricCounter
+from apps.dot_ext.archival import archive_expired_tokens, clear_archive_checkpoint
+from apps.dot_ext.models import ArchivedToken
+from apps.dot_ext.revocation import bulk_revoke_tokens
+from apps.dot_ext.utils import remove_application_user_pair_tokens_data_access
+from apps.fhir.bluebutton.models import Crosswalk
+from apps.logging.utils import cleanup_logger, redirect_loggers
+from apps.test import BaseApiTest
+
+
+AccessToken = get_access_token_model()
+
+
+class TestMetricCounters(BaseApiTest):
+    def setUp(self):
+        self.read_capability = self._create_capability("Read", [])
+        self.write_capability = self._create_capability("Write", [])
+        self.logger_registry = redirect_loggers()
+        clear_archive_checkpoint()
+
+    def tearDown(self):
+        cleanup_logger(self.logger_registry)
+        clear_archive_checkpoint()
+
+    def assertNoDrift(self):
+        summary = reconcile_counters()
+        self.assertEqual([], summary["drift"])
+
+    def test_counters_follow_signals(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            app0, users = self._create_range_users_app_token_grant(
+                start_fhir_id="-2000000000000", count=2, app_name="app0", app_user_organization="org0")
+            app1, _ = self._create_range_users_app_token_grant(
+                start_fhir_id="3000000000000", count=3, app_name="app1", app_user_organization="org1")
+
+        self.assertEqual(5, get_counter("crosswalk"))
+        self.assertEqual(2, get_counter("crosswalk_synthetic"))
+        self.assertEqual(3, get_counter("crosswalk_real"))
+        self.assertEqual(5, get_counter("grant"))
+        self.assertEqual(2, get_counter("grant", app0.id))
+        self.assertEqual(3, get_counter("token", app1.id))
+        self.assertNoDrift()
+
+        # Revoke: grant and tokens archived by the signal receivers and bulk revocation
+        with self.captureOnCommitCallbacks(execute=True):
+            remove_application_user_pair_tokens_data_access(app0, users["-20000000000000"])
+
+        self.assertEqual(1, get_counter("grant", app0.id))
+        self.assertEqual(1, get_counter("archived_grant", app0.id))
+        self.assertEqual(1, get_counter("token", app0.id))
+        self.assertEqual(1, get_counter("archived_token", app0.id))
+        self.assertEqual(
+            {"crosswalk": 5, "crosswalk_real": 3, "crosswalk_synthetic": 2, "archived_crosswalk": 0,
+             "grant": 4, "archived_grant": 1, "token": 4, "archived_token": 1},
+            get_counters(),
+        )
+        self.assertEqual({"grant": 3, "token": 3}, get_application_counters(["grant", "token"])[app1.id])
+        self.assertNoDrift()
+
+    def test_counters_follow_token_archival(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            app, users = self._create_range_users_app_token_grant(
+                start_fhir_id="3000000000000", count=3, app_name="app0", app_user_organization="org0")
+        AccessToken.objects.filter(user=users["30000000000000"]).update(
+            expires=timezone.now() - timedelta(hours=1))
+        # Refresh tokens keep the access tokens out of the archive
+        AccessToken.objects.filter(user=users["30000000000000"]).get().refresh_token.delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            summary = archive_expired_tokens()
+
+        self.assertEqual(1, summary["deleted_count"])
+        self.assertEqual(2, get_counter("token", app.id))
+        self.assertEqual(1, get_counter("archived_token", app.id))
+        self.assertNoDrift()
+
+    def test_counters_written_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            app, users = self._create_range_users_app_token_grant(
+                start_fhir_id="3000000000000", count=1, app_name="app0", app_user_organization="org0")
+            # Nothing written inside the transaction
+            self.assertEqual({}, get_counters())
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(1, get_counter("token", app.id))
+
+        # Rolled back changes are not counted
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                self._create_user("rolledback", "xxx", fhir_id="3000000000009",
+                                  user_hicn_hash="rolledback_hicn_hash", user_mbi_hash="rolledback_mbi_hash")
+                raise ValueError()
+        self.assertEqual(1, get_counter("crosswalk"))
+        self.assertNoDrift()
+
+    def test_already_archived_tokens_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            app, users = self._create_range_users_app_token_grant(
+                start_fhir_id="3000000000000", count=2, app_name="app0", app_user_organization="org0")
+            token = AccessToken.objects.filter(user=users["30000000000000"]).get()
+            ArchivedToken.objects.create(user_id=token.user_id, token=token.token, application_id=app.id,
+                                         expires=token.expires, scope=token.scope,
+                                         created=token.created, updated=token.updated)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_revoke_tokens(app)
+
+        self.assertEqual(0, get_counter("token", app.id))
+        self.assertEqual(2, get_counter("archived_token", app.id))
+        self.assertNoDrift()
+
+    def test_reconcile_repairs_drift(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            app, users = self._create_range_users_app_token_grant(
+                start_fhir_id="3000000000000", count=2, app_name="app0", app_user_organization="org0")
+        MetricCounter.objects.filter(name="grant", application_id=app.id).update(value=7)
+        MetricCounter.objects.filter(name="crosswalk").delete()
+        MetricCounter.objects.create(name="token", application_id=app.id + 1, value=3)
+        # Changes made without signals
+        DataAccessGrant.objects.filter(beneficiary=users["30000000000000"])._raw_delete(DataAccessGrant.objects.db)
+
+        out = StringIO()
+        call_command("reconcile_metric_counters", stdout=out)
+
+        self.assertIn("drift=4", out.getvalue())
+        self.assertEqual(1, get_counter("grant", app.id))
+        self.assertEqual(1, get_counter("grant"))
+        self.assertEqual(Crosswalk.objects.count(), get_counter("crosswalk"))
+        self.assertIsNone(get_counter("token", app.id + 1))
+        self.assertNoDrift()
+
+    @override_settings(METRIC_COUNTERS_ENABLED=False)
+    def test_disabled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_range_users_app_token_grant(
+                start_fhir_id="3000000000000", count=1, app_name="app0", app_user_organization="org0")
+        self.assertEqual({}, get_counters())
@@ -0,0 +1,103 @@
+import csv
+import gzip
+import io
+import os
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.accounts.models import UserProfile
+from apps.core.export import get_related_path, write_csv
+from apps.core.management.commands.benchmark_export import benchmark, is_flat
+
+
+class TestModelCsvExport(TestCase):
+    def _create_users(self, count, prefix="user"):
+        User.objects.bulk_create(
+            [User(username="{}{:05d}".format(prefix, i), email="{}{}@example.com".format(prefix, i))
+             for i in range(count)]
+        )
+        users = list(User.objects.filter(username__startswith=prefix).order_by("pk"))
+        UserProfile.objects.bulk_create([UserProfile(user=user, user_type="BEN") for user in users[::2]])
+        return users
+
+    def _model2csv(self, *args):
+        out = io.StringIO()
+        call_command("model2csv", "--application", "accounts", "--model", "UserProfile", *args, stdout=out)
+        return out.getvalue()
+
+    def test_related_path(self):
+        self.assertEqual("", get_related_path(User, "username"))
+        self.assertEqual("userprofile", get_related_path(User, "userprofile__user_type"))
+        self.assertEqual("user", get_related_path(UserProfile, "user"))
+        with self.assertRaises(ValueError):
+            get_related_path(User, "groups")
+        with self.assertRaises(ValueError):
+            get_related_path(User, "username__name")
+
+    def test_related_columns_without_per_row_queries(self):
+        users = self._create_users(25)
+        out = io.StringIO()
+
+        with CaptureQueriesContext(connection) as context:
+            rows = write_csv(out, User, ["id", "username", "userprofile__user_type"], chunk_size=10)
+
+        self.assertEqual(25, rows)
+        self.assertEqual(1, len(context.captured_queries))
+        lines = list(csv.reader(io.StringIO(out.getvalue())))
+        self.assertEqual(["id", "username", "userprofile__user_type"], lines[0])
+        self.assertEqual([str(users[0].pk), "user00000", "BEN"], lines[1])
+        self.assertEqual([str(users[1].pk), "user00001", "None"], lines[2])
+
+    def test_model2csv_command(self):
+        self._create_users(4)
+
+        lines = list(csv.reader(io.StringIO(self._model2csv(
+            "--filter_fields", "user,user__email,user_type", "--add_table_name", "True"))))
+
+        self.assertEqual(["user", "user__email", "user_type", "accounts.UserProfile", "model2csv_time"], lines[0])
+        self.assertEqual(["user00000", "user0@example.com", "BEN", "accounts.UserProfile"], lines[1][:4])
+        self.assertEqual(3, len(lines))
+
+        with self.assertRaises(CommandError):
+            self._model2csv("--filter_fields", "user,missing")
+        # COPY exports need Postgres
+        with self.assertRaises(CommandError):
+            self._model2csv("--use_copy")
+
+    def test_gzip_output_and_progress(self):
+        self._create_users(10)
+        path = os.path.join(tempfile.mkdtemp(), "profiles.csv.gz")
+        err = io.StringIO()
+
+        call_command("model2csv", "--application", "auth", "--model", "User", "--filter_fields", "username",
+                     "--output", path, "--gzip", "--chunk_size", "4", "--progress", stderr=err)
+
+        with gzip.open(path, "rt", newline="") as f:
+            lines = list(csv.reader(f))
+        self.assertEqual(["username"], lines[0])
+        self.assertEqual(11, len(lines))
+        self.assertEqual(["model2csv: 4 rows", "model2csv: 8 rows", "model2csv: 10 rows"],
+                         err.getvalue().splitlines())
+
+    def test_memory_flat_across_row_counts(self):
+        self._create_users(3000)
+
+        results = benchmark(User, [300, 3000], chunk_size=100)
+
+        self.assertEqual([300, 3000], [r["rows"] for r in results])
+        self.assertTrue(is_flat(results), results)
+        # Caching the whole queryset grows with the rows
+        self.assertGreater(results[1]["all_rows_peak_kb"], 3 * results[0]["all_rows_peak_kb"])
+
+    def test_benchmark_command(self):
+        self._create_users(20)
+        out = io.StringIO()
+
+        call_command("benchmark_export", "-n", "5", "-n", "20", "--chunk_size", "5", stdout=out)
+
+        self.assertIn("auth.User, chunk size 5", out.getvalue())
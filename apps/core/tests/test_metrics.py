@@ -0,0 +1,157 @@
+import multiprocessing
+import os
+import tempfile
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.core.metrics import (
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    MmapedDict,
+    observe_request,
+)
+
+
+def _child_observe(counter, histogram, gauge):
+    counter.labels(endpoint="token").inc(2)
+    histogram.observe(0.3)
+    gauge.set(7)
+
+
+# Fresh in memory values for each test
+@override_settings(METRICS_MULTIPROC_DIR=None)
+class TestMetricsRegistry(SimpleTestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def _metrics(self):
+        counter = Counter("test_requests_total", "Requests", ["endpoint"], registry=self.registry)
+        histogram = Histogram("test_request_seconds", "Latency", buckets=[0.1, 1.0], registry=self.registry)
+        gauge = Gauge("test_workers", "Workers", registry=self.registry, multiprocess_mode="max")
+        return counter, histogram, gauge
+
+    def _text(self):
+        return self.registry.generate_text().splitlines()
+
+    def test_text_format(self):
+        counter, histogram, gauge = self._metrics()
+        counter.labels(endpoint="token").inc()
+        counter.labels("user\"info").inc(3)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        gauge.set(4)
+
+        self.assertEqual([
+            "# HELP test_request_seconds Latency",
+            "# TYPE test_request_seconds histogram",
+            'test_request_seconds_bucket{le="0.1"} 1.0',
+            'test_request_seconds_bucket{le="1.0"} 2.0',
+            'test_request_seconds_bucket{le="+Inf"} 3.0',
+            "test_request_seconds_count 3.0",
+            "test_request_seconds_sum 5.55",
+            "# HELP test_requests Requests",
+            "# TYPE test_requests counter",
+            'test_requests_total{endpoint="token"} 1.0',
+            'test_requests_total{endpoint="user\\"info"} 3.0',
+            "# HELP test_workers Workers",
+            "# TYPE test_workers gauge",
+            "test_workers 4.0",
+        ], self._text())
+
+    def test_invalid_metrics(self):
+        counter, histogram, gauge = self._metrics()
+        with self.assertRaises(ValueError):
+            Counter("test_requests_total", "Duplicate", registry=self.registry)
+        with self.assertRaises(ValueError):
+            Counter("test-bad-name", "Bad name", registry=self.registry)
+        with self.assertRaises(ValueError):
+            counter.labels(other="x")
+        with self.assertRaises(ValueError):
+            counter.inc()
+        with self.assertRaises(ValueError):
+            counter.labels(endpoint="token").inc(-1)
+
+    def test_observe_request(self):
+        counter = Counter("test_calls_total", "Calls", ["endpoint", "status"], registry=self.registry)
+        histogram = Histogram("test_call_seconds", "Latency", ["endpoint"], registry=self.registry)
+
+        with observe_request(counter, histogram, endpoint="token") as call:
+            call["status"] = 200
+        with self.assertRaises(ConnectionError):
+            with observe_request(counter, histogram, endpoint="token"):
+                raise ConnectionError()
+
+        text = self._text()
+        self.assertIn('test_calls_total{endpoint="token",status="200"} 1.0', text)
+        self.assertIn('test_calls_total{endpoint="token",status="error"} 1.0', text)
+        self.assertIn('test_call_seconds_count{endpoint="token"} 2.0', text)
+
+    def test_mmaped_dict_grows_and_reloads(self):
+        path = os.path.join(self.directory, "values.db")
+        values = MmapedDict(path)
+        keys = ["key-{}".format("x" * i) for i in range(1000)]
+        for i, key in enumerate(keys):
+            values.write_value(key, i)
+        values.close()
+
+        self.assertGreater(os.path.getsize(path), MmapedDict.INITIAL_SIZE)
+        self.assertEqual([(key, float(i)) for i, key in enumerate(keys)], MmapedDict.read_all_values(path))
+
+        values = MmapedDict(path)
+        self.assertEqual(999.0, values.read_value(keys[-1]))
+        values.close()
+
+    def test_values_shared_across_processes(self):
+        with override_settings(METRICS_MULTIPROC_DIR=self.directory):
+            counter, histogram, gauge = self._metrics()
+            counter.labels(endpoint="token").inc()
+            histogram.observe(0.05)
+            gauge.set(3)
+
+            child = multiprocessing.get_context("fork").Process(target=_child_observe,
+                                                                args=(counter, histogram, gauge))
+            child.start()
+            child.join()
+            self.assertEqual(0, child.exitcode)
+
+            text = self._text()
+            self.assertEqual(2, len(os.listdir(self.directory)))
+
+        self.assertIn('test_requests_total{endpoint="token"} 3.0', text)
+        self.assertIn('test_request_seconds_bucket{le="0.1"} 1.0', text)
+        self.assertIn('test_request_seconds_bucket{le="1.0"} 2.0', text)
+        self.assertIn("test_request_seconds_count 2.0", text)
+        # Max of the processes' gauge values
+        self.assertIn("test_workers 7.0", text)
+
+
+class TestMetricsEndpoint(TestCase):
+    def test_disabled_without_token(self):
+        self.assertEqual(404, self.client.get("/health/metrics").status_code)
+
+    @override_settings(METRICS_ENDPOINT_TOKEN="secret")
+    def test_requires_token(self):
+        self.assertEqual(403, self.client.get("/health/metrics").status_code)
+        self.assertEqual(403, self.client.get("/health/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code)
+
+        response = self.client.get("/health/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("text/plain; version=0.0.4; charset=utf-8", response["Content-Type"])
+        content = response.content.decode()
+        for family in ["bb2_bfd_requests", "bb2_bfd_request_seconds", "bb2_token_throttle_decisions",
+                       "bb2_oauth_token_requests", "bb2_oauth_token_request_seconds",
+                       "bb2_slsx_requests", "bb2_slsx_request_seconds"]:
+            self.assertIn("# TYPE {} ".format(family), content)
+
+    @override_settings(METRICS_ENDPOINT_TOKEN="secret")
+    def test_token_endpoint_counted(self):
+        self.client.post("/v1/o/token/", data={"grant_type": "authorization_code", "code": "bad"})
+
+        content = self.client.get("/health/metrics", HTTP_AUTHORIZATION="Bearer secret").content.decode()
+        self.assertRegex(content, r'bb2_oauth_token_requests_total\{grant_type="authorization_code",status="401"\} \d')
@@ -0,0 +1,210 @@
+import json
+
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.models import User
+from django.http import HttpRequest
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from httmock import all_requests, HTTMock
+from oauth2_provider.models import get_access_token_model
+
+import apps.logging.request_logger as logging
+
+from apps.core.query_budget import QueryBudgetTestMixin, fingerprint, track_queries
+from apps.dot_ext.models import Application, ArchivedToken
+from apps.dot_ext.views import AuthorizationView, TokenView
+from apps.fhir.bluebutton.views.generic import FhirDataView
+from apps.logging.utils import cleanup_logger, get_log_content, redirect_loggers_custom
+from apps.mymedicare_cb.tests.responses import patient_response
+from apps.test import BaseApiTest
+
+AccessToken = get_access_token_model()
+
+
+class TestQueryAccounting(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.logger_registry = redirect_loggers_custom([logging.PERFORMANCE_LOGGER])
+
+    def tearDown(self):
+        cleanup_logger(self.logger_registry)
+
+    def _performance_records(self):
+        content = get_log_content(self.logger_registry, logging.PERFORMANCE_LOGGER, [logging.PERFORMANCE_LOGGER])
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            'SELECT "a"."id" FROM "a" WHERE ("a"."id" IN (...) AND "a"."name" = ? AND "a"."n" > ?) LIMIT ?',
+            fingerprint('SELECT "a"."id" FROM "a" WHERE ("a"."id" IN (%s, %s,%s) AND "a"."name" = \'x\'\'y\' '
+                        'AND "a"."n" > 10)  LIMIT 21'))
+        self.assertEqual(fingerprint('SELECT * FROM "a" WHERE "a"."id" IN (%s)'),
+                         fingerprint('SELECT * FROM "a" WHERE "a"."id" IN (%s, %s)'))
+
+    def test_track_queries_flags_repeated_statements(self):
+        for i in range(3):
+            User.objects.create_user("user{}".format(i))
+
+        with track_queries() as stats:
+            # N+1: one query per user
+            for user in User.objects.all():
+                User.objects.filter(pk=user.pk).exists()
+
+        self.assertEqual(4, stats.count)
+        self.assertGreater(stats.duration, 0)
+        repeated = stats.repeated(3)
+        self.assertEqual(1, len(repeated))
+        self.assertEqual(3, repeated[0][1])
+        self.assertIn('WHERE "auth_user"."id" = ?', repeated[0][0])
+
+    def test_assert_query_budget(self):
+        with self.assertQueryBudget(1):
+            User.objects.count()
+
+        with self.assertRaisesRegex(AssertionError, "2 queries run, over the budget of 1"):
+            with self.assertQueryBudget(1):
+                User.objects.count()
+                User.objects.exists()
+
+        with self.assertRaisesRegex(AssertionError, "repeated more than 1 times"):
+            with self.assertQueryBudget(10, max_repeats=1):
+                User.objects.count()
+                User.objects.count()
+
+    @override_settings(QUERY_BUDGET_DEFAULT=0)
+    def test_over_budget_request_logged(self):
+        self.client.force_login(User.objects.create_user("user"))
+        self.client.get(reverse("home"))
+
+        records = [r for r in self._performance_records() if r["type"] == "query_budget"]
+        self.assertEqual(1, len(records))
+        self.assertTrue(records[0]["over_budget"])
+        self.assertEqual(0, records[0]["db_query_budget"])
+        self.assertGreater(records[0]["db_queries"], 0)
+        self.assertIn("db_time_ms", records[0])
+
+    def test_request_within_budget_not_logged(self):
+        response = self.client.get(reverse("home"))
+
+        self.assertEqual([], [r for r in self._performance_records() if r["type"] == "query_budget"])
+        self.assertWithinQueryBudget(response)
+
+
+class TestEndpointQueryBudgets(QueryBudgetTestMixin, BaseApiTest):
+    """
+    The FHIR, token and authorize views run within their declared query_budget.
+    """
+
+    def setUp(self):
+        self.read_capability = self._create_capability('Read', [])
+        self.write_capability = self._create_capability('Write', [])
+        self._create_capability('patient', [
+            ["GET", r"\/v1\/fhir\/Patient\/\-\d+"],
+            ["GET", "/v1/fhir/Patient"],
+        ])
+
+    def test_fhir_read_and_search(self):
+        access_token = self.create_token('John', 'Smith')
+
+        @all_requests
+        def catchall(url, req):
+            return {'status_code': 200, 'content': patient_response}
+
+        with HTTMock(catchall):
+            response = self.client.get(reverse('bb_oauth_fhir_patient_search'),
+                                       Authorization="Bearer %s" % access_token)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(FhirDataView.query_budget, response.wsgi_request._query_budget)
+            self.assertWithinQueryBudget(response)
+
+        @all_requests
+        def read(url, req):
+            return {'status_code': 200, 'content': patient_response['entry'][0]['resource']}
+
+        with HTTMock(read):
+            response = self.client.get(reverse('bb_oauth_fhir_patient_read_or_update_or_delete',
+                                               kwargs={'resource_id': '-20140000008325'}),
+                                       Authorization="Bearer %s" % access_token)
+            self.assertEqual(200, response.status_code)
+            self.assertWithinQueryBudget(response)
+
+    def _authorize_payload(self):
+        redirect_uri = 'http://localhost'
+        self._create_user('anna', '123456')
+        capability_a = self._create_capability('Capability A', [])
+        application = self._create_application(
+            'an app',
+            grant_type=Application.GRANT_AUTHORIZATION_CODE,
+            client_type=Application.CLIENT_CONFIDENTIAL,
+            redirect_uris=redirect_uri)
+        application.scope.add(capability_a)
+        self.client.login(request=HttpRequest(), username='anna', password='123456')
+
+        return application, {
+            'client_id': application.client_id,
+            'response_type': 'code',
+            'redirect_uri': redirect_uri,
+            'code_challenge': "sZrievZsrYqxdnu2NVD603EiYBM18CuzZpwB-pOSZjo",
+            'code_challenge_method': 'S256',
+        }
+
+    def _request_token(self, application, authorize_response):
+        return self.client.post(reverse('oauth2_provider:token'), data={
+            'grant_type': 'authorization_code',
+            'code': parse_qs(urlparse(authorize_response['Location']).query)['code'][0],
+            'redirect_uri': application.redirect_uris,
+            'client_id': application.client_id,
+            'client_secret': application.client_secret,
+            'code_verifier': 'test123456789123456789123456789123456789123456789',
+        })
+
+    def test_authorize_and_token(self):
+        application, payload = self._authorize_payload()
+        response = self.client.get(reverse('oauth2_provider:authorize'), data=payload)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(AuthorizationView.query_budget, response.wsgi_request._query_budget)
+        self.assertWithinQueryBudget(response)
+
+        response = self.client.post(reverse('oauth2_provider:authorize'), data={
+            **payload,
+            'scope': ['capability-a'],
+            'expires_in': 86400,
+            'allow': True,
+        })
+        self.assertEqual(302, response.status_code)
+        self.assertWithinQueryBudget(response)
+
+        response = self._request_token(application, response)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(TokenView.query_budget, response.wsgi_request._query_budget)
+        self.assertWithinQueryBudget(response)
+
+        response = self.client.post(reverse('oauth2_provider:token'), data={
+            'grant_type': 'refresh_token',
+            'refresh_token': response.json()['refresh_token'],
+            'client_id': application.client_id,
+            'client_secret': application.client_secret,
+        })
+        self.assertEqual(200, response.status_code)
+        self.assertWithinQueryBudget(response)
+
+    def test_authorize_withdrawing_demographic_scopes(self):
+        """
+        The largest authorize path: the beneficiary withdraws the demographic
+        scopes, archiving the application's tokens and grant, and the metric
+        counters of those changes are written on commit.
+        """
+        application, payload = self._authorize_payload()
+        payload.update({'scope': ['capability-a'], 'expires_in': 86400, 'allow': True})
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                response = self.client.post(reverse('oauth2_provider:authorize'), data=payload)
+                self.assertEqual(200, self._request_token(application, response).status_code)
+
+        with self.assertQueryBudget(AuthorizationView.query_budget):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('oauth2_provider:authorize'),
+                                            data={**payload, 'share_demographic_scopes': False})
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(0, AccessToken.objects.filter(application=application).count())
+        self.assertEqual(3, ArchivedToken.objects.filter(application=application).count())
@@ -0,0 +1,91 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from apps.accounts.models import UserProfile
+from apps.core.replica import (
+    clear_replica_status,
+    get_read_alias,
+    read_replica,
+    read_replica_view,
+)
+
+
+@override_settings(REPLICA_DATABASE_ALIAS="replica", REPLICA_MAX_LAG_SECONDS=30)
+class TestReadReplicaRouting(TestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        clear_replica_status()
+        self.admin_user = User.objects.create_superuser("admin", "admin@example.com", "xxx123")
+
+    def tearDown(self):
+        clear_replica_status()
+
+    def _create_replica_only_bene(self, username):
+        # A row that is on the replica but not on the default database
+        user = User.objects.using("replica").create(username=username)
+        UserProfile.objects.using("replica").create(user=user, user_type="BEN")
+
+    def test_reads_routed_within_block(self):
+        self._create_replica_only_bene("replicated")
+
+        self.assertFalse(User.objects.filter(username="replicated").exists())
+        with read_replica() as alias:
+            self.assertEqual("replica", alias)
+            self.assertTrue(User.objects.filter(username="replicated").exists())
+            # Writes go to the default database
+            User.objects.create(username="written")
+            with read_replica() as nested_alias:
+                self.assertEqual("replica", nested_alias)
+
+        self.assertFalse(User.objects.filter(username="replicated").exists())
+        self.assertTrue(User.objects.filter(username="written").exists())
+        self.assertFalse(User.objects.using("replica").filter(username="written").exists())
+
+    def test_lagging_replica_falls_back_to_default(self):
+        with mock.patch("apps.core.replica.get_replica_lag", return_value=120.0) as get_replica_lag:
+            self.assertEqual("default", get_read_alias())
+            self.assertEqual("default", get_read_alias())
+            self.assertEqual("replica", get_read_alias(max_lag=300))
+            # Lag checked once per REPLICA_LAG_CHECK_INTERVAL
+            self.assertEqual(1, get_replica_lag.call_count)
+
+    def test_unreachable_replica_falls_back_to_default(self):
+        with mock.patch("apps.core.replica.get_replica_lag", side_effect=OperationalError("down")):
+            with read_replica() as alias:
+                self.assertEqual("default", alias)
+
+    @override_settings(REPLICA_DATABASE_ALIAS=None)
+    def test_no_replica_configured(self):
+        with read_replica() as alias:
+            self.assertEqual("default", alias)
+
+    def test_metrics_view_reads_replica(self):
+        self._create_replica_only_bene("replicated")
+        self.client.force_login(self.admin_user)
+
+        response = self.client.get(reverse("beneficiaries"))
+        self.assertEqual({"count": 1}, response.json())
+
+        clear_replica_status()
+        with mock.patch("apps.core.replica.get_replica_lag", return_value=120.0):
+            response = self.client.get(reverse("beneficiaries"))
+        self.assertEqual({"count": 0}, response.json())
+
+    def test_view_template_response_rendered_within_block(self):
+        self._create_replica_only_bene("replicated")
+
+        class Response:
+            is_rendered = False
+
+            def render(self):
+                self.count = User.objects.filter(username="replicated").count()
+                self.is_rendered = True
+
+        response = read_replica_view(lambda: Response())()
+
+        self.assertEqual(1, response.count)
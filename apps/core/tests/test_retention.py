@@ -0,0 +1,111 @@
+import json
+import uuid
+
+from datetime import timedelta
+from io import StringIO
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+import apps.logging.request_logger as logging
+
+from apps.core.retention import apply_retention_policies, get_retention_policies
+from apps.dot_ext.models import AuthFlowUuid
+from apps.logging.utils import redirect_loggers, cleanup_logger, get_log_lines_list
+from apps.mymedicare_cb.models import AnonUserState
+
+
+TEST_RETENTION_POLICIES = [
+    {"model": "dot_ext.AuthFlowUuid", "age_field": "created", "max_age": timedelta(days=30),
+     "filter": {"code__isnull": True}},
+    {"model": "mymedicare_cb.AnonUserState", "keep_latest": 2},
+]
+
+
+@override_settings(RETENTION_POLICIES=TEST_RETENTION_POLICIES)
+class TestRetention(TestCase):
+    def setUp(self):
+        self.logger_registry = redirect_loggers()
+
+    def tearDown(self):
+        cleanup_logger(self.logger_registry)
+
+    def _create_auth_flows(self, count, age_days, code=False):
+        auth_uuids = []
+        for i in range(count):
+            auth_uuid = uuid.uuid4()
+            AuthFlowUuid.objects.create(auth_uuid=auth_uuid, code=str(auth_uuid) if code else None)
+            auth_uuids.append(auth_uuid)
+        AuthFlowUuid.objects.filter(auth_uuid__in=auth_uuids).update(created=timezone.now() - timedelta(days=age_days))
+        return auth_uuids
+
+    def _log_records(self):
+        return [json.loads(line) for line in
+                get_log_lines_list(self.logger_registry, logging.AUDIT_DATA_RETENTION_LOGGER)]
+
+    def test_apply_retention_policies(self):
+        self._create_auth_flows(5, age_days=31)
+        recent = self._create_auth_flows(2, age_days=1)
+        with_code = self._create_auth_flows(1, age_days=31, code=True)
+        states = [AnonUserState.objects.create(state="state-{}".format(i)) for i in range(5)]
+
+        stats = apply_retention_policies(batch_size=2)
+
+        self.assertEqual([(s["model"], s["deleted_count"], s["batch_count"]) for s in stats],
+                         [("dot_ext.AuthFlowUuid", 5, 3), ("mymedicare_cb.AnonUserState", 3, 2)])
+        self.assertEqual(set(AuthFlowUuid.objects.values_list("auth_uuid", flat=True)), set(recent + with_code))
+        self.assertEqual(list(AnonUserState.objects.order_by("pk")), states[3:])
+
+        records = self._log_records()
+        self.assertEqual([r["type"] for r in records], ["data_retention"] * 2)
+        self.assertEqual(records[0]["model"], "dot_ext.AuthFlowUuid")
+        self.assertEqual(records[0]["deleted_count"], 5)
+        self.assertIn("rows_per_sec", records[0])
+
+        # Nothing left to delete
+        stats = apply_retention_policies()
+        self.assertEqual([s["deleted_count"] for s in stats], [0, 0])
+
+    def test_dry_run(self):
+        self._create_auth_flows(3, age_days=31)
+
+        stats = apply_retention_policies(models=["dot_ext.AuthFlowUuid"], dry_run=True)
+
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0]["qualifying_count"], 3)
+        self.assertEqual(stats[0]["deleted_count"], 0)
+        self.assertEqual(AuthFlowUuid.objects.count(), 3)
+
+    def test_unknown_model(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_retention_policies(models=["dot_ext.ExpiresIn"])
+
+    @override_settings(RETENTION_POLICIES=[{"model": "dot_ext.AuthFlowUuid", "age_field": "created"}])
+    def test_invalid_policy(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_retention_policies()
+
+    def test_apply_retention_command(self):
+        self._create_auth_flows(3, age_days=31)
+
+        out = StringIO()
+        call_command("apply_retention", "--model", "dot_ext.AuthFlowUuid", "--dry-run", stdout=out)
+        self.assertIn("dot_ext.AuthFlowUuid: 3 rows qualify", out.getvalue())
+
+        out = StringIO()
+        call_command("apply_retention", "--batch-size", "2", "--pause", "0.01", stdout=out)
+        self.assertIn("dot_ext.AuthFlowUuid: deleted=3, batches=2", out.getvalue())
+        self.assertIn("mymedicare_cb.AnonUserState: deleted=0, batches=0", out.getvalue())
+        self.assertEqual(AuthFlowUuid.objects.count(), 0)
+
+
+class TestDefaultRetentionPolicies(TestCase):
+    def test_default_policies(self):
+        self.assertEqual(
+            [p.label for p in get_retention_policies()],
+            ["dot_ext.AuthFlowUuid", "dot_ext.Approval"],
+        )
+        # Qualifying querysets can be built for every policy
+        for policy in get_retention_policies():
+            self.assertEqual(policy.get_queryset().count(), 0)
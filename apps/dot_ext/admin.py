@@ -4,6 +4,7 @@ from oauth2_provider.models import AccessToken
 from oauth2_provider.models import get_application_model
 from .forms import CreateNewApplicationForm, CustomRegisterApplicationForm
 from .models import ApplicationLabel, AuthFlowUuid
+from .revocation import bulk_revoke_tokens
 from .utils import is_data_access_type_valid
 
 Application = get_application_model()
@@ -136,6 +137,21 @@ class MyApplicationAdmin(admin.ModelAdmin):
 
     raw_id_fields = ("user",)
 
+    actions = ["revoke_tokens"]
+
+    def revoke_tokens(self, request, queryset):
+        access_token_cnt = 0
+        refresh_token_cnt = 0
+        for app in queryset:
+            at_cnt, rt_cnt = bulk_revoke_tokens(app)
+            access_token_cnt += at_cnt
+            refresh_token_cnt += rt_cnt
+        self.message_user(
+            request,
+            "Revoked %d access token(s) and %d refresh token(s)." % (access_token_cnt, refresh_token_cnt),
+        )
+    revoke_tokens.short_description = "Revoke all tokens for selected applications"
+
     def get_data_access_type(self, obj):
         return obj.data_access_type
     get_data_access_type.short_description = "Data Access Type"
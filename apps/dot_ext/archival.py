@@ -0,0 +1,202 @@
+import time
+
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_refresh_token_model
+
+import apps.logging.request_logger as logging
+
+from apps.core.counters import add_counts
+
+from .models import ArchivedToken, bulk_token_archive
+from .revocation import ARCHIVED_TOKEN_FIELDS
+
+
+"""
+  Batched archival of expired access tokens.
+
+  Moves expired access tokens, that can no longer be refreshed, to the
+  ArchivedToken table in keyset (id) ordered chunks. Each chunk is one
+  short transaction using INSERT ... SELECT and DELETE set statements
+  (a single DELETE ... RETURNING / INSERT statement on PostgreSQL),
+  so no per-row post_delete archiving or audit logging takes place.
+  The metric counters are updated with the chunk's per application counts.
+
+  CALLED FROM: apps.dot_ext.management.commands.archive_tokens
+"""
+
+logger = logging.getLogger(logging.AUDIT_TOKEN_ARCHIVE_LOGGER)
+
+# Cache key holding the last access token id processed by an unfinished run.
+ARCHIVE_CHECKPOINT_CACHE_KEY = "dot_ext_archive_tokens_checkpoint"
+
+ARCHIVE_CHUNK_SIZE = 1000
+
+# Chunk predicate: expired and no refresh token pointing at the access token.
+# (same qualification as DOT's clear_expired() / cleartokens command)
+ARCHIVE_WHERE_SQL = (
+    "{at}.id > %s AND {at}.id <= %s AND {at}.expires < %s"
+    " AND NOT EXISTS (SELECT 1 FROM {rt} WHERE {rt}.access_token_id = {at}.id)"
+)
+
+POSTGRES_MOVE_SQL = (
+    "WITH moved AS ("
+    " DELETE FROM {at} WHERE {where} RETURNING {cols}"
+    "), archived AS ("
+    " INSERT INTO {arch} ({cols}, archived_at) SELECT {cols}, %s FROM moved"
+    " ON CONFLICT (token) DO NOTHING RETURNING 1"
+    ") SELECT (SELECT COUNT(*) FROM moved), (SELECT COUNT(*) FROM archived)"
+)
+
+INSERT_SELECT_SQL = (
+    "INSERT INTO {arch} ({cols}, archived_at) SELECT {cols}, %s FROM {at} WHERE {where}"
+    " ON CONFLICT (token) DO NOTHING"
+)
+
+DELETE_SQL = "DELETE FROM {at} WHERE {where}"
+
+# Chunk token counts per application, and of their token values not yet archived, for the metric counters
+COUNT_BY_APPLICATION_SQL = (
+    "SELECT {at}.application_id, COUNT(*),"
+    " SUM(CASE WHEN EXISTS (SELECT 1 FROM {arch} WHERE {arch}.token = {at}.token) THEN 0 ELSE 1 END)"
+    " FROM {at} WHERE {where} GROUP BY {at}.application_id"
+)
+
+
+def get_archive_checkpoint():
+    return cache.get(ARCHIVE_CHECKPOINT_CACHE_KEY, 0)
+
+
+def set_archive_checkpoint(last_id):
+    cache.set(ARCHIVE_CHECKPOINT_CACHE_KEY, last_id, None)
+
+
+def clear_archive_checkpoint():
+    cache.delete(ARCHIVE_CHECKPOINT_CACHE_KEY)
+
+
+def _sql_names():
+    qn = connection.ops.quote_name
+    return {
+        "at": qn(get_access_token_model()._meta.db_table),
+        "rt": qn(get_refresh_token_model()._meta.db_table),
+        "arch": qn(ArchivedToken._meta.db_table),
+        "cols": ", ".join(qn(c) for c in ARCHIVED_TOKEN_FIELDS),
+    }
+
+
+def move_token_chunk(low_id, high_id, cutoff):
+    """
+    Archive and delete the qualifying access tokens with
+    low_id < id <= high_id in one transaction.
+
+    RETURN:
+        deleted_cnt = Access tokens deleted.
+        archived_cnt = Archive rows inserted (already archived token values are skipped).
+    """
+    names = _sql_names()
+    names["where"] = ARCHIVE_WHERE_SQL.format(**names)
+    where_params = [low_id, high_id, connection.ops.adapt_datetimefield_value(cutoff)]
+    archived_at = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    with transaction.atomic(), bulk_token_archive(), connection.cursor() as cursor:
+        cursor.execute(COUNT_BY_APPLICATION_SQL.format(**names), where_params)
+        counts = cursor.fetchall()
+
+        if connection.vendor == "postgresql":
+            cursor.execute(POSTGRES_MOVE_SQL.format(**names), where_params + [archived_at])
+            deleted_cnt, archived_cnt = cursor.fetchone()
+        else:
+            cursor.execute(INSERT_SELECT_SQL.format(**names), [archived_at] + where_params)
+            archived_cnt = cursor.rowcount
+            cursor.execute(DELETE_SQL.format(**names), where_params)
+            deleted_cnt = cursor.rowcount
+
+        add_counts("token", {application_id: -n for application_id, n, new in counts})
+        add_counts("archived_token", {application_id: new for application_id, n, new in counts})
+
+    return deleted_cnt, archived_cnt
+
+
+def archive_expired_tokens(grace=timedelta(0), chunk_size=ARCHIVE_CHUNK_SIZE,
+                           max_rows_per_sec=None, limit=None, resume=True):
+    """
+    Archive expired access tokens in keyset paginated chunks.
+
+    grace = Only tokens expired for longer than this are archived.
+    chunk_size = Max tokens moved per transaction.
+    max_rows_per_sec = Rate limit, sleeps between chunks when exceeded.
+    limit = Stop after (about) this many tokens for the run.
+    resume = Start after the checkpoint of a previous unfinished run.
+
+    The checkpoint is saved after every chunk and cleared once the end
+    of the table is reached, so an interrupted run continues where it
+    stopped and a completed run starts over from the beginning.
+
+    Returns a summary dict that is also written to the audit logger.
+    """
+    AccessToken = get_access_token_model()
+
+    cutoff = timezone.now() - grace
+    last_id = get_archive_checkpoint() if resume else 0
+    start_t = time.time()
+
+    summary = {
+        "type": "token_archive_summary",
+        "cutoff": str(cutoff),
+        "start_id": last_id,
+        "chunk_size": chunk_size,
+        "max_rows_per_sec": max_rows_per_sec,
+        "limit": limit,
+        "chunk_count": 0,
+        "deleted_count": 0,
+        "archived_count": 0,
+        "completed": False,
+    }
+
+    while limit is None or summary["deleted_count"] < limit:
+        chunk_t = time.time()
+
+        ids = list(
+            AccessToken.objects.filter(
+                id__gt=last_id, expires__lt=cutoff, refresh_token__isnull=True
+            )
+            .order_by("id")
+            .values_list("id", flat=True)[:chunk_size]
+        )
+
+        if not ids:
+            summary["completed"] = True
+            clear_archive_checkpoint()
+            break
+
+        deleted_cnt, archived_cnt = move_token_chunk(last_id, ids[-1], cutoff)
+        last_id = ids[-1]
+        set_archive_checkpoint(last_id)
+
+        summary["chunk_count"] += 1
+        summary["deleted_count"] += deleted_cnt
+        summary["archived_count"] += archived_cnt
+
+        logger.info({
+            "type": "token_archive_progress",
+            "chunk": summary["chunk_count"],
+            "last_id": last_id,
+            "deleted_count": deleted_cnt,
+            "archived_count": archived_cnt,
+            "total_deleted_count": summary["deleted_count"],
+            "elapsed": round(time.time() - start_t, 3),
+        })
+
+        if max_rows_per_sec:
+            wait = deleted_cnt / max_rows_per_sec - (time.time() - chunk_t)
+            if wait > 0:
+                time.sleep(wait)
+
+    summary["last_id"] = last_id
+    summary["elapsed"] = round(time.time() - start_t, 3)
+    logger.info(summary)
+
+    return summary
@@ -0,0 +1,252 @@
+import hashlib
+
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.exceptions import ImproperlyConfigured, MultipleObjectsReturned
+from django.db import transaction
+from django.db.utils import IntegrityError
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import AuthFlowUuid
+
+
+"""
+  Auth flow trace state stores.
+
+  Holds the auth_uuid and related values of a beneficiary authorization
+  flow across the breaks in the session (Medicare.gov login callback,
+  token endpoint). Entries can be looked up by auth_uuid and also by the
+  secondary keys state and code. Both are unique per entry, like the
+  AuthFlowUuid table columns.
+
+  Stores:
+
+    DatabaseAuthFlowStore - Entries in the AuthFlowUuid table (default).
+    CacheAuthFlowStore - Entries in a Django cache with a native TTL, so
+                         abandoned flows simply expire (opt-in).
+
+  The store class is selected with settings.AUTH_FLOW_STORE. The cache
+  store needs a dedicated cache (settings.AUTH_FLOW_STORE_CACHE alias)
+  that is not the database cache, sized so in-flight flows are not culled.
+
+  CALLED FROM: apps.dot_ext.loggers
+"""
+
+# Fields kept per auth flow (same as the AuthFlowUuid model)
+AUTH_FLOW_FIELDS = ['auth_uuid', 'state', 'code', 'client_id', 'auth_pkce_method',
+                    'auth_crosswalk_action', 'auth_share_demographic_scopes']
+
+# Secondary lookup keys
+AUTH_FLOW_INDEX_FIELDS = ['state', 'code']
+
+
+class AuthFlowTrace:
+    """
+    Auth flow trace values returned by a store.
+    """
+
+    def __init__(self, **kwargs):
+        for f in AUTH_FLOW_FIELDS:
+            setattr(self, f, kwargs.get(f, None))
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in AUTH_FLOW_FIELDS}
+
+    def __str__(self):
+        return str(self.auth_uuid)
+
+
+class BaseAuthFlowStore:
+    """
+    Interface of the auth flow trace stores.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else settings.AUTH_FLOW_STORE_TTL
+
+    def create(self, auth_uuid, client_id=None, auth_pkce_method=None):
+        """
+        Create a new entry. Returns False if the auth_uuid already exists.
+        """
+        raise NotImplementedError
+
+    def get(self, auth_uuid):
+        """
+        Return the AuthFlowTrace for auth_uuid or None.
+        """
+        raise NotImplementedError
+
+    def get_by_state(self, state):
+        raise NotImplementedError
+
+    def get_by_code(self, code):
+        raise NotImplementedError
+
+    def update(self, auth_uuid, **values):
+        """
+        Update entry values. Returns False if the entry does not exist,
+        or a state/code value is already used by another entry.
+        """
+        raise NotImplementedError
+
+    def delete(self, auth_uuid):
+        raise NotImplementedError
+
+
+class CacheAuthFlowStore(BaseAuthFlowStore):
+    """
+    Cache backed store.
+
+    Entries are kept under an auth_uuid key, with an index key per
+    state/code value pointing at the auth_uuid. Index keys are added
+    with cache.add() so the first entry to claim a value owns it.
+    """
+
+    KEY_PREFIX = "authflow"
+
+    def __init__(self, ttl=None, cache_alias=None):
+        super().__init__(ttl)
+        cache_alias = cache_alias or settings.AUTH_FLOW_STORE_CACHE
+        if cache_alias not in settings.CACHES:
+            raise ImproperlyConfigured(
+                "CacheAuthFlowStore needs a dedicated cache, settings.CACHES has no {!r} alias".format(cache_alias))
+        self.cache = caches[cache_alias]
+        if isinstance(self.cache, DatabaseCache):
+            # Would put the writes back on the primary database, and cull in-flight flows
+            raise ImproperlyConfigured(
+                "CacheAuthFlowStore can't use the database cache {!r}".format(cache_alias))
+
+    def _entry_key(self, auth_uuid):
+        return "{}:uuid:{}".format(self.KEY_PREFIX, auth_uuid)
+
+    def _index_key(self, field, value):
+        # Hashed, as code values can exceed key length limits of some backends.
+        return "{}:{}:{}".format(self.KEY_PREFIX, field,
+                                 hashlib.sha256(value.encode('utf-8')).hexdigest())
+
+    def create(self, auth_uuid, client_id=None, auth_pkce_method=None):
+        entry = AuthFlowTrace(auth_uuid=str(auth_uuid), client_id=client_id,
+                              auth_pkce_method=auth_pkce_method)
+        return self.cache.add(self._entry_key(auth_uuid), entry.to_dict(), self.ttl)
+
+    def get(self, auth_uuid):
+        entry = self.cache.get(self._entry_key(auth_uuid))
+        return AuthFlowTrace(**entry) if entry else None
+
+    def _get_by_index(self, field, value):
+        auth_uuid = self.cache.get(self._index_key(field, value))
+        if auth_uuid is None:
+            return None
+
+        entry = self.get(auth_uuid)
+        # Ignore index keys left behind by an updated entry.
+        if entry is None or getattr(entry, field) != value:
+            return None
+        return entry
+
+    def get_by_state(self, state):
+        return self._get_by_index('state', state)
+
+    def get_by_code(self, code):
+        return self._get_by_index('code', code)
+
+    def update(self, auth_uuid, **values):
+        entry = self.cache.get(self._entry_key(auth_uuid))
+        if entry is None:
+            return False
+
+        auth_uuid = entry['auth_uuid']
+        for field in AUTH_FLOW_INDEX_FIELDS:
+            value = values.get(field)
+            if value is None or value == entry[field]:
+                continue
+
+            index_key = self._index_key(field, value)
+            if not self.cache.add(index_key, auth_uuid, self.ttl):
+                owner = self.cache.get(index_key)
+                owner_entry = self.get(owner) if owner and owner != auth_uuid else None
+                if owner_entry is not None and getattr(owner_entry, field) == value:
+                    return False
+                self.cache.set(index_key, auth_uuid, self.ttl)
+
+            if entry[field] is not None:
+                self.cache.delete(self._index_key(field, entry[field]))
+
+        entry.update({k: v for k, v in values.items() if k in AUTH_FLOW_FIELDS and k != 'auth_uuid'})
+        self.cache.set(self._entry_key(auth_uuid), entry, self.ttl)
+        return True
+
+    def delete(self, auth_uuid):
+        entry = self.cache.get(self._entry_key(auth_uuid))
+        if entry is None:
+            return
+
+        keys = [self._entry_key(auth_uuid)]
+        for field in AUTH_FLOW_INDEX_FIELDS:
+            if entry[field] is not None:
+                keys.append(self._index_key(field, entry[field]))
+        self.cache.delete_many(keys)
+
+
+class DatabaseAuthFlowStore(BaseAuthFlowStore):
+    """
+    AuthFlowUuid table backed store.
+
+    Entries older than the TTL are not returned, but are only removed
+    when a flow completes or by the authflow_id_delete command.
+    """
+
+    def _live(self):
+        return AuthFlowUuid.objects.filter(created__gte=timezone.now() - timedelta(seconds=self.ttl))
+
+    def _get(self, **lookup):
+        try:
+            return self._live().get(**lookup)
+        except (AuthFlowUuid.DoesNotExist, MultipleObjectsReturned):
+            return None
+
+    def create(self, auth_uuid, client_id=None, auth_pkce_method=None):
+        try:
+            with transaction.atomic():
+                AuthFlowUuid.objects.create(auth_uuid=auth_uuid,
+                                            client_id=client_id,
+                                            auth_pkce_method=auth_pkce_method)
+        except IntegrityError:
+            return False
+        return True
+
+    def get(self, auth_uuid):
+        return self._get(auth_uuid=auth_uuid)
+
+    def get_by_state(self, state):
+        return self._get(state=state)
+
+    def get_by_code(self, code):
+        return self._get(code=code)
+
+    def update(self, auth_uuid, **values):
+        try:
+            with transaction.atomic():
+                auth_flow_uuid = AuthFlowUuid.objects.get(auth_uuid=auth_uuid)
+                for k, v in values.items():
+                    if k in AUTH_FLOW_FIELDS and k != 'auth_uuid':
+                        setattr(auth_flow_uuid, k, v)
+                auth_flow_uuid.save()
+        except AuthFlowUuid.DoesNotExist:
+            return False
+        except IntegrityError:
+            return False
+        return True
+
+    def delete(self, auth_uuid):
+        AuthFlowUuid.objects.filter(auth_uuid=auth_uuid).delete()
+
+
+def get_auth_flow_store():
+    """
+    Return an instance of the store class configured in settings.AUTH_FLOW_STORE.
+    """
+    return import_string(settings.AUTH_FLOW_STORE)()
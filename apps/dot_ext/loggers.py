@@ -1,16 +1,13 @@
 import re
 import uuid
-from django.core.exceptions import MultipleObjectsReturned
-from django.db import transaction
-from django.db.utils import IntegrityError
 from oauth2_provider.models import get_application_model
-from .models import AuthFlowUuid
+from .authflow import get_auth_flow_store
 
 
 """
   Logger related functions for dot_ext/mymedicare_cb modules.
 
-  The AuthFlowUuid tracking object is used to track the
+  The auth flow trace store (see apps.dot_ext.authflow) is used to track the
   auth flow between beneficiary and 3rd party application sessions.
 
   Values are retrieved/updated in the request.session.
@@ -54,7 +51,7 @@ def create_session_auth_flow_trace(request):
     '''
     Create auth flow log tracing related items.
 
-    - Create a new AuthFlowUuid instance.
+    - Create a new auth flow trace store entry.
     - Set new auth flow values in session.
 
     CALLED FROM:  apps.dot_ext.views.authorization.AuthorizationView.dispatch()
@@ -86,14 +83,10 @@ def create_session_auth_flow_trace(request):
                               }
             set_session_auth_flow_trace(request, auth_flow_dict)
 
-            try:
-                # Create and return AuthFlowUuid instance for tracking.
-                with transaction.atomic():
-                    AuthFlowUuid.objects.create(auth_uuid=new_auth_uuid,
-                                                client_id=application.client_id,
-                                                auth_pkce_method=auth_pkce_method)
-            except IntegrityError:
-                pass
+            # Create auth flow trace store entry for tracking.
+            get_auth_flow_store().create(new_auth_uuid,
+                                         client_id=application.client_id,
+                                         auth_pkce_method=auth_pkce_method)
         except Application.DoesNotExist:
             # Clear values in session. Set to empty value to denote not found.
             auth_flow_dict = {"auth_uuid": new_auth_uuid,
@@ -144,7 +137,7 @@ def clear_session_auth_flow_trace(request):
 
 def set_session_values_from_auth_flow_uuid(request, auth_flow_uuid):
     '''
-    Set auth flow related items in the session given an AuthFlowUuid instance.
+    Set auth flow related items in the session given an auth flow trace store entry.
     '''
     Application = get_application_model()
 
@@ -179,7 +172,7 @@ def set_session_auth_flow_trace_value(request, key, value):
 
 def update_instance_auth_flow_trace_with_code(auth_dict, code):
     '''
-    Update AuthFlowUuid instance with code, crosswalk_action and share_demographic_scopes values.
+    Update auth flow trace store entry with code, crosswalk_action and share_demographic_scopes values.
 
     CALLED FROM:  apps.dot_ext.views.authorization.AuthorizationView.form_valid()
     '''
@@ -187,84 +180,60 @@ def update_instance_auth_flow_trace_with_code(auth_dict, code):
     auth_crosswalk_action = auth_dict.get('auth_crosswalk_action', None)
     auth_share_demographic_scopes = auth_dict.get('auth_share_demographic_scopes', None)
 
-    try:
-        if auth_uuid:
-            with transaction.atomic():
-                auth_flow_uuid = AuthFlowUuid.objects.get(auth_uuid=auth_uuid)
+    if auth_uuid:
+        values = {}
+
+        if code and len(code.strip()) != 0:
+            values['code'] = code
 
-                if code and len(code.strip()) != 0:
-                    auth_flow_uuid.code = code
+        if auth_crosswalk_action:
+            values['auth_crosswalk_action'] = auth_crosswalk_action
 
-                if auth_crosswalk_action:
-                    auth_flow_uuid.auth_crosswalk_action = auth_crosswalk_action
+        if auth_share_demographic_scopes:
+            if auth_share_demographic_scopes == "True":
+                values['auth_share_demographic_scopes'] = True
+            elif auth_share_demographic_scopes == "False":
+                values['auth_share_demographic_scopes'] = False
 
-                if auth_share_demographic_scopes:
-                    if auth_share_demographic_scopes == "True":
-                        auth_flow_uuid.auth_share_demographic_scopes = True
-                    elif auth_share_demographic_scopes == "False":
-                        auth_flow_uuid.auth_share_demographic_scopes = False
-                auth_flow_uuid.save()
-    except AuthFlowUuid.DoesNotExist:
-        pass
-    except IntegrityError:
-        pass
+        get_auth_flow_store().update(auth_uuid, **values)
 
 
 def update_session_auth_flow_trace_from_code(request, code):
     '''
-    Update session values from AuthFlowUuid instance from code.
+    Update session values from auth flow trace store entry from code.
 
     CALLED FROM:  apps.dot_ext.oauth2_backends.OAuthLibSMARTonFHIR.create_token_response()
     '''
-    # Get session values from AuthFlowUuid via code.
-    try:
-        # Get previously created AuthFlowUuid with code.
-        if code and len(code.strip()) != 0:
-            auth_flow_uuid = AuthFlowUuid.objects.get(code=code)
+    # Get session values from previously stored entry via code.
+    if code and len(code.strip()) != 0:
+        store = get_auth_flow_store()
+        auth_flow_uuid = store.get_by_code(code)
+        if auth_flow_uuid:
             set_session_values_from_auth_flow_uuid(request, auth_flow_uuid)
-            # Delete the no longer needed instance
-            auth_flow_uuid.delete()
-    except AuthFlowUuid.DoesNotExist:
-        pass
-    except MultipleObjectsReturned:
-        pass
+            # Delete the no longer needed entry
+            store.delete(auth_flow_uuid.auth_uuid)
 
 
 def update_instance_auth_flow_trace_with_state(request, state):
     '''
-    Update AuthFlowUuid instance with state value.
+    Update auth flow trace store entry with state value.
 
     CALLED FROM:  apps.mymedicare_cb.views.mymedicare_login()
     '''
-    # Update AuthFlowUuid instance to pass along auth_uuid using state.
+    # Update store entry to pass along auth_uuid using state.
     auth_uuid = request.session.get('auth_uuid', None)
 
-    if auth_uuid:
-        # Store state in AuthFlowUuid.
-        try:
-            if state and len(state.strip()) != 0:
-                with transaction.atomic():
-                    auth_flow_uuid = AuthFlowUuid.objects.get(auth_uuid=auth_uuid)
-                    auth_flow_uuid.state = state
-                    auth_flow_uuid.save()
-        except AuthFlowUuid.DoesNotExist:
-            pass
-        except IntegrityError:
-            pass
+    if auth_uuid and state and len(state.strip()) != 0:
+        get_auth_flow_store().update(auth_uuid, state=state)
 
 
 def update_session_auth_flow_trace_from_state(request, state):
     '''
-    Update session values from AuthFlowUuid instance from state.
+    Update session values from auth flow trace store entry from state.
 
     CALLED FROM:  apps.mymedicare_cb.views.authenticate()
     '''
-    # Retreive auth flow session values using previous state in AuthFlowUuid.
-    try:
-        if state and len(state.strip()) != 0:
-            auth_flow_uuid = AuthFlowUuid.objects.get(state=state)
-            set_session_values_from_auth_flow_uuid(request, auth_flow_uuid)
-    except AuthFlowUuid.DoesNotExist:
-        pass
-    except MultipleObjectsReturned:
-        pass
+    # Retreive auth flow session values using previous state in the store.
+    if state and len(state.strip()) != 0:
+        auth_flow_uuid = get_auth_flow_store().get_by_state(state)
+        set_session_values_from_auth_flow_uuid(request, auth_flow_uuid)
@@ -0,0 +1,33 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+
+from apps.dot_ext.archival import ARCHIVE_CHUNK_SIZE, archive_expired_tokens
+
+
+class Command(BaseCommand):
+    help = ('Archive expired access tokens (no refresh token) to dot_ext_archivedtoken '
+            'in keyset paginated chunks. Use instead of the per-row cleartokens command.')
+
+    def add_arguments(self, parser):
+        parser.add_argument("-g", "--grace", type=int, default=0,
+                            help="Only archive tokens expired for more than this many minutes.")
+        parser.add_argument("-c", "--chunk-size", type=int, default=ARCHIVE_CHUNK_SIZE,
+                            help="Number of tokens archived per transaction.")
+        parser.add_argument("-r", "--rate", type=int, default=0,
+                            help="Max tokens archived per second (0 = no rate limit).")
+        parser.add_argument("-l", "--limit", type=int, default=0,
+                            help="Stop after about this many tokens for this run (0 = no limit).")
+        parser.add_argument("--restart", action='store_true',
+                            help="Ignore the checkpoint of a previous unfinished run and start from the beginning.")
+
+    def handle(self, *args, **options):
+        summary = archive_expired_tokens(
+            grace=timedelta(minutes=options["grace"]),
+            chunk_size=options["chunk_size"],
+            max_rows_per_sec=options["rate"] or None,
+            limit=options["limit"] or None,
+            resume=not options["restart"],
+        )
+        self.stdout.write("Archived tokens: deleted={}, archived={}, chunks={}, completed={}".format(
+            summary["deleted_count"], summary["archived_count"],
+            summary["chunk_count"], summary["completed"]))
@@ -43,7 +43,9 @@ def delete_authflow_uuid_table(age, limit_on_delete, simulation):
 
 
 class Command(BaseCommand):
-    help = ('Delete aged dot_ext_authflowuuid table records.')
+    help = ('Delete aged dot_ext_authflowuuid table records.'
+            ' Only needed with settings.AUTH_FLOW_STORE set to the DatabaseAuthFlowStore,'
+            ' cache store entries expire on their own.')
     
     def add_arguments(self, parser):
         parser.add_argument("-a", "--age", type=int, default=30, help="Age (in days) of authflow uuid records qualified for deletion.")
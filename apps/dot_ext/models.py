@@ -2,8 +2,11 @@ import hashlib
 import itertools
 import pytz
 import sys
+import threading
 import uuid
 
+from collections import defaultdict
+from contextlib import contextmanager
 from datetime import datetime
 from django.conf import settings
 from django.contrib.auth import get_user_model
@@ -26,6 +29,16 @@ from urllib.parse import urlparse
 from waffle import switch_is_active
 
 from apps.capabilities.models import ProtectedCapability
+from apps.core.aggregation import (
+    CountIf,
+    aggregate_counts,
+    aggregate_counts_by,
+    bene_type_case,
+    grouped_counts,
+    real_fhir_id_q,
+    synthetic_fhir_id_q,
+)
+from apps.core.counters import objects_created
 from .utils import is_data_access_type_valid
 
 
@@ -336,17 +349,63 @@ class ExpiresIn(models.Model):
     objects = ExpiresInManager()
 
 
+# Thread local state used to flag when a bulk token archive/revoke is running.
+_bulk_token_archive_state = threading.local()
+
+
+@contextmanager
+def bulk_token_archive():
+    """
+    Mark the current thread as running a bulk token archive/revoke.
+
+    While active, the per-row AccessToken post_delete receivers
+    (archive_token and the audit token_removed logger) are skipped,
+    since the bulk path archives and logs the tokens itself.
+    """
+    depth = getattr(_bulk_token_archive_state, "depth", 0)
+    _bulk_token_archive_state.depth = depth + 1
+    try:
+        yield
+    finally:
+        _bulk_token_archive_state.depth = depth
+
+
+def create_archived_tokens(archived_tokens):
+    """
+    Insert the ArchivedToken instances with a single INSERT, skipping
+    the token values already archived. Returns the inserted instances.
+    """
+    archived = set(
+        ArchivedToken.objects.filter(token__in=[t.token for t in archived_tokens]).values_list("token", flat=True)
+    )
+    archived_tokens = [t for t in archived_tokens if t.token not in archived]
+    # A token value archived concurrently is still ignored, the counters reconciler repairs that drift.
+    ArchivedToken.objects.bulk_create(archived_tokens, ignore_conflicts=True)
+    objects_created(archived_tokens)
+    return archived_tokens
+
+
+def is_bulk_token_archive_active():
+    return getattr(_bulk_token_archive_state, "depth", 0) > 0
+
+
 def archive_token(sender, instance=None, **kwargs):
+    if is_bulk_token_archive_active():
+        return
+
     tkn = instance
-    ArchivedToken.objects.get_or_create(
-        user=tkn.user,
-        token=tkn.token,
-        application=tkn.application,
-        expires=tkn.expires,
-        scope=tkn.scope,
-        created=tkn.created,
-        updated=tkn.updated,
-    )
+    archived_tokens = [
+        ArchivedToken(
+            user_id=tkn.user_id,
+            token=tkn.token,
+            application_id=tkn.application_id,
+            expires=tkn.expires,
+            scope=tkn.scope,
+            created=tkn.created,
+            updated=tkn.updated,
+        )
+    ]
+    create_archived_tokens(archived_tokens)
 
 
 class AuthFlowUuid(models.Model):
@@ -420,12 +479,13 @@ def get_application_counts():
     Application = get_application_model()
 
     try:
-        active_cnt = Application.objects.filter(active=True).count()
-        inactive_cnt = Application.objects.filter(active=False).count()
-        return {
-            "active_cnt": active_cnt,
-            "inactive_cnt": inactive_cnt,
-        }
+        return aggregate_counts(
+            Application.objects,
+            {
+                "active_cnt": CountIf(Q(active=True)),
+                "inactive_cnt": CountIf(Q(active=False)),
+            },
+        )
     except ValueError:
         pass
     except Application.DoesNotExist:
@@ -477,37 +537,83 @@ def get_token_bene_counts(application=None):
         token_queryset = token_queryset.filter(application=application)
         archived_token_queryset = archived_token_queryset.filter(application=application)
 
-    # Get AccessToken and ArchivedTokentable count
-    counts_returned["total"] = token_queryset.count()
+    # AccessToken table count and real/synth bene distinct counts (excludes granted to multiple apps) in one scan
+    counts_returned.update(
+        aggregate_counts(
+            token_queryset,
+            {
+                "total": CountIf(),
+                "real_deduped": CountIf(
+                    real_fhir_id_q("user__crosswalk___fhir_id"), "user", distinct=True
+                ),
+                "synthetic_deduped": CountIf(
+                    synthetic_fhir_id_q("user__crosswalk___fhir_id"), "user", distinct=True
+                ),
+            },
+        )
+    )
     counts_returned["archived_total"] = archived_token_queryset.count()
 
-    token_queryset = token_queryset.order_by("user__id").values("user__id")
+    # Global real/synth bene and app pair counts. This should match grant counts.
+    if not application:
+        pair_counts = grouped_counts(
+            token_queryset.annotate(bene_type=bene_type_case("user__crosswalk___fhir_id"))
+            .order_by()
+            .values("user", "application", "bene_type")
+            .distinct(),
+            ["bene_type"],
+        )
+        counts_returned["real_bene_app_pair_deduped"] = pair_counts[("real",)]
+        counts_returned["synthetic_bene_app_pair_deduped"] = pair_counts[("synthetic",)]
 
-    # real/synth bene distinct counts (excludes granted to multiple apps)
-    real_token_queryset = token_queryset.filter(
-        ~Q(user__crosswalk___fhir_id__startswith="-")
-        & ~Q(user__crosswalk___fhir_id="")
-        & Q(user__crosswalk___fhir_id__isnull=False)
+    counts_returned["deduped_elapsed"] = round(
+        datetime.utcnow().timestamp() - start_time, 3
     )
 
-    synthetic_token_queryset = token_queryset.filter(
-        Q(user__crosswalk___fhir_id__startswith="-")
-        & ~Q(user__crosswalk___fhir_id="")
-        & Q(user__crosswalk___fhir_id__isnull=False)
-    )
+    return counts_returned
 
-    counts_returned["real_deduped"] = real_token_queryset.distinct().count()
-    counts_returned["synthetic_deduped"] = synthetic_token_queryset.distinct().count()
 
-    # Global real/synth bene and app pair counts. This should match grant counts.
-    if not application:
-        counts_returned["real_bene_app_pair_deduped"] = real_token_queryset.values("user", "application").distinct().count()
-        counts_returned["synthetic_bene_app_pair_deduped"] = synthetic_token_queryset.values(
-            "user", "application").distinct().count()
+def get_token_bene_counts_by_application(application_ids=None):
+    """
+    Get the per application get_token_bene_counts(application) counts for
+    all applications (or application_ids), with one GROUP BY application
+    query per table.
 
-    counts_returned["deduped_elapsed"] = round(
-        datetime.utcnow().timestamp() - start_time, 3
+    Returns {application_id: counts}, zero counts for applications without tokens.
+    """
+    AccessToken = get_access_token_model()
+
+    token_queryset = AccessToken.objects.all()
+    archived_token_queryset = ArchivedToken.objects.all()
+
+    if application_ids is not None:
+        token_queryset = token_queryset.filter(application_id__in=application_ids)
+        archived_token_queryset = archived_token_queryset.filter(application_id__in=application_ids)
+
+    counts_returned = defaultdict(
+        lambda: {"total": 0, "archived_total": 0, "real_deduped": 0, "synthetic_deduped": 0}
+    )
+
+    token_counts = aggregate_counts_by(
+        token_queryset,
+        "application",
+        {
+            "total": CountIf(),
+            "real_deduped": CountIf(
+                real_fhir_id_q("user__crosswalk___fhir_id"), "user", distinct=True
+            ),
+            "synthetic_deduped": CountIf(
+                synthetic_fhir_id_q("user__crosswalk___fhir_id"), "user", distinct=True
+            ),
+        },
     )
+    archived_token_counts = aggregate_counts_by(
+        archived_token_queryset, "application", {"archived_total": CountIf()}
+    )
+
+    for grouped in [token_counts, archived_token_counts]:
+        for application_id, counts in grouped.items():
+            counts_returned[application_id].update(counts)
 
     return counts_returned
 
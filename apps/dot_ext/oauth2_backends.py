@@ -2,6 +2,7 @@ import json
 from oauth2_provider.oauth2_backends import OAuthLibCore
 from oauth2_provider.models import AccessToken
 from ..fhir.bluebutton.models import Crosswalk
+from ..logging.audit_context import record_access_token, record_crosswalk
 from .loggers import (clear_session_auth_flow_trace, update_session_auth_flow_trace_from_code,
                       set_session_auth_flow_trace_value)
 
@@ -14,7 +15,7 @@ class OAuthLibSMARTonFHIR(OAuthLibCore):
         SMART on FHIR Authorization
         http://docs.smarthealthit.org/authorization/
         """
-        # Get session values previously stored in AuthFlowUuid from AuthorizationView.form_valid() from code.
+        # Get session values previously stored in the auth flow trace store from AuthorizationView.form_valid() from code.
         body = dict(self.extract_body(request))
         clear_session_auth_flow_trace(request)
         update_session_auth_flow_trace_from_code(request, body.get('code', None))
@@ -26,11 +27,16 @@ class OAuthLibSMARTonFHIR(OAuthLibCore):
         # https://github.com/evonove/django-oauth-toolkit/blob/2cd1f0dccadb8e74919a059d9b4985f9ecb1d59f/oauth2_provider/views/base.py#L192
         if status == 200:
             fhir_body = json.loads(body)
-            token = AccessToken.objects.get(token=fhir_body.get("access_token"))
+            token = AccessToken.objects.select_related("application__user", "user__crosswalk").get(
+                token=fhir_body.get("access_token"))
+            record_access_token(token.token, token)
 
-            if Crosswalk.objects.filter(user=token.user).exists():
-                fhir_body = json.loads(body)
-                cw = Crosswalk.objects.get(user=token.user)
+            try:
+                cw = token.user.crosswalk
+            except Crosswalk.DoesNotExist:
+                cw = None
+            record_crosswalk(token.user, cw)
+            if cw is not None:
                 fhir_body["patient"] = cw.fhir_id
                 body = json.dumps(fhir_body)
 
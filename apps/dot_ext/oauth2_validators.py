@@ -1,5 +1,10 @@
+import hashlib
+
+from oauth2_provider.models import AccessToken
 from oauth2_provider.oauth2_validators import OAuth2Validator as DotOAuth2Validator
 from django.core.exceptions import ObjectDoesNotExist
+from apps.logging.audit_context import (record_access_token, record_application,
+                                        record_refreshed_access_token_hash)
 from apps.pkce.oauth2_validators import PKCEValidatorMixin
 from oauthlib.oauth2.rfc6749.errors import InvalidGrantError
 
@@ -27,6 +32,28 @@ class OAuth2Validator(DotOAuth2Validator):
 
         return auth_string
 
+    def _load_access_token(self, token):
+        # Also loads the application's user (developer) and the user's crosswalk,
+        # used by the resource views and the request audit log.
+        access_token = (AccessToken.objects.select_related("application__user", "user__crosswalk")
+                        .filter(token=token).first())
+        record_access_token(token, access_token)
+        return access_token
+
+    def _load_application(self, client_id, request):
+        application = super()._load_application(client_id, request)
+        client = getattr(request, "client", None)
+        record_application(client_id, client if client is not None and client.client_id == client_id else None)
+        return application
+
+    def validate_refresh_token(self, refresh_token, client, request, *args, **kwargs):
+        valid = super().validate_refresh_token(refresh_token, client, request, *args, **kwargs)
+        # The access token is replaced by the grant, log the hash of the one being refreshed
+        rt = getattr(request, "refresh_token_instance", None)
+        if rt is not None:
+            record_refreshed_access_token_hash(hashlib.sha256(str(rt.access_token).encode("utf-8")).hexdigest())
+        return valid
+
 
 class SingleAccessTokenValidator(
         PKCEValidatorMixin,
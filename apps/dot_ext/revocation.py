@@ -0,0 +1,98 @@
+from django.db import transaction
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_refresh_token_model
+
+from apps.core.counters import batched_counts
+
+from .models import ArchivedToken, bulk_token_archive, create_archived_tokens
+from .signals import tokens_bulk_revoked
+
+
+"""
+  Set-based token revocation.
+
+  Revokes the access/refresh tokens for an application (optionally
+  limited to one beneficiary) with a constant number of statements
+  per batch, instead of calling token.revoke() row by row.
+"""
+
+# Number of access tokens archived and deleted per statement.
+BULK_REVOKE_BATCH_SIZE = 1000
+
+# AccessToken fields copied to ArchivedToken.
+ARCHIVED_TOKEN_FIELDS = ["user_id", "token", "application_id", "expires", "scope", "created", "updated"]
+
+
+def archive_access_tokens(tokens):
+    """
+    Archive access tokens with a single bulk insert.
+
+    tokens = An iterable of AccessToken instances.
+
+    Tokens already in the archive (unique token value) are ignored.
+    """
+    create_archived_tokens([ArchivedToken(**{f: getattr(t, f) for f in ARCHIVED_TOKEN_FIELDS}) for t in tokens])
+
+
+def bulk_revoke_tokens(application, user=None, batch_size=BULK_REVOKE_BATCH_SIZE):
+    """
+    Revoke all access and refresh tokens for an application.
+    If user is provided, only that beneficiary's tokens are revoked.
+
+    - Refresh tokens are marked revoked with one UPDATE (same as RefreshToken.revoke()).
+    - Access tokens are archived with one bulk INSERT and removed with one DELETE per batch,
+      each batch in its own transaction.
+    - One tokens_bulk_revoked signal is sent per batch with the deleted tokens, logged
+      as one revoked audit record per token. Only the current batch is kept in memory.
+
+    RETURN:
+        access_token_revoke_cnt = Access tokens archived and deleted.
+        refresh_token_revoke_cnt = Refresh tokens marked revoked.
+
+    CALLED FROM:
+        apps.authorization.signals.revoke_associated_tokens()
+        apps.dot_ext.admin.MyApplicationAdmin.revoke_tokens()
+    """
+    AccessToken = get_access_token_model()
+    RefreshToken = get_refresh_token_model()
+
+    access_token_queryset = AccessToken.objects.filter(application=application)
+    refresh_token_queryset = RefreshToken.objects.filter(application=application, revoked__isnull=True)
+
+    if user is not None:
+        access_token_queryset = access_token_queryset.filter(user=user)
+        refresh_token_queryset = refresh_token_queryset.filter(user=user)
+
+    access_token_revoke_cnt = 0
+
+    with bulk_token_archive():
+        refresh_token_revoke_cnt = refresh_token_queryset.update(
+            access_token=None, revoked=timezone.now()
+        )
+
+        last_id = 0
+        while True:
+            with transaction.atomic(), batched_counts():
+                # With the application and user data of the audit records
+                tokens = list(
+                    access_token_queryset.filter(id__gt=last_id)
+                    .select_related("application__user", "user__crosswalk")
+                    .order_by("id")[:batch_size]
+                )
+                if tokens:
+                    archive_access_tokens(tokens)
+                    AccessToken.objects.filter(id__in=[t.id for t in tokens]).delete()
+
+            if not tokens:
+                break
+
+            tokens_bulk_revoked.send(
+                sender=AccessToken,
+                application=application,
+                user=user,
+                access_tokens=tokens,
+            )
+            access_token_revoke_cnt += len(tokens)
+            last_id = tokens[-1].id
+
+    return access_token_revoke_cnt, refresh_token_revoke_cnt
@@ -16,6 +16,7 @@ logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
 
 
 beneficiary_authorized_application = Signal(providing_args=["request", "user", "application"])
+tokens_bulk_revoked = Signal(providing_args=["application", "user", "access_tokens"])
 
 
 @waffle_function_switch('outreach_email')
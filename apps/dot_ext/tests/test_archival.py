@@ -0,0 +1,117 @@
+import json
+
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_refresh_token_model
+
+import apps.logging.request_logger as logging
+
+from apps.dot_ext.archival import (
+    archive_expired_tokens,
+    clear_archive_checkpoint,
+    get_archive_checkpoint,
+)
+from apps.dot_ext.models import ArchivedToken
+from apps.logging.utils import redirect_loggers, cleanup_logger, get_log_lines_list
+from apps.test import BaseApiTest
+
+AccessToken = get_access_token_model()
+RefreshToken = get_refresh_token_model()
+
+
+class TestArchiveExpiredTokens(BaseApiTest):
+    def setUp(self):
+        self.user = self._create_user("bene", "123456")
+        self.app = self._create_application("archive_app", user=self.user)
+        self.logger_registry = redirect_loggers()
+        clear_archive_checkpoint()
+
+    def tearDown(self):
+        cleanup_logger(self.logger_registry)
+        clear_archive_checkpoint()
+
+    def _create_token(self, name, expires_delta, with_refresh=False):
+        at = AccessToken.objects.create(
+            user=self.user,
+            application=self.app,
+            token=name,
+            expires=timezone.now() + expires_delta,
+            scope="capability-a",
+        )
+        if with_refresh:
+            RefreshToken.objects.create(
+                user=self.user, application=self.app, token=name + "-refresh", access_token=at,
+            )
+        return at
+
+    def _log_records(self):
+        return [json.loads(line) for line in
+                get_log_lines_list(self.logger_registry, logging.AUDIT_TOKEN_ARCHIVE_LOGGER)]
+
+    def test_archive_expired_tokens(self):
+        for i in range(5):
+            self._create_token("expired-{}".format(i), timedelta(hours=-1))
+        self._create_token("live", timedelta(hours=1))
+        self._create_token("refreshable", timedelta(hours=-1), with_refresh=True)
+        # Already archived token value is not duplicated
+        ArchivedToken.objects.create(token="expired-0", expires=timezone.now(),
+                                     created=timezone.now(), updated=timezone.now())
+
+        summary = archive_expired_tokens(chunk_size=2)
+
+        self.assertTrue(summary["completed"])
+        self.assertEqual(summary["deleted_count"], 5)
+        self.assertEqual(summary["archived_count"], 4)
+        self.assertEqual(summary["chunk_count"], 3)
+        self.assertEqual(
+            sorted(AccessToken.objects.values_list("token", flat=True)), ["live", "refreshable"]
+        )
+        archived = ArchivedToken.objects.get(token="expired-3")
+        self.assertEqual(archived.user, self.user)
+        self.assertEqual(archived.application, self.app)
+        self.assertEqual(archived.scope, "capability-a")
+        self.assertIsNotNone(archived.archived_at)
+        self.assertEqual(get_archive_checkpoint(), 0)
+
+        records = self._log_records()
+        self.assertEqual([r["type"] for r in records], ["token_archive_progress"] * 3 + ["token_archive_summary"])
+
+        # No per-row audit events for the archived tokens
+        token_log = get_log_lines_list(self.logger_registry, logging.AUDIT_AUTHZ_TOKEN_LOGGER)
+        self.assertEqual(token_log, [])
+
+    def test_archive_grace_period(self):
+        self._create_token("expired-recent", timedelta(minutes=-5))
+        self._create_token("expired-old", timedelta(hours=-2))
+
+        archive_expired_tokens(grace=timedelta(hours=1))
+
+        self.assertEqual(list(AccessToken.objects.values_list("token", flat=True)), ["expired-recent"])
+
+    def test_archive_limit_and_resume(self):
+        tokens = [self._create_token("expired-{}".format(i), timedelta(hours=-1)) for i in range(5)]
+
+        summary = archive_expired_tokens(chunk_size=2, limit=2)
+        self.assertFalse(summary["completed"])
+        self.assertEqual(summary["deleted_count"], 2)
+        self.assertEqual(get_archive_checkpoint(), tokens[1].id)
+
+        # Resumes after the checkpoint
+        summary = archive_expired_tokens(chunk_size=2)
+        self.assertTrue(summary["completed"])
+        self.assertEqual(summary["start_id"], tokens[1].id)
+        self.assertEqual(summary["deleted_count"], 3)
+        self.assertEqual(AccessToken.objects.count(), 0)
+        self.assertEqual(ArchivedToken.objects.count(), 5)
+
+    def test_archive_tokens_command(self):
+        for i in range(3):
+            self._create_token("expired-{}".format(i), timedelta(hours=-1))
+
+        out = StringIO()
+        call_command("archive_tokens", "--chunk-size", "2", "--rate", "1000", stdout=out)
+
+        self.assertIn("deleted=3, archived=3, chunks=2, completed=True", out.getvalue())
+        self.assertEqual(AccessToken.objects.count(), 0)
@@ -0,0 +1,119 @@
+import uuid
+
+from datetime import timedelta
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from apps.dot_ext.authflow import CacheAuthFlowStore, DatabaseAuthFlowStore
+from apps.dot_ext.models import AuthFlowUuid
+
+
+class AuthFlowStoreTestMixin:
+    def _create(self, client_id="client-1"):
+        auth_uuid = str(uuid.uuid4())
+        self.assertTrue(self.store.create(auth_uuid, client_id=client_id, auth_pkce_method="S256"))
+        return auth_uuid
+
+    def test_create_get_delete(self):
+        auth_uuid = self._create()
+
+        entry = self.store.get(auth_uuid)
+        self.assertEqual(str(entry.auth_uuid), auth_uuid)
+        self.assertEqual(entry.client_id, "client-1")
+        self.assertEqual(entry.auth_pkce_method, "S256")
+        self.assertIsNone(entry.state)
+
+        # Duplicate auth_uuid
+        self.assertFalse(self.store.create(auth_uuid, client_id="client-2"))
+
+        self.store.delete(auth_uuid)
+        self.assertIsNone(self.store.get(auth_uuid))
+        self.store.delete(auth_uuid)
+
+    def test_secondary_lookups(self):
+        auth_uuid = self._create()
+
+        self.assertTrue(self.store.update(auth_uuid, state="state-1"))
+        self.assertTrue(self.store.update(auth_uuid, code="code-1", auth_crosswalk_action="R",
+                                          auth_share_demographic_scopes=True))
+
+        for entry in [self.store.get_by_state("state-1"), self.store.get_by_code("code-1")]:
+            self.assertEqual(str(entry.auth_uuid), auth_uuid)
+            self.assertEqual(entry.auth_crosswalk_action, "R")
+            self.assertTrue(entry.auth_share_demographic_scopes)
+
+        # Replaced state value is no longer found
+        self.assertTrue(self.store.update(auth_uuid, state="state-2"))
+        self.assertIsNone(self.store.get_by_state("state-1"))
+        self.assertEqual(str(self.store.get_by_state("state-2").auth_uuid), auth_uuid)
+
+        self.store.delete(auth_uuid)
+        self.assertIsNone(self.store.get_by_state("state-2"))
+        self.assertIsNone(self.store.get_by_code("code-1"))
+
+    def test_unique_secondary_keys(self):
+        auth_uuid1 = self._create()
+        auth_uuid2 = self._create()
+
+        self.assertTrue(self.store.update(auth_uuid1, state="state-1"))
+        self.assertFalse(self.store.update(auth_uuid2, state="state-1"))
+        self.assertEqual(str(self.store.get_by_state("state-1").auth_uuid), auth_uuid1)
+        self.assertIsNone(self.store.get(auth_uuid2).state)
+
+        # Released once the owning entry is deleted
+        self.store.delete(auth_uuid1)
+        self.assertTrue(self.store.update(auth_uuid2, state="state-1"))
+        self.assertEqual(str(self.store.get_by_state("state-1").auth_uuid), auth_uuid2)
+
+    def test_update_missing_entry(self):
+        self.assertFalse(self.store.update(str(uuid.uuid4()), state="state-1"))
+        self.assertIsNone(self.store.get_by_state("state-1"))
+
+
+class TestCacheAuthFlowStore(AuthFlowStoreTestMixin, TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = CacheAuthFlowStore(ttl=60, cache_alias="default")
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_long_code_value(self):
+        auth_uuid = self._create()
+        code = "c" * 255
+
+        self.assertTrue(self.store.update(auth_uuid, code=code))
+        self.assertEqual(self.store.get_by_code(code).auth_uuid, auth_uuid)
+
+    def test_dedicated_non_database_cache_required(self):
+        with self.assertRaises(ImproperlyConfigured):
+            CacheAuthFlowStore(cache_alias="missing")
+
+        with override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "authflow": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "django_cache"},
+        }):
+            with self.assertRaises(ImproperlyConfigured):
+                CacheAuthFlowStore()
+
+    def test_no_database_writes(self):
+        with self.assertNumQueries(0):
+            auth_uuid = self._create()
+            self.store.update(auth_uuid, state="state-1")
+            self.store.get_by_state("state-1")
+            self.store.delete(auth_uuid)
+
+
+class TestDatabaseAuthFlowStore(AuthFlowStoreTestMixin, TestCase):
+    def setUp(self):
+        self.store = DatabaseAuthFlowStore(ttl=60)
+
+    def test_expired_entry_not_returned(self):
+        auth_uuid = self._create()
+        self.store.update(auth_uuid, state="state-1")
+        AuthFlowUuid.objects.filter(auth_uuid=auth_uuid).update(created=timezone.now() - timedelta(minutes=2))
+
+        self.assertIsNone(self.store.get(auth_uuid))
+        self.assertIsNone(self.store.get_by_state("state-1"))
@@ -0,0 +1,130 @@
+import json
+
+from datetime import timedelta
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from oauth2_provider.models import get_access_token_model, get_refresh_token_model
+
+import apps.logging.request_logger as logging
+
+from apps.authorization.models import DataAccessGrant
+from apps.dot_ext.models import ArchivedToken
+from apps.dot_ext.revocation import bulk_revoke_tokens
+from apps.logging.serializers import Token
+from apps.logging.utils import redirect_loggers, cleanup_logger, get_log_lines_list
+from apps.test import BaseApiTest
+
+AccessToken = get_access_token_model()
+RefreshToken = get_refresh_token_model()
+
+
+class TestBulkRevokeTokens(BaseApiTest):
+    def setUp(self):
+        self.dev_user = self._create_unique_user("dev", "-20000000000001")
+        self.app = self._create_application("bulk_app", user=self.dev_user)
+        self._create_capability("Capability A", [])
+        self.logger_registry = redirect_loggers()
+
+    def tearDown(self):
+        cleanup_logger(self.logger_registry)
+
+    def _create_unique_user(self, username, fhir_id):
+        return self._create_user(username, "123456", fhir_id=fhir_id,
+                                 user_hicn_hash=fhir_id + self.test_hicn_hash[len(fhir_id):],
+                                 user_mbi_hash=fhir_id + self.test_mbi_hash[len(fhir_id):])
+
+    def _create_bene_tokens(self, username, fhir_id, count=2):
+        bene = self._create_unique_user(username, fhir_id)
+        DataAccessGrant.objects.create(beneficiary=bene, application=self.app)
+        for i in range(count):
+            at = AccessToken.objects.create(
+                user=bene,
+                application=self.app,
+                token="{}-access-{}".format(username, i),
+                expires=timezone.now() + timedelta(hours=10),
+                scope="capability-a",
+            )
+            RefreshToken.objects.create(
+                user=bene,
+                application=self.app,
+                token="{}-refresh-{}".format(username, i),
+                access_token=at,
+            )
+        return bene
+
+    def _token_log_records(self):
+        return [json.loads(line) for line in
+                get_log_lines_list(self.logger_registry, logging.AUDIT_AUTHZ_TOKEN_LOGGER)]
+
+    def test_grant_delete_revokes_bene_tokens(self):
+        bene1 = self._create_bene_tokens("bene1", "-20000000000002", count=3)
+        bene2 = self._create_bene_tokens("bene2", "-20000000000003", count=2)
+        # Audit records of the per-token revoke path
+        expected_records = [
+            json.loads(json.dumps(Token(tkn, action="revoked").to_dict()))
+            for tkn in AccessToken.objects.filter(user=bene1).order_by("id")
+        ]
+
+        DataAccessGrant.objects.get(beneficiary=bene1, application=self.app).delete()
+
+        # Only bene1 tokens are archived and removed
+        self.assertEqual(AccessToken.objects.filter(user=bene1).count(), 0)
+        self.assertEqual(AccessToken.objects.filter(user=bene2).count(), 2)
+        self.assertEqual(ArchivedToken.objects.filter(user=bene1).count(), 3)
+        self.assertEqual(ArchivedToken.objects.filter(user=bene2).count(), 0)
+        archived = ArchivedToken.objects.get(token="bene1-access-0")
+        self.assertEqual(archived.application, self.app)
+        self.assertEqual(archived.scope, "capability-a")
+
+        # Refresh tokens are marked revoked, same as RefreshToken.revoke()
+        self.assertEqual(RefreshToken.objects.filter(user=bene1, revoked__isnull=True).count(), 0)
+        self.assertEqual(RefreshToken.objects.filter(user=bene1, access_token__isnull=False).count(), 0)
+        self.assertEqual(RefreshToken.objects.filter(user=bene2, revoked__isnull=True).count(), 2)
+
+        # The same per-token audit records as the per-token revoke path
+        records = [r for r in self._token_log_records() if r["type"] == "AccessToken"]
+        self.assertEqual(expected_records, records)
+        self.assertEqual("capability-a", records[0]["scopes"])
+        self.assertEqual(bene1.crosswalk.fhir_id, records[0]["crosswalk"]["fhir_id"])
+        self.assertNotIn("bene1-access-0", json.dumps(records))
+
+    def test_single_token_revoke_still_archived(self):
+        bene = self._create_bene_tokens("bene1", "-20000000000002", count=1)
+        AccessToken.objects.get(user=bene).revoke()
+
+        self.assertTrue(ArchivedToken.objects.filter(token="bene1-access-0").exists())
+        records = self._token_log_records()
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["type"], "AccessToken")
+
+    def test_app_wide_revoke_query_count_is_constant(self):
+        self._create_bene_tokens("bene1", "-20000000000002", count=2)
+
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(bulk_revoke_tokens(self.app), (2, 2))
+
+        self._create_bene_tokens("bene2", "-20000000000003", count=5)
+        self._create_bene_tokens("bene3", "-20000000000004", count=5)
+
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(bulk_revoke_tokens(self.app), (10, 10))
+
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertEqual(AccessToken.objects.filter(application=self.app).count(), 0)
+        self.assertEqual(ArchivedToken.objects.filter(application=self.app).count(), 12)
+
+    def test_app_wide_revoke_in_batches(self):
+        self._create_bene_tokens("bene1", "-20000000000002", count=5)
+
+        self.assertEqual(bulk_revoke_tokens(self.app, batch_size=2), (5, 5))
+        self.assertEqual(ArchivedToken.objects.filter(application=self.app).count(), 5)
+
+        # One audit record per token
+        records = self._token_log_records()
+        self.assertEqual(5, len(records))
+        self.assertEqual({"AccessToken"}, {r["type"] for r in records})
+
+        # Nothing left to revoke, no audit record for the empty call
+        self.assertEqual(bulk_revoke_tokens(self.app), (0, 0))
+        self.assertEqual(len(self._token_log_records()), 5)
@@ -1,6 +1,8 @@
 from rest_framework.throttling import SimpleRateThrottle
 from django.utils.deprecation import MiddlewareMixin
 
+from apps.core.metrics import Counter
+
 
 HEADERS = {
     'Remaining': 'X-RateLimit-Remaining',
@@ -8,6 +10,9 @@ HEADERS = {
     'Reset': 'X-RateLimit-Reset',
 }
 
+THROTTLE_DECISIONS = Counter("bb2_token_throttle_decisions_total", "Token rate throttle decisions",
+                             ["result"])
+
 
 class TokenRateThrottle(SimpleRateThrottle):
     """
@@ -32,6 +37,7 @@ class TokenRateThrottle(SimpleRateThrottle):
     def allow_request(self, request, view):
         # run this first to populate/update self.history, self.now, self.duration, self.num_requests
         result = super(TokenRateThrottle, self).allow_request(request, view)
+        THROTTLE_DECISIONS.labels(result="allowed" if result else "throttled").inc()
         try:
             request.META[HEADERS['Remaining']] = self.num_requests - len(self.history)
             request.META[HEADERS['Limit']] = self.num_requests
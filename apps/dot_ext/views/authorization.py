@@ -17,6 +17,7 @@ from oauth2_provider.models import get_application_model
 from oauthlib.oauth2.rfc6749.errors import InvalidClientError
 from urllib.parse import urlparse, parse_qs
 
+from apps.core.metrics import Counter, Histogram, observe_request
 from apps.dot_ext.scopes import CapabilitiesScopes
 import apps.logging.request_logger as bb2logging
 
@@ -42,6 +43,13 @@ log = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
 
 QP_CHECK_LIST = ["client_secret"]
 
+TOKEN_GRANT_TYPES = ["authorization_code", "refresh_token", "client_credentials", "password"]
+
+TOKEN_REQUESTS = Counter("bb2_oauth_token_requests_total", "Token endpoint requests by response status code",
+                         ["grant_type", "status"])
+TOKEN_REQUEST_SECONDS = Histogram("bb2_oauth_token_request_seconds", "Token endpoint latency",
+                                  ["grant_type"])
+
 
 class AuthorizationView(DotAuthorizationView):
     """
@@ -51,6 +59,10 @@ class AuthorizationView(DotAuthorizationView):
     version = None
     form_class = SimpleAllowForm
     login_url = "/mymedicare/login"
+    # SQL queries per request (incl. the metric counter updates), see apps.core.query_budget.
+    # The largest path, withdrawing the demographic scopes of a previously authorized
+    # application (archiving its tokens and grant), runs 51.
+    query_budget = 60
 
     def __init__(self, version=1):
         self.version = version
@@ -59,12 +71,12 @@ class AuthorizationView(DotAuthorizationView):
     def dispatch(self, request, *args, **kwargs):
         """
         Override the base authorization view from dot to
-        initially create an AuthFlowUuid object for authorization
+        initially create an auth flow trace store entry for authorization
         flow tracing in logs.
         """
         # TODO: Should the client_id match a valid application here before continuing, instead of after matching to FHIR_ID?
         if not kwargs.get('is_subclass_approvalview', False):
-            # Create new authorization flow trace UUID in session and AuthFlowUuid instance, if subclass is not ApprovalView
+            # Create new authorization flow trace UUID in session and auth flow trace store, if subclass is not ApprovalView
             create_session_auth_flow_trace(request)
 
         try:
@@ -209,7 +221,7 @@ class AuthorizationView(DotAuthorizationView):
         # We are done using auth_uuid, clear it from the session.
         cleanup_session_auth_flow_trace(self.request)
 
-        # Update AuthFlowUuid instance with code.
+        # Update auth flow trace store entry with code.
         update_instance_auth_flow_trace_with_code(auth_dict, code)
 
         return self.redirect(self.success_url, application)
@@ -265,8 +277,19 @@ class ApprovalView(AuthorizationView):
 
 @method_decorator(csrf_exempt, name="dispatch")
 class TokenView(DotTokenView):
+    # SQL queries per request (incl. the metric counter updates), see apps.core.query_budget
+    query_budget = 44
+
     @method_decorator(sensitive_post_parameters("password"))
     def post(self, request, *args, **kwargs):
+        grant_type = request.POST.get("grant_type")
+        with observe_request(TOKEN_REQUESTS, TOKEN_REQUEST_SECONDS,
+                             grant_type=grant_type if grant_type in TOKEN_GRANT_TYPES else "other") as call:
+            response = self._post(request, *args, **kwargs)
+            call["status"] = response.status_code
+        return response
+
+    def _post(self, request, *args, **kwargs):
         try:
             validate_app_is_active(request)
         except InvalidClientError as error:
@@ -2,6 +2,8 @@ from oauth2_provider.contrib.rest_framework import authentication
 from django.utils import timezone
 from rest_framework import exceptions
 
+from apps.logging.audit_context import record_crosswalk
+
 
 class OAuth2ResourceOwner(authentication.OAuth2Authentication):
     def authenticate(self, request):
@@ -21,8 +23,10 @@ class OAuth2ResourceOwner(authentication.OAuth2Authentication):
             user, access_token = user_auth_tuple
             request.resource_owner = user
             if not hasattr(user, "crosswalk"):
+                record_crosswalk(user, None)
                 return None
             request.crosswalk = user.crosswalk
+            record_crosswalk(user, user.crosswalk)
 
             # Update Application activity metric datetime fields
             access_token.application.last_active = timezone.now()
@@ -30,7 +34,7 @@ class OAuth2ResourceOwner(authentication.OAuth2Authentication):
                 access_token.application.first_active = (
                     access_token.application.last_active
                 )
-            access_token.application.save()
+            access_token.application.save(update_fields=["last_active", "first_active"])
 
             return user, access_token
         return None
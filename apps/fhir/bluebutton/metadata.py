@@ -0,0 +1,293 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from urllib.parse import urlencode, urlparse
+
+from apps.fhir.bluebutton import constants
+from apps.fhir.bluebutton.utils import (request_call,
+                                        prepend_q,
+                                        get_resourcerouter,
+                                        get_response_text,
+                                        build_oauth_resource)
+
+import apps.logging.request_logger as bb2logging
+
+
+"""
+  In-process cache of the filtered BFD FHIR CapabilityStatement per API version.
+
+  The statement only changes with BFD deploys, so a refresher thread,
+  started at process start (hhs_oauth_server.wsgi), fetches it for every
+  API version and refreshes it every settings.FHIR_METADATA_REFRESH_INTERVAL
+  seconds. If a refresh fails the last good copy keeps being served.
+
+  A request finding no statement fetches it (one fetch per version at a
+  time, concurrent requests wait for it); one finding a stale statement,
+  e.g. without a running refresher, starts a background refresh.
+
+  Fetches go through request_call() like the other BFD calls (same
+  certificate, timeout and logging), with the request independent
+  generate_server_info_headers() headers.
+
+  Setting FHIR_METADATA_REFRESH_INTERVAL to 0 disables the cache (BFD is
+  called on every request).
+
+  CALLED FROM: apps.fhir.bluebutton.views.home.fhir_conformance()
+"""
+
+logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
+
+# Max rendered documents (one per issuer/host) kept per cache entry
+MAX_RENDERED_PER_ENTRY = 16
+
+_metadata_cache = {}
+_metadata_lock = threading.Lock()
+_refreshing = set()
+_refresher = None
+# Held while fetching a version's statement
+_fetch_locks = {False: threading.RLock(), True: threading.RLock()}
+
+
+class CapabilityStatementFetchError(Exception):
+    def __init__(self, status_code, content):
+        super().__init__("FHIR metadata fetch failed: {}".format(status_code))
+        self.status_code = status_code
+        self.content = content
+
+
+class CapabilityStatementEntry:
+    """
+    A filtered CapabilityStatement, without the request specific
+    security section, and its renderings per issuer.
+    """
+
+    def __init__(self, statement, last_modified=None):
+        self.statement = statement
+        self.digest = hashlib.sha256(json.dumps(statement).encode('utf-8')).hexdigest()
+        self.checked_at = time.time()
+        self.last_modified = last_modified or int(self.checked_at)
+        self._rendered = {}
+
+    def is_stale(self):
+        return time.time() - self.checked_at >= settings.FHIR_METADATA_REFRESH_INTERVAL
+
+    def render(self, request, v2=False):
+        """
+        Return (body, etag) of the statement with the security
+        section for the issuer of the request.
+        """
+        security = build_oauth_resource(request, v2, format_type="json")
+        key = json.dumps(security)
+
+        rendered = self._rendered.get(key)
+        if rendered is None:
+            od = OrderedDict(self.statement)
+            # Append Security to ConformanceStatement
+            od['rest'] = [OrderedDict(od['rest'][0], security=security)] + od['rest'][1:]
+            # Fix format values
+            od['format'] = ['application/json', 'application/fhir+json']
+
+            body = json.dumps(od, cls=DjangoJSONEncoder).encode('utf-8')
+            rendered = (body, '"{}"'.format(hashlib.sha256(body).hexdigest()))
+
+            if len(self._rendered) >= MAX_RENDERED_PER_ENTRY:
+                self._rendered.clear()
+            self._rendered[key] = rendered
+
+        return rendered
+
+
+def get_metadata_url(v2=False):
+    resource_router = get_resourcerouter()
+    parsed_url = urlparse(resource_router.fhir_url)
+    if parsed_url.path is not None:
+        return '{}://{}/{}/fhir/metadata'.format(parsed_url.scheme, parsed_url.netloc, 'v2' if v2 else 'v1')
+    else:
+        # url with no path
+        return '{}/{}/fhir/metadata'.format(resource_router.fhir_url, 'v2' if v2 else 'v1')
+
+
+def fetch_capability_statement(v2=False):
+    """
+    Fetch and filter the CapabilityStatement from BFD.
+
+    Raises CapabilityStatementFetchError on failure.
+    """
+    call_to = get_metadata_url(v2) + prepend_q(urlencode({'_format': 'json'}))
+    r = request_call(None, call_to, None, timeout=settings.REQUEST_CALL_TIMEOUT)
+
+    text_in = get_response_text(fhir_response=r)
+    if r.status_code >= 300:
+        raise CapabilityStatementFetchError(r.status_code, text_in)
+
+    try:
+        statement = conformance_filter(json.loads(text_in, object_pairs_hook=OrderedDict))
+    except ValueError as e:
+        raise CapabilityStatementFetchError(502, str(e))
+
+    if not statement or not statement.get('rest'):
+        raise CapabilityStatementFetchError(502, "CapabilityStatement without rest section")
+
+    return statement
+
+
+def refresh_capability_statement(v2=False):
+    """
+    Fetch the statement into the cache. Keeps (and returns) the
+    last good copy if the fetch fails and one is cached.
+    """
+    with _fetch_locks[v2]:
+        previous = _metadata_cache.get(v2)
+
+        try:
+            statement = fetch_capability_statement(v2)
+        except CapabilityStatementFetchError as e:
+            if previous is None:
+                raise
+            logger.warning("FHIR metadata refresh failed, serving last good copy: %s" % e)
+            previous.checked_at = time.time()
+            return previous
+
+        entry = CapabilityStatementEntry(statement)
+        if previous is not None and previous.digest == entry.digest:
+            entry.last_modified = previous.last_modified
+            entry._rendered = previous._rendered
+
+        _metadata_cache[v2] = entry
+        return entry
+
+
+def refresh_capability_statements():
+    """
+    Refresh the statement of every API version, logging the failures.
+    """
+    for v2 in (False, True):
+        try:
+            refresh_capability_statement(v2)
+        except Exception:
+            logger.exception("FHIR metadata refresh failed")
+
+
+def _refresh_periodically():
+    while True:
+        refresh_capability_statements()
+        connections.close_all()
+        time.sleep(settings.FHIR_METADATA_REFRESH_INTERVAL)
+
+
+def start_capability_statement_refresher():
+    """
+    Start the thread filling the cache and refreshing it every
+    FHIR_METADATA_REFRESH_INTERVAL seconds, once per process.
+
+    CALLED FROM: hhs_oauth_server.wsgi at process start.
+    """
+    global _refresher
+
+    if not settings.FHIR_METADATA_REFRESH_INTERVAL:
+        return False
+
+    with _metadata_lock:
+        if _refresher is not None:
+            return False
+        _refresher = threading.Thread(target=_refresh_periodically, daemon=True)
+
+    _refresher.start()
+    return True
+
+
+def _refresh_in_background(v2):
+    try:
+        refresh_capability_statement(v2)
+    except Exception:
+        logger.exception("FHIR metadata refresh failed")
+    finally:
+        with _metadata_lock:
+            _refreshing.discard(v2)
+        connections.close_all()
+
+
+def start_capability_statement_refresh(v2=False):
+    """
+    Start a background refresh unless one is already running.
+    """
+    with _metadata_lock:
+        if v2 in _refreshing:
+            return False
+        _refreshing.add(v2)
+
+    threading.Thread(target=_refresh_in_background, args=(v2,), daemon=True).start()
+    return True
+
+
+def get_capability_statement(v2=False):
+    """
+    Return the cached CapabilityStatementEntry, fetching it when missing.
+    A stale entry is returned while a background refresh is started.
+    """
+    if not settings.FHIR_METADATA_REFRESH_INTERVAL:
+        return CapabilityStatementEntry(fetch_capability_statement(v2))
+
+    entry = _metadata_cache.get(v2)
+    if entry is None:
+        with _fetch_locks[v2]:
+            # Unless fetched by another request while waiting
+            entry = _metadata_cache.get(v2)
+            if entry is None:
+                entry = refresh_capability_statement(v2)
+        return entry
+
+    if entry.is_stale():
+        start_capability_statement_refresh(v2)
+
+    return entry
+
+
+def clear_capability_statement_cache():
+    _metadata_cache.clear()
+
+
+def conformance_filter(text_block):
+    """ Filter FHIR Conformance Statement based on
+        supported ResourceTypes
+    """
+
+    resource_names = constants.ALLOWED_RESOURCE_TYPES
+    ct = 0
+    if text_block:
+        if 'rest' in text_block:
+            for k in text_block['rest']:
+                for i, v in k.items():
+                    if i == 'resource':
+                        supp_resources = get_supported_resources(v, resource_names)
+                        text_block['rest'][ct]['resource'] = supp_resources
+                ct += 1
+        else:
+            text_block = ""
+    else:
+        text_block = ""
+
+    return text_block
+
+
+def get_supported_resources(resources, resource_names):
+    """ Filter resources for resource type matches """
+
+    resource_list = []
+
+    # if resource 'type in resource_names add resource to resource_list
+    for item in resources:
+        for k, v in item.items():
+            if k == 'type':
+                if v in resource_names:
+                    item['interaction'] = [{"code": "read"}, {"code": "search-type"}]
+                    resource_list.append(item)
+
+    return resource_list
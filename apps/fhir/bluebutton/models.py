@@ -11,6 +11,7 @@ from rest_framework import status
 from rest_framework.exceptions import APIException
 
 from apps.accounts.models import get_user_id_salt
+from apps.core.aggregation import CountIf, aggregate_counts
 
 
 class BBFhirBluebuttonModelException(APIException):
@@ -281,13 +282,19 @@ def get_crosswalk_bene_counts():
 
     start_time = datetime.utcnow().timestamp()
 
-    # Get total table counts
-    counts_returned["total"] = Crosswalk.objects.count()
+    # Total and real/synth counts (same filters as the real/synth_objects managers) in one scan
+    counts_returned.update(
+        aggregate_counts(
+            Crosswalk.objects,
+            {
+                "total": CountIf(),
+                "synthetic": CountIf(Q(_fhir_id__startswith="-")),
+                "real": CountIf(~Q(_fhir_id__startswith="-") & ~Q(_fhir_id="")),
+            },
+        )
+    )
     counts_returned["archived_total"] = ArchivedCrosswalk.objects.count()
 
-    counts_returned["synthetic"] = Crosswalk.synth_objects.count()
-    counts_returned["real"] = Crosswalk.real_objects.count()
-
     counts_returned["elapsed"] = round(datetime.utcnow().timestamp() - start_time, 3)
 
     return counts_returned
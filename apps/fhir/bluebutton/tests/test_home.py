@@ -5,7 +5,25 @@ Created: 7/19/16 9:04 AM
 
 File created by: ''
 """
-from django.test import TestCase, RequestFactory
+import threading
+import time
+
+from unittest import mock
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.test import TestCase, RequestFactory, override_settings
+from django.urls import reverse
+from httmock import all_requests, HTTMock
+
+from apps.fhir.bluebutton import metadata
+from apps.fhir.bluebutton.metadata import (clear_capability_statement_cache,
+                                           get_capability_statement,
+                                           refresh_capability_statement,
+                                           refresh_capability_statements,
+                                           start_capability_statement_refresh,
+                                           start_capability_statement_refresher)
+from apps.fhir.bluebutton.tests.test_fhir_resources_read_search_w_validation import get_response_json
 
 
 class BlueButtonReadRequestTest(TestCase):
@@ -28,3 +46,142 @@ class ConformanceFilterTest(TestCase):
     # Make call to Conformance Statement
 
     # Test that Patient is only resource displayed
+
+
+@override_settings(FHIR_METADATA_REFRESH_INTERVAL=600)
+class FhirConformanceCacheTest(TestCase):
+    """ Test the cached Conformance Statement served from /metadata """
+
+    def setUp(self):
+        clear_capability_statement_cache()
+        self.calls = []
+        self.headers = []
+        self.status_code = 200
+
+        @all_requests
+        def bfd_metadata(url, req):
+            self.calls.append(url.path)
+            self.headers.append(req.headers)
+            return {
+                'status_code': self.status_code,
+                'content': get_response_json("fhir_meta_v2" if url.path.startswith("/v2") else "fhir_meta_v1"),
+            }
+        self.bfd_metadata = bfd_metadata
+
+    def tearDown(self):
+        clear_capability_statement_cache()
+
+    def test_cached_per_version(self):
+        with HTTMock(self.bfd_metadata):
+            for i in range(2):
+                response = self.client.get(reverse('fhir_conformance_metadata'))
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()["fhirVersion"], '3.0.2')
+                self.assertIn("security", response.json()["rest"][0])
+
+            response = self.client.get(reverse('fhir_conformance_metadata_v2'))
+            self.assertEqual(response.json()["fhirVersion"], '4.0.0')
+
+        self.assertEqual(self.calls, ["/v1/fhir/metadata", "/v2/fhir/metadata"])
+        # Fetched through request_call(), with request independent headers
+        self.assertEqual(self.headers[0]['BlueButton-OriginalUrl'], "")
+        self.assertEqual(self.headers[0]['BlueButton-BeneficiaryId'], "")
+        self.assertEqual(self.headers[0]['X-Forwarded-Host'], urlparse(settings.HOSTNAME_URL).netloc)
+        self.assertIn('BlueButton-OriginalQueryId', self.headers[1])
+
+    def test_conditional_get(self):
+        with HTTMock(self.bfd_metadata):
+            response = self.client.get(reverse('fhir_conformance_metadata'))
+            etag = response['ETag']
+            self.assertTrue(response.has_header('Last-Modified'))
+
+            response = self.client.get(reverse('fhir_conformance_metadata'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+            # ETag differs per issuer (security section)
+            with self.settings(HOSTNAME_URL="https://other.example.com"):
+                response = self.client.get(reverse('fhir_conformance_metadata'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "https://other.example.com")
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_last_good_copy_served_when_bfd_unavailable(self):
+        with HTTMock(self.bfd_metadata):
+            response = self.client.get(reverse('fhir_conformance_metadata'))
+            etag = response['ETag']
+
+            self.status_code = 503
+            entry = refresh_capability_statement()
+
+            response = self.client.get(reverse('fhir_conformance_metadata'))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(entry, get_capability_statement())
+
+            # Nothing cached yet for v2
+            response = self.client.get(reverse('fhir_conformance_metadata_v2'))
+            self.assertEqual(response.status_code, 503)
+
+    def test_stale_entry_refreshed_in_background(self):
+        with HTTMock(self.bfd_metadata):
+            entry = get_capability_statement()
+            entry.checked_at -= 601
+
+            with mock.patch('apps.fhir.bluebutton.metadata.threading.Thread') as thread:
+                self.assertEqual(get_capability_statement(), entry)
+                thread.assert_called_once()
+                thread.return_value.start.assert_called_once()
+                # Refresh already running
+                self.assertFalse(start_capability_statement_refresh())
+
+            thread.call_args[1]["target"](*thread.call_args[1]["args"])
+            refreshed = get_capability_statement()
+
+        self.assertIsNot(refreshed, entry)
+        self.assertFalse(refreshed.is_stale())
+        # Unchanged content keeps the Last-Modified value
+        self.assertEqual(refreshed.last_modified, entry.last_modified)
+
+    def test_refresher(self):
+        with mock.patch('apps.fhir.bluebutton.metadata._refresher', None):
+            with mock.patch('apps.fhir.bluebutton.metadata.threading.Thread') as thread:
+                self.assertTrue(start_capability_statement_refresher())
+                # Once per process
+                self.assertFalse(start_capability_statement_refresher())
+            thread.assert_called_once()
+            thread.return_value.start.assert_called_once()
+
+        # Each run fills or refreshes every API version, without a request
+        with HTTMock(self.bfd_metadata):
+            refresh_capability_statements()
+            with mock.patch('apps.fhir.bluebutton.metadata.threading.Thread') as thread:
+                self.assertEqual(get_capability_statement().statement["fhirVersion"], '3.0.2')
+                self.assertEqual(get_capability_statement(True).statement["fhirVersion"], '4.0.0')
+            thread.assert_not_called()
+        self.assertEqual(self.calls, ["/v1/fhir/metadata", "/v2/fhir/metadata"])
+
+    @override_settings(FHIR_METADATA_REFRESH_INTERVAL=0)
+    def test_refresher_disabled(self):
+        with mock.patch('apps.fhir.bluebutton.metadata._refresher', None):
+            with mock.patch('apps.fhir.bluebutton.metadata.threading.Thread') as thread:
+                self.assertFalse(start_capability_statement_refresher())
+            thread.assert_not_called()
+
+    def test_first_fetch_single_flight(self):
+        statement = {"rest": [{"resource": []}]}
+
+        def slow_fetch(v2=False):
+            time.sleep(0.1)
+            return statement
+
+        with mock.patch('apps.fhir.bluebutton.metadata.fetch_capability_statement',
+                        side_effect=slow_fetch) as fetch:
+            threads = [threading.Thread(target=get_capability_statement) for i in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        fetch.assert_called_once()
+        self.assertEqual(statement, metadata._metadata_cache[False].statement)
@@ -5,11 +5,14 @@ import apps.logging.request_logger as bb2logging
 
 import pytz
 import requests
+import threading
+import time
 import uuid
 
 from collections import OrderedDict
 from datetime import datetime
 from pytz import timezone
+from urllib.parse import urlparse
 
 from django.conf import settings
 from django.contrib import messages
@@ -22,6 +25,13 @@ from .models import Crosswalk, Fhir_Response
 
 logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
 
+# Most patients kept by the get_patient_by_id() cache
+PATIENT_CACHE_MAX_ENTRIES = 1000
+
+# {fhir_id: (fetched at, patient)}, least recently fetched first
+_patient_cache = OrderedDict()
+_patient_cache_lock = threading.Lock()
+
 
 def get_user_from_request(request):
     """Returns a user or None with login or OAuth2 API"""
@@ -187,6 +197,8 @@ def set_default_header(request, header=None):
         header = {}
 
     header['keep-alive'] = settings.REQUEST_EOB_KEEP_ALIVE
+    # Ask for compressed payloads, requests decodes them transparently
+    header['Accept-Encoding'] = settings.REQUEST_BACKEND_ACCEPT_ENCODING
     if request.is_secure():
         header['X-Forwarded-Proto'] = "https"
     else:
@@ -203,8 +215,31 @@ def set_default_header(request, header=None):
     return header
 
 
+def generate_server_info_headers():
+    """
+    Returns the headers of a backend call made for no particular request
+    (e.g. the background FHIR metadata refresh), the request independent
+    part of generate_info_headers() and set_default_header()
+    """
+    hostname_url = urlparse(settings.HOSTNAME_URL)
+    return {
+        'includeAddressFields': 'False',
+        'BlueButton-OriginalQueryTimestamp': str(get_timestamp(None)),
+        'BlueButton-OriginalQueryId': str(get_query_id(None)),
+        'BlueButton-OriginalQueryCounter': str(get_query_counter(None)),
+        'BlueButton-BeneficiaryId': "",
+        'keep-alive': settings.REQUEST_EOB_KEEP_ALIVE,
+        'Accept-Encoding': settings.REQUEST_BACKEND_ACCEPT_ENCODING,
+        'X-Forwarded-Proto': hostname_url.scheme,
+        'X-Forwarded-Host': hostname_url.netloc,
+        'X-Forwarded-For': "",
+    }
+
+
 def request_call(request, call_url, crosswalk=None, timeout=None, get_parameters={}):
     """  call to request or redirect on fail
+    request = the request the call is made for, None for a call made for
+    no particular request (see generate_server_info_headers())
     call_url = target server URL and search parameters to be sent
     crosswalk = Crosswalk record. The crosswalk is keyed off Request.user
     timeout allows a timeout in seconds to be set.
@@ -234,13 +269,16 @@ def request_call(request, call_url, crosswalk=None, timeout=None, get_parameters
     else:
         cert = ()
 
-    header_info = generate_info_headers(request)
+    if request is None:
+        header_info = generate_server_info_headers()
+    else:
+        header_info = generate_info_headers(request)
 
-    header_info = set_default_header(request, header_info)
+        header_info = set_default_header(request, header_info)
 
     header_detail = header_info
-    header_detail['BlueButton-OriginalUrl'] = request.path
-    header_detail['BlueButton-OriginalQuery'] = request.META['QUERY_STRING']
+    header_detail['BlueButton-OriginalUrl'] = request.path if request is not None else ""
+    header_detail['BlueButton-OriginalQuery'] = request.META['QUERY_STRING'] if request is not None else ""
     header_detail['BlueButton-BackendCall'] = call_url
 
     logger_perf.info(header_detail)
@@ -290,7 +328,8 @@ def request_call(request, call_url, crosswalk=None, timeout=None, get_parameters
 
         fhir_response = build_fhir_response(request, call_url, crosswalk, r=None, e=e)
 
-        messages.error(request, 'Problem connecting to FHIR Server.')
+        if request is not None:
+            messages.error(request, 'Problem connecting to FHIR Server.')
 
         logger.debug("HTTPError Status_code:%s" %
                      requests.exceptions.HTTPError)
@@ -493,12 +532,12 @@ def build_fhir_response(request, call_url, crosswalk, r=None, e=None):
         else:
             fhir_response._json = {}
 
-        if 'user' in request:
+        if request is not None and 'user' in request:
             fhir_response._owner = request.user + ":"
         else:
             fhir_response._owner = ":"
 
-        if 'resource_owner' in request:
+        if request is not None and 'resource_owner' in request:
             fhir_response._owner = request.resource_owner
         else:
             fhir_response._owner += ""
@@ -519,11 +558,11 @@ def build_fhir_response(request, call_url, crosswalk, r=None, e=None):
         fhir_response._text = "No Text returned"
         fhir_response._json = {}
 
-        if 'user' in request:
+        if request is not None and 'user' in request:
             fhir_response._owner = request.user + ":"
         else:
             fhir_response._owner = ":"
-        if 'resource_owner' in request:
+        if request is not None and 'resource_owner' in request:
             fhir_response._owner += request.resource_owner
         else:
             fhir_response._owner += ""
@@ -663,16 +702,9 @@ def build_oauth_resource(request, v2=False, format_type="json"):
     return security
 
 
-def get_patient_by_id(id, request):
-    '''
-    a helper adapted to just get patient given an id out of band of auth flow
-    or noraml data flow, use by tools such as BB2-Tools admin viewers
-    '''
+def _fetch_patient(id, headers):
     auth_settings = FhirServerAuth(None)
     certs = (auth_settings['cert_file'], auth_settings['key_file'])
-    headers = generate_info_headers(request)
-    headers['BlueButton-Application'] = "BB2-Tools"
-    headers['includeIdentifiers'] = "true"
     url = "{}Patient/{}?_format={}".format(get_resourcerouter().fhir_url, id, settings.FHIR_PARAM_FORMAT)
     s = requests.Session()
     req = requests.Request('GET', url, headers=headers)
@@ -680,3 +712,49 @@ def get_patient_by_id(id, request):
     response = s.send(prepped, cert=certs, verify=False)
     response.raise_for_status()
     return response.json()
+
+
+def _get_cached_patient(id):
+    with _patient_cache_lock:
+        entry = _patient_cache.get(id)
+        if entry is None:
+            return None
+        fetched_at, patient = entry
+        if time.monotonic() - fetched_at >= settings.BFD_PATIENT_CACHE_TTL:
+            del _patient_cache[id]
+            return None
+        return patient
+
+
+def _cache_patient(id, patient):
+    if not settings.BFD_PATIENT_CACHE_TTL:
+        return
+    with _patient_cache_lock:
+        _patient_cache.pop(id, None)
+        _patient_cache[id] = (time.monotonic(), patient)
+        while len(_patient_cache) > PATIENT_CACHE_MAX_ENTRIES:
+            _patient_cache.popitem(last=False)
+
+
+def clear_patient_cache():
+    with _patient_cache_lock:
+        _patient_cache.clear()
+
+
+def get_patient_by_id(id, request):
+    '''
+    a helper adapted to just get patient given an id out of band of auth flow
+    or noraml data flow, use by tools such as BB2-Tools admin viewers
+
+    patients fetched in the last settings.BFD_PATIENT_CACHE_TTL seconds
+    are served from an in process cache (patient data is kept out of the
+    shared cache)
+    '''
+    patient = _get_cached_patient(id)
+    if patient is None:
+        headers = generate_info_headers(request)
+        headers['BlueButton-Application'] = "BB2-Tools"
+        headers['includeIdentifiers'] = "true"
+        patient = _fetch_patient(id, headers)
+        _cache_patient(id, patient)
+    return patient
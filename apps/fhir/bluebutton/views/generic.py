@@ -12,10 +12,12 @@ from rest_framework.views import APIView
 from urllib.parse import quote
 
 from apps.authorization.permissions import DataAccessGrantPermission
+from apps.core.metrics import Counter, Histogram, observe_request
 from apps.dot_ext.throttling import TokenRateThrottle
 from apps.fhir.parsers import FHIRParser
 from apps.fhir.renderers import FHIRRenderer
 from apps.fhir.server import connection as backend_connection
+from apps.logging.timing import span
 
 from ..authentication import OAuth2ResourceOwner
 from ..exceptions import process_error_response
@@ -30,6 +32,11 @@ from ..utils import (build_fhir_response,
 
 logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
 
+BFD_REQUESTS = Counter("bb2_bfd_requests_total", "BFD FHIR requests by status code",
+                       ["version", "resource_type", "status"])
+BFD_REQUEST_SECONDS = Histogram("bb2_bfd_request_seconds", "BFD FHIR request latency",
+                                ["version", "resource_type"])
+
 
 class FhirDataView(APIView):
     version = None
@@ -44,6 +51,8 @@ class FhirDataView(APIView):
         HasCrosswalk,
         ResourcePermission,
         DataAccessGrantPermission]
+    # SQL queries per request, see apps.core.query_budget
+    query_budget = 12
 
     def __init__(self, version=1):
         self.version = version
@@ -77,6 +86,46 @@ class FhirDataView(APIView):
     def validate_response(self, response):
         pass
 
+    # Timing spans (see apps.logging.timing) for the request phases
+
+    def perform_authentication(self, request):
+        with span("auth"):
+            super().perform_authentication(request)
+
+    def check_throttles(self, request):
+        with span("throttle"):
+            super().check_throttles(request)
+
+    def check_permissions(self, request):
+        for permission in self.get_permissions():
+            with span("permission." + type(permission).__name__):
+                allowed = permission.has_permission(request, self)
+            if not allowed:
+                self.permission_denied(
+                    request,
+                    message=getattr(permission, 'message', None),
+                    code=getattr(permission, 'code', None)
+                )
+
+    def check_object_permissions(self, request, obj):
+        for permission in self.get_permissions():
+            with span("object_permission." + type(permission).__name__):
+                allowed = permission.has_object_permission(request, self, obj)
+            if not allowed:
+                self.permission_denied(
+                    request,
+                    message=getattr(permission, 'message', None),
+                    code=getattr(permission, 'code', None)
+                )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        # Render here rather than in the Django handler, to time it
+        if isinstance(response, Response) and not response.is_rendered:
+            with span("render"):
+                response.render()
+        return response
+
     def initial(self, request, resource_type, *args, **kwargs):
         """
         Read from Remote FHIR Server
@@ -133,11 +182,15 @@ class FhirDataView(APIView):
         prepped = s.prepare_request(req)
         # Send signal
         pre_fetch.send_robust(FhirDataView, request=req, auth_request=request, api_ver='v2' if self.version == 2 else 'v1')
-        r = s.send(
-            prepped,
-            cert=backend_connection.certs(crosswalk=request.crosswalk),
-            timeout=resource_router.wait_time,
-            verify=FhirServerVerify(crosswalk=request.crosswalk))
+        with span("bfd_fetch"), observe_request(BFD_REQUESTS, BFD_REQUEST_SECONDS,
+                                                version='v2' if self.version == 2 else 'v1',
+                                                resource_type=resource_type) as call:
+            r = s.send(
+                prepped,
+                cert=backend_connection.certs(crosswalk=request.crosswalk),
+                timeout=resource_router.wait_time,
+                verify=FhirServerVerify(crosswalk=request.crosswalk))
+            call["status"] = r.status_code
         # Send signal
         post_fetch.send_robust(FhirDataView, request=prepped, auth_request=request,
                                response=r, api_ver='v2' if self.version == 2 else 'v1')
@@ -151,7 +204,8 @@ class FhirDataView(APIView):
 
         self.validate_response(response)
 
-        out_data = r.json()
+        with span("json_parse"):
+            out_data = r.json()
 
         self.check_object_permissions(request, out_data)
 
@@ -5,9 +5,11 @@ from .views import (
     CheckInternal,
     CheckExternal,
     CheckSLSX,
+    Metrics,
 )
 
 urlpatterns = [
+    url(r'metrics', Metrics.as_view()),
     url(r'external', CheckExternal.as_view()),
     url(r'external_v2', CheckExternal.as_view()),
     url(r'bfd', CheckBFD.as_view()),
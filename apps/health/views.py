@@ -1,6 +1,10 @@
+import hmac
 import logging
 
+from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.views import View
 from rest_framework.exceptions import APIException
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -14,6 +18,8 @@ from .checks import (
 
 import apps.logging.request_logger as bb2logging
 
+from apps.core.metrics import CONTENT_TYPE, REGISTRY
+
 logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
 
 
@@ -66,3 +72,18 @@ class CheckBFD(Check):
 
 class CheckDB(Check):
     services = db_services
+
+
+class Metrics(View):
+    """
+    Operational metrics in the Prometheus text format, for requests with
+    the settings.METRICS_ENDPOINT_TOKEN bearer token.
+    """
+
+    def get(self, request):
+        if not settings.METRICS_ENDPOINT_TOKEN:
+            raise Http404()
+        expected = "Bearer {}".format(settings.METRICS_ENDPOINT_TOKEN)
+        if not hmac.compare_digest(request.META.get("HTTP_AUTHORIZATION", "").encode(), expected.encode()):
+            return HttpResponseForbidden()
+        return HttpResponse(REGISTRY.generate_text(), content_type=CONTENT_TYPE)
@@ -0,0 +1,104 @@
+import contextvars
+
+from django.core.exceptions import ObjectDoesNotExist
+from oauth2_provider.models import AccessToken, get_application_model
+
+
+"""
+  Request scoped audit context.
+
+  Authentication (the oauth2 validator and backend) records the objects
+  it resolves while handling the request, so the request/response audit
+  log (hhs_oauth_server.request_logging.RequestResponseLog) can be built
+  without querying for them again.
+
+  The context is current for the duration of the request (set by
+  RequestTimeLoggingMiddleware), the record_*() functions are no-ops
+  outside of a request.
+"""
+
+_current_audit_context = contextvars.ContextVar("audit_context", default=None)
+
+
+class AuditContext:
+    def __init__(self):
+        # token string -> AccessToken (None if not found)
+        self.access_tokens = {}
+        # client_id -> Application (None if not found)
+        self.applications = {}
+        # user pk -> Crosswalk (None if the user has none)
+        self.crosswalks = {}
+        # Hash of the access token replaced by a refresh_token grant
+        self.refreshed_access_token_hash = None
+        # Body size of a streaming response, counted while it is sent
+        self.response_size = None
+
+    def get_access_token(self, token):
+        if token not in self.access_tokens:
+            self.access_tokens[token] = (AccessToken.objects
+                                         .select_related("application__user", "user__crosswalk")
+                                         .filter(token=token).first())
+        return self.access_tokens[token]
+
+    def get_application(self, client_id):
+        if client_id not in self.applications:
+            self.applications[client_id] = get_application_model().objects.filter(client_id=client_id).first()
+        return self.applications[client_id]
+
+    def get_token_scopes(self, access_token):
+        """
+        Space separated scopes of access_token. Scopes are checked against
+        the known capabilities when the token is issued, so unlike
+        AccessToken.scopes this does not load them again.
+        """
+        return " ".join(access_token.scope.split())
+
+    def get_crosswalk(self, user):
+        if user.pk not in self.crosswalks:
+            try:
+                self.crosswalks[user.pk] = user.crosswalk
+            except ObjectDoesNotExist:
+                self.crosswalks[user.pk] = None
+        return self.crosswalks[user.pk]
+
+
+def start_audit_context(request):
+    """
+    Make a new AuditContext current and attach it to the request.
+
+    Returns the token for end_audit_context().
+    """
+    request._audit_context = AuditContext()
+    return _current_audit_context.set(request._audit_context)
+
+
+def end_audit_context(token):
+    _current_audit_context.reset(token)
+
+
+def get_audit_context():
+    return _current_audit_context.get()
+
+
+def record_access_token(token, access_token):
+    audit_context = _current_audit_context.get()
+    if audit_context is not None and token:
+        audit_context.access_tokens[token] = access_token
+
+
+def record_application(client_id, application):
+    audit_context = _current_audit_context.get()
+    if audit_context is not None and client_id:
+        audit_context.applications[client_id] = application
+
+
+def record_crosswalk(user, crosswalk):
+    audit_context = _current_audit_context.get()
+    if audit_context is not None and user is not None:
+        audit_context.crosswalks[user.pk] = crosswalk
+
+
+def record_refreshed_access_token_hash(token_hash):
+    audit_context = _current_audit_context.get()
+    if audit_context is not None:
+        audit_context.refreshed_access_token_hash = token_hash
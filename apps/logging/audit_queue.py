@@ -0,0 +1,232 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from django.conf import settings
+
+
+"""
+  Non-blocking audit log pipeline.
+
+  Audit records (the data dicts passed to apps.logging.request_logger
+  BasicLogger/RequestLogger) are put on a bounded in-process queue and a
+  background writer thread serializes them to JSON and hands them to the
+  logger's handlers, in batches of up to settings.AUDIT_LOG_QUEUE_BATCH_SIZE
+  records or every settings.AUDIT_LOG_QUEUE_FLUSH_INTERVAL seconds.
+
+  The log records written are the same as when logging synchronously
+  (message is the JSON dump of the data dict, logged on the same logger
+  at the same level), with the record time set to the time the record
+  was queued.
+
+  When the queue is full, settings.AUDIT_LOG_QUEUE_OVERFLOW decides:
+    - "drop": The record is dropped and counted, the count is reported
+              on the hhs_server logger.
+    - "block": Wait up to settings.AUDIT_LOG_QUEUE_BLOCK_TIMEOUT seconds
+               for space (None = no limit), then drop.
+
+  The queue is drained on interpreter shutdown (atexit).
+"""
+
+OVERFLOW_DROP = "drop"
+OVERFLOW_BLOCK = "block"
+OVERFLOW_POLICIES = [OVERFLOW_DROP, OVERFLOW_BLOCK]
+
+# Max seconds to wait for the writer to drain the queue at shutdown
+SHUTDOWN_TIMEOUT = 10
+
+# Name of the hhs_server logger, see apps.logging.request_logger.HHS_SERVER_LOGNAME_FMT
+logger = logging.getLogger("hhs_server.{}".format(__name__))
+
+_STOP = object()
+
+
+class AuditLogEntry:
+    __slots__ = ("logger", "level", "data", "cls", "created", "exc_info")
+
+    def __init__(self, logger, level, data, cls=None, exc_info=None):
+        self.logger = logger
+        self.level = level
+        # Shallow copy, the caller may keep updating its dict
+        self.data = dict(data) if isinstance(data, dict) else data
+        self.cls = cls
+        self.created = time.time()
+        self.exc_info = exc_info
+
+
+class AuditLogQueue:
+    def __init__(self, maxsize=10000, batch_size=100, flush_interval=1.0,
+                 overflow=OVERFLOW_DROP, block_timeout=1.0, format_message=None):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown audit log queue overflow policy: {}".format(overflow))
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.format_message = format_message or format_audit_message
+
+        self.dropped = 0
+        self.written = 0
+        self._reported_dropped = 0
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+    def _ensure_started(self):
+        # (Re)start in a forked worker process, the parent's thread is not copied.
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid() or self._thread is None or not self._thread.is_alive():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue(self.maxsize)
+                    self.dropped = self.written = self._reported_dropped = 0
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+                self._thread.start()
+
+    def put(self, entry):
+        """
+        Queue an AuditLogEntry. Returns False if it was dropped.
+        """
+        self._ensure_started()
+        try:
+            if self.overflow == OVERFLOW_BLOCK:
+                self._queue.put(entry, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(entry)
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+
+    def qsize(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _next_batch(self):
+        """
+        Return (batch, stop). Waits for the first record, then collects
+        records until the batch is full or the flush interval is over.
+        """
+        batch = []
+        item = self._queue.get()
+        if item is _STOP:
+            return batch, True
+        batch.append(item)
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch, stop = self._next_batch()
+            self.write_batch(batch)
+            self._report_dropped()
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+
+    def write_batch(self, batch):
+        for entry in batch:
+            try:
+                record = entry.logger.makeRecord(
+                    entry.logger.name, entry.level, __file__, 0,
+                    self.format_message(entry.data, entry.cls), (), entry.exc_info)
+                record.created = entry.created
+                record.msecs = (entry.created - int(entry.created)) * 1000
+                entry.logger.handle(record)
+                self.written += 1
+            except Exception:
+                logger.exception("Failed to write audit log record")
+
+    def _report_dropped(self):
+        with self._lock:
+            dropped = self.dropped - self._reported_dropped
+            self._reported_dropped = self.dropped
+        if dropped:
+            logger.warning("Audit log queue full, dropped %s records (%s total)" % (dropped, self.dropped))
+
+    def flush(self):
+        """
+        Block until all queued records are written.
+        """
+        if self._queue is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self, timeout=SHUTDOWN_TIMEOUT):
+        """
+        Write out the queued records and stop the writer thread.
+        """
+        if self._queue is None or self._pid != os.getpid() or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.error("Audit log queue did not drain at shutdown, %s records lost" % self.qsize())
+            return
+        self._thread.join(timeout)
+
+
+def format_audit_message(data_dict, cls=None):
+    try:
+        if settings.LOG_JSON_FORMAT_PRETTY:
+            args = {"sort_keys": True, "indent": 2, "cls": cls}
+        else:
+            args = {"cls": cls}
+        return json.dumps(data_dict, **args)
+    except Exception:
+        return "Could not turn the data_dict into a JSON dump"
+
+
+_audit_log_queue = None
+_audit_log_queue_lock = threading.Lock()
+
+
+def get_audit_log_queue():
+    """
+    Return the process wide AuditLogQueue, or None when
+    settings.AUDIT_LOG_QUEUE_ENABLED is off.
+    """
+    global _audit_log_queue
+    if not settings.AUDIT_LOG_QUEUE_ENABLED:
+        return None
+    if _audit_log_queue is None:
+        with _audit_log_queue_lock:
+            if _audit_log_queue is None:
+                _audit_log_queue = AuditLogQueue(
+                    maxsize=settings.AUDIT_LOG_QUEUE_SIZE,
+                    batch_size=settings.AUDIT_LOG_QUEUE_BATCH_SIZE,
+                    flush_interval=settings.AUDIT_LOG_QUEUE_FLUSH_INTERVAL,
+                    overflow=settings.AUDIT_LOG_QUEUE_OVERFLOW,
+                    block_timeout=settings.AUDIT_LOG_QUEUE_BLOCK_TIMEOUT,
+                )
+    return _audit_log_queue
+
+
+def flush_audit_log_queue():
+    if _audit_log_queue is not None:
+        _audit_log_queue.flush()
+
+
+@atexit.register
+def stop_audit_log_queue():
+    if _audit_log_queue is not None:
+        _audit_log_queue.stop()
@@ -1,4 +1,5 @@
 from datetime import datetime
+from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
 
 import apps.logging.request_logger as logging
@@ -6,15 +7,18 @@ import apps.logging.request_logger as logging
 from apps.accounts.models import UserProfile
 from apps.authorization.models import (
     get_grant_bene_counts,
+    get_grant_bene_counts_by_application,
     get_beneficiary_counts,
     get_beneficiary_grant_app_pair_counts,
 )
 
+from apps.core.counters import get_counters
 from apps.dot_ext.models import (
     Application,
     get_application_counts,
     get_application_require_demographic_scopes_count,
     get_token_bene_counts,
+    get_token_bene_counts_by_application,
 )
 from apps.fhir.bluebutton.models import get_crosswalk_bene_counts
 from apps.accounts.models import get_developer_counts
@@ -27,6 +31,46 @@ from apps.logging.utils import format_timestamp
 """
 logger = logging.getLogger(logging.AUDIT_GLOBAL_STATE_METRICS_LOGGER)
 
+# Global state record fields read from the metric counters (apps.core.counters),
+# the full table scan figures are kept as their verification.
+GLOBAL_STATE_COUNTER_FIELDS = [
+    ("real_bene_cnt", "crosswalk_real"),
+    ("synth_bene_cnt", "crosswalk_synthetic"),
+    ("crosswalk_real_bene_count", "crosswalk_real"),
+    ("crosswalk_synthetic_bene_count", "crosswalk_synthetic"),
+    ("crosswalk_table_count", "crosswalk"),
+    ("crosswalk_archived_table_count", "archived_crosswalk"),
+    ("grant_table_count", "grant"),
+    ("grant_archived_table_count", "archived_grant"),
+    ("token_table_count", "token"),
+    ("token_archived_table_count", "archived_token"),
+]
+
+
+def apply_metric_counters(log_dict):
+    """
+    Replace the full scan table counts of a global state record with the
+    metric counters, and add the metric_counters_drift {counter name:
+    counter - scan} of the counters not matching their scan.
+
+    Fields of counters not written yet keep the scan figure.
+    """
+    if not settings.METRIC_COUNTERS_ENABLED:
+        return log_dict
+
+    counters = get_counters({name for field, name in GLOBAL_STATE_COUNTER_FIELDS})
+    drift = {}
+    for field, name in GLOBAL_STATE_COUNTER_FIELDS:
+        if name not in counters:
+            continue
+        scanned = log_dict[field]
+        log_dict[field] = counters[name]
+        if scanned is not None and counters[name] != scanned:
+            drift[name] = counters[name] - scanned
+
+    log_dict["metric_counters_drift"] = drift
+    return log_dict
+
 
 def log_global_state_metrics(group_timestamp=None, report_flag=True):
     """
@@ -312,6 +356,7 @@ def log_global_state_metrics(group_timestamp=None, report_flag=True):
             "elapsed", None
         ),
     }
+    apply_metric_counters(log_dict)
 
     logger.info(log_dict)
 
@@ -325,20 +370,27 @@ def log_global_state_metrics(group_timestamp=None, report_flag=True):
         )
         print("---")
 
-    applications = Application.objects.all()
-
     start_time = datetime.utcnow().timestamp()
+
+    # Per application counts with a few GROUP BY application queries,
+    # and the applications with their dev user and profile in one query.
+    app_access_token_counts = get_token_bene_counts_by_application()
+
+    app_grant_counts = get_grant_bene_counts_by_application()
+
+    applications = Application.objects.select_related("user", "user__userprofile")
+
     count = 0
     for app in applications:
         # Get UserProfile for application's dev user
         try:
-            user_profile = UserProfile.objects.get(user=app.user)
+            user_profile = app.user.userprofile
         except UserProfile.DoesNotExist:
             user_profile = None
 
-        access_token_counts = get_token_bene_counts(application=app)
+        access_token_counts = app_access_token_counts[app.id]
 
-        grant_counts = get_grant_bene_counts(application=app)
+        grant_counts = app_grant_counts[app.id]
 
         log_dict = {
             "type": "global_state_metrics_per_app",
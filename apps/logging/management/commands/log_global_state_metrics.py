@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 from django.core.management.base import BaseCommand
 
+from apps.core.replica import read_replica
 from apps.logging.loggers import log_global_state_metrics
 from apps.logging.utils import format_timestamp
 
@@ -20,4 +21,5 @@ class Command(BaseCommand):
        
         report_flag = False if options.get("no_report", None) else True
 
-        log_global_state_metrics(group_timestamp, report_flag)
+        with read_replica():
+            log_global_state_metrics(group_timestamp, report_flag)
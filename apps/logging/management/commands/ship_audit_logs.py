@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.logging.shipping import get_audit_log_destination, ship_sealed_segments
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload sealed audit log segments to the BFD-Insights bucket, once or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--directory", default=settings.AUDIT_LOG_SINK_DIR,
+                            help="Audit log sink directory (default: settings.AUDIT_LOG_SINK_DIR).")
+        parser.add_argument("--destination", default=settings.AUDIT_LOG_SHIP_DESTINATION,
+                            help="s3://<bucket>/<prefix> or local directory (default: settings.AUDIT_LOG_SHIP_DESTINATION).")
+        parser.add_argument("--interval", type=float, default=0,
+                            help="Keep shipping every INTERVAL seconds (default: ship once and exit).")
+
+    def handle(self, *args, **options):
+        if not options["directory"] or not options["destination"]:
+            raise CommandError("An audit log sink directory and destination are required.")
+
+        destination = get_audit_log_destination(options["destination"])
+
+        while True:
+            shipped = ship_sealed_segments(options["directory"], destination)
+            self.stdout.write("Shipped {} audit log segments to {}".format(len(shipped), destination))
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
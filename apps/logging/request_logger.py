@@ -1,8 +1,9 @@
 import logging
-import json
+import sys
 
-from django.conf import settings
 from apps.dot_ext.loggers import get_session_auth_flow_trace
+from apps.logging.audit_queue import AuditLogEntry, format_audit_message, get_audit_log_queue
+from apps.logging.sampling import get_audit_log_policy
 
 CRITICAL = logging.CRITICAL
 FATAL = logging.FATAL
@@ -26,6 +27,8 @@ AUDIT_REQUEST_LOGGER = "audit.request_logger"
 AUDIT_WAFFLE_EVENT_LOGGER = "audit.waffle.event"
 AUDIT_AUTHFLOW_ID_CLEANUP_LOGGER = "audit.authflow.uuid.cleanup"
 AUDIT_CREDS_REQUEST_LOGGER = "audit.creds.request"
+AUDIT_TOKEN_ARCHIVE_LOGGER = "audit.token.archive"
+AUDIT_DATA_RETENTION_LOGGER = "audit.data.retention"
 PERFORMANCE_LOGGER = 'performance'
 
 LOGGER_NAMES = [
@@ -40,7 +43,9 @@ LOGGER_NAMES = [
     AUDIT_GLOBAL_STATE_METRICS_LOGGER,
     AUDIT_REQUEST_LOGGER,
     AUDIT_WAFFLE_EVENT_LOGGER,
-    AUDIT_AUTHFLOW_ID_CLEANUP_LOGGER
+    AUDIT_AUTHFLOW_ID_CLEANUP_LOGGER,
+    AUDIT_TOKEN_ARCHIVE_LOGGER,
+    AUDIT_DATA_RETENTION_LOGGER,
 ]
 
 HHS_SERVER_LOGNAME_FMT = "hhs_server.{}"
@@ -62,33 +67,47 @@ class BasicLogger:
     def logger(self):
         return self._logger
 
+    def get_log_data(self, data_dict):
+        return data_dict
+
     def format_for_output(self, data_dict, cls=None):
-        try:
-            if settings.LOG_JSON_FORMAT_PRETTY:
-                args = {"sort_keys": True, "indent": 2, "cls": cls}
-            else:
-                args = {"cls": cls}
-            return json.dumps(data_dict, **args)
-        except Exception:
-            return "Could not turn the data_dict into a JSON dump"
+        return format_audit_message(self.get_log_data(data_dict), cls=cls)
+
+    def log(self, level, data_dict, cls=None, exc_info=None):
+        """
+        Log data_dict as JSON, subject to the audit log sampling policy
+        (see apps.logging.sampling) and through the audit log queue when
+        it is enabled (see apps.logging.audit_queue).
+        """
+        if not self._logger.isEnabledFor(level):
+            return
+        # Sampled out or trimmed per settings.AUDIT_LOG_SAMPLING_RULES
+        log_data = get_audit_log_policy().apply(self._logger.name, level, self.get_log_data(data_dict))
+        if log_data is None:
+            return
+        audit_queue = get_audit_log_queue()
+        if audit_queue is None:
+            self._logger.log(level, format_audit_message(log_data, cls=cls), exc_info=exc_info)
+        else:
+            audit_queue.put(AuditLogEntry(self._logger, level, log_data, cls, exc_info))
 
     def debug(self, data_dict, cls=None):
-        self._logger.debug(self.format_for_output(data_dict, cls=cls))
+        self.log(DEBUG, data_dict, cls=cls)
 
     def info(self, data_dict, cls=None):
-        self._logger.info(self.format_for_output(data_dict, cls=cls))
+        self.log(INFO, data_dict, cls=cls)
 
     def error(self, data_dict, cls=None):
-        self._logger.error(self.format_for_output(data_dict, cls=cls))
+        self.log(ERROR, data_dict, cls=cls)
 
     def warning(self, data_dict, cls=None):
-        self._logger.warning(self.format_for_output(data_dict, cls=cls))
+        self.log(WARNING, data_dict, cls=cls)
 
     def critical(self, data_dict, cls=None):
-        self._logger.critical(self.format_for_output(data_dict, cls=cls))
+        self.log(CRITICAL, data_dict, cls=cls)
 
     def exception(self, data_dict, cls=None):
-        self._logger.exception(self.format_for_output(data_dict, cls=cls))
+        self.log(ERROR, data_dict, cls=cls, exc_info=sys.exc_info())
 
     def setLevel(self, lvl):
         self._logger.setLevel(lvl)
@@ -129,24 +148,14 @@ class RequestLogger(BasicLogger):
 
         self.standard_log_data.update(get_session_auth_flow_trace(request))
 
-    def format_for_output(self, data_dict, cls=None):
-        merged_dict = {**self.standard_log_data, **data_dict}
-        return super().format_for_output(merged_dict, cls=cls)
+    def get_log_data(self, data_dict):
+        return {**self.standard_log_data, **data_dict}
 
     def debug(self, data_dict, request=None, cls=None):
-        self._logger.debug(self.format_for_output(data_dict, cls=cls))
+        self.log(DEBUG, data_dict, cls=cls)
 
     def info(self, data_dict, request=None, cls=None):
-        self._logger.info(self.format_for_output(data_dict, cls=cls))
+        self.log(INFO, data_dict, cls=cls)
 
     def error(self, data_dict, request=None, cls=None):
-        self._logger.error(self.format_for_output(data_dict, cls=cls))
-
-    def warning(self, data_dict, cls=None):
-        self._logger.warning(self.format_for_output(data_dict, cls=cls))
-
-    def critical(self, data_dict, cls=None):
-        self._logger.critical(self.format_for_output(data_dict, cls=cls))
-
-    def exception(self, data_dict, cls=None):
-        self._logger.exception(self.format_for_output(data_dict, cls=cls))
+        self.log(ERROR, data_dict, cls=cls)
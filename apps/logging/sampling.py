@@ -0,0 +1,142 @@
+import logging
+import random
+import re
+import zlib
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+
+"""
+  Sampling and verbosity policy for the audit loggers.
+
+  settings.AUDIT_LOG_SAMPLING_RULES is a list of rules, the first rule
+  matching a record decides its sample rate and trimmed fields:
+
+    logger = Logger name the rule applies to
+             (default: the request/response middleware logger).
+    path   = Optional regex the record's "path" must match (re.search).
+    status = Optional list of response codes, or classes like "2xx",
+             the record's "response_code" must match.
+    rate   = Fraction of the matching records kept (0.0 - 1.0, default 1.0).
+    trim   = Optional list of fields removed from the kept records.
+
+  These records are always kept in full, whatever the rules:
+    - Records logged at WARNING or above, or with a response_code >= 400.
+    - Auth events: records from the audit.authorization.* and
+      audit.authenticate.* loggers and requests on auth flow paths.
+    - Data access events: records from the audit.data.* loggers and
+      requests for FHIR data or userinfo.
+
+  When rules are configured every audit record gets a "sample_rate" field
+  (1.0 for records that are always kept), so aggregates can be re-weighted
+  by 1 / sample_rate. Requests are sampled by their request_uuid, so all
+  the sampled records of a request are kept or dropped together.
+"""
+
+SAMPLE_RATE_FIELD = "sample_rate"
+
+DEFAULT_RULE_LOGGER = "audit.hhs_oauth_server.request_logging"
+
+ALWAYS_KEEP_LOGGERS_REGEX = re.compile(r"^audit\.(authorization|authenticate|data)\.")
+
+ALWAYS_KEEP_PATHS_REGEX = re.compile(
+    r"^/v[12]/o/"
+    r"|^/mymedicare/"
+    r"|^/v[12]/connect/userinfo"
+    r"|^/v[12]/fhir/(?!metadata)"
+)
+
+STATUS_CLASS_REGEX = re.compile(r"^[1-5]xx$")
+
+
+class AuditLogSamplingRule:
+    def __init__(self, logger=DEFAULT_RULE_LOGGER, path=None, status=None, rate=1.0, trim=None):
+        if not 0.0 <= float(rate) <= 1.0:
+            raise ValueError("Audit log sample rate must be between 0.0 and 1.0: {}".format(rate))
+        self.logger = logger
+        self.path = re.compile(path) if path else None
+        self.status = [str(s) for s in status] if status else None
+        self.rate = float(rate)
+        self.trim = list(trim or [])
+
+    def _status_matches(self, response_code):
+        for status in self.status:
+            if STATUS_CLASS_REGEX.match(status):
+                if str(response_code)[:1] == status[0]:
+                    return True
+            elif status == str(response_code):
+                return True
+        return False
+
+    def matches(self, logger_name, data_dict):
+        if logger_name != self.logger:
+            return False
+        if self.path is not None and not self.path.search(str(data_dict.get("path", ""))):
+            return False
+        if self.status is not None and not self._status_matches(data_dict.get("response_code")):
+            return False
+        return True
+
+
+class AuditLogPolicy:
+    def __init__(self, rules):
+        self.rules = [AuditLogSamplingRule(**rule) for rule in rules]
+
+    def is_always_kept(self, logger_name, level, data_dict):
+        if level >= logging.WARNING or ALWAYS_KEEP_LOGGERS_REGEX.match(logger_name):
+            return True
+        try:
+            if int(data_dict.get("response_code") or 0) >= 400:
+                return True
+        except (TypeError, ValueError):
+            pass
+        return bool(ALWAYS_KEEP_PATHS_REGEX.match(str(data_dict.get("path", ""))))
+
+    def is_sampled_in(self, rate, data_dict):
+        if rate >= 1.0:
+            return True
+        key = data_dict.get("request_uuid")
+        if key:
+            # Stable per request, all records of a request get the same decision
+            return zlib.crc32(str(key).encode("utf-8")) / 0xFFFFFFFF < rate
+        return random.random() < rate
+
+    def apply(self, logger_name, level, data_dict):
+        """
+        Return the data dict to log (with its sample rate), or None to drop the record.
+        """
+        if not self.rules or not isinstance(data_dict, dict):
+            return data_dict
+
+        rule = None
+        if not self.is_always_kept(logger_name, level, data_dict):
+            rule = next((r for r in self.rules if r.matches(logger_name, data_dict)), None)
+
+        if rule is None:
+            return {**data_dict, SAMPLE_RATE_FIELD: 1.0}
+
+        if not self.is_sampled_in(rule.rate, data_dict):
+            return None
+
+        data_dict = {k: v for k, v in data_dict.items() if k not in rule.trim}
+        data_dict[SAMPLE_RATE_FIELD] = rule.rate
+        return data_dict
+
+
+_policy = None
+
+
+def get_audit_log_policy():
+    global _policy
+    if _policy is None:
+        _policy = AuditLogPolicy(settings.AUDIT_LOG_SAMPLING_RULES)
+    return _policy
+
+
+@receiver(setting_changed)
+def reset_audit_log_policy(setting=None, **kwargs):
+    global _policy
+    if setting == "AUDIT_LOG_SAMPLING_RULES":
+        _policy = None
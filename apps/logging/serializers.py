@@ -38,16 +38,23 @@ class Token:
     tkn = None
     action = None
 
-    def __init__(self, obj, action=None):
+    def __init__(self, obj, action=None, all_scopes=None):
         self.tkn = obj
         self.action = action
+        # Scopes backend get_all_scopes(), when looked up once for a batch of tokens
+        self.all_scopes = all_scopes
 
     def to_dict(self):
         # seems like this should be a serializer
         app = getattr(self.tkn, 'application', None)
         app_user = getattr(app, 'user', None)
         user = getattr(self.tkn, 'user', None)
-        scopes_dict = getattr(self.tkn, 'scopes', None)
+        if self.all_scopes is not None:
+            # Same as AccessToken.scopes
+            token_scopes = (getattr(self.tkn, 'scope', None) or "").split()
+            scopes_dict = {name: desc for name, desc in self.all_scopes.items() if name in token_scopes}
+        else:
+            scopes_dict = getattr(self.tkn, 'scopes', None)
         crosswalk = getattr(user, 'crosswalk', None)
 
         if scopes_dict:
@@ -0,0 +1,95 @@
+import logging
+import os
+import shutil
+
+from urllib.parse import urlparse
+
+from apps.logging.sinks import SEALED_DIR, SEGMENT_SUFFIX, segment_partition_key
+
+
+"""
+  Ships sealed audit log segments (see apps.logging.sinks) to the
+  BFD-Insights bucket, in the partition layout the Athena tables read:
+
+    <destination>/events-<env>-perf-mon/dt=YYYY/MM/DD/HH/<segment name>
+
+  The destination is a URL, "s3://<bucket>/<prefix>" (for example
+  "s3://<bucket>/databases/bb2/") or a local directory path (used for
+  local development and tests). A segment is deleted locally once it
+  has been uploaded, failed uploads are retried on the next run.
+"""
+
+logger = logging.getLogger("hhs_server.{}".format(__name__))
+
+
+class LocalDirectoryDestination:
+    def __init__(self, root):
+        self.root = root
+
+    def upload(self, path, key):
+        dest_path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        # Copy then rename, readers never see a partial segment
+        tmp_path = dest_path + ".tmp"
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, dest_path)
+
+    def __str__(self):
+        return self.root
+
+
+class S3Destination:
+    def __init__(self, bucket, prefix=""):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            self._client = boto3.client("s3")
+        return self._client
+
+    def upload(self, path, key):
+        self.client.upload_file(path, self.bucket, self.prefix + key)
+
+    def __str__(self):
+        return "s3://{}/{}".format(self.bucket, self.prefix)
+
+
+def get_audit_log_destination(url):
+    parsed = urlparse(url)
+    if parsed.scheme == "s3":
+        return S3Destination(parsed.netloc, parsed.path)
+    if parsed.scheme == "file":
+        return LocalDirectoryDestination(parsed.path)
+    if parsed.scheme:
+        raise ValueError("Unsupported audit log destination: {}".format(url))
+    return LocalDirectoryDestination(url)
+
+
+def ship_sealed_segments(directory, destination):
+    """
+    Upload the sealed segments in the sink directory to destination.
+
+    Returns the list of keys uploaded.
+    """
+    sealed_dir = os.path.join(directory, SEALED_DIR)
+    if not os.path.isdir(sealed_dir):
+        return []
+
+    shipped = []
+    for name in sorted(os.listdir(sealed_dir)):
+        if not name.endswith(SEGMENT_SUFFIX):
+            continue
+        path = os.path.join(sealed_dir, name)
+        try:
+            key = segment_partition_key(name)
+            destination.upload(path, key)
+        except Exception:
+            logger.exception("Failed to ship audit log segment %s to %s" % (name, destination))
+            continue
+        os.remove(path)
+        shipped.append(key)
+    return shipped
@@ -5,11 +5,13 @@ from django.db.models.signals import (
 )
 from django.dispatch import receiver
 from oauth2_provider.models import AccessToken
+from oauth2_provider.scopes import get_scopes_backend
 from oauth2_provider.signals import app_authorized
 
 from apps.authorization.models import DataAccessGrant
 from apps.dot_ext.admin import MyAccessToken
-from apps.dot_ext.signals import beneficiary_authorized_application
+from apps.dot_ext.models import is_bulk_token_archive_active
+from apps.dot_ext.signals import beneficiary_authorized_application, tokens_bulk_revoked
 from apps.fhir.bluebutton.signals import (
     pre_fetch,
     post_fetch
@@ -91,10 +93,23 @@ def handle_app_authorized(sender, request, auth_status, auth_status_code, user,
 @receiver(post_delete, sender=MyAccessToken)
 @receiver(post_delete, sender=AccessToken)
 def token_removed(sender, instance=None, **kwargs):
+    # Bulk revokes are logged by tokens_removed_bulk()
+    if is_bulk_token_archive_active():
+        return
+
     token_logger = logging.getLogger(logging.AUDIT_AUTHZ_TOKEN_LOGGER)
     token_logger.info(Token(instance, action="revoked").to_dict())
 
 
+@receiver(tokens_bulk_revoked)
+def tokens_removed_bulk(sender, access_tokens=None, **kwargs):
+    # Same records as token_removed(), one per token
+    token_logger = logging.getLogger(logging.AUDIT_AUTHZ_TOKEN_LOGGER)
+    all_scopes = get_scopes_backend().get_all_scopes()
+    for tkn in access_tokens:
+        token_logger.info(Token(tkn, action="revoked", all_scopes=all_scopes).to_dict())
+
+
 @receiver(post_delete, sender=DataAccessGrant)
 def log_grant_removed(sender, instance=None, **kwargs):
     token_logger = logging.getLogger(logging.AUDIT_AUTHZ_TOKEN_LOGGER)
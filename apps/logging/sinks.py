@@ -0,0 +1,215 @@
+import gzip
+import io
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+
+from datetime import datetime
+
+
+"""
+  Local audit log segment sink.
+
+  AuditSegmentHandler writes log records as BFD-Insights events, one JSON
+  object per line, in the format the Firehose CloudWatch logs processor
+  lambda produces (insights/lambdas):
+
+    {"time_of_event": ..., "component": "bb2.web", "vpc": <env>,
+     "log_name": <logger name>, ...message fields}
+
+  to gzip compressed segment files. A segment is written in the
+  "<directory>/active" directory and sealed (closed and moved to
+  "<directory>/sealed") when it reaches max_bytes of events, is max_age
+  seconds old or the hour of its events changes, so each sealed segment
+  belongs to a single hourly partition. Sealed segment names carry the
+  partition, see segment_partition_key().
+
+  Sealed segments are uploaded by apps.logging.shipping (the
+  ship_audit_logs management command).
+"""
+
+ACTIVE_DIR = "active"
+SEALED_DIR = "sealed"
+
+SEGMENT_SUFFIX = ".gz"
+SEGMENT_TIME_FORMAT = "%Y-%m-%d-%H-%M-%S"
+
+SEGMENT_NAME_REGEX = re.compile(
+    r"^bfd-insights-bb2-(?P<env>.+)-perf-mon-1-"
+    r"(?P<time>\d{4}-\d{2}-\d{2}-\d{2}-\d{2}-\d{2})-[0-9a-f-]+\.gz$"
+)
+
+PARTITION_DIR_FORMAT = "dt=%Y/%m/%d/%H/"
+
+COMPONENT = "bb2.web"
+
+# Name of the hhs_server logger, see apps.logging.request_logger.HHS_SERVER_LOGNAME_FMT
+logger = logging.getLogger("hhs_server.{}".format(__name__))
+
+
+def segment_name(env, dt):
+    return "bfd-insights-bb2-{}-perf-mon-1-{}-{}{}".format(
+        env.lower(), dt.strftime(SEGMENT_TIME_FORMAT), uuid.uuid4(), SEGMENT_SUFFIX)
+
+
+def segment_partition_key(name):
+    """
+    Returns the key (relative path) of a sealed segment in the
+    BFD-Insights S3 layout:
+      events-<env>-perf-mon/dt=YYYY/MM/DD/HH/<name>
+    """
+    m = SEGMENT_NAME_REGEX.match(name)
+    if m is None:
+        raise ValueError("Not an audit log segment name: {}".format(name))
+    dt = datetime.strptime(m.group("time"), SEGMENT_TIME_FORMAT)
+    return "events-{}-perf-mon/{}{}".format(m.group("env"), dt.strftime(PARTITION_DIR_FORMAT), name)
+
+
+def format_event(record, env):
+    """
+    Returns the BFD-Insights event line (without newline) for a log record.
+    """
+    header = {
+        # Same format as apps.logging.utils.format_timestamp(), not imported
+        # here as handlers are created before the apps are loaded.
+        "time_of_event": datetime.utcfromtimestamp(int(record.created)).isoformat(),
+        "component": COMPONENT,
+        "vpc": env,
+        "log_name": record.name,
+    }
+    message = record.getMessage()
+
+    # Audit messages are single line JSON objects, splice the message
+    # fields in after the header fields without parsing them.
+    if message.startswith("{") and message.endswith("}") and "\n" not in message:
+        body = message[1:].lstrip()
+        if body == "}":
+            return json.dumps(header)
+        return json.dumps(header)[:-1] + ", " + body
+
+    try:
+        message_dict = json.loads(message)
+    except ValueError:
+        message_dict = None
+    if not isinstance(message_dict, dict):
+        message_dict = {"message": message}
+    header.update(message_dict)
+    return json.dumps(header)
+
+
+class AuditSegmentHandler(logging.Handler):
+    def __init__(self, directory, env="DEV", max_bytes=64 * 1024 * 1024, max_age=300, compresslevel=6):
+        super().__init__()
+        self.directory = directory
+        self.active_dir = os.path.join(directory, ACTIVE_DIR)
+        self.sealed_dir = os.path.join(directory, SEALED_DIR)
+        self.env = env
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compresslevel = compresslevel
+
+        os.makedirs(self.active_dir, exist_ok=True)
+        os.makedirs(self.sealed_dir, exist_ok=True)
+
+        self._pid = None
+        self._segment = None
+        self._timer = None
+
+    def _open_segment(self, created):
+        dt = datetime.utcfromtimestamp(created)
+        name = segment_name(self.env, dt)
+        path = os.path.join(self.active_dir, name)
+        raw = open(path, "wb")
+        gz = gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=self.compresslevel)
+        self._segment = {
+            "name": name,
+            "path": path,
+            "raw": raw,
+            "writer": io.BufferedWriter(gz),
+            "hour": dt.strftime(PARTITION_DIR_FORMAT),
+            "opened": time.monotonic(),
+            "bytes": 0,
+        }
+
+    def _segment_due(self, created=None):
+        segment = self._segment
+        if segment["bytes"] >= self.max_bytes:
+            return True
+        if self.max_age and time.monotonic() - segment["opened"] >= self.max_age:
+            return True
+        if created is not None:
+            return datetime.utcfromtimestamp(created).strftime(PARTITION_DIR_FORMAT) != segment["hour"]
+        return False
+
+    def seal(self):
+        """
+        Close the active segment and move it to the sealed directory.
+
+        Returns the sealed segment path, or None when there is no active segment.
+        """
+        segment, self._segment = self._segment, None
+        if segment is None:
+            return None
+        segment["writer"].close()
+        segment["raw"].close()
+        sealed_path = os.path.join(self.sealed_dir, segment["name"])
+        os.replace(segment["path"], sealed_path)
+        return sealed_path
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # Forked: the parent process owns its segment, start our own.
+            self._pid = os.getpid()
+            self._segment = None
+            self._timer = None
+            if self.max_age:
+                self._timer = threading.Thread(target=self._seal_idle, name="audit-segment-sealer", daemon=True)
+                self._timer.start()
+
+    def _seal_idle(self):
+        # Seal segments that stopped receiving records, so they get shipped.
+        while self._timer is threading.current_thread():
+            time.sleep(min(self.max_age, 60))
+            self.acquire()
+            try:
+                if self._segment is not None and self._pid == os.getpid() and self._segment_due():
+                    self.seal()
+            except Exception:
+                logger.exception("Failed to seal audit log segment")
+            finally:
+                self.release()
+
+    def emit(self, record):
+        try:
+            line = (format_event(record, self.env) + "\n").encode("utf-8")
+            self._check_pid()
+            if self._segment is not None and self._segment_due(record.created):
+                self.seal()
+            if self._segment is None:
+                self._open_segment(record.created)
+            self._segment["writer"].write(line)
+            self._segment["bytes"] += len(line)
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self._segment is not None and self._pid == os.getpid():
+                self._segment["writer"].flush()
+        finally:
+            self.release()
+
+    def close(self):
+        self.acquire()
+        try:
+            self._timer = None
+            if self._pid == os.getpid():
+                self.seal()
+        finally:
+            self.release()
+            super().close()
@@ -674,6 +674,7 @@ GLOBAL_STATE_METRICS_LOG_SCHEMA = {
         "global_beneficiary_app_pair_real_archived_vs_grant_difference_total_count": {"type": "number"},
         "global_beneficiary_app_pair_synthetic_archived_vs_grant_difference_total_count": {"type": "number"},
         "global_beneficiary_app_pair_counts_elapsed": {"type": "number"},
+        "metric_counters_drift": {"type": "object"},
     },
     "required": [
         "type",
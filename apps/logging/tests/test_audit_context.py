@@ -0,0 +1,103 @@
+import hashlib
+import json
+
+from unittest import mock
+
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+import apps.logging.request_logger as logging
+
+from apps.logging.utils import redirect_loggers, cleanup_logger, get_log_lines_list
+from apps.test import BaseApiTest
+from hhs_oauth_server.request_logging import RequestResponseLog, RequestTimeLoggingMiddleware
+
+
+class TestRequestResponseLogAuditContext(BaseApiTest):
+    def setUp(self):
+        self.read_capability = self._create_capability("Read", [])
+        self.write_capability = self._create_capability("Write", [])
+        self.logger_registry = redirect_loggers()
+
+        # Count the queries made building each request log record
+        self.to_dict_queries = []
+        to_dict = RequestResponseLog.to_dict
+
+        def counting_to_dict(log):
+            with CaptureQueriesContext(connection) as ctx:
+                log_dict = to_dict(log)
+            self.to_dict_queries.append(len(ctx.captured_queries))
+            return log_dict
+
+        patcher = mock.patch.object(RequestResponseLog, "to_dict", counting_to_dict)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        cleanup_logger(self.logger_registry)
+
+    def _last_request_log(self):
+        return json.loads(get_log_lines_list(self.logger_registry, logging.AUDIT_HHS_AUTH_SERVER_REQ_LOGGER)[-1])
+
+    def test_bearer_request_log_without_queries(self):
+        user, application, token_response = self._create_user_app_token_grant(
+            first_name="first", last_name="last", fhir_id="-20140000008325",
+            app_name="test_app", app_username="devuser", app_user_organization="org")
+        access_token = token_response["access_token"]
+
+        self.to_dict_queries.clear()
+        self.client.get("/v1/connect/userinfo", HTTP_AUTHORIZATION="Bearer " + access_token)
+
+        self.assertEqual([0], self.to_dict_queries)
+        log_dict = self._last_request_log()
+        self.assertEqual(hashlib.sha256(access_token.encode("utf-8")).hexdigest(), log_dict["access_token_hash"])
+        self.assertEqual(application.id, log_dict["app_id"])
+        self.assertEqual("test_app", log_dict["app_name"])
+        self.assertEqual("devuser", log_dict["dev_name"])
+        self.assertEqual(user.username, log_dict["user_username"])
+        self.assertEqual("-20140000008325", log_dict["fhir_id"])
+
+    def test_refresh_token_request_log_without_queries(self):
+        user, application, token_response = self._create_user_app_token_grant(
+            first_name="first", last_name="last", fhir_id="-20140000008325",
+            app_name="test_app", app_username="devuser", app_user_organization="org")
+        access_token = token_response["access_token"]
+
+        self.to_dict_queries.clear()
+        response = self.client.post("/v1/o/token/", data={
+            "grant_type": "refresh_token",
+            "refresh_token": token_response["refresh_token"],
+            "redirect_uri": application.redirect_uris,
+            "client_id": application.client_id,
+            "client_secret": application.client_secret,
+        })
+        self.assertEqual(200, response.status_code)
+        content = json.loads(response.content)
+
+        self.assertEqual([0], self.to_dict_queries)
+        log_dict = self._last_request_log()
+        self.assertEqual(hashlib.sha256(access_token.encode("utf-8")).hexdigest(), log_dict["req_access_token_hash"])
+        self.assertEqual(application.id, log_dict["req_app_id"])
+        self.assertEqual(hashlib.sha256(content["access_token"].encode("utf-8")).hexdigest(),
+                         log_dict["resp_access_token_hash"])
+        self.assertEqual("devuser", log_dict["resp_dev_name"])
+        self.assertEqual(user.username, log_dict["resp_user_username"])
+        self.assertEqual("-20140000008325", log_dict["resp_fhir_id"])
+
+    def test_streaming_response_size_is_counted(self):
+        request = RequestFactory().get("/v1/fhir/Patient")
+        middleware = RequestTimeLoggingMiddleware(
+            lambda request: StreamingHttpResponse(iter([b"abc", b"defgh"])))
+
+        response = middleware(request)
+        # Nothing logged until the content is sent
+        self.assertEqual([], get_log_lines_list(self.logger_registry, logging.AUDIT_HHS_AUTH_SERVER_REQ_LOGGER))
+
+        self.assertEqual(b"abcdefgh", b"".join(response.streaming_content))
+        response.close()
+
+        log_dict = self._last_request_log()
+        self.assertEqual(8, log_dict["size"])
+        self.assertEqual(200, log_dict["response_code"])
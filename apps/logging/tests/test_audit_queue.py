@@ -0,0 +1,161 @@
+import io
+import json
+import logging
+import threading
+
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+import apps.logging.request_logger as bb2logging
+
+from apps.logging.audit_queue import (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP,
+    AuditLogEntry,
+    AuditLogQueue,
+)
+
+
+class BlockingHandler(logging.StreamHandler):
+    """
+    Handler that waits for an event before writing, to hold up the writer thread.
+    """
+
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.released = threading.Event()
+
+    def emit(self, record):
+        self.released.wait(5)
+        super().emit(record)
+
+
+class TestAuditLogQueue(SimpleTestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.logger = logging.getLogger("audit.test_audit_queue")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.handler = logging.StreamHandler(self.stream)
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.handler.close()
+
+    def _lines(self):
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_records_written_in_order_with_same_schema(self):
+        audit_queue = AuditLogQueue(batch_size=3, flush_interval=0.01)
+        for i in range(10):
+            self.assertTrue(audit_queue.put(AuditLogEntry(self.logger, logging.INFO, {"type": "t", "n": i})))
+        audit_queue.flush()
+
+        self.assertEqual([{"type": "t", "n": i} for i in range(10)], self._lines())
+        self.assertEqual(10, audit_queue.written)
+        self.assertEqual(0, audit_queue.dropped)
+        audit_queue.stop()
+
+    def test_entry_keeps_queue_time_and_data_snapshot(self):
+        records = []
+        self.handler.emit = records.append
+        audit_queue = AuditLogQueue(flush_interval=0.01)
+        data = {"n": 1}
+        entry = AuditLogEntry(self.logger, logging.INFO, data)
+        data["n"] = 2
+        audit_queue.put(entry)
+        audit_queue.flush()
+        audit_queue.stop()
+
+        self.assertEqual('{"n": 1}', records[0].getMessage())
+        self.assertEqual(entry.created, records[0].created)
+        self.assertEqual("audit.test_audit_queue", records[0].name)
+
+    def test_overflow_drop_counts_dropped_records(self):
+        handler = BlockingHandler(self.stream)
+        self.logger.removeHandler(self.handler)
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+
+        audit_queue = AuditLogQueue(maxsize=2, batch_size=1, flush_interval=0.01, overflow=OVERFLOW_DROP)
+        # The first record is taken by the writer, which then blocks in the handler
+        audit_queue.put(AuditLogEntry(self.logger, logging.INFO, {"n": 0}))
+        while audit_queue.qsize():
+            pass
+        results = [audit_queue.put(AuditLogEntry(self.logger, logging.INFO, {"n": i})) for i in range(1, 6)]
+
+        self.assertEqual([True, True, False, False, False], results)
+        self.assertEqual(3, audit_queue.dropped)
+
+        with self.assertLogs("hhs_server.apps.logging.audit_queue", level="WARNING") as cm:
+            handler.released.set()
+            audit_queue.flush()
+            audit_queue.stop()
+        self.assertIn("dropped 3 records", cm.output[0])
+        self.assertEqual([0, 1, 2], [r["n"] for r in self._lines()])
+
+    def test_overflow_block_waits_for_space(self):
+        handler = BlockingHandler(self.stream)
+        self.logger.removeHandler(self.handler)
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+
+        audit_queue = AuditLogQueue(maxsize=1, batch_size=1, flush_interval=0.01,
+                                    overflow=OVERFLOW_BLOCK, block_timeout=5)
+        audit_queue.put(AuditLogEntry(self.logger, logging.INFO, {"n": 0}))
+        while audit_queue.qsize():
+            pass
+        audit_queue.put(AuditLogEntry(self.logger, logging.INFO, {"n": 1}))
+
+        threading.Timer(0.05, handler.released.set).start()
+        # Blocks until the writer takes the queued record
+        self.assertTrue(audit_queue.put(AuditLogEntry(self.logger, logging.INFO, {"n": 2})))
+        audit_queue.flush()
+        audit_queue.stop()
+
+        self.assertEqual(0, audit_queue.dropped)
+        self.assertEqual([0, 1, 2], [r["n"] for r in self._lines()])
+
+    def test_stop_writes_queued_records(self):
+        audit_queue = AuditLogQueue(batch_size=1000, flush_interval=60)
+        for i in range(5):
+            audit_queue.put(AuditLogEntry(self.logger, logging.INFO, {"n": i}))
+        audit_queue.stop()
+
+        self.assertEqual(5, len(self._lines()))
+        self.assertFalse(audit_queue._thread.is_alive())
+
+    def test_unknown_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            AuditLogQueue(overflow="wait")
+
+
+class TestBasicLoggerQueue(SimpleTestCase):
+    def setUp(self):
+        self.stream = io.StringIO()
+        self.handler = logging.StreamHandler(self.stream)
+        self.audit_logger = bb2logging.getLogger(bb2logging.AUDIT_BASIC_LOGGER)
+        self.audit_logger.setLevel(logging.INFO)
+        self.audit_logger.logger().addHandler(self.handler)
+
+    def tearDown(self):
+        self.audit_logger.logger().removeHandler(self.handler)
+        self.handler.close()
+
+    def test_logs_through_queue(self):
+        audit_queue = AuditLogQueue(flush_interval=0.01)
+        with mock.patch("apps.logging.request_logger.get_audit_log_queue", return_value=audit_queue):
+            self.audit_logger.info({"type": "queued"})
+            # Below the logger level, not queued
+            self.audit_logger.debug({"type": "debug"})
+            audit_queue.flush()
+            audit_queue.stop()
+
+        self.assertEqual([{"type": "queued"}], [json.loads(line) for line in self.stream.getvalue().splitlines()])
+        self.assertEqual(1, audit_queue.written)
+
+    def test_logs_synchronously_when_disabled(self):
+        self.audit_logger.info({"type": "sync"})
+        self.assertEqual({"type": "sync"}, json.loads(self.stream.getvalue()))
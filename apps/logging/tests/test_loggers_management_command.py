@@ -4,18 +4,24 @@ import jsonschema
 
 from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from django.test.client import Client
 from django.utils import timezone
 from jsonschema import validate
 from io import StringIO
 from oauth2_provider.models import get_access_token_model, get_application_model
 
+from apps.core.counters import GLOBAL
+from apps.core.models import MetricCounter
 from apps.dot_ext.utils import (
     remove_application_user_pair_tokens_data_access,
 )
 from apps.fhir.bluebutton.models import Crosswalk, ArchivedCrosswalk
 import apps.logging.request_logger as logging
-from apps.logging.utils import redirect_loggers, cleanup_logger, get_log_content
+from apps.logging.loggers import log_global_state_metrics
+from apps.logging.utils import redirect_loggers, cleanup_logger, format_timestamp, get_log_content
 from apps.test import BaseApiTest
 
 from .audit_logger_schemas import (
@@ -1290,3 +1296,67 @@ class TestLoggersGlobalMetricsManagementCommand(BaseApiTest):
             "global_beneficiary_app_pair_synthetic_archived_vs_grant_difference_total_count": 113,  # 3 -> 113
         })
         self._validate_global_state_metrics_log(validate_global_dict)
+
+    def test_per_app_metrics_query_count_is_constant(self):
+        """
+        The per application metrics don't run more queries as apps are added.
+        """
+        def count_queries():
+            with CaptureQueriesContext(connection) as context:
+                log_global_state_metrics(report_flag=False)
+            return len(context.captured_queries)
+
+        self._create_range_users_app_token_grant(
+            start_fhir_id="-2000000000000", count=2, app_name="app0",
+            app_user_organization="app0-org"
+        )
+        query_count = count_queries()
+
+        for i in range(1, 4):
+            self._create_range_users_app_token_grant(
+                start_fhir_id="-200000000000{}".format(i), count=2, app_name="app{}".format(i),
+                app_user_organization="app{}-org".format(i)
+            )
+        self._revoke_range_users_app_token_grant(
+            start_fhir_id="-2000000000001", count=1, app_name="app1"
+        )
+
+        self.assertEqual(query_count, count_queries())
+
+        per_app_logs = [
+            json.loads(line)
+            for line in get_log_content(self.logger_registry, logging.AUDIT_GLOBAL_STATE_METRICS_LOGGER).splitlines()
+        ]
+        per_app_logs = {log["name"]: log for log in per_app_logs if log["type"] == "global_state_metrics_per_app"}
+        self.assertEqual(4, len(per_app_logs))
+        self.assertEqual(2, per_app_logs["app0"]["grant_synthetic_bene_count"])
+        self.assertEqual(1, per_app_logs["app1"]["grant_synthetic_bene_count"])
+        self.assertEqual(1, per_app_logs["app1"]["grant_archived_table_count"])
+        self.assertEqual(2, per_app_logs["app1"]["grant_and_archived_synthetic_bene_deduped_count"])
+        self.assertEqual(1, per_app_logs["app1"]["token_synthetic_bene_count"])
+        self.assertEqual("app1-org", per_app_logs["app1"]["user_organization"])
+
+    def test_global_state_metrics_read_metric_counters(self):
+        """
+        The global table counts are read from the metric counters, verified against the full scans.
+        """
+        with self.captureOnCommitCallbacks(execute=True):
+            self._create_range_users_app_token_grant(
+                start_fhir_id="-2000000000000", count=2, app_name="app0",
+                app_user_organization="app0-org"
+            )
+        MetricCounter.objects.filter(name="token", application_id=GLOBAL).update(value=F("value") + 5)
+
+        log_global_state_metrics(group_timestamp=format_timestamp(timezone.now()), report_flag=False)
+
+        log_dict = [
+            json.loads(line)
+            for line in get_log_content(self.logger_registry, logging.AUDIT_GLOBAL_STATE_METRICS_LOGGER).splitlines()
+            if json.loads(line)["type"] == "global_state_metrics"
+        ][-1]
+        self.assertTrue(self._validateJsonSchema(TEST_GLOBAL_STATE_METRICS_LOG_SCHEMA, log_dict))
+        self.assertEqual(7, log_dict["token_table_count"])
+        self.assertEqual(2, log_dict["grant_table_count"])
+        self.assertEqual(2, log_dict["crosswalk_synthetic_bene_count"])
+        self.assertEqual(0, log_dict["crosswalk_archived_table_count"])
+        self.assertEqual({"token": 5}, log_dict["metric_counters_drift"])
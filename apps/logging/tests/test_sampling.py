@@ -0,0 +1,94 @@
+import json
+import uuid
+
+from django.test import SimpleTestCase, override_settings
+
+import apps.logging.request_logger as logging
+
+from apps.logging.sampling import AuditLogPolicy, get_audit_log_policy
+from apps.logging.utils import redirect_loggers, cleanup_logger, get_log_lines_list
+
+REQUEST_LOGGER = logging.AUDIT_HHS_AUTH_SERVER_REQ_LOGGER
+
+RULES = [
+    {"path": r"^/health", "status": ["2xx"], "rate": 0.0},
+    {"path": r"/fhir/metadata$", "status": [200, "3xx"], "rate": 0.5, "trim": ["req_header_user_agent"]},
+    {"path": r"^/v1/fhir/Patient", "rate": 0.0},
+]
+
+
+def request_record(path, response_code=200, **kwargs):
+    return {"type": "request_response_middleware", "path": path, "response_code": response_code,
+            "request_uuid": str(uuid.uuid1()), "req_header_user_agent": "test", **kwargs}
+
+
+class TestAuditLogPolicy(SimpleTestCase):
+    def setUp(self):
+        self.policy = AuditLogPolicy(RULES)
+
+    def test_no_rules_keeps_records_unchanged(self):
+        record = request_record("/health")
+        self.assertIs(record, AuditLogPolicy([]).apply(REQUEST_LOGGER, logging.INFO, record))
+
+    def test_sampled_out(self):
+        self.assertIsNone(self.policy.apply(REQUEST_LOGGER, logging.INFO, request_record("/health")))
+
+    def test_unmatched_records_kept_with_rate(self):
+        # Status not matched
+        record = self.policy.apply(REQUEST_LOGGER, logging.INFO, request_record("/health", 302))
+        self.assertEqual(1.0, record["sample_rate"])
+        # Other logger
+        record = self.policy.apply(logging.AUDIT_WAFFLE_EVENT_LOGGER, logging.INFO, {"path": "/health"})
+        self.assertEqual({"path": "/health", "sample_rate": 1.0}, record)
+
+    def test_errors_auth_and_data_access_always_kept(self):
+        for logger_name, level, record in [
+            (REQUEST_LOGGER, logging.INFO, request_record("/health", 500)),
+            (REQUEST_LOGGER, logging.ERROR, request_record("/health")),
+            (REQUEST_LOGGER, logging.INFO, request_record("/v1/fhir/Patient/-20140000008325")),
+            (REQUEST_LOGGER, logging.INFO, request_record("/v2/o/token/")),
+            (logging.AUDIT_DATA_FHIR_LOGGER, logging.INFO, {"path": "/health"}),
+            (logging.AUDIT_AUTHZ_TOKEN_LOGGER, logging.INFO, {"path": "/health"}),
+        ]:
+            kept = self.policy.apply(logger_name, level, record)
+            self.assertEqual({**record, "sample_rate": 1.0}, kept)
+
+    def test_sample_rate_recorded_and_fields_trimmed(self):
+        kept = [self.policy.apply(REQUEST_LOGGER, logging.INFO, request_record("/v1/fhir/metadata"))
+                for i in range(400)]
+        kept = [r for r in kept if r is not None]
+
+        self.assertTrue(120 < len(kept) < 280)
+        for record in kept:
+            self.assertEqual(0.5, record["sample_rate"])
+            self.assertNotIn("req_header_user_agent", record)
+
+    def test_same_decision_per_request(self):
+        record = request_record("/v1/fhir/metadata")
+        decisions = {self.policy.apply(REQUEST_LOGGER, logging.INFO, dict(record)) is None for i in range(10)}
+        self.assertEqual(1, len(decisions))
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            AuditLogPolicy([{"rate": 2}])
+
+
+class TestAuditLoggerSampling(SimpleTestCase):
+    def setUp(self):
+        self.logger_registry = redirect_loggers()
+
+    def tearDown(self):
+        cleanup_logger(self.logger_registry)
+
+    def test_policy_applied_by_audit_loggers(self):
+        audit = logging.getLogger(REQUEST_LOGGER)
+        with override_settings(AUDIT_LOG_SAMPLING_RULES=RULES):
+            audit.info(request_record("/health"))
+            audit.info(request_record("/health", 503))
+        self.assertEqual([], get_audit_log_policy().rules)
+
+        lines = get_log_lines_list(self.logger_registry, REQUEST_LOGGER)
+        self.assertEqual(1, len(lines))
+        record = json.loads(lines[0])
+        self.assertEqual(503, record["response_code"])
+        self.assertEqual(1.0, record["sample_rate"])
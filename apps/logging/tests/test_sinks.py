@@ -0,0 +1,140 @@
+import gzip
+import json
+import logging
+import os
+import tempfile
+
+from datetime import datetime, timezone
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from apps.logging.shipping import LocalDirectoryDestination, get_audit_log_destination, ship_sealed_segments
+from apps.logging.sinks import (
+    ACTIVE_DIR,
+    SEALED_DIR,
+    AuditSegmentHandler,
+    format_event,
+    segment_partition_key,
+)
+
+
+def _record(message, name="audit.hhs_oauth_server.request_logging", created=None):
+    record = logging.LogRecord(name, logging.INFO, __file__, 0, message, (), None)
+    if created is not None:
+        record.created = created
+    return record
+
+
+def _timestamp(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+class TestAuditSegmentSink(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = os.path.join(tmp.name, "sink")
+        self.bucket = os.path.join(tmp.name, "bucket")
+
+    def _handler(self, **kwargs):
+        handler = AuditSegmentHandler(self.directory, env="TEST", max_age=0, **kwargs)
+        self.addCleanup(handler.close)
+        return handler
+
+    def _sealed(self):
+        return sorted(os.listdir(os.path.join(self.directory, SEALED_DIR)))
+
+    def _read_segment(self, path):
+        with gzip.open(path, "rt") as f:
+            return [json.loads(line) for line in f]
+
+    def test_format_event_matches_insights_format(self):
+        created = _timestamp(2022, 3, 4, 5, 6, 7, 890000)
+        event = json.loads(format_event(_record('{"type": "request_response_middleware", "size": 10}',
+                                                created=created), "TEST"))
+        self.assertEqual({
+            "time_of_event": "2022-03-04T05:06:07",
+            "component": "bb2.web",
+            "vpc": "TEST",
+            "log_name": "audit.hhs_oauth_server.request_logging",
+            "type": "request_response_middleware",
+            "size": 10,
+        }, event)
+
+        # Pretty printed, empty and non JSON messages
+        self.assertEqual(1, json.loads(format_event(_record('{\n  "a": 1\n}', created=created), "TEST"))["a"])
+        self.assertEqual(4, len(json.loads(format_event(_record("{}", created=created), "TEST"))))
+        self.assertEqual("plain text", json.loads(format_event(_record("plain text", created=created), "TEST"))["message"])
+
+    def test_segments_sealed_on_size_and_hour(self):
+        handler = self._handler(max_bytes=300)
+        for i in range(6):
+            handler.emit(_record(json.dumps({"n": i}), created=_timestamp(2022, 3, 4, 5, 59, i)))
+        # New hour, new segment
+        handler.emit(_record(json.dumps({"n": 6}), created=_timestamp(2022, 3, 4, 6, 0, 0)))
+        handler.close()
+
+        self.assertEqual([], os.listdir(os.path.join(self.directory, ACTIVE_DIR)))
+        sealed = self._sealed()
+        self.assertGreater(len(sealed), 2)
+
+        events = []
+        for name in sealed:
+            events.extend(self._read_segment(os.path.join(self.directory, SEALED_DIR, name)))
+        self.assertEqual(list(range(7)), sorted(e["n"] for e in events))
+
+        keys = [segment_partition_key(name) for name in sealed]
+        self.assertTrue(all(k.startswith("events-test-perf-mon/dt=2022/03/04/") for k in keys))
+        self.assertEqual(1, len([k for k in keys if "/dt=2022/03/04/06/" in k]))
+
+    def test_ship_sealed_segments_to_local_destination(self):
+        handler = self._handler()
+        handler.emit(_record('{"type": "x"}', created=_timestamp(2022, 3, 4, 5, 6, 7)))
+        handler.seal()
+        # Records after sealing go to a new, still active segment
+        handler.emit(_record('{"type": "y"}', created=_timestamp(2022, 3, 4, 5, 6, 8)))
+
+        shipped = ship_sealed_segments(self.directory, LocalDirectoryDestination(self.bucket))
+
+        self.assertEqual(1, len(shipped))
+        key = shipped[0]
+        self.assertRegex(key, r"^events-test-perf-mon/dt=2022/03/04/05/"
+                              r"bfd-insights-bb2-test-perf-mon-1-2022-03-04-05-06-07-[0-9a-f-]+\.gz$")
+        self.assertEqual(["x"], [e["type"] for e in self._read_segment(os.path.join(self.bucket, key))])
+        self.assertEqual([], self._sealed())
+
+        # Shipped once only
+        self.assertEqual([], ship_sealed_segments(self.directory, LocalDirectoryDestination(self.bucket)))
+
+    def test_failed_upload_keeps_segment(self):
+        handler = self._handler()
+        handler.emit(_record('{"type": "x"}'))
+        handler.seal()
+
+        class FailingDestination:
+            def upload(self, path, key):
+                raise OSError("unavailable")
+
+        with self.assertLogs("hhs_server.apps.logging.shipping", level="ERROR"):
+            self.assertEqual([], ship_sealed_segments(self.directory, FailingDestination()))
+        self.assertEqual(1, len(self._sealed()))
+
+    def test_ship_audit_logs_command(self):
+        handler = self._handler()
+        handler.emit(_record('{"type": "x"}'))
+        handler.seal()
+
+        out = StringIO()
+        call_command("ship_audit_logs", directory=self.directory, destination="file://" + self.bucket, stdout=out)
+
+        self.assertIn("Shipped 1 audit log segments", out.getvalue())
+        self.assertEqual([], self._sealed())
+
+    def test_get_audit_log_destination(self):
+        destination = get_audit_log_destination("s3://bb2-bucket/databases/bb2/")
+        self.assertEqual(("bb2-bucket", "databases/bb2/"), (destination.bucket, destination.prefix))
+        self.assertEqual("/tmp/bucket", get_audit_log_destination("/tmp/bucket").root)
+        with self.assertRaises(ValueError):
+            get_audit_log_destination("ftp://host/path")
@@ -0,0 +1,112 @@
+import json
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from httmock import all_requests, HTTMock
+
+import apps.logging.request_logger as logging
+
+from apps.logging.timing import RequestTimer, end_request_timer, get_request_timer, span, start_request_timer
+from apps.logging.utils import cleanup_logger, get_log_content, redirect_loggers_custom
+from apps.mymedicare_cb.tests.responses import patient_response
+from apps.test import BaseApiTest
+
+
+class TestRequestTimer(SimpleTestCase):
+    def test_span_outside_request_is_noop(self):
+        self.assertIsNone(get_request_timer())
+        with span("noop"):
+            pass
+        self.assertIsNone(get_request_timer())
+
+    def test_spans_are_summed_and_counted(self):
+        request = RequestFactory().get("/")
+        token = start_request_timer(request)
+        try:
+            for i in range(3):
+                with span("db"):
+                    pass
+            with self.assertRaises(ValueError):
+                with span("render"):
+                    raise ValueError()
+        finally:
+            end_request_timer(token)
+        self.assertIsNone(get_request_timer())
+
+        timer = request._request_timer
+        timing = timer.to_dict()
+        self.assertEqual(["db", "db_count", "render"], sorted(timing["spans"]))
+        self.assertEqual(3, timing["spans"]["db_count"])
+        self.assertGreaterEqual(timing["elapsed_ms"], timing["spans"]["db"])
+        self.assertRegex(timer.server_timing(), r"^db;dur=\d+\.\d\d, render;dur=\d+\.\d\d, total;dur=\d+\.\d\d$")
+
+    def test_empty_timer(self):
+        timer = RequestTimer()
+        self.assertEqual({}, timer.to_dict()["spans"])
+        self.assertRegex(timer.server_timing(), r"^total;dur=\d+\.\d\d$")
+
+
+class TestRequestTimingSpans(BaseApiTest):
+    def setUp(self):
+        self.read_capability = self._create_capability('Read', [])
+        self.write_capability = self._create_capability('Write', [])
+        self._create_capability('patient', [
+            ["GET", "/v1/fhir/Patient"],
+        ])
+        self.logger_registry = redirect_loggers_custom([logging.PERFORMANCE_LOGGER])
+
+    def tearDown(self):
+        cleanup_logger(self.logger_registry)
+
+    def _timing_records(self):
+        content = get_log_content(self.logger_registry, logging.PERFORMANCE_LOGGER, [logging.PERFORMANCE_LOGGER])
+        records = [json.loads(line) for line in content.splitlines()]
+        return [r for r in records if r.get("type") == "request_timing"]
+
+    def _search(self):
+        access_token = self.create_token('John', 'Smith')
+
+        @all_requests
+        def catchall(url, req):
+            return {
+                'status_code': 200,
+                'content': patient_response,
+            }
+
+        with HTTMock(catchall):
+            response = self.client.get(reverse('bb_oauth_fhir_patient_search'),
+                                       Authorization="Bearer %s" % access_token)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_fhir_request_spans_logged(self):
+        response = self._search()
+
+        self.assertFalse(response.has_header("Server-Timing"))
+        records = self._timing_records()
+        self.assertEqual(1, len(records))
+        record = records[0]
+        self.assertEqual("/v1/fhir/Patient", record["path"])
+        self.assertEqual(200, record["response_code"])
+        self.assertIsNotNone(record["request_uuid"])
+        for name in ["auth",
+                     "throttle",
+                     "permission.TokenHasProtectedCapability",
+                     "permission.DataAccessGrantPermission",
+                     "bfd_fetch",
+                     "json_parse",
+                     "object_permission.DataAccessGrantPermission",
+                     "render"]:
+            self.assertIn(name, record["spans"])
+        self.assertGreaterEqual(record["elapsed_ms"], record["spans"]["bfd_fetch"])
+
+    @override_settings(REQUEST_TIMING_SERVER_TIMING=True)
+    def test_server_timing_header(self):
+        response = self._search()
+
+        self.assertIn("bfd_fetch;dur=", response["Server-Timing"])
+        self.assertIn("total;dur=", response["Server-Timing"])
+
+    def test_request_without_spans_not_logged(self):
+        self.client.get("/")
+        self.assertEqual([], self._timing_records())
@@ -0,0 +1,103 @@
+import contextvars
+import time
+
+from contextlib import contextmanager
+
+
+"""
+  Request scoped timing spans.
+
+  RequestTimeLoggingMiddleware makes a RequestTimer current for each
+  request, code timed with span(name) adds the elapsed time to the span
+  of that name (spans entered several times are summed and counted):
+
+      with span("bfd_fetch"):
+          r = session.send(prepped)
+
+  At the end of the request the spans are logged as one
+  "request_timing" record on the performance logger and, when
+  settings.REQUEST_TIMING_SERVER_TIMING is set, sent in a Server-Timing
+  response header. span() is a no-op outside of a request.
+
+  Span names are Server-Timing metric names: letters, digits and
+  "_", "-" or ".".
+"""
+
+_current_request_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+class RequestTimer:
+    __slots__ = ("start", "elapsed", "spans")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.elapsed = None
+        # name -> [count, seconds]
+        self.spans = {}
+
+    def add(self, name, seconds):
+        span = self.spans.get(name)
+        if span is None:
+            self.spans[name] = [1, seconds]
+        else:
+            span[0] += 1
+            span[1] += seconds
+
+    def stop(self):
+        if self.elapsed is None:
+            self.elapsed = time.perf_counter() - self.start
+        return self.elapsed
+
+    def to_dict(self):
+        """
+        Span durations in milliseconds, with the call count for spans
+        entered more than once.
+        """
+        spans = {}
+        for name, (count, seconds) in self.spans.items():
+            spans[name] = round(seconds * 1000, 2)
+            if count > 1:
+                spans[name + "_count"] = count
+        return {
+            "elapsed_ms": round(self.stop() * 1000, 2),
+            "spans": spans,
+        }
+
+    def server_timing(self):
+        """
+        Server-Timing header value for the spans and the total time.
+        """
+        metrics = ["{};dur={:.2f}".format(name, seconds * 1000) for name, (count, seconds) in self.spans.items()]
+        metrics.append("total;dur={:.2f}".format(self.stop() * 1000))
+        return ", ".join(metrics)
+
+
+def start_request_timer(request):
+    """
+    Make a new RequestTimer current and attach it to the request.
+
+    Returns the token for end_request_timer().
+    """
+    request._request_timer = RequestTimer()
+    return _current_request_timer.set(request._request_timer)
+
+
+def end_request_timer(token):
+    _current_request_timer.reset(token)
+
+
+def get_request_timer():
+    return _current_request_timer.get()
+
+
+@contextmanager
+def span(name):
+    timer = _current_request_timer.get()
+    if timer is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.add(name, time.perf_counter() - start)
@@ -0,0 +1,210 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.http import http_date
+
+import apps.logging.request_logger as bb2logging
+
+from apps.core.replica import ReadReplicaMixin, read_replica_view
+
+
+"""
+  Stale-while-revalidate cache of the metrics API responses.
+
+  Dashboards poll the metrics endpoints continuously, so the rendered
+  responses are kept in the settings.METRICS_CACHE_ALIAS cache per
+  request path, query parameters and Accept header:
+
+  - Younger than settings.METRICS_CACHE_SOFT_TTL: served from the cache.
+  - Older: still served from the cache, while one background recompute
+    (guarded by a cache lock, so one per key across all web workers)
+    refreshes it.
+  - Older than settings.METRICS_CACHE_HARD_TTL (the cache timeout) or
+    missing: recomputed within the request.
+
+  Responses carry Age, Last-Modified (when the data was computed) and
+  X-Cache (HIT, STALE or MISS) headers. Cached responses are only served
+  to requests passing the view's authentication and permission checks;
+  the background recompute reuses that checked request rather than
+  authenticating and throttling it again.
+
+  The alias must be a dedicated non-database cache (Redis, Memcached):
+  the pickled responses would otherwise be rewritten to the primary
+  database on every refresh, so a database cache is refused. Without the
+  alias in settings.CACHES, or with METRICS_CACHE_HARD_TTL = 0, nothing
+  is cached.
+"""
+
+log = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
+
+METRICS_CACHE_KEY = "metrics_result:{}"
+METRICS_CACHE_REFRESH_LOCK_KEY = "metrics_result_refresh:{}"
+
+# Lock expires in case a worker dies while refreshing.
+METRICS_CACHE_REFRESH_LOCK_TIMEOUT = 5 * 60
+
+
+class CachedResult:
+    def __init__(self, body, content_type, computed_at=None):
+        self.body = body
+        self.content_type = content_type
+        self.computed_at = time.time() if computed_at is None else computed_at
+
+    def age(self):
+        return max(time.time() - self.computed_at, 0)
+
+
+def get_result_cache():
+    """
+    Return the METRICS_CACHE_ALIAS cache, None when caching is disabled.
+    """
+    alias = settings.METRICS_CACHE_ALIAS
+    if not settings.METRICS_CACHE_HARD_TTL or alias not in settings.CACHES:
+        return None
+
+    result_cache = caches[alias]
+    if isinstance(result_cache, DatabaseCache):
+        raise ImproperlyConfigured("The metrics result cache can't use the database cache {!r}".format(alias))
+    return result_cache
+
+
+def get_result_cache_key(request):
+    params = sorted((key, sorted(values)) for key, values in request.GET.lists())
+    digest = hashlib.sha256(
+        json.dumps([request.path, params, request.META.get("HTTP_ACCEPT", "")]).encode("utf-8")
+    ).hexdigest()
+    return METRICS_CACHE_KEY.format(digest)
+
+
+def set_data_age_headers(response, result, status):
+    response["Age"] = str(int(result.age()))
+    response["Last-Modified"] = http_date(result.computed_at)
+    response["X-Cache"] = status
+    return response
+
+
+def store_result(key, response):
+    """
+    Cache a successful rendered (non HTML) response, returns the CachedResult or None.
+    """
+    if response.status_code != 200 or not hasattr(response, "render"):
+        return None
+
+    response.render()
+    content_type = response.get("Content-Type", "")
+    # Browsable API pages are per user (CSRF token, user name)
+    if content_type.startswith("text/html"):
+        return None
+
+    result = CachedResult(response.content, content_type)
+    get_result_cache().set(key, result, settings.METRICS_CACHE_HARD_TTL)
+    return result
+
+
+def _refresh_result_thread(view_class, key, request, args, kwargs):
+    try:
+        view = view_class()
+        view.setup(request._request, *args, **kwargs)
+        recompute = view.recompute_result
+        if isinstance(view, ReadReplicaMixin):
+            recompute = read_replica_view(recompute)
+        store_result(key, recompute(request, *args, **kwargs))
+    except Exception:
+        log.exception("Metrics result refresh failed")
+    finally:
+        get_result_cache().delete(METRICS_CACHE_REFRESH_LOCK_KEY.format(key))
+        # Worker threads get their own DB connections, release them.
+        connections.close_all()
+
+
+def start_result_refresh(view_class, key, request, args, kwargs):
+    """
+    Recompute a cached result on a background thread, unless a refresh
+    of the key is already running. The request is the DRF request that
+    passed ResultCacheMixin.check_cached_result_access().
+    """
+    lock_key = METRICS_CACHE_REFRESH_LOCK_KEY.format(key)
+    if not get_result_cache().add(lock_key, time.time(), METRICS_CACHE_REFRESH_LOCK_TIMEOUT):
+        return False
+
+    threading.Thread(
+        target=_refresh_result_thread, args=(view_class, key, request, args, kwargs), daemon=True
+    ).start()
+    return True
+
+
+class ResultCacheMixin(object):
+    """
+    APIView mixin serving GET/HEAD responses from the stale-while-revalidate
+    result cache.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        result_cache = get_result_cache()
+        if request.method not in ("GET", "HEAD") or result_cache is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        key = get_result_cache_key(request)
+        result = result_cache.get(key)
+
+        if result is None or result.age() >= settings.METRICS_CACHE_HARD_TTL:
+            response = super().dispatch(request, *args, **kwargs)
+            result = store_result(key, response)
+            if result is not None:
+                set_data_age_headers(response, result, "MISS")
+            return response
+
+        denied = self.check_cached_result_access(request, *args, **kwargs)
+        if denied is not None:
+            return denied
+
+        status = "HIT"
+        if result.age() >= settings.METRICS_CACHE_SOFT_TTL:
+            status = "STALE"
+            start_result_refresh(type(self), key, self.request, args, kwargs)
+
+        response = HttpResponse(result.body, content_type=result.content_type)
+        response = self.finalize_response(self.request, response, *args, **kwargs)
+        return set_data_age_headers(response, result, status)
+
+    def check_cached_result_access(self, request, *args, **kwargs):
+        """
+        Run the view's authentication, permission and throttling checks
+        (APIView.initial()), returns the error response or None.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        self.request = self.initialize_request(request, *args, **kwargs)
+        self.headers = self.default_response_headers
+
+        try:
+            self.initial(self.request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+            return self.finalize_response(self.request, response, *args, **kwargs)
+        return None
+
+    def recompute_result(self, request, *args, **kwargs):
+        """
+        Run the view's handler for a DRF request that already passed
+        check_cached_result_access(), skipping APIView.initial() so the
+        request isn't authenticated and throttled twice.
+        """
+        self.args = args
+        self.kwargs = kwargs
+        self.request = request
+        self.headers = self.default_response_headers
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+
+        handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+        response = handler(request, *args, **kwargs)
+        return self.finalize_response(request, response, *args, **kwargs)
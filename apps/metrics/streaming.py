@@ -0,0 +1,170 @@
+import json
+import logging
+
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.serializers import ListSerializer, LIST_SERIALIZER_KWARGS
+from rest_framework_csv.renderers import CSVStreamingRenderer
+
+import apps.logging.request_logger as bb2logging
+
+
+"""
+  Streaming exports of (large) querysets.
+
+  Rows are read by primary key keyset, in chunks of STREAM_CHUNK_SIZE:
+
+    SELECT ... WHERE pk > <last pk of the previous chunk> ORDER BY pk LIMIT <size>
+
+  so every chunk is an index range scan (no OFFSET re-scan of the rows
+  already sent), rows inserted or deleted while streaming can't shift the
+  window (no row is skipped or sent twice), and only one chunk is held in
+  memory.
+
+  A serializer using StreamableSerializerMixin is streamed with
+  many=True, stream=True. Its Meta declares the query profile of a chunk:
+
+    stream_select_related = ('userprofile',)
+    stream_prefetch_related = ('useridentificationlabel_set',)
+
+  The serializer's data is a generator of representations, rendered as a
+  JSON array (JSONStreamingRenderer) or CSV (CSVStreamingRenderer, with
+  the header from get_csv_header() so the rows are never materialized).
+"""
+
+log = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
+
+STREAM_SERIALIZER_KWARGS = LIST_SERIALIZER_KWARGS
+
+# Rows per keyset query
+STREAM_CHUNK_SIZE = 500
+
+
+def keyset_chunks(queryset, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield lists of the queryset's rows, walking it in primary key order.
+
+    Annotations, filters (also on aggregates) and select/prefetch_related
+    of queryset apply to every chunk.
+    """
+    queryset = queryset.order_by("pk")
+    last_pk = None
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            return
+
+        yield chunk
+
+        if len(chunk) < chunk_size:
+            return
+        last_pk = chunk[-1].pk
+
+
+class StreamingSerializer(ListSerializer):
+    chunk_size = STREAM_CHUNK_SIZE
+
+    def get_stream_queryset(self, queryset):
+        meta = getattr(self.child, 'Meta', None)
+        select_related = getattr(meta, 'stream_select_related', ())
+        prefetch_related = getattr(meta, 'stream_prefetch_related', ())
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch_related:
+            queryset = queryset.prefetch_related(*prefetch_related)
+        return queryset
+
+    def get_csv_header(self):
+        """
+        CSV columns, the serializer's fields in sorted order (as the CSV
+        renderer orders the columns it collects).
+        """
+        return sorted(self.child.fields)
+
+    @property
+    def data(self):
+        data = self.instance
+        if not isinstance(data, QuerySet):
+            for item in data:
+                yield self.child.to_representation(item)
+            return
+
+        count = 0
+        for chunk in keyset_chunks(self.get_stream_queryset(data), self.chunk_size):
+            log.info("pulled {} items from the db after pk {}".format(len(chunk), chunk[0].pk))
+            for item in chunk:
+                yield self.child.to_representation(item)
+            count += len(chunk)
+        log.info("streamed {} items".format(count))
+
+
+class StreamableSerializerMixin(object):
+    def __new__(cls, *args, **kwargs):
+
+        # We override this method in order to automagically create
+        # `ListSerializer` classes instead when `many=True` is set.
+        if kwargs.pop('many', False):
+            if kwargs.pop('stream', False):
+                return cls.stream_init(*args, **kwargs)
+            return cls.many_init(*args, **kwargs)
+
+        return super().__new__(cls, *args, **kwargs)
+
+    @classmethod
+    def stream_init(cls, *args, **kwargs):
+        allow_empty = kwargs.pop('allow_empty', None)
+        child_serializer = cls(*args, **kwargs)
+        stream_kwargs = {
+            'child': child_serializer,
+        }
+        if allow_empty is not None:
+            stream_kwargs['allow_empty'] = allow_empty
+
+        stream_kwargs.update({
+            key: value for key, value in kwargs.items()
+            if key in STREAM_SERIALIZER_KWARGS
+        })
+
+        meta = getattr(cls, 'Meta', None)
+        stream_serializer_class = getattr(meta, 'stream_serializer_class', StreamingSerializer)
+        return stream_serializer_class(*args, **stream_kwargs)
+
+
+class JSONStreamingRenderer(JSONRenderer):
+    """
+    Renders a generator of items into a JSON array, item by item, to be
+    used with Django StreamingHttpResponse.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        yield b"["
+        for index, item in enumerate(data):
+            separator = "," if index else ""
+            yield (separator + json.dumps(item, cls=self.encoder_class, ensure_ascii=self.ensure_ascii)).encode()
+        yield b"]"
+
+
+class StreamingListMixin(object):
+    """
+    ListAPIView mixin streaming the filtered queryset, as CSV or a JSON
+    array by the negotiated renderer (?format=csv|json).
+    """
+    renderer_classes = (CSVStreamingRenderer, JSONStreamingRenderer)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # The rows are read after the view returns, from the database it would read now
+        queryset = queryset.using(queryset.db)
+        serializer = self.get_serializer(queryset, many=True, stream=True)
+
+        renderer = request.accepted_renderer
+        renderer_context = {}
+        if isinstance(renderer, CSVStreamingRenderer):
+            renderer_context['header'] = serializer.get_csv_header()
+
+        return StreamingHttpResponse(
+            renderer.render(serializer.data, renderer_context=renderer_context),
+            content_type=renderer.media_type,
+        )
@@ -0,0 +1,124 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.views import APIView
+
+from apps.accounts.models import UserProfile
+from apps.metrics.cache import get_result_cache_key
+
+
+@override_settings(METRICS_CACHE_ALIAS="default", METRICS_CACHE_SOFT_TTL=60, METRICS_CACHE_HARD_TTL=600)
+class TestMetricsResultCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin_user = User.objects.create_superuser("admin", "admin@example.com", "xxx123")
+        self.client.force_login(self.admin_user)
+
+    def tearDown(self):
+        cache.clear()
+
+    def _create_bene(self, username):
+        UserProfile.objects.create(user=User.objects.create_user(username), user_type="BEN")
+
+    def _age_cached_result(self, response, seconds):
+        key = get_result_cache_key(response.wsgi_request)
+        result = cache.get(key)
+        result.computed_at -= seconds
+        cache.set(key, result)
+
+    def test_hit_and_miss(self):
+        response = self.client.get(reverse("beneficiaries"))
+        self.assertEqual({"count": 0}, response.json())
+        self.assertEqual("MISS", response["X-Cache"])
+        self.assertEqual("0", response["Age"])
+        self.assertIn("Last-Modified", response)
+
+        self._create_bene("bene1")
+
+        response = self.client.get(reverse("beneficiaries"))
+        self.assertEqual({"count": 0}, response.json())
+        self.assertEqual("HIT", response["X-Cache"])
+
+        # Keyed by the query parameters
+        response = self.client.get(reverse("beneficiaries"), {"x": "1"})
+        self.assertEqual({"count": 1}, response.json())
+        self.assertEqual("MISS", response["X-Cache"])
+
+    def test_stale_result_refreshed_in_background(self):
+        response = self.client.get(reverse("beneficiaries"))
+        self._create_bene("bene1")
+        self._age_cached_result(response, 61)
+
+        with mock.patch("apps.metrics.cache.threading.Thread") as thread:
+            response = self.client.get(reverse("beneficiaries"))
+            self.assertEqual({"count": 0}, response.json())
+            self.assertEqual("STALE", response["X-Cache"])
+            self.assertEqual("61", response["Age"])
+
+            # One refresh at a time
+            self.client.get(reverse("beneficiaries"))
+            thread.assert_called_once()
+            thread.return_value.start.assert_called_once()
+
+        # The refresh reuses the checked request, without re-running authentication and throttling
+        with mock.patch.object(APIView, "initial") as initial:
+            thread.call_args[1]["target"](*thread.call_args[1]["args"])
+        initial.assert_not_called()
+
+        response = self.client.get(reverse("beneficiaries"))
+        self.assertEqual({"count": 1}, response.json())
+        self.assertEqual("HIT", response["X-Cache"])
+
+    def test_hard_ttl_recomputed_in_request(self):
+        response = self.client.get(reverse("beneficiaries"))
+        self._create_bene("bene1")
+        self._age_cached_result(response, 600)
+
+        with mock.patch("apps.metrics.cache.threading.Thread") as thread:
+            response = self.client.get(reverse("beneficiaries"))
+        self.assertEqual({"count": 1}, response.json())
+        self.assertEqual("MISS", response["X-Cache"])
+        thread.assert_not_called()
+
+    def test_cached_result_requires_permission(self):
+        self.client.get(reverse("beneficiaries"))
+
+        self.client.logout()
+        response = self.client.get(reverse("beneficiaries"))
+        self.assertEqual(403, response.status_code)
+        self.assertNotIn("X-Cache", response)
+
+        self.client.force_login(User.objects.create_user("dev"))
+        response = self.client.get(reverse("beneficiaries"))
+        self.assertEqual(403, response.status_code)
+
+    def test_browsable_api_not_cached(self):
+        response = self.client.get(reverse("developers"), HTTP_ACCEPT="text/html")
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn("X-Cache", response)
+
+        response = self.client.get(reverse("developers"))
+        self.assertEqual("MISS", response["X-Cache"])
+
+    @override_settings(METRICS_CACHE_HARD_TTL=0)
+    def test_disabled(self):
+        response = self.client.get(reverse("beneficiaries"))
+        self.assertNotIn("X-Cache", response)
+
+    @override_settings(METRICS_CACHE_ALIAS="metrics")
+    def test_disabled_without_cache_alias(self):
+        response = self.client.get(reverse("beneficiaries"))
+        self.assertEqual(200, response.status_code)
+        self.assertNotIn("X-Cache", response)
+
+    def test_database_cache_refused(self):
+        with override_settings(CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "metrics": {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "metrics_cache"},
+        }, METRICS_CACHE_ALIAS="metrics"):
+            with self.assertRaises(ImproperlyConfigured):
+                self.client.get(reverse("beneficiaries"))
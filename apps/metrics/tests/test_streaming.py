@@ -0,0 +1,95 @@
+import csv
+import io
+import json
+
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from apps.accounts.models import UserIdentificationLabel, UserProfile
+from apps.metrics.streaming import StreamingSerializer, keyset_chunks
+
+
+STREAM_URL = "/admin/metrics/raw/developers"
+
+
+class TestStreamingExport(TestCase):
+    def setUp(self):
+        self.admin_user = User.objects.create_superuser("admin", "admin@example.com", "xxx123")
+        self.client.force_login(self.admin_user)
+
+    def _create_developers(self, count, prefix="dev"):
+        User.objects.bulk_create(
+            [User(username="{}{:05d}".format(prefix, i), email="{}{}@example.com".format(prefix, i))
+             for i in range(count)]
+        )
+        users = list(User.objects.filter(username__startswith=prefix).order_by("pk"))
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, user_type="DEV", organization_name="org{}".format(i % 7))
+             for i, user in enumerate(users)]
+        )
+        return users
+
+    def _stream(self, **params):
+        response = self.client.get(STREAM_URL, params)
+        self.assertEqual(200, response.status_code)
+        return b"".join(response.streaming_content).decode()
+
+    def test_keyset_chunks(self):
+        users = self._create_developers(23)
+
+        chunks = list(keyset_chunks(User.objects.filter(username__startswith="dev").order_by("-username"), 10))
+
+        self.assertEqual([10, 10, 3], [len(chunk) for chunk in chunks])
+        self.assertEqual([user.pk for user in users], [user.pk for chunk in chunks for user in chunk])
+
+    def test_rows_deleted_while_streaming_not_skipped(self):
+        users = self._create_developers(30)
+        streamed = []
+
+        for chunk in keyset_chunks(User.objects.filter(username__startswith="dev"), 10):
+            streamed.extend(user.pk for user in chunk)
+            # An OFFSET window would shift past rows not streamed yet
+            User.objects.filter(pk__in=[user.pk for user in chunk[:5]]).delete()
+
+        self.assertEqual([user.pk for user in users], streamed)
+
+    @mock.patch.object(StreamingSerializer, "chunk_size", 50)
+    def test_csv_export_is_complete_and_duplicate_free(self):
+        users = self._create_developers(537)
+        label = UserIdentificationLabel.objects.create(name="Label A", slug="label-a")
+        label.users.add(*users[:3])
+
+        with CaptureQueriesContext(connection) as context:
+            rows = list(csv.DictReader(io.StringIO(self._stream())))
+
+        self.assertEqual([str(user.pk) for user in users], [row["id"] for row in rows])
+        self.assertEqual(len(users), len({row["id"] for row in rows}))
+        self.assertEqual("org3", rows[3]["organization"])
+        self.assertEqual("label-a", rows[0]["identification.0.slug"])
+        self.assertEqual("", rows[3]["identification.0.slug"])
+        # One keyset and one label prefetch query per chunk, no per row queries
+        self.assertLess(len(context.captured_queries), 2 * (len(users) // 50 + 1) + 10)
+
+    @mock.patch.object(StreamingSerializer, "chunk_size", 50)
+    def test_json_export(self):
+        users = self._create_developers(120)
+
+        items = json.loads(self._stream(format="json", min_app_count=0))
+
+        self.assertEqual([user.pk for user in users], [item["id"] for item in items])
+        self.assertEqual([], items[0]["identification"])
+        self.assertEqual("DEV", items[0]["user_type"])
+
+    def test_empty_export_has_header(self):
+        content = self._stream()
+
+        self.assertEqual(
+            "active_app_count,app_count,date_joined,email,first_active,id,last_active,"
+            "last_login,organization,user_type,username",
+            content.strip(),
+        )
+        self.assertEqual("[]", self._stream(format="json"))
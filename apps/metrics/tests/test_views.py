@@ -0,0 +1,74 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.test import BaseApiTest
+
+
+class TestAppMetricsView(BaseApiTest):
+    def setUp(self):
+        self.read_capability = self._create_capability("Read", [])
+        self.write_capability = self._create_capability("Write", [])
+        self.admin_user = User.objects.create_superuser("admin", "admin@example.com", "xxx123")
+
+    def _get_applications(self):
+        # The token helpers log the client in as the beneficiary
+        self.client.force_login(self.admin_user)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse("applications"), {"page_size": 100})
+        self.assertEqual(200, response.status_code)
+        return response.json(), len(context.captured_queries)
+
+    def test_bene_counts_query_count_is_constant(self):
+        self._create_range_users_app_token_grant(
+            start_fhir_id="-2000000000000", count=2, app_name="app0", app_user_organization="org0")
+        content, query_count = self._get_applications()
+        self.assertEqual({"real": 0, "synthetic": 2}, content["results"][0]["beneficiaries"])
+
+        self._create_range_users_app_token_grant(
+            start_fhir_id="2000000000000", count=3, app_name="app1", app_user_organization="org1")
+        self._create_range_users_app_token_grant(
+            start_fhir_id="-2000000000001", count=1, app_name="app2", app_user_organization="org2")
+
+        content, new_query_count = self._get_applications()
+        self.assertEqual(query_count, new_query_count)
+        self.assertEqual(
+            {
+                "app0": {"real": 0, "synthetic": 2},
+                "app1": {"real": 3, "synthetic": 0},
+                "app2": {"real": 0, "synthetic": 1},
+            },
+            {app["name"]: app["beneficiaries"] for app in content["results"]},
+        )
+
+    def test_detail_bene_counts(self):
+        app, users = self._create_range_users_app_token_grant(
+            start_fhir_id="2000000000000", count=2, app_name="app0", app_user_organization="org0")
+
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse("applications-detail", kwargs={"pk": app.pk}))
+        self.assertEqual({"real": 2, "synthetic": 0}, response.json()["beneficiaries"])
+
+
+class TestMetricCountersView(BaseApiTest):
+    def setUp(self):
+        self.read_capability = self._create_capability("Read", [])
+        self.write_capability = self._create_capability("Write", [])
+        self.admin_user = User.objects.create_superuser("admin", "admin@example.com", "xxx123")
+
+    def test_counters(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            app, _ = self._create_range_users_app_token_grant(
+                start_fhir_id="2000000000000", count=2, app_name="app0", app_user_organization="org0")
+
+        self.client.force_login(self.admin_user)
+        response = self.client.get(reverse("counters"))
+        self.assertEqual(200, response.status_code)
+        content = response.json()
+        self.assertEqual(2, content["counters"]["token"])
+        self.assertEqual(2, content["counters"]["crosswalk_real"])
+        self.assertEqual({"grant": 2, "token": 2}, content["applications"][str(app.id)])
+
+        response = self.client.get(reverse("tokens"))
+        self.assertEqual({"count": 2}, response.json())
@@ -5,6 +5,7 @@ from .views import (
     AppMetricsView,
     AppMetricsDetailView,
     TokenMetricsView,
+    MetricCountersView,
     DevelopersView,
     DevelopersStreamView,
     ArchivedTokenView,
@@ -23,6 +24,7 @@ urlpatterns = [
     url(r'^crosswalks/check$', CheckCrosswalksView.as_view(), name='check-crosswalks'),
     url(r'^developers/$', DevelopersView.as_view(), name='developers'),
     url(r'^tokens$', TokenMetricsView.as_view(), name='tokens'),
+    url(r'^counters$', MetricCountersView.as_view(), name='counters'),
     url(r'^tokens/archive$', ArchivedTokenView.as_view(), name='archived-tokens'),
     url(r'^grants$', DataAccessGrantView.as_view(), name='grants'),
     url(r'^grants/archive$', ArchivedDataAccessGrantView.as_view(), name='archive-grants'),
@@ -6,11 +6,11 @@ from django.db.models import (
     QuerySet,
     Min,
     Max,
+    Prefetch,
 )
 from django_filters import rest_framework as filters
-from django.http import StreamingHttpResponse
 from oauth2_provider.models import AccessToken
-from rest_framework_csv.renderers import PaginatedCSVRenderer, CSVStreamingRenderer
+from rest_framework_csv.renderers import PaginatedCSVRenderer
 from rest_framework.generics import ListAPIView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
@@ -23,71 +23,26 @@ from rest_framework.serializers import (
     ListSerializer,
     IntegerField,
     DateTimeField,
-    LIST_SERIALIZER_KWARGS,
 )
 from rest_framework.views import APIView
+from rest_framework import status
 from apps.accounts.models import UserProfile, UserIdentificationLabel
+from apps.authorization.jobs import get_grants_backfill_status, start_grants_backfill
 from apps.authorization.models import (
     DataAccessGrant,
     ArchivedDataAccessGrant,
-    check_grants,
-    update_grants)
-from apps.dot_ext.models import Application, ArchivedToken
-from apps.fhir.bluebutton.models import (
-    Crosswalk,
-    get_crosswalk_bene_counts)
+    check_grants)
+from apps.core.counters import get_application_counters, get_counter, get_counters
+from apps.core.replica import ReadReplicaMixin
+from apps.dot_ext.models import Application, ArchivedToken, get_token_bene_counts_by_application
+from apps.fhir.bluebutton.models import get_crosswalk_bene_counts
 
 import apps.logging.request_logger as bb2logging
 
-log = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
-
-STREAM_SERIALIZER_KWARGS = LIST_SERIALIZER_KWARGS
-
-
-class StreamingSerializer(ListSerializer):
-    @property
-    def data(self):
-        data = self.instance
-        psize = 100
-        count = data.count() if isinstance(data, QuerySet) else len(data)
-        log.info("csv of {} items".format(count))
-        for i in range(0, count, psize):
-            iterable = data.all()[i:i + psize] if isinstance(data, QuerySet) else data
-            log.info("pulled {} items from the db starting at index {}".format(len(iterable), i))
-            for item in iterable:
-                yield self.child.to_representation(item)
-
-
-class StreamableSerializerMixin(object):
-    def __new__(cls, *args, **kwargs):
-
-        # We override this method in order to automagically create
-        # `ListSerializer` classes instead when `many=True` is set.
-        if kwargs.pop('many', False):
-            if kwargs.pop('stream', False):
-                return cls.stream_init(*args, **kwargs)
-            return cls.many_init(*args, **kwargs)
-
-        return super().__new__(cls, *args, **kwargs)
-
-    @classmethod
-    def stream_init(cls, *args, **kwargs):
-        allow_empty = kwargs.pop('allow_empty', None)
-        child_serializer = cls(*args, **kwargs)
-        stream_kwargs = {
-            'child': child_serializer,
-        }
-        if allow_empty is not None:
-            stream_kwargs['allow_empty'] = allow_empty
+from .cache import ResultCacheMixin
+from .streaming import StreamableSerializerMixin, StreamingListMixin, StreamingSerializer
 
-        stream_kwargs.update({
-            key: value for key, value in kwargs.items()
-            if key in STREAM_SERIALIZER_KWARGS
-        })
-
-        meta = getattr(cls, 'Meta', None)
-        stream_serializer_class = getattr(meta, 'stream_serializer_class', StreamingSerializer)
-        return stream_serializer_class(*args, **stream_kwargs)
+log = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
 
 
 class UserSerializer(ModelSerializer):
@@ -105,6 +60,24 @@ class UserSerializer(ModelSerializer):
         )
 
 
+class DevUserStreamingSerializer(StreamingSerializer):
+    def get_csv_header(self):
+        # identification is a list of labels, flattened into
+        # identification.<n>.name/slug columns up to the most labels of a developer
+        label_counts = (
+            UserIdentificationLabel.users.through.objects
+            .filter(user_id__in=self.instance.values('pk'))
+            .values('user_id')
+            .annotate(label_count=Count('pk'))
+        )
+        max_labels = label_counts.aggregate(max_labels=Max('label_count'))['max_labels'] or 0
+
+        header = [field for field in self.child.fields if field != 'identification']
+        for index in range(max_labels):
+            header += ['identification.{}.name'.format(index), 'identification.{}.slug'.format(index)]
+        return sorted(header)
+
+
 class DevUserSerializer(StreamableSerializerMixin, ModelSerializer):
     organization = CharField(source='userprofile.organization_name')
     user_type = CharField(source='userprofile.user_type')
@@ -116,6 +89,12 @@ class DevUserSerializer(StreamableSerializerMixin, ModelSerializer):
 
     class Meta:
         model = User
+        stream_serializer_class = DevUserStreamingSerializer
+        stream_select_related = ('userprofile',)
+        stream_prefetch_related = (
+            Prefetch('useridentificationlabel_set', queryset=UserIdentificationLabel.objects.order_by('pk'),
+                     to_attr='identification_labels'),
+        )
         fields = (
             'id',
             'username',
@@ -132,6 +111,8 @@ class DevUserSerializer(StreamableSerializerMixin, ModelSerializer):
         )
 
     def get_identification(self, obj):
+        if hasattr(obj, 'identification_labels'):
+            return [{'slug': label.slug, 'name': label.name} for label in obj.identification_labels]
         identification = UserIdentificationLabel.objects.filter(users=obj.id).values('slug', 'name')
         return(list(identification))
 
@@ -159,6 +140,15 @@ class BeneUserSerializer(StreamableSerializerMixin, ModelSerializer):
         )
 
 
+class AppMetricsListSerializer(ListSerializer):
+    def to_representation(self, data):
+        # Bene counts of all the listed apps in one GROUP BY application query
+        apps = list(data.all() if isinstance(data, QuerySet) else data)
+        self.child.context['app_token_bene_counts'] = get_token_bene_counts_by_application(
+            [app.id for app in apps])
+        return super().to_representation(apps)
+
+
 class AppMetricsSerializer(ModelSerializer):
     beneficiaries = SerializerMethodField()
     user = UserSerializer(read_only=True)
@@ -167,16 +157,15 @@ class AppMetricsSerializer(ModelSerializer):
         model = Application
         fields = ('id', 'name', 'active', 'user', 'beneficiaries', 'first_active', 'last_active',
                   'logo_uri', 'tos_uri', 'policy_uri', 'contacts', 'website_uri', 'description')
+        list_serializer_class = AppMetricsListSerializer
 
     def get_beneficiaries(self, obj):
-        distinct = AccessToken.objects.filter(application=obj.id).distinct('user').values('user')
-
-        real_cnt = Crosswalk.real_objects.filter(
-            user__in=[item['user'] for item in distinct]).values('user', '_fhir_id').count()
-        synth_cnt = Crosswalk.synth_objects.filter(
-            user__in=[item['user'] for item in distinct]).values('user', '_fhir_id').count()
+        app_counts = self.context.get('app_token_bene_counts')
+        if app_counts is None:
+            app_counts = get_token_bene_counts_by_application([obj.id])
 
-        return({'real': real_cnt, 'synthetic': synth_cnt})
+        counts = app_counts[obj.id]
+        return {'real': counts['real_deduped'], 'synthetic': counts['synthetic_deduped']}
 
 
 class MetricsPagination(PageNumberPagination):
@@ -185,7 +174,7 @@ class MetricsPagination(PageNumberPagination):
     max_page_size = 10000
 
 
-class BeneMetricsView(APIView):
+class BeneMetricsView(ResultCacheMixin, ReadReplicaMixin, APIView):
     """
     View to provide beneficiary metrics.
 
@@ -227,7 +216,7 @@ class ArchivedTokenSerializer(ModelSerializer):
         fields = ('user', 'application', 'token', 'expires', 'created', 'archived_at', )
 
 
-class ArchivedTokenView(ListAPIView):
+class ArchivedTokenView(ResultCacheMixin, ReadReplicaMixin, ListAPIView):
     permission_classes = [
         IsAuthenticated,
         IsAdminUser,
@@ -266,7 +255,7 @@ class ArchivedDataAccessGrantSerializer(ModelSerializer):
         fields = ('beneficiary', 'application', 'created_at', 'archived_at', 'id', )
 
 
-class ArchivedDataAccessGrantView(ListAPIView):
+class ArchivedDataAccessGrantView(ResultCacheMixin, ReadReplicaMixin, ListAPIView):
     permission_classes = [
         IsAuthenticated,
         IsAdminUser,
@@ -304,7 +293,7 @@ class DataAccessGrantSerializer(ModelSerializer):
         fields = ('beneficiary', 'application', 'created_at', 'id', )
 
 
-class DataAccessGrantView(ListAPIView):
+class DataAccessGrantView(ResultCacheMixin, ReadReplicaMixin, ListAPIView):
     permission_classes = [
         IsAuthenticated,
         IsAdminUser,
@@ -330,11 +319,15 @@ class CheckDataAccessGrantsView(APIView):
     ]
 
     def get(self, request, format=None):
-        return Response(check_grants())
+        content = check_grants()
+        content["backfill"] = get_grants_backfill_status()
+        return Response(content)
 
     def post(self, request, format=None):
-        update_grants()
-        return Response()
+        # Backfill runs in the background, poll GET for its progress.
+        started, backfill_status = start_grants_backfill()
+        return Response({"started": started, "backfill": backfill_status},
+                        status=status.HTTP_202_ACCEPTED if started else status.HTTP_409_CONFLICT)
 
 
 class CheckCrosswalksView(APIView):
@@ -347,7 +340,7 @@ class CheckCrosswalksView(APIView):
         return Response(get_crosswalk_bene_counts())
 
 
-class AppMetricsView(ListAPIView):
+class AppMetricsView(ResultCacheMixin, ReadReplicaMixin, ListAPIView):
     """
     View to provide application metrics.
 
@@ -366,11 +359,11 @@ class AppMetricsView(ListAPIView):
     pagination_class = MetricsPagination
 
     def get_queryset(self):
-        queryset = Application.objects.select_related().all().order_by('name')
+        queryset = Application.objects.select_related('user', 'user__userprofile').all().order_by('name')
         return queryset
 
 
-class AppMetricsDetailView(APIView):
+class AppMetricsDetailView(ResultCacheMixin, ReadReplicaMixin, APIView):
     """
     View to provide application metrics detail.
 
@@ -393,7 +386,7 @@ class AppMetricsDetailView(APIView):
         return Response(AppMetricsSerializer(queryset).data)
 
 
-class TokenMetricsView(APIView):
+class TokenMetricsView(ReadReplicaMixin, APIView):
     """
     View to provide access token metrics.
 
@@ -408,8 +401,31 @@ class TokenMetricsView(APIView):
     renderer_classes = (JSONRenderer, )
 
     def get(self, request, format=None):
+        count = get_counter('token')
         content = {
-            'count': AccessToken.objects.count()
+            'count': AccessToken.objects.count() if count is None else count
+        }
+        return Response(content)
+
+
+class MetricCountersView(ReadReplicaMixin, APIView):
+    """
+    View to provide the incrementally maintained metric counters.
+
+    * Only admin users are able to access this view.
+    * Returns the global counters and the per application counters
+    """
+    permission_classes = (
+        IsAuthenticated,
+        IsAdminUser,
+    )
+
+    renderer_classes = (JSONRenderer, )
+
+    def get(self, request, format=None):
+        content = {
+            'counters': get_counters(),
+            'applications': get_application_counters(),
         }
         return Response(content)
 
@@ -470,7 +486,7 @@ class DeveloperFilter(filters.FilterSet):
                   'active_app_count', 'min_active_app_count', 'max_active_app_count', 'identification']
 
 
-class DevelopersView(ListAPIView):
+class DevelopersView(ResultCacheMixin, ReadReplicaMixin, ListAPIView):
     permission_classes = (
         IsAuthenticated,
         IsAdminUser,
@@ -489,7 +505,7 @@ class DevelopersView(ListAPIView):
     pagination_class = MetricsPagination
 
 
-class DevelopersStreamView(ListAPIView):
+class DevelopersStreamView(ReadReplicaMixin, StreamingListMixin, ListAPIView):
     permission_classes = (
         IsAuthenticated,
         IsAdminUser,
@@ -504,12 +520,3 @@ class DevelopersStreamView(ListAPIView):
     serializer_class = DevUserSerializer
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = DeveloperFilter
-    renderer_classes = (CSVStreamingRenderer,)
-
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-
-        serializer = self.get_serializer(queryset, many=True, stream=True)
-        renderer = CSVStreamingRenderer()
-        response = StreamingHttpResponse(renderer.render(serializer.data), content_type='text/csv')
-        return response
@@ -9,6 +9,7 @@ from enum import Enum
 from rest_framework import status
 from rest_framework.exceptions import APIException
 
+from apps.core.metrics import Counter, Histogram, observe_request
 from apps.fhir.bluebutton.models import hash_hicn, hash_mbi
 from apps.logging.serializers import SLSxTokenResponse, SLSxUserInfoResponse
 
@@ -16,6 +17,10 @@ from .signals import response_hook_wrapper
 from .validators import is_mbi_format_valid, is_mbi_format_synthetic
 
 
+SLSX_REQUESTS = Counter("bb2_slsx_requests_total", "SLSx requests by response status code",
+                        ["endpoint", "status"])
+SLSX_REQUEST_SECONDS = Histogram("bb2_slsx_request_seconds", "SLSx request latency", ["endpoint"])
+
 MSG_SLS_RESP_MISSING_AUTHTOKEN = "Exchange auth_token is missing in response error"
 MSG_SLS_RESP_MISSING_USERID = "Exchange user_id is missing in response error"
 MSG_SLS_RESP_MISSING_USERINFO_USERID = (
@@ -155,19 +160,21 @@ class OAuth2ConfigSLSx(object):
 
         headers = self.slsx_common_headers(request)
 
-        response = requests.post(
-            self.token_endpoint,
-            auth=self.basic_auth(),
-            json=data_dict,
-            headers=headers,
-            allow_redirects=False,
-            verify=self.verify_ssl_external,
-            hooks={
-                "response": [
-                    response_hook_wrapper(sender=SLSxTokenResponse, request=request)
-                ]
-            },
-        )
+        with observe_request(SLSX_REQUESTS, SLSX_REQUEST_SECONDS, endpoint="token") as call:
+            response = requests.post(
+                self.token_endpoint,
+                auth=self.basic_auth(),
+                json=data_dict,
+                headers=headers,
+                allow_redirects=False,
+                verify=self.verify_ssl_external,
+                hooks={
+                    "response": [
+                        response_hook_wrapper(sender=SLSxTokenResponse, request=request)
+                    ]
+                },
+            )
+            call["status"] = response.status_code
         self.token_status_code = response.status_code
         response.raise_for_status()
 
@@ -196,17 +203,19 @@ class OAuth2ConfigSLSx(object):
         headers = self.slsx_common_headers(request)
         headers.update(self.auth_header())
 
-        response = requests.get(
-            self.userinfo_endpoint + "/" + self.user_id,
-            headers=headers,
-            allow_redirects=False,
-            verify=self.verify_ssl_internal,
-            hooks={
-                "response": [
-                    response_hook_wrapper(sender=SLSxUserInfoResponse, request=request)
-                ]
-            },
-        )
+        with observe_request(SLSX_REQUESTS, SLSX_REQUEST_SECONDS, endpoint="userinfo") as call:
+            response = requests.get(
+                self.userinfo_endpoint + "/" + self.user_id,
+                headers=headers,
+                allow_redirects=False,
+                verify=self.verify_ssl_internal,
+                hooks={
+                    "response": [
+                        response_hook_wrapper(sender=SLSxUserInfoResponse, request=request)
+                    ]
+                },
+            )
+            call["status"] = response.status_code
         self.userinfo_status_code = response.status_code
         response.raise_for_status()
 
@@ -281,13 +290,15 @@ class OAuth2ConfigSLSx(object):
         """
         headers = self.slsx_common_headers(request)
 
-        response = requests.get(
-            self.healthcheck_endpoint,
-            headers=headers,
-            allow_redirects=False,
-            verify=self.verify_ssl_internal,
-            timeout=5,
-        )
+        with observe_request(SLSX_REQUESTS, SLSX_REQUEST_SECONDS, endpoint="health") as call:
+            response = requests.get(
+                self.healthcheck_endpoint,
+                headers=headers,
+                allow_redirects=False,
+                verify=self.verify_ssl_internal,
+                timeout=5,
+            )
+            call["status"] = response.status_code
         response.raise_for_status()
         return True
 
@@ -303,12 +314,14 @@ class OAuth2ConfigSLSx(object):
         headers = self.slsx_common_headers(request)
         headers.update(self.auth_header())
 
-        response = requests.get(
-            self.signout_endpoint,
-            headers=headers,
-            allow_redirects=False,
-            verify=self.verify_ssl_external,
-        )
+        with observe_request(SLSX_REQUESTS, SLSX_REQUEST_SECONDS, endpoint="signout") as call:
+            response = requests.get(
+                self.signout_endpoint,
+                headers=headers,
+                allow_redirects=False,
+                verify=self.verify_ssl_external,
+            )
+            call["status"] = response.status_code
         self.signout_status_code = response.status_code
         response.raise_for_status()
 
@@ -335,17 +348,19 @@ class OAuth2ConfigSLSx(object):
         headers = self.slsx_common_headers(request)
         headers.update(self.auth_header())
 
-        response = requests.get(
-            self.userinfo_endpoint + "/" + self.user_id,
-            headers=headers,
-            allow_redirects=False,
-            verify=self.verify_ssl_internal,
-            hooks={
-                "response": [
-                    response_hook_wrapper(sender=SLSxUserInfoResponse, request=request)
-                ]
-            },
-        )
+        with observe_request(SLSX_REQUESTS, SLSX_REQUEST_SECONDS, endpoint="validate_signout") as call:
+            response = requests.get(
+                self.userinfo_endpoint + "/" + self.user_id,
+                headers=headers,
+                allow_redirects=False,
+                verify=self.verify_ssl_internal,
+                hooks={
+                    "response": [
+                        response_hook_wrapper(sender=SLSxUserInfoResponse, request=request)
+                    ]
+                },
+            )
+            call["status"] = response.status_code
         self.validate_signout_status_code = response.status_code
 
         self.validate_asserts(
@@ -26,7 +26,7 @@ from .models import AnonUserState, get_and_update_user
 
 # For SLSx auth workflow info, see apps/mymedicare_db/README.md
 def authenticate(request):
-    # Update authorization flow from previously stored state in AuthFlowUuid instance in mymedicare_login().
+    # Update authorization flow from previously stored state in auth flow trace store in mymedicare_login().
     request_state = request.GET.get('relay')
 
     clear_session_auth_flow_trace(request)
@@ -163,7 +163,7 @@ def mymedicare_login(request, version=1):
 
     AnonUserState.objects.create(state=state, next_uri=next_uri)
 
-    # Update authorization flow trace AuthFlowUuid with state for pickup in authenticate().
+    # Update authorization flow trace store entry with state for pickup in authenticate().
     update_instance_auth_flow_trace_with_state(request, state)
 
     return HttpResponseRedirect(mymedicare_login_url)
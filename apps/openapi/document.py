@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import os
+import threading
+import yaml
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.renderers import JSONRenderer
+from rest_framework_yaml.renderers import YAMLRenderer
+
+from apps.core.compression import SUPPORTED_ENCODINGS, compress
+
+import apps.logging.request_logger as bb2logging
+
+
+"""
+  OpenAPI document loaded once per process.
+
+  The YAML file at settings.OPENAPI_DOC is parsed and validated on first
+  use and kept as pre-serialized JSON and YAML bytes, each with a strong
+  ETag (content hash) and pre-compressed variants, so serving it does no
+  parsing or rendering.
+
+  CALLED FROM: apps.openapi.views.OpenAPI
+"""
+
+logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
+
+OPENAPI_FORMATS = {
+    "json": (JSONRenderer, "application/json"),
+    "yaml": (YAMLRenderer, "application/yaml; charset=utf-8"),
+}
+
+# Compressed once per process, so use the best compression levels
+PRECOMPRESS_LEVELS = {"gzip": 9, "br": 11}
+
+_documents = {}
+_documents_lock = threading.Lock()
+
+
+class OpenAPIVariant:
+    def __init__(self, body, etag, content_type, encoding=None):
+        self.body = body
+        self.etag = etag
+        self.content_type = content_type
+        self.encoding = encoding
+
+
+class OpenAPIDocument:
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'r') as stream:
+            definition = yaml.safe_load(stream)
+        validate_openapi_definition(definition, path)
+
+        self.last_modified = int(os.path.getmtime(path))
+        self.variants = {}
+
+        for fmt, (renderer_class, content_type) in OPENAPI_FORMATS.items():
+            body = renderer_class().render(definition)
+            digest = hashlib.sha256(body).hexdigest()
+            self.variants[(fmt, None)] = OpenAPIVariant(body, '"{}"'.format(digest), content_type)
+
+            for encoding in SUPPORTED_ENCODINGS:
+                self.variants[(fmt, encoding)] = OpenAPIVariant(
+                    compress(body, encoding, PRECOMPRESS_LEVELS[encoding]),
+                    '"{}-{}"'.format(digest, encoding), content_type, encoding)
+
+    def get_variant(self, fmt, encoding=None):
+        return self.variants[(fmt, encoding)]
+
+
+def validate_openapi_definition(definition, path):
+    if not isinstance(definition, dict):
+        raise ImproperlyConfigured("OpenAPI document {} is not a mapping.".format(path))
+    if "openapi" not in definition and "swagger" not in definition:
+        raise ImproperlyConfigured("OpenAPI document {} has no openapi/swagger version.".format(path))
+    if not isinstance(definition.get("paths"), dict):
+        raise ImproperlyConfigured("OpenAPI document {} has no paths.".format(path))
+
+
+def get_openapi_document():
+    """
+    Return the OpenAPIDocument for settings.OPENAPI_DOC, loading it on first use.
+    """
+    path = settings.OPENAPI_DOC
+    document = _documents.get(path)
+    if document is None:
+        with _documents_lock:
+            document = _documents.get(path)
+            if document is None:
+                document = _documents[path] = OpenAPIDocument(path)
+    return document
+
+
+def preload_openapi_document():
+    """
+    Load the document at process start, so a bad document is reported
+    before the first request.
+
+    CALLED FROM: hhs_oauth_server.wsgi
+    """
+    try:
+        get_openapi_document()
+    except (OSError, yaml.YAMLError, ImproperlyConfigured):
+        logger.exception("Failed to load OpenAPI document %s" % settings.OPENAPI_DOC)
+
+
+def clear_openapi_documents():
+    _documents.clear()
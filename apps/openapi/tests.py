@@ -0,0 +1,84 @@
+import gzip
+import json
+import os
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from apps.openapi.document import clear_openapi_documents, get_openapi_document
+
+
+OPENAPI_YAML = """
+openapi: 3.0.0
+info:
+  title: Blue Button API
+  version: "2.0"
+paths:
+  /v2/fhir/Patient/:
+    get:
+      summary: Patient search
+"""
+
+
+class OpenAPITest(TestCase):
+    def setUp(self):
+        fd, self.doc_path = tempfile.mkstemp(suffix=".yaml")
+        with os.fdopen(fd, "w") as f:
+            f.write(OPENAPI_YAML)
+        clear_openapi_documents()
+        self.override = override_settings(OPENAPI_DOC=self.doc_path)
+        self.override.enable()
+
+    def tearDown(self):
+        self.override.disable()
+        clear_openapi_documents()
+        os.remove(self.doc_path)
+
+    def test_json_and_yaml(self):
+        response = self.client.get("/v2/openapi.json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(json.loads(response.content)["info"]["title"], "Blue Button API")
+
+        response = self.client.get("/v1/openapi.yaml")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"title: Blue Button API", response.content)
+
+    def test_loaded_once(self):
+        document = get_openapi_document()
+        with open(self.doc_path, "w") as f:
+            f.write("not: [valid")
+
+        self.client.get("/v2/openapi.json")
+        self.assertIs(get_openapi_document(), document)
+
+    def test_conditional_get(self):
+        response = self.client.get("/v2/openapi.json")
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+        response = self.client.get("/v2/openapi.json", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get("/v2/openapi.yaml", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_precompressed(self):
+        plain = self.client.get("/v2/openapi.json")
+
+        response = self.client.get("/v2/openapi.json", HTTP_ACCEPT_ENCODING="gzip;q=1.0, br;q=0")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertNotEqual(response["ETag"], plain["ETag"])
+
+        response = self.client.get("/v2/openapi.json", HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_invalid_document(self):
+        with open(self.doc_path, "w") as f:
+            f.write("info:\n  title: no version\n")
+
+        with self.assertRaises(ImproperlyConfigured):
+            get_openapi_document()
@@ -1,17 +1,30 @@
-import yaml
-
-from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 from rest_framework.views import APIView
-from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
 from rest_framework_yaml.renderers import YAMLRenderer
 
+from apps.core.compression import SUPPORTED_ENCODINGS, choose_encoding
+from apps.openapi.document import get_openapi_document
+
 
 class OpenAPI(APIView):
 
     renderer_classes = (JSONRenderer, YAMLRenderer, )
 
     def get(self, request, format=None):
-        with open(settings.OPENAPI_DOC, 'r') as stream:
-            definition = yaml.load(stream)
-        return Response(definition)
+        document = get_openapi_document()
+        variant = document.get_variant(format or "json", choose_encoding(request, SUPPORTED_ENCODINGS))
+
+        response = get_conditional_response(request, etag=variant.etag, last_modified=document.last_modified)
+        if response is None:
+            response = HttpResponse(variant.body, content_type=variant.content_type)
+            if variant.encoding:
+                response['Content-Encoding'] = variant.encoding
+
+        response['ETag'] = variant.etag
+        response['Last-Modified'] = http_date(document.last_modified)
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        return response
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class WellknownConfig(AppConfig):
     name = 'apps.wellknown'
+
+    def ready(self):
+        from . import signals  # noqa
@@ -0,0 +1,131 @@
+import hashlib
+import json
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.urls import get_script_prefix
+from django.utils.cache import get_conditional_response
+
+
+"""
+  Pre-rendered .well-known discovery documents.
+
+  - The openid configuration only depends on the issuer (host/scheme),
+    so it is rendered once per issuer and kept in process memory.
+  - Application list responses are cached in the Django cache as a
+    snapshot per request URL. Snapshots are versioned, the version is
+    replaced by the Application/ApplicationLabel signals in
+    apps.wellknown.signals so any listed change invalidates all snapshots
+    (application activity updates don't).
+
+  Both are served with a strong ETag and answer conditional requests.
+"""
+
+# Max openid configuration renderings (one per issuer) kept in memory
+MAX_RENDERED_DOCUMENTS = 64
+
+APP_LIST_VERSION_CACHE_KEY = "wellknown_app_list_version"
+APP_LIST_SNAPSHOT_CACHE_KEY = "wellknown_app_list:{version}:{url}"
+# Snapshots also expire, in case a change bypasses the model signals (e.g. QuerySet.update()).
+APP_LIST_SNAPSHOT_TIMEOUT = 60 * 60
+
+_rendered_documents = {}
+_rendered_documents_lock = threading.Lock()
+
+
+class RenderedDocument:
+    def __init__(self, body, content_type="application/json"):
+        self.body = body
+        self.content_type = content_type
+        self.etag = '"{}"'.format(hashlib.sha256(body).hexdigest())
+
+
+def render_json_document(data):
+    return RenderedDocument(json.dumps(data, cls=DjangoJSONEncoder).encode("utf-8"))
+
+
+def document_response(request, document):
+    """
+    Return the response for a rendered document, or a 304 for a matching conditional request.
+    """
+    response = get_conditional_response(request, etag=document.etag)
+    if response is None:
+        response = HttpResponse(document.body, content_type=document.content_type)
+    response["ETag"] = document.etag
+    return response
+
+
+def get_rendered_document(name, issuer, build):
+    """
+    Return the RenderedDocument for name and issuer, calling build()
+    for the document data the first time.
+    """
+    key = (name, issuer, get_script_prefix())
+    document = _rendered_documents.get(key)
+    if document is None:
+        document = render_json_document(build())
+        with _rendered_documents_lock:
+            if len(_rendered_documents) >= MAX_RENDERED_DOCUMENTS:
+                _rendered_documents.clear()
+            _rendered_documents[key] = document
+    return document
+
+
+def clear_rendered_documents():
+    _rendered_documents.clear()
+
+
+def _new_app_list_version():
+    # Time based, so a version key lost from the cache never restarts at an old value.
+    return time.time_ns()
+
+
+def get_app_list_version():
+    version = cache.get(APP_LIST_VERSION_CACHE_KEY)
+    if version is None:
+        cache.add(APP_LIST_VERSION_CACHE_KEY, _new_app_list_version(), None)
+        version = cache.get(APP_LIST_VERSION_CACHE_KEY)
+    return version
+
+
+def invalidate_app_list_snapshots():
+    """
+    Set a new snapshot version, so all cached application lists are rebuilt.
+
+    A plain set instead of incr(), which is a non atomic read and write on
+    some cache backends (e.g. the database cache).
+    """
+    cache.set(APP_LIST_VERSION_CACHE_KEY, _new_app_list_version(), None)
+
+
+def _app_list_snapshot_key(request):
+    url = hashlib.sha256(request.build_absolute_uri().encode("utf-8")).hexdigest()
+    return APP_LIST_SNAPSHOT_CACHE_KEY.format(version=get_app_list_version(), url=url)
+
+
+class AppListSnapshotMixin:
+    """
+    ListAPIView mixin caching the rendered list as a snapshot per request URL.
+
+    Only successful GET/HEAD responses are cached.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = _app_list_snapshot_key(request)
+        document = cache.get(key)
+
+        if document is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200 or not hasattr(response, "render"):
+                return response
+            response.render()
+            document = RenderedDocument(response.content, response["Content-Type"])
+            cache.set(key, document, APP_LIST_SNAPSHOT_TIMEOUT)
+
+        return document_response(request, document)
@@ -0,0 +1,29 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from apps.dot_ext.models import Application, ApplicationLabel
+
+from .documents import invalidate_app_list_snapshots
+
+# Application fields not in the application lists, saved on every API call
+APP_ACTIVITY_FIELDS = {"last_active", "first_active"}
+
+
+@receiver(post_save, sender=Application)
+def application_saved(sender, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= APP_ACTIVITY_FIELDS:
+        return
+    invalidate_app_list_snapshots()
+
+
+@receiver(post_delete, sender=Application)
+@receiver(post_save, sender=ApplicationLabel)
+@receiver(post_delete, sender=ApplicationLabel)
+def app_list_changed(sender, **kwargs):
+    invalidate_app_list_snapshots()
+
+
+@receiver(m2m_changed, sender=ApplicationLabel.applications.through)
+def app_list_labels_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        invalidate_app_list_snapshots()
@@ -1,9 +1,18 @@
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.client import Client
 from django.urls import reverse
+from django.utils import timezone
 from django.conf import settings
+from waffle.models import Switch
 import json
 
+from apps.dot_ext.models import Application, ApplicationLabel
+from apps.test import BaseApiTest
+from apps.wellknown.documents import clear_rendered_documents
+
 
 class OpenIDConnectConfigurationTestCase(TestCase):
     """
@@ -28,3 +37,86 @@ class OpenIDConnectConfigurationTestCase(TestCase):
         response_content = response.content
         response_content = str(response_content, encoding='utf8')
         self.assertEqual(type(json.loads(response_content)), type({}))
+
+    def test_rendered_once_with_etag(self):
+        clear_rendered_documents()
+        response = self.client.get(self.url)
+        etag = response['ETag']
+
+        with mock.patch('apps.wellknown.views.openid.build_endpoint_info') as build:
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['ETag'], etag)
+
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            build.assert_not_called()
+
+        # Rendered separately per issuer
+        with self.settings(HOSTNAME_URL="https://other.example.com"):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "https://other.example.com/v1/o/token/")
+
+        response = self.client.get(reverse('openid-configuration-v2'))
+        self.assertContains(response, reverse('oauth2_provider_v2:token-v2'))
+
+
+class ApplicationListSnapshotTestCase(BaseApiTest):
+    def setUp(self):
+        cache.clear()
+        Switch.objects.create(name='wellknown_applications', active=True)
+        self.app = self._create_application("Snapshot App")
+
+    def tearDown(self):
+        cache.clear()
+
+    def _app_names(self, response):
+        return [a['name'] for a in response.json()['results']]
+
+    def test_snapshot_invalidated_on_save(self):
+        for url_name in ['applications-list', 'public-applications-list']:
+            url = reverse(url_name)
+            response = self.client.get(url)
+            self.assertEqual(self._app_names(response), ["Snapshot App"])
+
+            # Served from the snapshot
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+
+        # Application activity updates keep the snapshot
+        self.app.last_active = timezone.now()
+        self.app.save(update_fields=["last_active"])
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        # Changes not going through the model signals keep the snapshot
+        Application.objects.filter(id=self.app.id).update(name="Updated App")
+        self.assertEqual(self._app_names(self.client.get(reverse('applications-list'))), ["Snapshot App"])
+
+        self.app.refresh_from_db()
+        self.app.save()
+        self.assertEqual(self._app_names(self.client.get(reverse('applications-list'))), ["Updated App"])
+        self.assertEqual(self._app_names(self.client.get(reverse('public-applications-list'))), ["Updated App"])
+
+        self.app.delete()
+        self.assertEqual(self._app_names(self.client.get(reverse('applications-list'))), [])
+
+    def test_snapshot_per_query(self):
+        label = ApplicationLabel.objects.create(name="Label", slug="label", description="label")
+
+        response = self.client.get(reverse('applications-list'), {'label': 'label'})
+        self.assertEqual(self._app_names(response), [])
+
+        label.applications.add(self.app)
+        response = self.client.get(reverse('applications-list'), {'label': 'label'})
+        self.assertEqual(self._app_names(response), ["Snapshot App"])
+
+        response = self.client.get(reverse('application-labels'))
+        self.assertEqual([lbl['slug'] for lbl in response.json()], ["label"])
+
+        # Errors are not cached
+        response = self.client.get(reverse('applications-list'), {'label': 'unknown'})
+        self.assertEqual(response.status_code, 400)
@@ -6,6 +6,7 @@ from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny
 from rest_framework.renderers import JSONRenderer
 from apps.dot_ext.models import Application, ApplicationLabel
+from ..documents import AppListSnapshotMixin
 from ..serializers import ApplicationListSerializer, ApplicationLabelSerializer
 
 
@@ -38,12 +39,14 @@ class ApplicationListFilter(FilterSet):
         fields = ['label']
 
 
-class ApplicationListView(ListAPIView):
+class ApplicationListView(AppListSnapshotMixin, ListAPIView):
     """
     View to provide an applications list.
 
     An application that has active=False or with a label slug in the APP_LIST_EXCLUDE
     list will be excluded from this view.
+
+    Responses are cached as snapshots invalidated on Application changes.
     """
     permission_classes = (AllowAny,)
     renderer_classes = (JSONRenderer,)
@@ -58,12 +61,14 @@ class ApplicationListView(ListAPIView):
         return queryset
 
 
-class ApplicationLabelView(ListAPIView):
+class ApplicationLabelView(AppListSnapshotMixin, ListAPIView):
     """
     View to provide an application labels list.
 
     An application label that has a label slug in the APP_LIST_EXCLUDE
     list will be excluded from this view.
+
+    Responses are cached as snapshots invalidated on ApplicationLabel changes.
     """
     permission_classes = (AllowAny,)
     renderer_classes = (JSONRenderer,)
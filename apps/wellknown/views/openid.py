@@ -1,6 +1,5 @@
 import logging
 
-from django.http import JsonResponse
 from django.views.decorators.http import require_GET
 from collections import OrderedDict
 from django.conf import settings
@@ -8,6 +7,8 @@ from django.urls import reverse
 
 import apps.logging.request_logger as bb2logging
 
+from ..documents import document_response, get_rendered_document
+
 logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
 
 
@@ -15,12 +16,14 @@ logger = logging.getLogger(bb2logging.HHS_SERVER_LOGNAME_FMT.format(__name__))
 def openid_configuration(request):
     """
     Views that returns openid_configuration.
+
+    The document is rendered once per issuer, see apps.wellknown.documents.
     """
-    data = OrderedDict()
     issuer = base_issuer(request)
     v2 = request.path.endswith('openid-configuration-v2') or request.path.endswith('openidConfigV2')
-    data = build_endpoint_info(data, issuer=issuer, v2=v2)
-    return JsonResponse(data)
+    document = get_rendered_document('openid-configuration-v2' if v2 else 'openid-configuration', issuer,
+                                     lambda: build_endpoint_info(OrderedDict(), issuer=issuer, v2=v2))
+    return document_response(request, document)
 
 
 def base_issuer(request):
@@ -7,6 +7,7 @@ from rest_framework.renderers import JSONRenderer
 from rest_framework import serializers
 from rest_framework.response import Response
 from apps.dot_ext.models import Application
+from ..documents import AppListSnapshotMixin
 
 
 class ProviderPagination(PageNumberPagination):
@@ -75,12 +76,14 @@ class ApplicationListSerializer(serializers.ModelSerializer):
         return contacts
 
 
-class ApplicationListView(ListAPIView):
+class ApplicationListView(AppListSnapshotMixin, ListAPIView):
     """
     View to provide an applications list.
 
     An application that has active=False or with a label slug in the APP_LIST_EXCLUDE
     list will be excluded from this view.
+
+    Responses are cached as snapshots invalidated on Application changes.
     """
     permission_classes = (AllowAny,)
     renderer_classes = (JSONRenderer,)
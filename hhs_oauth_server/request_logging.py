@@ -5,9 +5,9 @@ import uuid
 
 import apps.logging.request_logger as logging
 
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.utils.deprecation import MiddlewareMixin
-from oauth2_provider.models import AccessToken, RefreshToken, get_application_model
 from rest_framework.response import Response
 
 from apps.dot_ext.loggers import (
@@ -20,8 +20,11 @@ from apps.fhir.bluebutton.utils import (
     get_user_from_request,
     get_access_token_from_request,
 )
+from apps.logging.audit_context import AuditContext, end_audit_context, start_audit_context
+from apps.logging.timing import end_request_timer, start_request_timer
 
 audit = logging.getLogger("audit.%s" % __name__)
+performance = logging.getLogger(logging.PERFORMANCE_LOGGER)
 
 
 class RequestResponseLog(object):
@@ -106,7 +109,8 @@ class RequestResponseLog(object):
         - resp_token_type = Response refresh token info. (BB2-342)
         - resp_user_id = Response refresh token info. (BB2-342)
         - resp_user_username = Response refresh token info. (BB2-342)
-        - size = Size in bytes of the response.content
+        - sample_rate = Fraction of such records logged, when sampling rules are set (see apps.logging.sampling).
+        - size = Size in bytes of the response content (counted while sent for streaming responses)
         - start_time = Unix Epoch format time of the request processed.
         - type = Label for type of log. Set to "request_response_middleware". (BB2-342)
         - user_id = Login user (or None) or OAuth2 API id. (BB2-342)
@@ -120,6 +124,8 @@ class RequestResponseLog(object):
     def __init__(self, req, resp):
         self.request = req
         self.response = resp
+        # Objects already resolved for this request, see apps.logging.audit_context
+        self.audit_context = getattr(req, "_audit_context", None) or AuditContext()
         """
         Init log message. NOTE: These values set to empty for backward Splunk dashboard compatibility.
         The convention for newly added items is to set empty values to None.
@@ -182,6 +188,20 @@ class RequestResponseLog(object):
         except AttributeError:
             self.log_msg[key] = "AttributeError exception for key " + key + ":" + qp_key
 
+    def _log_msg_update_from_application(self, client_id):
+        application = self.audit_context.get_application(client_id)
+        if application is not None:
+            self._log_msg_update_from_object(application, "req_app_name", "name")
+            self._log_msg_update_from_object(application, "req_app_id", "id")
+        else:
+            self.log_msg["req_app_name"] = ""
+            self.log_msg["req_app_id"] = ""
+
+    def _get_crosswalk(self, user):
+        if getattr(user, "pk", None) is None:
+            return None
+        return self.audit_context.get_crosswalk(user)
+
     def _sync_app_name(self):
         if self.log_msg.get("app_id") is not None and self.log_msg.get("app_name") is not None \
            and not self.log_msg.get("app_id") and not self.log_msg.get("app_name") \
@@ -239,28 +259,17 @@ class RequestResponseLog(object):
             )
 
         """
-        --- Logging items from request.body ---
+        --- Logging items from the request body, as parsed into request.POST for the view ---
         """
-        if getattr(self.request, "body", False):
-            req_body = self.request.body.decode("utf-8", "ignore")
+        if getattr(self.request, "POST", False):
+            request_body_dict = self.request.POST.dict()
             try:
-                request_body_dict = dict(
-                    item.split("=") for item in req_body.split("&")
-                )
                 self._log_msg_update_from_dict(
                     request_body_dict, "req_client_id", "client_id"
                 )
 
                 if self.log_msg.get("req_client_id", False):
-                    try:
-                        application = get_application_model().objects.get(
-                            client_id=self.log_msg.get("req_client_id")
-                        )
-                        self._log_msg_update_from_object(application, "req_app_name", "name")
-                        self._log_msg_update_from_object(application, "req_app_id", "id")
-                    except ObjectDoesNotExist:
-                        self.log_msg["req_app_name"] = ""
-                        self.log_msg["req_app_id"] = ""
+                    self._log_msg_update_from_application(self.log_msg.get("req_client_id"))
 
                 refresh_token = request_body_dict.get("refresh_token", None)
                 if refresh_token is not None:
@@ -268,10 +277,9 @@ class RequestResponseLog(object):
                         str(refresh_token).encode("utf-8")
                     ).hexdigest()
 
-                # Log AC passed from RequestTimeLoggingMiddleware.process_request() pre-response
-                self._log_msg_update_from_object(
-                    self.request, "req_access_token_hash", "_req_access_token_hash"
-                )
+                # Log AC replaced by a refresh_token grant, recorded by the oauth2 validator
+                if self.audit_context.refreshed_access_token_hash is not None:
+                    self.log_msg["req_access_token_hash"] = self.audit_context.refreshed_access_token_hash
 
                 self._log_msg_update_from_dict(
                     request_body_dict, "req_response_type", "response_type"
@@ -296,8 +304,6 @@ class RequestResponseLog(object):
                 self._log_msg_update_from_dict(request_body_dict, "req_allow", "allow")
             except ObjectDoesNotExist:
                 pass
-            except ValueError:
-                pass
 
         """
         --- Logging items from request.user ---
@@ -307,10 +313,9 @@ class RequestResponseLog(object):
             self._log_msg_update_from_object(
                 self.request.user, "req_user_username", "username"
             )
-            if getattr(self.request.user, "crosswalk", False):
-                self._log_msg_update_from_object(
-                    self.request.user.crosswalk, "req_fhir_id", "fhir_id"
-                )
+            crosswalk = self._get_crosswalk(self.request.user)
+            if crosswalk:
+                self._log_msg_update_from_object(crosswalk, "req_fhir_id", "fhir_id")
 
         """
         --- Logging items from request.session for Auth Flow Tracing ---
@@ -347,15 +352,7 @@ class RequestResponseLog(object):
             self._log_msg_update_from_querydict("req_qparam_type", "type")
 
             if self.log_msg.get("req_qparam_client_id", False):
-                try:
-                    application = get_application_model().objects.get(
-                        client_id=self.log_msg.get("req_qparam_client_id")
-                    )
-                    self._log_msg_update_from_object(application, "req_app_name", "name")
-                    self._log_msg_update_from_object(application, "req_app_id", "id")
-                except ObjectDoesNotExist:
-                    self.log_msg["req_app_name"] = ""
-                    self.log_msg["req_app_id"] = ""
+                self._log_msg_update_from_application(self.log_msg.get("req_qparam_client_id"))
 
         """
         --- Logging items from request ---
@@ -370,10 +367,9 @@ class RequestResponseLog(object):
         user = get_user_from_request(self.request)
         if user:
             self.log_msg["user"] = str(user)
-            try:
-                self.log_msg["fhir_id"] = str(user.crosswalk.fhir_id)
-            except ObjectDoesNotExist:
-                pass
+            crosswalk = self._get_crosswalk(user)
+            if crosswalk is not None:
+                self.log_msg["fhir_id"] = str(crosswalk.fhir_id)
 
         """
         --- Logging items from request access token ---
@@ -382,14 +378,13 @@ class RequestResponseLog(object):
             self.request, "auth", get_access_token_from_request(self.request)
         )
 
-        if access_token:
+        at = self.audit_context.get_access_token(str(access_token)) if access_token else None
+        if at is not None:
             try:
-                at = AccessToken.objects.get(token=access_token)
-
                 self.log_msg["access_token_hash"] = hashlib.sha256(
                     str(access_token).encode("utf-8")
                 ).hexdigest()
-                self.log_msg["access_token_scopes"] = " ".join([s for s in at.scopes])
+                self.log_msg["access_token_scopes"] = self.audit_context.get_token_scopes(at)
                 self._log_msg_update_from_object(
                     at.application, "access_token_id", "id"
                 )
@@ -417,6 +412,8 @@ class RequestResponseLog(object):
         self.log_msg["response_code"] = getattr(self.response, "status_code", 0)
         if self.log_msg["response_code"] in (300, 301, 302, 307):
             self.log_msg["location"] = self.response.get("Location", "?")
+        elif self.audit_context.response_size is not None:
+            self.log_msg["size"] = self.audit_context.response_size
         elif getattr(self.response, "content", False):
             self.log_msg["size"] = len(self.response.content)
 
@@ -471,17 +468,14 @@ class RequestResponseLog(object):
 
                 resp_access_token = response_content.get("access_token", None)
 
-                if resp_access_token:
+                at = self.audit_context.get_access_token(resp_access_token) if resp_access_token else None
+                if at is not None:
                     try:
-                        at = AccessToken.objects.get(token=resp_access_token)
-
                         self.log_msg["resp_access_token_hash"] = hashlib.sha256(
                             str(at).encode("utf-8")
                         ).hexdigest()
 
-                        self.log_msg["resp_access_token_scopes"] = " ".join(
-                            [s for s in at.scopes]
-                        )
+                        self.log_msg["resp_access_token_scopes"] = self.audit_context.get_token_scopes(at)
 
                         self._log_msg_update_from_object(
                             at.application, "resp_app_id", "id"
@@ -536,6 +530,24 @@ class RequestTimeLoggingMiddleware(MiddlewareMixin):
         audit.info(RequestResponseLog(request, response).to_dict())
         request._logging_pass += 1
 
+    @staticmethod
+    def log_timing(request, response):
+        """
+        Log the request's timing spans (see apps.logging.timing), for
+        requests with instrumented code only.
+        """
+        timer = request._request_timer
+        if settings.REQUEST_TIMING_SERVER_TIMING:
+            response["Server-Timing"] = timer.server_timing()
+        if timer.spans:
+            performance.info({
+                "type": "request_timing",
+                "request_uuid": request._logging_uuid,
+                "path": request.path,
+                "response_code": response.status_code,
+                **timer.to_dict(),
+            })
+
     def process_request(self, request):
         """
         --- Get request (pre-response) logging items
@@ -544,27 +556,34 @@ class RequestTimeLoggingMiddleware(MiddlewareMixin):
         request._logging_start_dt = datetime.datetime.utcnow()
         request._logging_pass = 1
         request._logger = audit
-
-        # Get access token to be refreshed pre-response, since it is removed
-        if getattr(request, "body", False):
-            req_body = request.body.decode("utf-8", "ignore")
-            try:
-                request_body_dict = dict(
-                    item.split("=") for item in req_body.split("&")
-                )
-
-                refresh_token = request_body_dict.get("refresh_token", None)
-                if refresh_token is not None:
-                    rt = RefreshToken.objects.get(token=refresh_token)
-                    if rt:
-                        request._req_access_token_hash = hashlib.sha256(
-                            str(rt.access_token).encode("utf-8")
-                        ).hexdigest()
-            except ValueError:
-                pass
-            except ObjectDoesNotExist:
-                pass
+        request._audit_context_token = start_audit_context(request)
+        request._request_timer_token = start_request_timer(request)
 
     def process_response(self, request, response):
-        self.log_message(request, response)
+        token = getattr(request, "_audit_context_token", None)
+        if token is not None:
+            end_audit_context(token)
+            request._audit_context_token = None
+
+        token = getattr(request, "_request_timer_token", None)
+        if token is not None:
+            end_request_timer(token)
+            request._request_timer_token = None
+            self.log_timing(request, response)
+
+        if response.streaming:
+            # Log once the content is sent, with its counted size
+            response.streaming_content = self._log_after_streaming(request, response, response.streaming_content)
+        else:
+            self.log_message(request, response)
         return response
+
+    def _log_after_streaming(self, request, response, streaming_content):
+        size = 0
+        try:
+            for chunk in streaming_content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            request._audit_context.response_size = size
+            self.log_message(request, response)
@@ -227,8 +227,12 @@ if env("OPTIONAL_INSTALLED_APPS", False):
 MIDDLEWARE = [
     # Middleware that adds headers to the resposne
     "django.middleware.security.SecurityMiddleware",
+    # Compresses API responses, see COMPRESSION_* settings
+    "apps.core.compression.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "hhs_oauth_server.request_logging.RequestTimeLoggingMiddleware",
+    # Counts the SQL queries of each request, see QUERY_BUDGET_* settings
+    "apps.core.query_budget.QueryBudgetMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     # Middleware that can send a response must be below this line
     "django.middleware.common.CommonMiddleware",
@@ -248,6 +252,14 @@ MIDDLEWARE = [
 
 CORS_ORIGIN_ALLOW_ALL = bool_env(env("CORS_ORIGIN_ALLOW_ALL", True))
 
+# Response compression (apps.core.compression.CompressionMiddleware)
+# Only API paths, HTML pages with CSRF tokens are not compressed (BREACH).
+COMPRESSION_PATHS_REGEX = env("DJANGO_COMPRESSION_PATHS_REGEX", r"^/v[12]/fhir/|admin/metrics/")
+# Responses smaller than this (in bytes) are sent uncompressed
+COMPRESSION_MIN_SIZE = int_env(env("DJANGO_COMPRESSION_MIN_SIZE", 1024))
+COMPRESSION_GZIP_LEVEL = int_env(env("DJANGO_COMPRESSION_GZIP_LEVEL", 6))
+COMPRESSION_BROTLI_QUALITY = int_env(env("DJANGO_COMPRESSION_BROTLI_QUALITY", 5))
+
 ROOT_URLCONF = "hhs_oauth_server.urls"
 
 TEMPLATES = [
@@ -289,6 +301,19 @@ DATABASES = {
     ),
 }
 
+# Optional read replica of the default database (see apps.core.replica).
+# The metrics views, admin charts and exports read from it while its
+# replication lag is within REPLICA_MAX_LAG_SECONDS (checked every
+# REPLICA_LAG_CHECK_INTERVAL seconds), else from the default database.
+if env("DATABASES_REPLICA", None):
+    DATABASES["replica"] = dj_database_url.parse(env("DATABASES_REPLICA"))
+
+REPLICA_DATABASE_ALIAS = "replica" if "replica" in DATABASES else None
+REPLICA_MAX_LAG_SECONDS = int_env(env("DJANGO_REPLICA_MAX_LAG_SECONDS", 60))
+REPLICA_LAG_CHECK_INTERVAL = int_env(env("DJANGO_REPLICA_LAG_CHECK_INTERVAL", 10))
+
+DATABASE_ROUTERS = ["apps.core.replica.ReplicaRouter"]
+
 # this helps Django messages format nicely with Bootstrap3
 MESSAGE_TAGS = {
     messages.DEBUG: "debug",
@@ -420,6 +445,79 @@ LOGGING = env(
 # Option for local development to pretty print/format JSON logging
 LOG_JSON_FORMAT_PRETTY = env("DJANGO_LOG_JSON_FORMAT_PRETTY", False)
 
+# Audit log records are written by a background thread from a bounded queue
+# (see apps.logging.audit_queue). Overflow policy "drop" or "block".
+AUDIT_LOG_QUEUE_ENABLED = bool_env(env("DJANGO_AUDIT_LOG_QUEUE_ENABLED", True))
+AUDIT_LOG_QUEUE_SIZE = int_env(env("DJANGO_AUDIT_LOG_QUEUE_SIZE", 10000))
+AUDIT_LOG_QUEUE_BATCH_SIZE = int_env(env("DJANGO_AUDIT_LOG_QUEUE_BATCH_SIZE", 100))
+AUDIT_LOG_QUEUE_FLUSH_INTERVAL = float(env("DJANGO_AUDIT_LOG_QUEUE_FLUSH_INTERVAL", 1.0))
+AUDIT_LOG_QUEUE_OVERFLOW = env("DJANGO_AUDIT_LOG_QUEUE_OVERFLOW", "drop")
+AUDIT_LOG_QUEUE_BLOCK_TIMEOUT = float(env("DJANGO_AUDIT_LOG_QUEUE_BLOCK_TIMEOUT", 1.0))
+
+# Sampling/trimming of high volume audit records (see apps.logging.sampling).
+# Errors, auth and data access events are always logged in full.
+AUDIT_LOG_SAMPLING_RULES = env("DJANGO_AUDIT_LOG_SAMPLING_RULES", [
+    {"path": r"^/health", "status": ["2xx"], "rate": 0.01},
+    {"path": r"/fhir/metadata$|^/\.well-known/", "status": ["2xx", "3xx"], "rate": 0.1,
+     "trim": ["req_header_accept_encoding", "req_header_content_length", "req_header_content_type",
+              "req_header_referrer"]},
+])
+
+# Optional local sink writing the audit/performance logs as BFD-Insights
+# events to gzip segments (see apps.logging.sinks), shipped to
+# AUDIT_LOG_SHIP_DESTINATION by the ship_audit_logs command.
+AUDIT_LOG_SINK_DIR = env("DJANGO_AUDIT_LOG_SINK_DIR", None)
+AUDIT_LOG_SINK_MAX_BYTES = int_env(env("DJANGO_AUDIT_LOG_SINK_MAX_BYTES", 64 * 1024 * 1024))
+AUDIT_LOG_SINK_MAX_AGE = int_env(env("DJANGO_AUDIT_LOG_SINK_MAX_AGE", 300))
+AUDIT_LOG_SHIP_DESTINATION = env("DJANGO_AUDIT_LOG_SHIP_DESTINATION", None)
+
+if AUDIT_LOG_SINK_DIR:
+    LOGGING.setdefault("handlers", {})["audit_segments"] = {
+        "class": "apps.logging.sinks.AuditSegmentHandler",
+        "directory": AUDIT_LOG_SINK_DIR,
+        "env": env("TARGET_ENV", "DEV"),
+        "max_bytes": AUDIT_LOG_SINK_MAX_BYTES,
+        "max_age": AUDIT_LOG_SINK_MAX_AGE,
+    }
+    for _logger_name in ["audit", "performance"]:
+        if _logger_name in LOGGING.get("loggers", {}):
+            LOGGING["loggers"][_logger_name].setdefault("handlers", []).append("audit_segments")
+
+# Send request timing spans (see apps.logging.timing) in a Server-Timing
+# response header, for internal environments only.
+REQUEST_TIMING_SERVER_TIMING = bool_env(env("DJANGO_REQUEST_TIMING_SERVER_TIMING", False))
+
+# Operational metrics (see apps.core.metrics), exposed at /health/metrics
+# to requests with "Authorization: Bearer <METRICS_ENDPOINT_TOKEN>" (the
+# endpoint is disabled when no token is set). With several worker
+# processes, set METRICS_MULTIPROC_DIR to a directory shared by the
+# workers and emptied when the service starts.
+METRICS_MULTIPROC_DIR = env("DJANGO_METRICS_MULTIPROC_DIR", None)
+METRICS_ENDPOINT_TOKEN = env("DJANGO_METRICS_ENDPOINT_TOKEN", None)
+
+# SQL query budgets (see apps.core.query_budget). Requests running more
+# queries than their view's query_budget (default QUERY_BUDGET_DEFAULT,
+# None for no limit) or repeating a statement QUERY_BUDGET_REPEAT_THRESHOLD
+# times are logged on the performance logger.
+QUERY_BUDGET_ENABLED = bool_env(env("DJANGO_QUERY_BUDGET_ENABLED", True))
+QUERY_BUDGET_DEFAULT = int_env(env("DJANGO_QUERY_BUDGET_DEFAULT", 50))
+QUERY_BUDGET_REPEAT_THRESHOLD = int_env(env("DJANGO_QUERY_BUDGET_REPEAT_THRESHOLD", 10))
+
+# Incrementally maintained row counts of the grant, token and crosswalk
+# tables (see apps.core.counters), repaired by the periodic
+# reconcile_metric_counters management command.
+METRIC_COUNTERS_ENABLED = bool_env(env("DJANGO_METRIC_COUNTERS_ENABLED", True))
+
+# Stale-while-revalidate cache of the metrics API responses (see
+# apps.metrics.cache): refreshed in the background once older than the
+# soft TTL, recomputed within the request once older than the hard TTL
+# (in seconds), 0 = no caching. The responses are kept in the
+# METRICS_CACHE_ALIAS cache alias, which must be a dedicated non-database
+# cache (Redis, Memcached); without that alias nothing is cached.
+METRICS_CACHE_ALIAS = env("DJANGO_METRICS_CACHE_ALIAS", "metrics")
+METRICS_CACHE_SOFT_TTL = int_env(env("DJANGO_METRICS_CACHE_SOFT_TTL", 60))
+METRICS_CACHE_HARD_TTL = int_env(env("DJANGO_METRICS_CACHE_HARD_TTL", 15 * 60))
+
 AUTH_PROFILE_MODULE = "accounts.UserProfile"
 
 # Django Oauth Tookit settings and customizations
@@ -537,6 +635,16 @@ SETTINGS_EXPORT = [
 ]
 
 SESSION_COOKIE_AGE = 5400
+
+# Auth flow trace store (see apps.dot_ext.authflow).
+# AuthFlowUuid table by default. "apps.dot_ext.authflow.CacheAuthFlowStore"
+# keeps the values in the AUTH_FLOW_STORE_CACHE cache alias instead, which
+# must be a dedicated non-database cache (Redis, Memcached) large enough
+# not to cull in-flight flows.
+AUTH_FLOW_STORE = env("DJANGO_AUTH_FLOW_STORE", "apps.dot_ext.authflow.DatabaseAuthFlowStore")
+AUTH_FLOW_STORE_CACHE = env("DJANGO_AUTH_FLOW_STORE_CACHE", "authflow")
+# TTL (in seconds) of an auth flow trace entry
+AUTH_FLOW_STORE_TTL = int_env(env("DJANGO_AUTH_FLOW_STORE_TTL", SESSION_COOKIE_AGE))
 SESSION_COOKIE_SECURE = env("DJANGO_SECURE_SESSION", True)
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 
@@ -595,6 +703,16 @@ REQUEST_CALL_TIMEOUT = (30, 120)
 # Headers Keep-Alive value
 # this can be over-ridden in aws-{env}.py file to set values per environment
 REQUEST_EOB_KEEP_ALIVE = "timeout=120, max=10"
+# Accept-Encoding sent to the FHIR backend, responses are decoded by requests
+REQUEST_BACKEND_ACCEPT_ENCODING = "gzip, deflate"
+
+# Refresh interval (in seconds) of the cached FHIR /metadata CapabilityStatement
+# (see apps.fhir.bluebutton.metadata), 0 = no caching
+FHIR_METADATA_REFRESH_INTERVAL = int_env(env("DJANGO_FHIR_METADATA_REFRESH_INTERVAL", 600))
+
+# Seconds the BB2-Tools admin keeps BFD patients fetched by
+# apps.fhir.bluebutton.utils.get_patient_by_id() in process, 0 = no caching
+BFD_PATIENT_CACHE_TTL = int_env(env("DJANGO_BFD_PATIENT_CACHE_TTL", 60))
 
 SIGNUP_TIMEOUT_DAYS = env("SIGNUP_TIMEOUT_DAYS", 7)
 ORGANIZATION_NAME = "CMS Medicare Blue Button"
@@ -607,6 +725,11 @@ LOGOUT_REDIRECT_URL = "/"
 # Move Admin to a variable url location
 ADMIN_PREPEND_URL = env("DJANGO_ADMIN_PREPEND_URL", "")
 
+# Unfiltered bb2_tools admin changelists of tables with more rows than
+# this (by the Postgres planner estimate) paginate on the estimate
+# instead of an exact COUNT(*).
+ADMIN_ESTIMATED_COUNT_THRESHOLD = int_env(env("DJANGO_ADMIN_ESTIMATED_COUNT_THRESHOLD", 100000))
+
 ALLOW_END_USER_EXTERNAL_AUTH = "B"
 EXTERNAL_AUTH_NAME = "Medicare.gov"
 
@@ -696,6 +819,28 @@ else:
         # This sets up a media path in urls.py when set for local storage.
         IS_MEDIA_URL_LOCAL = True
 
+# Data retention policies for transient tables, applied by the
+# apply_retention management command (see apps.core.retention).
+#
+#   model = "<app_label>.<ModelName>"
+#   age_field + max_age = Delete rows with age_field older than max_age.
+#   filter = Optional extra field lookups a row must match to be deleted.
+#   keep_latest = Delete all but the latest N rows (by primary key),
+#                 for tables without a timestamp field.
+#
+# Only the ephemeral authorization flow tables are cleaned up by default.
+# The archive and audit tables (dot_ext.ArchivedToken,
+# authorization.ArchivedDataAccessGrant) feed the metrics and admin charts,
+# deleting them is a data governance decision. Add policies for them (or
+# creds.CredentialingReqest, mymedicare_cb.AnonUserState) per deployment,
+# for example:
+#   {"model": "dot_ext.ArchivedToken", "age_field": "archived_at",
+#    "max_age": datetime.timedelta(days=3 * 365)},
+RETENTION_POLICIES = [
+    {"model": "dot_ext.AuthFlowUuid", "age_field": "created", "max_age": datetime.timedelta(days=30)},
+    {"model": "dot_ext.Approval", "age_field": "created_at", "max_age": datetime.timedelta(days=1)},
+]
+
 # PROD Access Credentialing
 # TTL (time to live, in minutes) for a bb2 generated unique and one time use url to be shared with on boarding app
 # for obtaining app credentials i.e. client id and client secret
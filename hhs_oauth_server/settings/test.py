@@ -10,6 +10,28 @@ LOGIN_RATE = '100/m'
 
 REQUEST_CALL_TIMEOUT = (5, 120)
 
+# Log audit records synchronously, tests read them right after the request
+AUDIT_LOG_QUEUE_ENABLED = False
+AUDIT_LOG_SAMPLING_RULES = []
+
+# Call BFD mocks for every /metadata request
+FHIR_METADATA_REFRESH_INTERVAL = 0
+
+# Fetch BFD patients on every BB2-Tools lookup
+BFD_PATIENT_CACHE_TTL = 0
+
+# Compute the metrics API responses on every request
+METRICS_CACHE_HARD_TTL = 0
+
+# Second database for the read replica tests (apps.core.tests.test_replica),
+# created only for the tests using it. Replica reads are off unless a test
+# sets REPLICA_DATABASE_ALIAS.
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+}
+REPLICA_DATABASE_ALIAS = None
+
 OFFLINE = True
 
 # Should be set to True in production and False in all other dev and test environments
@@ -19,3 +19,11 @@ if os.path.isfile(os.path.join(DJANGO_CUSTOM_SETTINGS_DIR, '.env')):
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "hhs_oauth_server.settings.base")
 
 application = get_wsgi_application()
+
+# Fill the FHIR /metadata cache and keep it refreshed in the background
+from apps.fhir.bluebutton.metadata import start_capability_statement_refresher  # noqa: E402
+start_capability_statement_refresher()
+
+# Parse and pre-serialize the OpenAPI document
+from apps.openapi.document import preload_openapi_document  # noqa: E402
+preload_openapi_document()